@@ -0,0 +1,140 @@
+# app/function/analysis_jobs.py
+import asyncio
+import logging
+import multiprocessing
+import os
+from typing import Optional
+
+from app.function.memory_extraction import MemoryExtractionService
+from app.personal_agents.slang_extraction import SlangExtractionService
+from app.psychology.combined_analysis import CombinedAnalysisService
+from app.psychology.mbti_analysis import MBTIAnalysisService
+from app.psychology.ocean_analysis import OceanAnalysisService
+from app.utils.job_queue import JobQueue, JobWorker
+
+
+# SQLite file holding the post-turn analysis jobs (shared by every worker on the host)
+ANALYSIS_QUEUE_PATH = os.getenv("ANALYSIS_QUEUE_PATH", "analysis_jobs.sqlite3")
+# Number of analysis jobs run at the same time
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "8"))
+# Run the analyses in a separate worker process (otherwise on the web server's event loop)
+ANALYSIS_WORKER_PROCESS = os.getenv("ANALYSIS_WORKER_PROCESS", "true").lower() == "true"
+# "separate": one model call per analysis; "combined": one call returning all four (see CombinedAnalysisService)
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "separate").lower()
+
+# The analyses run on every transcript; in separate mode each is its own job so they run concurrently
+SEPARATE_ANALYSIS_KINDS = ("memory", "mbti", "ocean", "slang")
+COMBINED_ANALYSIS_KINDS = ("combined",)
+
+
+# The handlers raise when an analysis fails so the worker retries the job (see JobQueue.fail)
+async def extract_memory(user_id: str, transcript: str):
+    return await MemoryExtractionService(user_id).extract(transcript)
+
+
+async def analyze_mbti(user_id: str, transcript: str):
+    mbti_service = await MBTIAnalysisService.create(user_id)
+    return await mbti_service.analyze(transcript)
+
+
+async def analyze_ocean(user_id: str, transcript: str):
+    ocean_service = await OceanAnalysisService.create(user_id)
+    return await ocean_service.analyze(transcript)
+
+
+async def extract_slang(user_id: str, transcript: str):
+    return await SlangExtractionService(user_id).extract(transcript)
+
+
+async def analyze_combined(user_id: str, transcript: str):
+    return await CombinedAnalysisService(user_id).analyze(transcript)
+
+
+analysis_handlers = {
+    "memory": extract_memory,
+    "mbti": analyze_mbti,
+    "ocean": analyze_ocean,
+    "slang": extract_slang,
+    "combined": analyze_combined,
+}
+
+_queue: Optional[JobQueue] = None
+
+
+def get_analysis_queue() -> JobQueue:
+    """
+    The analysis job queue, opened on first use.
+    """
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(ANALYSIS_QUEUE_PATH)
+    return _queue
+
+
+def analysis_kinds(mode: str = ANALYSIS_MODE) -> tuple:
+    return COMBINED_ANALYSIS_KINDS if mode == "combined" else SEPARATE_ANALYSIS_KINDS
+
+
+def enqueue_analysis(user_id: str, transcript: str) -> None:
+    """
+    Queues every analysis of a conversation transcript for the user. If the user's earlier
+    analyses have not started yet, the new lines are added to them instead.
+    """
+    queue = get_analysis_queue()
+    for kind in analysis_kinds():
+        queue.enqueue(user_id, kind, transcript)
+
+
+def analysis_stats() -> dict:
+    try:
+        return get_analysis_queue().stats()
+    except Exception as e:
+        logging.error(f"Error reading analysis queue stats: {e}")
+        return {}
+
+
+async def run_analysis_worker(stop: Optional[asyncio.Event] = None) -> None:
+    await JobWorker(get_analysis_queue(), analysis_handlers, concurrency=ANALYSIS_CONCURRENCY).run(stop)
+
+
+def _worker_process_main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_analysis_worker())
+
+
+class AnalysisWorker:
+    """
+    Runs the analysis jobs for this server: in a child process by default, so analyses
+    never hold up the event loop that serves chat, or as a task on the current loop when
+    ANALYSIS_WORKER_PROCESS is false.
+    """
+    def __init__(self):
+        self._process: Optional[multiprocessing.Process] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        if ANALYSIS_WORKER_PROCESS:
+            if self._process is None or not self._process.is_alive():
+                # spawn: the child builds its own clients and event loop instead of inheriting ours
+                self._process = multiprocessing.get_context("spawn").Process(target=_worker_process_main, name="analysis-worker", daemon=True)
+                self._process.start()
+        elif self._task is None or self._task.done():
+            self._stop = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(run_analysis_worker(self._stop))
+
+    async def stop(self) -> None:
+        """
+        Stops the worker. Jobs that were running are picked up again after their lease expires.
+        """
+        if self._process is not None:
+            self._process.terminate()
+            await asyncio.to_thread(self._process.join, 10)
+            self._process = None
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
+
+
+analysis_worker = AnalysisWorker()
@@ -5,15 +5,15 @@ from typing import List, Optional, cast
 from agents import Agent, Runner
 from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from supabase import create_client
+from app.supabase.client import LazySupabaseClient
 from app.supabase.knowledge_edges import create_knowledge_edges
+from app.supabase.memory_index import peek_user_memory_index, remember_memory
 from app.supabase.pgvector import generate_embedding
 from app.utils.match_filter import MemoryFilter
 
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = LazySupabaseClient(SUPABASE_SERVICE_ROLE_KEY)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
  
  
@@ -97,24 +97,35 @@ class MemoryExtractionService:
      
     async def extract_memory(self, message: str) -> Optional[MemoryMetadata]:
         try:
-            memory_result = await Runner.run(self.agent, message)
-            
-            memory: MemoryMetadata = cast(MemoryMetadata, memory_result.final_output)
-                                                                         
-            if memory.importance < 0.3:
-                logging.info("Extracted memory is not valuable enough to store.")
-                return None
-
-            memory.timestamp = self.get_timestamp().isoformat()
-            
-            await run_in_threadpool(lambda: self.store_memory(memory))
-            
-            return memory
-        
+            return await self.extract(message)
         except Exception as e:
             logging.error(f"Error extracting memory: {e}")
             return None
 
+    async def extract(self, message: str) -> Optional[MemoryMetadata]:
+        """
+        Like extract_memory, but raises if the extraction fails, so a queued job is retried.
+        Returns None when the memory is not important enough to keep.
+        """
+        memory_result = await Runner.run(self.agent, message)
+        memory: MemoryMetadata = cast(MemoryMetadata, memory_result.final_output)
+        return await self.keep_memory(memory)
+
+    async def keep_memory(self, memory: MemoryMetadata) -> Optional[MemoryMetadata]:
+        """
+        Stores an extracted memory (from extract_memory or the combined analysis) if it is
+        important enough.
+        """
+        if memory.importance < 0.3:
+            logging.info("Extracted memory is not valuable enough to store.")
+            return None
+
+        memory.timestamp = self.get_timestamp().isoformat()
+        
+        await run_in_threadpool(lambda: self.store_memory(memory))
+        
+        return memory
+
     def store_memory(self, memory: MemoryMetadata) -> bool:
         """
         Stores extracted memory in the vector database with safety checks.
@@ -142,6 +153,7 @@ class MemoryExtractionService:
             # Edge creation
             new_id = response.data[0]["id"]            
             create_knowledge_edges(self.user_id, new_id, text_vectors, memory_dict)
+            remember_memory(self.user_id, response.data[0], text_vectors)
             return True
         
         except Exception as e:
@@ -149,12 +161,28 @@ class MemoryExtractionService:
             return False
     
     # Main function to search the vector database
-    def vector_search(self, query_str: str, limit: int = 10) -> List[MemoryResponse]:
+    def vector_search(self, query_str: str, limit: int = 10, memory_filter: Optional[MemoryFilter] = None) -> List[MemoryResponse]:
         """
         Accepts a query string, computes its embedding, and then queries the vector DB with the given filters.
+        The filter is applied before the top-k cut, so up to `limit` matching memories come back.
+        Callers still run memory_filter.apply() on the result for sorting.
         """
         try:
-            query_vector = self.generate_embeddings(query_str)      
+            query_vector = self.generate_embeddings(query_str)
+
+            # Answer in-process when the user's memories are already loaded
+            user_index = peek_user_memory_index(self.user_id)
+            if user_index is not None:
+                return user_index.search(query_vector, limit, memory_filter)
+
+            if memory_filter is not None:
+                try:
+                    response = supabase.rpc("find_similar_memories_filtered", {"input_user_id": self.user_id, "query_embedding": query_vector, "top_k": limit, "filter_spec": memory_filter.to_spec()}).execute()
+                    return response.data
+                except Exception as e:
+                    # e.g. the migration in app/supabase/sql has not been applied yet
+                    logging.error(f"Error in filtered vector search, falling back to unfiltered: {e}")
+
             response = supabase.rpc("find_similar_memories", {"input_user_id": self.user_id, "query_embedding": query_vector, "top_k": limit}).execute()
             return response.data
         except Exception as e:
@@ -196,9 +224,10 @@ class MemoryExtractionService:
                 Allows the AI to bring forward deeply emotional moments for empathy, 
                 connection, or insight, making the conversation feel more personal and attuned.
         """
-        results = self.vector_search(query_str, self.limit)
+        memory_filter = MemoryFilter().match("emotional_intensity", "high")
+        results = self.vector_search(query_str, self.limit, memory_filter)
         
-        filtered_results = MemoryFilter().match("emotional_intensity", "high").apply(results)
+        filtered_results = memory_filter.apply(results)
 
         #logging.info(f"Filtered Emotional Intensity Results: {filtered_results}")
         return filtered_results
@@ -226,14 +255,15 @@ class MemoryExtractionService:
                 Helps the AI remember what truly matters to the user, focusing on meaningful 
                 experiences over generic messages.
         """
-        results = self.vector_search(query_str, self.limit)
-                
-        filtered_results = MemoryFilter() \
+        memory_filter = MemoryFilter() \
             .match("disclosure", True) \
             .match("boundary_discussion", True) \
             .greater_than_or_equal("importance", 0.7) \
-            .match("emotional_intensity", "high") \
-            .apply(results)
+            .match("emotional_intensity", "high")
+
+        results = self.vector_search(query_str, self.limit, memory_filter)
+                
+        filtered_results = memory_filter.apply(results)
 
         #logging.info(f"FilteredContext-Weighted Results: {filtered_results}")
         return filtered_results
@@ -261,11 +291,12 @@ class MemoryExtractionService:
             Enables the AI to mirror the user’s preferred communication style—making conversations 
             feel more natural, emotionally attuned, and expressive.
         """
-        results = self.vector_search(query_str, self.limit)
+        memory_filter = MemoryFilter() \
+            .match("language_style", language_style)
+
+        results = self.vector_search(query_str, self.limit, memory_filter)
         
-        filtered_results = MemoryFilter() \
-            .match("language_style", language_style) \
-            .apply(results)
+        filtered_results = memory_filter.apply(results)
         
         logging.info(f"Mood-Based Language Results: {filtered_results}")
         return filtered_results
@@ -292,13 +323,14 @@ class MemoryExtractionService:
             Helps the AI create long-term narrative presence by bringing up past experiences 
             that deepen the current emotional moment.
         """
-        results = self.vector_search(query_str, self.limit)
-        
-        filtered_results = MemoryFilter() \
+        memory_filter = MemoryFilter() \
             .match("ritual", True) \
             .match("emotional_intensity", "medium") \
-            .greater_than_or_equal("importance", 0.7) \
-            .apply(results)
+            .greater_than_or_equal("importance", 0.7)
+
+        results = self.vector_search(query_str, self.limit, memory_filter)
+        
+        filtered_results = memory_filter.apply(results)
             
         #logging.info(f"Memory Surface Results: {filtered_results}")
         return filtered_results
@@ -325,9 +357,10 @@ class MemoryExtractionService:
             Makes the AI feel more integrated into the user's life rhythm—helping establish 
             routine, reflection, and continuity in the emotional bond.
         """
-        results = self.vector_search(query_str, self.limit)
+        memory_filter = MemoryFilter().match("ritual", True).greater_than_or_equal("importance", 0.5)
+        results = self.vector_search(query_str, self.limit, memory_filter)
         
-        filtered_results = MemoryFilter().match("ritual", True).greater_than_or_equal("importance", 0.5).apply(results)
+        filtered_results = memory_filter.apply(results)
 
         #logging.info(f"FilteredRituals Results: {filtered_results}")
         return filtered_results
@@ -354,9 +387,10 @@ class MemoryExtractionService:
             Reinforces emotional safety and trust by letting the AI recognize when 
             to tread gently or ask before diving deeper.
         """
-        results = self.vector_search(query_str, self.limit)
+        memory_filter = MemoryFilter().match("boundary_discussion", True).greater_than_or_equal("importance", 0.5)
+        results = self.vector_search(query_str, self.limit, memory_filter)
         
-        filtered_results = MemoryFilter().match("boundary_discussion", True).greater_than_or_equal("importance", 0.5).apply(results)
+        filtered_results = memory_filter.apply(results)
 
         logging.info(f"Boundaries Results: {filtered_results}")
         return filtered_results
@@ -383,9 +417,10 @@ class MemoryExtractionService:
             Brings a human-feeling layer to the interaction, helping the AI sound present, grounded, 
             and emotionally in-tune with its own limitations and role.
         """
-        results = self.vector_search(query_str, self.limit)
+        memory_filter = MemoryFilter().match("self_awareness", True).greater_than_or_equal("importance", 0.5)
+        results = self.vector_search(query_str, self.limit, memory_filter)
         
-        filtered_results = MemoryFilter().match("self_awareness", True).greater_than_or_equal("importance", 0.5).apply(results)
+        filtered_results = memory_filter.apply(results)
 
         logging.info(f"Self-Awareness Results: {filtered_results}")
         return filtered_results
@@ -414,9 +449,10 @@ class MemoryExtractionService:
             concerns, or recurring mental threads.
         """        
         
-        results = self.vector_search(query_str, self.limit)
+        memory_filter = MemoryFilter().contains_any("topics", topics).greater_than_or_equal("importance", 0.5)
+        results = self.vector_search(query_str, self.limit, memory_filter)
 
-        filter = MemoryFilter().contains_any("topics", topics).greater_than_or_equal("importance", 0.5).apply(results)
+        filter = memory_filter.apply(results)
         #print("filter: ", filter)
         return filter
 
@@ -433,8 +469,9 @@ class MemoryExtractionService:
         Returns:
             List[MemoryResponse]: A list of memories tagged with the "feedback" topic.
         """
-        results = self.vector_search(query_str, self.limit)
+        memory_filter = MemoryFilter().match("topics", "feedback")
+        results = self.vector_search(query_str, self.limit, memory_filter)
         
-        filtered_results = MemoryFilter().match("topics", "feedback").apply(results)
+        filtered_results = memory_filter.apply(results)
         
         return filtered_results
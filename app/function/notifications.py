@@ -8,7 +8,7 @@ from apscheduler.executors.pool import ThreadPoolExecutor
 from dotenv import load_dotenv
 from pywebpush import webpush, WebPushException
 from pydantic import BaseModel
-from supabase import create_client, Client
+from app.supabase.client import LazySupabaseClient
 from datetime import datetime, timezone
 import logging
 from dateutil import parser
@@ -32,10 +32,9 @@ VAPID_CLAIMS = {"sub": "mailto:your_email@example.com"}
 
 
 load_dotenv(override=True)
-SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase = LazySupabaseClient(SUPABASE_KEY)
 
 
 executors = {'default': ThreadPoolExecutor(5)}
@@ -11,8 +11,10 @@ from app.psychology.theory_planned_behavior import TheoryPlannedBehaviorService
 from app.psychology.intent_classification import IntentClassificationService
 from app.psychology.mbti_analysis import MBTIAnalysisService
 from app.psychology.ocean_analysis import OceanAnalysisService
-from app.supabase.conversation_history import Message, append_message_to_history, replace_conversation_history_with_summary
+from app.supabase.conversation_history import Message, append_message_to_history, get_history_length_async
 from app.supabase.knowledge_edges import get_connected_memories, pretty_print_memories
+from app.supabase.credit_ledger import credit_ledger
+from app.supabase.rolling_summary import summary_queue
 from app.supabase.profiles import ProfileRepository
 from app.supabase.user_feedback import UserFeedbackRepository
 from app.utils.moderation import ModerationService
@@ -96,8 +98,10 @@ async def chat_orchestration(user_id: str, user_input: str, summarize: int = 10,
     #      return error_stream
     
 
-    # Check if the user has enough credits.
-    credits = profile_repo.get_user_credit(user_id)
+    # Check if the user has enough credits (the ledger's view includes charges not yet flushed).
+    credits = credit_ledger.balance(user_id)
+    if credits is None:
+        credits = await credit_ledger.load(user_id)
     if credits is None or credits < 1:
         async def error_stream():
             yield json.dumps({"error": "NO_CREDITS"}) + "\n"
@@ -310,7 +314,7 @@ Response = "I'm here to help! What would you like to discuss or ask about?"
         tools=[WebSearchTool()]
     )
     
-    memory_agents.agent.tools = memory_agents.create_memory_tools(user_id)
+    memory_agent = memory_agents.create_memory_agent(user_id)
 
     convo_lead_agent = Agent(
         name=agent_name,
@@ -329,7 +333,7 @@ Response = "I'm here to help! What would you like to discuss or ask about?"
                 tool_name="web_search",
                 tool_description="Search the internet for the user's answer."
             ),
-            memory_agents.agent.as_tool(
+            memory_agent.as_tool(
                 tool_name="memory_search",
                 tool_description="Search your memories of the user for relevant information and context to make the conversation more meaningful."
             )
@@ -411,8 +415,8 @@ async def process_history(user_id: str, history: list[Message], summarize: int =
     provider_cost = calculate_provider_cost(user_input, ai_output)
     credits_cost = calculate_credits_to_deduct(provider_cost)
     
-    # deduct credits
-    profile_repo.deduct_credits(user_id, credits_cost)
+    # deduct credits (recorded locally, written to Supabase in the ledger's next batch)
+    credit_ledger.deduct(user_id, credits_cost)
     
     # costs = f"""
     # Provider Cost: {provider_cost}
@@ -420,8 +424,8 @@ async def process_history(user_id: str, history: list[Message], summarize: int =
     # """
     #logging.info(f"Costs: {costs}")
 
-    # replace history with summary
-    if len(history) >= summarize:
-        asyncio.create_task(replace_conversation_history_with_summary(user_id, extract))
+    # fold the oldest messages into the rolling summary; the folded messages are what gets analyzed (see fold_history)
+    if await get_history_length_async(user_id) > summarize:
+        summary_queue.schedule(user_id, summarize, extract=extract)
 
 
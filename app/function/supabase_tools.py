@@ -4,17 +4,18 @@ import logging
 from agents import function_tool
 from fastapi import HTTPException
 from app.personal_agents.knowledge_extraction import KnowledgeExtractionService
-from app.supabase.conversation_history import clear_conversation_history
-from app.supabase.profiles import ProfileRepository
-from app.supabase.user_feedback import UserFeedback, UserFeedbackRepository
+from app.supabase.conversation_history import clear_conversation_history_async
+from app.supabase.profiles import AsyncProfileRepository
+from app.supabase.user_feedback import AsyncUserFeedbackRepository, UserFeedback
 from app.utils.user_context import current_user_id
 
-profile_repo = ProfileRepository()
-user_feedback_repo = UserFeedbackRepository()
+# The tools run on the event loop, so they use the async repositories
+profile_repo = AsyncProfileRepository()
+user_feedback_repo = AsyncUserFeedbackRepository()
 
 
 @function_tool
-def get_users_name() -> str:
+async def get_users_name() -> str:
     """
     Retrieves the name of the user from the profile repository.
     
@@ -22,11 +23,11 @@ def get_users_name() -> str:
     - str: the name of the user
     """ 
     user_id = current_user_id.get()
-    return profile_repo.get_user_name(user_id)
+    return await profile_repo.get_user_name(user_id)
 
 
 @function_tool
-def get_user_birthdate() -> str:
+async def get_user_birthdate() -> str:
     """
     Retrieves the birthdate of the user from the profile repository.
 
@@ -34,11 +35,11 @@ def get_user_birthdate() -> str:
     - datetime.date: the birthdate of the user
     """
     user_id = current_user_id.get()
-    return profile_repo.get_user_birthdate(user_id)
+    return await profile_repo.get_user_birthdate(user_id)
 
 
 @function_tool
-def get_user_location() -> str:
+async def get_user_location() -> str:
     """
     Retrieves the location of the user from the profile repository.
     
@@ -46,11 +47,11 @@ def get_user_location() -> str:
     - str: the location of the user
     """
     user_id = current_user_id.get()
-    return profile_repo.get_user_location(user_id)
+    return await profile_repo.get_user_location(user_id)
 
 
 @function_tool
-def get_user_gender() -> str:
+async def get_user_gender() -> str:
     """
     Retrieves the gender of the user from the profile repository.
     
@@ -58,11 +59,11 @@ def get_user_gender() -> str:
     - str: the gender of the user
     """
     user_id = current_user_id.get()
-    return profile_repo.get_user_gender(user_id)
+    return await profile_repo.get_user_gender(user_id)
 
 
 @function_tool
-def update_user_name(name: str) -> bool:
+async def update_user_name(name: str) -> bool:
     """
     Updates the user's name in the profile repository.
 
@@ -74,11 +75,11 @@ def update_user_name(name: str) -> bool:
     """ 
     user_id = current_user_id.get()
     print(f"Updating user name to: {user_id} {name}")
-    return profile_repo.update_user_name(user_id, name)
+    return await profile_repo.update_user_name(user_id, name)
 
 
 @function_tool
-def update_user_birthdate(birthdate: str) -> bool:
+async def update_user_birthdate(birthdate: str) -> bool:
     """
     Updates the user's birthdate in the profile repository.
     
@@ -89,11 +90,11 @@ def update_user_birthdate(birthdate: str) -> bool:
     - bool: True if the update was successful, False otherwise.
     """
     user_id = current_user_id.get()
-    return profile_repo.update_user_birthdate(user_id, birthdate)
+    return await profile_repo.update_user_birthdate(user_id, birthdate)
 
 
 @function_tool
-def update_user_location(location: str) -> bool:
+async def update_user_location(location: str) -> bool:
     """
     Updates the user's location in the profile repository.
     
@@ -104,11 +105,11 @@ def update_user_location(location: str) -> bool:
     - bool: True if the update was successful, False otherwise.
     """
     user_id = current_user_id.get()
-    return profile_repo.update_user_location(user_id, location)
+    return await profile_repo.update_user_location(user_id, location)
 
 
 @function_tool
-def update_user_gender(gender: str) -> bool:
+async def update_user_gender(gender: str) -> bool:
     """
     Updates the user's gender in the profile repository.    
     
@@ -119,7 +120,7 @@ def update_user_gender(gender: str) -> bool:
     - bool: True if the update was successful, False otherwise.
     """
     user_id = current_user_id.get()
-    return profile_repo.update_user_gender(user_id, gender)
+    return await profile_repo.update_user_gender(user_id, gender)
 
 
 @function_tool
@@ -159,15 +160,15 @@ async def create_user_feedback(user_feedback: UserFeedback) -> str:
     """
     user_id = current_user_id.get()
     user_feedback.user_id = user_id
-    return user_feedback_repo.create_user_feedback(user_feedback)
+    return await user_feedback_repo.create_user_feedback(user_feedback)
 
 
 @function_tool
-def clear_history():
+async def clear_history():
     """
     Clears the history for the user.
     """
     user_id = current_user_id.get()
-    return clear_conversation_history(user_id)
+    return await clear_conversation_history_async(user_id)
 
 #endregion
\ No newline at end of file
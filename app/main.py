@@ -3,6 +3,9 @@ from fastapi import FastAPI, HTTPException, Request, Depends
 import os
 from dotenv import load_dotenv
 from app.function.notifications import start_scheduler_once
+from app.function.analysis_jobs import analysis_worker
+from app.supabase.credit_ledger import credit_ledger
+from app.supabase.rolling_summary import summary_queue
 from app.websockets.routes.websockets_routes import router as ws_router
 
 # Load environment variables first before importing STRIPE_CONFIG
@@ -53,6 +56,16 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     start_scheduler_once()
+    credit_ledger.start()
+    analysis_worker.start()
+
+
+# Write out credit charges that have not been flushed yet and stop the background workers
+@app.on_event("shutdown")
+async def shutdown_event():
+    await credit_ledger.stop()
+    await summary_queue.stop()
+    await analysis_worker.stop()
 
 
 
@@ -124,8 +137,8 @@ from slowapi.util import get_remote_address
 from fastapi import FastAPI
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 from app.auth import verify_token
-from app.psychology.mbti_analysis import MBTIAnalysisService
-from app.psychology.ocean_analysis import OceanAnalysisService
+from app.supabase.supabase_mbti import AsyncMBTIRepository
+from app.supabase.supabase_ocean import AsyncOceanRepository
 
 
 limiter = Limiter(key_func=get_remote_address)
@@ -136,8 +149,7 @@ app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])  # Change * to yo
 
 @app.get("/mbti", dependencies=[Depends(limiter.limit("50 per minute"))], include_in_schema=False)
 async def get_mbti(user_id: str = Depends(verify_token)):
-    service = MBTIAnalysisService(user_id)
-    mbti_data = service.repository.get_mbti(user_id)
+    mbti_data = await AsyncMBTIRepository().get_mbti(user_id)
 
     if mbti_data:
         return mbti_data.model_dump()
@@ -147,8 +159,7 @@ async def get_mbti(user_id: str = Depends(verify_token)):
     
 @app.get("/ocean", dependencies=[Depends(limiter.limit("50 per minute"))], include_in_schema=False)
 async def get_ocean(user_id: str = Depends(verify_token)):
-    service = OceanAnalysisService(user_id)
-    ocean_data = service.repository.get_ocean(user_id)
+    ocean_data = await AsyncOceanRepository().get_ocean(user_id)
 
     if ocean_data:
         return ocean_data.model_dump()
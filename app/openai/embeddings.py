@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from openai import AsyncOpenAI
+
+from app.utils.embedding_cache import normalize_text
+
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Concurrent embedding requests are grouped into one API call of at most this many inputs
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# How long the first queued text waits for others before its batch is sent
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10"))
+
+
+class EmbeddingBackend:
+    """
+    Turns a list of texts into a list of embeddings, in the same order.
+    """
+    model: str = EMBEDDING_MODEL
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    def __init__(self, model: str = EMBEDDING_MODEL, client: Optional[AsyncOpenAI] = None):
+        self.model = model
+        self._client = client
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # created lazily so importing this module does not require an API key
+        if self._client is None:
+            self._client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self._client
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        response = await self.client.embeddings.create(model=self.model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class FakeEmbeddingBackend(EmbeddingBackend):
+    """
+    Offline backend for tests and benchmarks. Vectors are seeded from the text hash so the same
+    text always gets the same embedding. Latency is modelled as a fixed cost per request plus a
+    small cost per input, with an optional cap on concurrent requests (like an HTTP pool).
+    """
+    def __init__(self, dim: int = 1536, latency: float = 0.0, per_item_latency: float = 0.0, max_concurrency: Optional[int] = None):
+        self.model = "fake-embedding"
+        self.dim = dim
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.requests = 0
+        self.texts = 0
+
+    def vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32).tolist()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if self.max_concurrency and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        if self._semaphore:
+            async with self._semaphore:
+                return await self._embed(texts)
+        return await self._embed(texts)
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        self.texts += len(texts)
+        delay = self.latency + self.per_item_latency * len(texts)
+        if delay:
+            await asyncio.sleep(delay)
+        return [self.vector(text) for text in texts]
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching queue in front of an EmbeddingBackend.
+
+    Callers await embed(text). Texts submitted while a batch is filling are sent together as
+    a single `input=[...]` request once max_batch_size is reached or max_wait_ms has passed,
+    and each caller's future is resolved with its own vector. A text that is already queued
+    or in flight is not sent twice; later callers share the first caller's future.
+    Failed requests resolve to None, matching generate_embedding.
+    """
+    def __init__(self, backend: EmbeddingBackend, max_batch_size: int = EMBEDDING_BATCH_SIZE, max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.failures = 0
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # futures cannot cross event loops; start clean on a new one
+            self._loop = loop
+            self._pending = {}
+            self._in_flight = {}
+            self._timer = None
+        return loop
+
+    async def embed(self, text: str) -> Optional[List[float]]:
+        loop = self._bind_loop()
+        self.submitted += 1
+        key = normalize_text(text)
+
+        future = self._in_flight.get(key)
+        if future is None and key in self._pending:
+            future = self._pending[key][1]
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = loop.create_future()
+        self._pending[key] = (text, future)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await asyncio.shield(future)
+
+    async def embed_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch = dict(list(self._pending.items())[:self.max_batch_size])
+        for key in batch:
+            del self._pending[key]
+        for key, (_, future) in batch.items():
+            self._in_flight[key] = future
+
+        task = self._loop.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        if self._pending:
+            self._timer = self._loop.call_later(self.max_wait, self._flush)
+
+    async def _send(self, batch: Dict[str, Tuple[str, asyncio.Future]]) -> None:
+        self.batches += 1
+        texts = [text for text, _ in batch.values()]
+        try:
+            vectors = await self.backend.embed(texts)
+        except Exception as e:
+            logging.error(f"Error generating {len(texts)} batched embeddings: {e}")
+            self.failures += 1
+            vectors = [None] * len(texts)
+
+        results = dict(zip(batch, vectors))
+        for key in batch:
+            future = self._in_flight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(results.get(key))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "failures": self.failures,
+            "pending": len(self._pending),
+            "in_flight": len(self._in_flight),
+        }
+
+
+# Process-wide batcher used by generate_embedding_async
+embedding_batcher = EmbeddingBatcher(OpenAIEmbeddingBackend())
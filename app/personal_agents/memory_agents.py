@@ -367,3 +367,11 @@ def create_memory_tools(user_id: str):
         topics,
         feedback,
     ]
+
+
+def create_memory_agent(user_id: str) -> Agent:
+    """
+    A copy of the memory agent with its tools bound to user_id.
+    The module-level agent is left untouched so it can be shared between users.
+    """
+    return agent.clone(tools=create_memory_tools(user_id))
@@ -44,19 +44,29 @@ If none of these match, fall back to a **custom goal**.
 service = MultistepService()
 
 
-@function_tool
-def start_multistep(goal: str, flow_id: str):
-    print(f"Multistep Agent started: {goal}, {flow_id}")
-    return service.start(goal, flow_id)
+def create_multistep_tools(service: MultistepService):
+    @function_tool
+    async def start_multistep(goal: str, flow_id: str):
+        print(f"Multistep Agent started: {goal}, {flow_id}")
+        return await service.start(goal, flow_id)
+
+    @function_tool
+    async def abort_multistep():
+        return await service.abort()
+
+    return [start_multistep, abort_multistep]
 
-@function_tool
-def abort_multistep():
-    return service.abort()
 
 multistep_agent = Agent(
     name="Multistep Agent",
     instructions=multistep_instructions,
     model="gpt-4o-mini",
-    tools=[start_multistep, abort_multistep],
+    tools=create_multistep_tools(service),
 )
 
+
+def create_multistep_agent(service: MultistepService) -> Agent:
+    """
+    A copy of the multistep agent whose tools act on the given (per-session) service.
+    """
+    return multistep_agent.clone(tools=create_multistep_tools(service))
@@ -2,7 +2,7 @@ from datetime import datetime
 import logging
 from typing import List, Optional, cast
 from agents import Agent, Runner
-from app.supabase.pgvector import find_similar_slang, store_user_slang
+from app.supabase.pgvector import find_similar_slang, find_similar_slang_async, store_user_slang_async
 from pydantic import BaseModel
 
 
@@ -78,28 +78,40 @@ class SlangExtractionService:
 
     async def extract_slang(self, message: str) -> Optional[SlangResult]:
         try:
-            slang_result = await Runner.run(self.extraction_agent, message)
-            result : SlangResult = cast(SlangResult, slang_result.final_output)
-                        
-            logging.info(f"Extracted slang: {result}")
-            
-            if result.metadata.score.value_score < 0.3:
-                logging.info("Extracted slang is not valuable enough to store.")
-                return None
-            
-            result.metadata.timestamp = self.get_timestamp()
-            await self.store_slang(result)
-            
-            return result
+            return await self.extract(message)
         except Exception as e:
             logging.error(f"Error extracting slang: {e}")
             return None
 
+    async def extract(self, message: str) -> Optional[SlangResult]:
+        """
+        Like extract_slang, but raises if the extraction fails, so a queued job is retried.
+        Returns None when the slang is not valuable enough to keep.
+        """
+        slang_result = await Runner.run(self.extraction_agent, message)
+        result: SlangResult = cast(SlangResult, slang_result.final_output)
+        logging.info(f"Extracted slang: {result}")
+        return await self.keep_slang(result)
+
+    async def keep_slang(self, result: SlangResult) -> Optional[SlangResult]:
+        """
+        Stores extracted slang (from extract_slang or the combined analysis) if it is
+        valuable enough.
+        """
+        if result.metadata.score.value_score < 0.3:
+            logging.info("Extracted slang is not valuable enough to store.")
+            return None
+        
+        result.metadata.timestamp = self.get_timestamp()
+        await self.store_slang(result)
+        
+        return result
+
     async def store_slang(self, slang: SlangResult):
         """
         Store extracted slang in the vector store using a similar function to your knowledge extraction.
         """
-        store_user_slang(self.user_id, slang.slang_text, slang.metadata.model_dump())
+        await store_user_slang_async(self.user_id, slang.slang_text, slang.metadata.model_dump())
 
     def retrieve_similar_slang(self, query: str, top_k: int = 2) -> List[SlangRetrieval]:
         """
@@ -115,6 +127,20 @@ class SlangExtractionService:
         
         return []
 
+    async def retrieve_similar_slang_async(self, query: str, top_k: int = 2) -> List[SlangRetrieval]:
+        """
+        retrieve_similar_slang for code running on the event loop.
+        """
+        try:
+            slangs = await find_similar_slang_async(self.user_id, query, top_k)
+
+            if slangs and len(slangs) > 0:
+                return [SlangRetrieval.from_raw_data(slang) for slang in slangs]
+        except Exception as e:
+            logging.error(f"Error retrieving slang: {e}")
+
+        return []
+
     # TODO: Add a pretty print function for the slang results
     def pretty_print_slang_result(self, slangs: List[SlangRetrieval]) -> str:
         if not slangs:
@@ -0,0 +1,97 @@
+# app/psychology/combined_analysis.py
+import asyncio
+import logging
+from typing import Optional
+
+from agents import Agent, Runner
+from pydantic import BaseModel
+
+from app.function import memory_extraction
+from app.function.memory_extraction import MemoryExtractionService, MemoryMetadata
+from app.personal_agents import slang_extraction
+from app.personal_agents.slang_extraction import SlangExtractionService, SlangResult
+from app.psychology import mbti_analysis, ocean_analysis
+from app.psychology.mbti_analysis import MBTIAnalysisService, MBTIResponse
+from app.psychology.ocean_analysis import OceanAnalysisService, OceanResponse
+
+
+logging.basicConfig(level=logging.INFO)
+
+
+class CombinedAnalysisResponse(BaseModel):
+    mbti: MBTIResponse
+    ocean: OceanResponse
+    memory: MemoryMetadata
+    slang: SlangResult
+
+
+# The four analyses' own instructions, one section each, so both modes score the same way
+instructions = f"""
+You analyze one conversation between a user and their AI companion (Noelle) in four ways at
+once and return all four results together. Follow each section's instructions for its field.
+
+# mbti
+{mbti_analysis.instructions}
+
+# ocean
+{ocean_analysis.instructions}
+
+# memory
+{memory_extraction.instructions}
+
+# slang
+{slang_extraction.instructions}
+"""
+
+
+combined_agent = Agent(
+    name="CombinedAnalysis",
+    handoff_description="An agent that runs the MBTI, OCEAN, memory and slang analyses of a conversation in one pass.",
+    instructions=instructions,
+    model="gpt-4o-mini",
+    output_type=CombinedAnalysisResponse,
+)
+
+
+class CombinedAnalysisService:
+    """
+    Runs the MBTI, OCEAN, memory and slang analyses of a transcript with one model call
+    (the transcript is sent once instead of four times), then hands each result to the
+    service that would have produced it, which updates its rolling average or store.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+
+    async def analyze_message(self, message: str) -> Optional[CombinedAnalysisResponse]:
+        try:
+            return await self.analyze(message)
+        except Exception as e:
+            logging.error(f"Error in combined analysis: {e}")
+            return None
+
+    async def analyze(self, message: str) -> CombinedAnalysisResponse:
+        """
+        Like analyze_message, but raises if the model call fails, so a queued job is retried.
+        Once the model has answered, a result that fails to store is only logged: retrying
+        would count the others in their rolling averages twice.
+        """
+        result = await Runner.run(combined_agent, message)
+        analysis = CombinedAnalysisResponse(**result.final_output.model_dump())
+        logging.info(f"Combined analysis result: {analysis}")
+
+        mbti_service, ocean_service = await asyncio.gather(
+            MBTIAnalysisService.create(self.user_id),
+            OceanAnalysisService.create(self.user_id),
+        )
+        outcomes = await asyncio.gather(
+            mbti_service.apply_result(analysis.mbti),
+            ocean_service.apply_result(analysis.ocean),
+            MemoryExtractionService(self.user_id).keep_memory(analysis.memory),
+            SlangExtractionService(self.user_id).keep_slang(analysis.slang),
+            return_exceptions=True,
+        )
+        for name, outcome in zip(("MBTI", "OCEAN", "memory", "slang"), outcomes):
+            if isinstance(outcome, Exception):
+                logging.error(f"Error storing the combined {name} result for user {self.user_id}: {outcome}")
+        return analysis
@@ -1,6 +1,7 @@
 import logging
 from pydantic import BaseModel
-from app.supabase.supabase_mbti import MBTI, MBTIRepository
+from typing import Optional
+from app.supabase.supabase_mbti import MBTI, AsyncMBTIRepository, MBTIRepository
 from agents import Agent, Runner
 
 
@@ -69,11 +70,22 @@ class MBTIAnalysisService:
     Service class that coordinates MBTI data retrieval, analysis, and updates.
     """
 
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, mbti: Optional[MBTI] = None):
         self.user_id = user_id
         self.repository = MBTIRepository()
-        self.mbti = self.mbti = self.repository.get_mbti(self.user_id) or MBTI()  # default
-        self.load_mbti()
+        self.async_repository = AsyncMBTIRepository()
+        if mbti is None:
+            mbti = self.repository.get_mbti(self.user_id)
+        self.mbti = mbti or MBTI()  # default
+
+    @classmethod
+    async def create(cls, user_id: str) -> "MBTIAnalysisService":
+        """
+        Builds the service from code running on the event loop, loading the MBTI data with
+        the async repository.
+        """
+        mbti = await AsyncMBTIRepository().get_mbti(user_id)
+        return cls(user_id, mbti=mbti or MBTI())
 
     def load_mbti(self):
         """
@@ -92,26 +104,35 @@ class MBTIAnalysisService:
         """
         self.repository.upsert_mbti(self.user_id, self.mbti)
 
+    async def save_mbti_async(self):
+        await self.async_repository.upsert_mbti(self.user_id, self.mbti)
+
     async def analyze_message(self, message: str):
         """
         Asynchronously calls your model/agent to analyze the user's message.
         """
         try:
-            mbti_result = await Runner.run(mbti_agent, message)
-                        
-            # Update the rolling average
-            self._update_mbti_rolling_average(MBTIResponse(**mbti_result.final_output.dict()))
-            
-            # Save the updated MBTI data to Supabase
-            self.save_mbti()
-            
-            logging.info(f"MBTI result: {mbti_result}")
-                        
-            return mbti_result.final_output
-            
+            return await self.analyze(message)
         except Exception as e:
             logging.error(f"Error in MBTI analysis: {e}")
             return None  # Return None to indicate analysis failed
+
+    async def analyze(self, message: str) -> MBTIResponse:
+        """
+        Like analyze_message, but raises if the analysis fails, so a queued job is retried.
+        """
+        mbti_result = await Runner.run(mbti_agent, message)
+        logging.info(f"MBTI result: {mbti_result}")
+        return await self.apply_result(MBTIResponse(**mbti_result.final_output.model_dump()))
+
+    async def apply_result(self, mbti_result: MBTIResponse) -> MBTIResponse:
+        """
+        Folds an analysis result (from analyze_message or the combined analysis) into the
+        rolling average and saves it.
+        """
+        self._update_mbti_rolling_average(mbti_result)
+        await self.save_mbti_async()
+        return mbti_result
     
 
     def _update_mbti_rolling_average(self, new_mbti: MBTIResponse):
@@ -2,7 +2,7 @@ from typing import Literal, Optional, List
 from pydantic import BaseModel
 from agents import Agent, RunResultStreaming, Runner
 
-from app.websockets.context.store import delete_context_key, update_context
+from app.websockets.context.store import delete_context_key_async, update_context_async
 
 
 class FlowStep(BaseModel):
@@ -233,7 +233,7 @@ class MultistepService:
         else:
             raise ValueError(f"Flow {flow_id} not found")
 
-    def start(self, goal: Optional[str] = None, flow_id: Optional[str] = None) -> Multistep:
+    async def start(self, goal: Optional[str] = None, flow_id: Optional[str] = None) -> Multistep:
         
         if flow_id is not None:
             flow = self.get_flow(flow_id)
@@ -258,7 +258,7 @@ class MultistepService:
             previous_steps=previous_steps
         )
 
-        update_context(self.user_id, "multistep", self.multistep)
+        await update_context_async(self.user_id, "multistep", self.multistep)
         
         print(f"Multistep started: {self.multistep}")
         return self.multistep
@@ -311,12 +311,12 @@ The user just replied: "{self.multistep.previous_steps[-1].content}".
         self.multistep.reason = judgement.reason
         self.multistep.previous_steps.append(MultistepMessage(role="user", content=user_input))
 
-        self.advance(judgement)
+        await self.advance(judgement)
 
         print(f"Multistep judged: {self.multistep}")
         return self.multistep
 
-    def advance(self, judgement: MultistepJudgement) -> Multistep:
+    async def advance(self, judgement: MultistepJudgement) -> Multistep:
         if judgement.advance:
             self.multistep.step_index += 1
         
@@ -325,30 +325,30 @@ The user just replied: "{self.multistep.previous_steps[-1].content}".
             if self.multistep.step_index < len(flow.steps):
                 self.multistep.content = flow.steps[self.multistep.step_index].content
             else:
-                self.finish()
+                await self.finish()
         
         self.update_prompt()
         
-        update_context(self.user_id, "multistep", self.multistep)
+        await update_context_async(self.user_id, "multistep", self.multistep)
         
         print(f"Multistep advanced: {self.multistep}")
         return self.multistep
 
-    def abort(self) -> Multistep:
+    async def abort(self) -> Multistep:
         self.multistep.done = True
         self.multistep.content = f"Flow {self.multistep.flow_id} aborted."
         
         #update_context(self.user_id, "multistep", self.multistep)
-        delete_context_key(self.user_id, "multistep")
+        await delete_context_key_async(self.user_id, "multistep")
         
         print(f"Multistep aborted: {self.multistep}")
         return self.multistep
 
-    def finish(self) -> Multistep:
+    async def finish(self) -> Multistep:
         self.multistep.done = True
         self.multistep.content = f"Flow {self.multistep.flow_id} completed."
         
-        update_context(self.user_id, "multistep", self.multistep)
+        await update_context_async(self.user_id, "multistep", self.multistep)
         
         print(f"Multistep finished: {self.multistep}")
         # TODO: DO other things like extract knowledge from the flow
@@ -1,7 +1,8 @@
 from pydantic import BaseModel
 from agents import Agent, Runner
 import logging
-from app.supabase.supabase_ocean import Ocean, OceanRepository
+from typing import Optional
+from app.supabase.supabase_ocean import AsyncOceanRepository, Ocean, OceanRepository
 
     
 logging.basicConfig(level=logging.INFO)
@@ -70,11 +71,22 @@ ocean_agent = Agent(
 )
 
 class OceanAnalysisService:
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, ocean: Optional[Ocean] = None):
         self.user_id = user_id
         self.repository = OceanRepository()
-        self.ocean = self.repository.get_ocean(self.user_id) or Ocean()
-        self.load_ocean()
+        self.async_repository = AsyncOceanRepository()
+        if ocean is None:
+            ocean = self.repository.get_ocean(self.user_id)
+        self.ocean = ocean or Ocean()
+
+    @classmethod
+    async def create(cls, user_id: str) -> "OceanAnalysisService":
+        """
+        Builds the service from code running on the event loop, loading the OCEAN data with
+        the async repository.
+        """
+        ocean = await AsyncOceanRepository().get_ocean(user_id)
+        return cls(user_id, ocean=ocean or Ocean())
 
     def load_ocean(self) -> Ocean:
         stored_ocean = self.repository.get_ocean(self.user_id)
@@ -88,23 +100,33 @@ class OceanAnalysisService:
     def save_ocean(self):
         self.repository.upsert_ocean(self.user_id, self.ocean)
 
+    async def save_ocean_async(self):
+        await self.async_repository.upsert_ocean(self.user_id, self.ocean)
+
     async def analyze_message(self, message: str):
         try:
-            ocean_result = await Runner.run(ocean_agent, message)
-            logging.info(f"OCEAN result: {ocean_result}")
-                    
-            # Update rolling average
-            self.update_ocean_rolling_average(OceanResponse(**ocean_result.final_output.dict()))
-            
-            # Save the updated OCEAN data to Supabase
-            self.save_ocean()
-            
-            return ocean_result.final_output
-            
+            return await self.analyze(message)
         except Exception as e:
             logging.error(f"Error in OCEAN analysis: {e}")
             return None  # Return None to indicate analysis failed
 
+    async def analyze(self, message: str) -> OceanResponse:
+        """
+        Like analyze_message, but raises if the analysis fails, so a queued job is retried.
+        """
+        ocean_result = await Runner.run(ocean_agent, message)
+        logging.info(f"OCEAN result: {ocean_result}")
+        return await self.apply_result(OceanResponse(**ocean_result.final_output.model_dump()))
+
+    async def apply_result(self, ocean_result: OceanResponse) -> OceanResponse:
+        """
+        Folds an analysis result (from analyze_message or the combined analysis) into the
+        rolling average and saves it.
+        """
+        self.update_ocean_rolling_average(ocean_result)
+        await self.save_ocean_async()
+        return ocean_result
+
     def update_ocean_rolling_average(self, new_ocean: OceanResponse):
         old_count = self.ocean.response_count
         new_count = old_count + 1
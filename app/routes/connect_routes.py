@@ -8,10 +8,10 @@ from app.auth import verify_token
 from app.function.memory_extraction import MemoryExtractionService
 from app.psychology.mbti_analysis import MBTIAnalysisService
 from app.psychology.ocean_analysis import OceanAnalysisService
-from app.supabase.knowledge_edges import get_connected_memories
-from app.supabase.profiles import ProfileRepository
+from app.supabase.knowledge_edges import get_connected_memories_async
+from app.supabase.profiles import AsyncProfileRepository
 from app.utils.geocode import reverse_geocode
-from app.websockets.context.store import get_context
+from app.websockets.context.store import get_context_async
 
 
 # get connect server url from env
@@ -77,30 +77,30 @@ async def generate_connect_profile(user_id: str = Depends(verify_token)) -> Conn
 
 
     # Initialize services
-    profile_service = ProfileRepository()
-    mbti_service = MBTIAnalysisService(user_id)
-    ocean_service = OceanAnalysisService(user_id)
+    profile_service = AsyncProfileRepository()
+    mbti_service = await MBTIAnalysisService.create(user_id)
+    ocean_service = await OceanAnalysisService.create(user_id)
     memory_service = MemoryExtractionService(user_id)
     
     mbti_type = mbti_service.get_mbti_type()   
     ocean_traits = ocean_service.get_pretty_print_ocean_format()
-    user_name = profile_service.get_user_name(user_id)
+    user_name = await profile_service.get_user_name(user_id)
 
     # Get location from context
-    context = get_context(user_id)
+    context = await get_context_async(user_id)
     location = context.get("gps")
     location_name = ""
     if location:
         location_name = await reverse_geocode(location['latitude'], location['longitude'])
 
     relationship_goals = memory_service.vector_search("What are the user's relationship goals and what they are looking for in a relationship?", limit=2)
-    relationship_goals_context = get_connected_memories(user_id, relationship_goals[0]['id'])
+    relationship_goals_context = await get_connected_memories_async(user_id, relationship_goals[0]['id'])
 
     personality_desc = memory_service.vector_search("Describe the user's personality in detail?", limit=2)
-    personality_desc_context = get_connected_memories(user_id, personality_desc[0]['id'])
+    personality_desc_context = await get_connected_memories_async(user_id, personality_desc[0]['id'])
 
     sexual_preferences = memory_service.vector_search("What are the user's gender oreintation and what gender are they interested in having a romantic relationship with?", limit=2)
-    sexual_preferences_context = get_connected_memories(user_id, sexual_preferences[0]['id'])
+    sexual_preferences_context = await get_connected_memories_async(user_id, sexual_preferences[0]['id'])
 
     about_the_user = f"""
     Using the following information, generate a user profile for the user:
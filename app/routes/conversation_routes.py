@@ -3,7 +3,7 @@ from typing import List
 
 from fastapi.params import Depends
 from app.auth import verify_token
-from app.supabase.conversation_history import get_or_create_conversation_history, Message
+from app.supabase.conversation_history import get_or_create_conversation_history_async, Message
 
 # Initialize the router
 router = APIRouter()
@@ -19,7 +19,7 @@ async def get_conversation_history_route(user_id=Depends(verify_token)):
     """
     try:
         user_id = user_id["id"]
-        history = get_or_create_conversation_history(user_id)
+        history = await get_or_create_conversation_history_async(user_id)
         # The function now returns list[Message] objects
         return history
     except Exception as e:
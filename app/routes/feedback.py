@@ -10,13 +10,13 @@ from fastapi import Depends
 from pydantic import BaseModel
 from app.auth import verify_token
 from app.function.memory_extraction import MemoryExtractionService, MemoryMetadata
-from app.supabase.conversation_history import get_or_create_conversation_history
-from app.supabase.user_feedback import UserFeedback, UserFeedbackRepository
+from app.supabase.conversation_history import get_or_create_conversation_history_async
+from app.supabase.user_feedback import AsyncUserFeedbackRepository, UserFeedback
 
 
 
 router = APIRouter()
-user_feedback_repo = UserFeedbackRepository()
+user_feedback_repo = AsyncUserFeedbackRepository()
 
     
 class FeedbackRequest(BaseModel):
@@ -37,7 +37,7 @@ async def create_user_feedback(feedback: FeedbackRequest, user=Depends(verify_to
     user_id = user["id"]
     
     sentiment = await Runner.run(sentiment_agent, feedback.feedback)
-    history = get_or_create_conversation_history(user_id)
+    history = await get_or_create_conversation_history_async(user_id)
     summary = history[0].content
         
     user_feedback = UserFeedback(
@@ -47,7 +47,7 @@ async def create_user_feedback(feedback: FeedbackRequest, user=Depends(verify_to
         sentiment=sentiment.final_output 
     )
     
-    return user_feedback_repo.create_user_feedback(user_feedback)
+    return await user_feedback_repo.create_user_feedback(user_feedback)
 
 
 @router.post("/store-feedback-memory")
@@ -1,9 +1,50 @@
 from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 
+from app.function.analysis_jobs import analysis_stats
+from app.openai.embeddings import embedding_batcher
+from app.supabase.client import pool_stats
+from app.supabase.credit_ledger import credit_ledger
+from app.supabase.profiles import profile_cache
+from app.supabase.rolling_summary import summary_queue
+from app.utils.embedding_cache import embedding_cache
+from app.utils.token_accounting import token_usage_stats
+from app.websockets.context.store import context_store
+from app.websockets.context_pipeline import context_pipeline_stats
+from app.websockets.delta_stream import stream_stats
+from app.websockets.dispatcher import dispatch_stats
+from app.websockets.prompt_assembler import prompt_stats
+from app.websockets.speculative import speculation_stats
+
 health_check_router = APIRouter()
 
 
 @health_check_router.get("/")
 async def health_check():
     return JSONResponse(content={"status": "I am Alive!"}, status_code=200)
+
+
+@health_check_router.get("/metrics")
+async def metrics():
+    """
+    Process-level cache and pool counters.
+    """
+    # the analysis queue is a SQLite file; read it off the event loop
+    analysis_queue = await run_in_threadpool(analysis_stats)
+    return JSONResponse(content={
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_batcher": embedding_batcher.stats(),
+        "context_pipeline": context_pipeline_stats.stats(),
+        "speculative_response": speculation_stats.stats(),
+        "prompt": prompt_stats.stats(),
+        "context_store": await context_store.run(context_store.stats),
+        "websocket_dispatch": dispatch_stats.stats(),
+        "response_stream": stream_stats.stats(),
+        "profile_cache": profile_cache.stats(),
+        "supabase_pool": pool_stats.stats(),
+        "credit_ledger": credit_ledger.stats(),
+        "summary_queue": summary_queue.stats(),
+        "analysis_queue": analysis_queue,
+        "token_usage": token_usage_stats.stats(),
+    }, status_code=200)
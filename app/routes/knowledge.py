@@ -42,8 +42,8 @@ def retrieve_knowledge(query: KnowledgeRequest, user=Depends(verify_token)):
     """
     user_id = user["id"]
     
-    # Convert the history to a string for similarity search
-    history_string = query.model_dump()
+    # Convert the history to a string for similarity search (plain text so the embedding cache can key it)
+    history_string = "\n".join([f"{msg.role}: {msg.content}" for msg in query.history])
     
     # Instantiate the KnowledgeExtractionService
     knowledge_service = KnowledgeExtractionService(user_id)
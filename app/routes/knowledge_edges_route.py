@@ -3,7 +3,7 @@ from fastapi import APIRouter
 from typing import Optional
 from uuid import UUID
 
-from app.supabase.knowledge_edges import get_connected_memories
+from app.supabase.knowledge_edges import get_connected_memories_async
 
 
 
@@ -28,5 +28,5 @@ async def related_memories(
     - List of memory records from user_knowledge
     """
     #user_id = user["id"]
-    results = get_connected_memories(user_id, source_id, relation_type, min_score)
+    results = await get_connected_memories_async(user_id, source_id, relation_type, min_score)
     return results
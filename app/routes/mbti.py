@@ -1,4 +1,4 @@
-from app.supabase.supabase_mbti import MBTI
+from app.supabase.supabase_mbti import MBTI, AsyncMBTIRepository
 from fastapi import APIRouter, Depends
 from app.psychology.mbti_analysis import MBTIAnalysisService
 from pydantic import BaseModel
@@ -44,7 +44,7 @@ async def mbti_analyze(data: MBTIRequest, user=Depends(verify_token)):
     history_string = "\n".join([f"{msg.role}: {msg.content}" for msg in user_messages])
     
     # Create a new analysis service for this user
-    service = MBTIAnalysisService(user_id)
+    service = await MBTIAnalysisService.create(user_id)
     # Perform the analysis
     await service.analyze_message(history_string)
 
@@ -61,8 +61,8 @@ async def mbti_analyze(data: MBTIRequest, user=Depends(verify_token)):
 @router.get("/get-mbti")
 async def get_mbti(user=Depends(verify_token)) -> MBTIUpdateResponse:
     user_id = user["id"] 
-    service = MBTIAnalysisService(user_id)
-    mbti_data = service.repository.get_mbti(user_id)
+    service = await MBTIAnalysisService.create(user_id)
+    mbti_data = service.mbti
     
     mbti_response = MBTIUpdateResponse(
         type=service.get_mbti_type(),
@@ -88,7 +88,7 @@ async def update_mbti(data: MBTIUpdateRequest, user=Depends(verify_token)):
     user_id =  user_id = user["id"] 
 
     # Initialize the MBTI Analysis Service
-    service = MBTIAnalysisService(user_id)
+    service = await MBTIAnalysisService.create(user_id)
 
     # Construct a new MBTI object with the incoming data
     new_mbti = MBTI(
@@ -103,7 +103,7 @@ async def update_mbti(data: MBTIUpdateRequest, user=Depends(verify_token)):
     service._update_mbti_rolling_average(new_mbti)
 
     # Save the updated MBTI data to Supabase
-    service.save_mbti()
+    await service.save_mbti_async()
 
     return {
         "message": "MBTI data updated successfully",
@@ -114,7 +114,7 @@ async def update_mbti(data: MBTIUpdateRequest, user=Depends(verify_token)):
 @router.get("/mbti-type")
 async def get_mbti_type(user=Depends(verify_token)):
     user_id =  user_id = user["id"] 
-    service = MBTIAnalysisService(user_id)
+    service = await MBTIAnalysisService.create(user_id)
     mbti_type = service.get_mbti_type()
     return {"mbti_type": mbti_type}
 
@@ -122,7 +122,6 @@ async def get_mbti_type(user=Depends(verify_token)):
 @router.post("/reset-mbti")
 async def reset_mbti(user=Depends(verify_token)):
     user_id = user["id"]
-    service = MBTIAnalysisService(user_id)
-    service.repository.reset_mbti(user_id)
+    await AsyncMBTIRepository().reset_mbti(user_id)
     return {"message": "MBTI data reset successfully"}
 
@@ -1,5 +1,5 @@
 from app.auth import verify_token
-from app.supabase.supabase_ocean import Ocean
+from app.supabase.supabase_ocean import AsyncOceanRepository, Ocean
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from app.psychology.ocean_analysis import OceanAnalysisService
@@ -31,7 +31,7 @@ async def ocean_analyze(data: OceanRequest, user=Depends(verify_token)):
     history_string = "\n".join([f"{msg.role}: {msg.content}" for msg in user_messages])
 
     # Create a new analysis service for this user
-    service = OceanAnalysisService(user_id)
+    service = await OceanAnalysisService.create(user_id)
     # Perform the analysis
     await service.analyze_message(history_string)
 
@@ -47,8 +47,7 @@ async def ocean_analyze(data: OceanRequest, user=Depends(verify_token)):
 @router.get("/get-ocean")
 async def get_ocean(user=Depends(verify_token)) -> Ocean:
     user_id = user["id"]
-    service = OceanAnalysisService(user_id)
-    ocean_data = service.repository.get_ocean(user_id)
+    ocean_data = await AsyncOceanRepository().get_ocean(user_id)
     
     if ocean_data:
         return ocean_data
@@ -65,7 +64,7 @@ async def update_ocean(data: OceanUpdateRequest, user=Depends(verify_token)):
     user_id = user["id"]
 
     # Initialize the OCEAN Analysis Service
-    service = OceanAnalysisService(user_id)
+    service = await OceanAnalysisService.create(user_id)
 
     # Construct a new Ocean object with the incoming data
     new_ocean = Ocean(
@@ -81,7 +80,7 @@ async def update_ocean(data: OceanUpdateRequest, user=Depends(verify_token)):
     service._update_ocean_rolling_average(new_ocean)
 
     # Save the updated OCEAN data to Supabase
-    service.save_ocean()
+    await service.save_ocean_async()
 
     return {
         "message": "OCEAN data updated successfully",
@@ -92,7 +91,7 @@ async def update_ocean(data: OceanUpdateRequest, user=Depends(verify_token)):
 @router.get("/ocean-traits")
 async def get_ocean_traits(user=Depends(verify_token)):
     user_id = user["id"]
-    service = OceanAnalysisService(user_id)
+    service = await OceanAnalysisService.create(user_id)
     traits = service.get_personality_traits()
     return {
         "personality_traits": traits,
@@ -102,14 +101,13 @@ async def get_ocean_traits(user=Depends(verify_token)):
 
 @router.get("/ocean-pretty-print")
 async def get_ocean_pretty_print(user : str):
-    service = OceanAnalysisService(user)
+    service = await OceanAnalysisService.create(user)
     return service.get_pretty_print_ocean_format()
 
 
 @router.post("/reset-ocean")
 async def reset_ocean(user=Depends(verify_token)):
     user_id = user["id"]
-    service = OceanAnalysisService(user_id)
-    service.repository.reset_ocean(user_id)
+    await AsyncOceanRepository().reset_ocean(user_id)
     return {"message": "OCEAN data reset successfully"}
 
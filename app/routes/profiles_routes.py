@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, status
-from app.supabase.profiles import ProfileRepository
+from app.supabase.profiles import AsyncProfileRepository, ProfileRepository
 from app.auth import verify_token
 from fastapi.params import Depends
 from pydantic import BaseModel
@@ -26,8 +26,8 @@ async def get_user_credits_route(user_id=Depends(verify_token)):
     """
 
     user_id = user_id["id"]
-    repo = ProfileRepository()
-    credits = repo.get_user_credit(user_id)
+    repo = AsyncProfileRepository()
+    credits = await repo.get_user_credit(user_id)
     if credits is None:
         # This could mean the user doesn't exist or an error occurred fetching credits
         # The repository logs specific errors, here we return a generic not found
@@ -44,8 +44,8 @@ async def get_user_credits_used_route(user_id=Depends(verify_token)):
     """
 
     user_id = user_id["id"]
-    repo = ProfileRepository()
-    credits_used = repo.get_user_credits_used(user_id)
+    repo = AsyncProfileRepository()
+    credits_used = await repo.get_user_credits_used(user_id)
     if credits_used is None:
         # This could mean the user doesn't exist or an error occurred fetching credits
         # The repository logs specific errors, here we return a generic not found
@@ -62,8 +62,8 @@ async def get_user_profile_route(user_id=Depends(verify_token)):
     Retrieves the profile for a specific user.
     """
     user_id = user_id["id"]
-    repo = ProfileRepository()
-    profile = repo.get_profile(user_id)
+    repo = AsyncProfileRepository()
+    profile = await repo.get_profile(user_id)
     if profile is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -72,7 +72,7 @@ async def get_user_profile_route(user_id=Depends(verify_token)):
     return profile
 
 @router.delete("/delete_account")
-async def delete_user_account_route(user_id=Depends(verify_token)):
+def delete_user_account_route(user_id=Depends(verify_token)):
     """
     Deletes the user account from the profile record in Supabase.
     """
@@ -83,7 +83,7 @@ async def delete_user_account_route(user_id=Depends(verify_token)):
 
 
 @router.post("/send_password_reset")
-async def send_password_reset_route(password_reset_request: PasswordResetRequest):
+def send_password_reset_route(password_reset_request: PasswordResetRequest):
     """
     Sends a password reset email to the user.
     """
@@ -92,7 +92,7 @@ async def send_password_reset_route(password_reset_request: PasswordResetRequest
     return results
 
 @router.post("/change_password")
-async def update_password(request: UpdatePasswordRequest):
+def update_password(request: UpdatePasswordRequest):
     """
     Updates a user's password.
     
@@ -129,8 +129,8 @@ async def set_user_pilot(request: UserPilotRequest, user_id=Depends(verify_token
     Sets the user as a pilot or not.
     """
     user_id = user_id["id"]
-    repo = ProfileRepository()
-    results = repo.set_user_pilot(user_id=user_id, is_pilot=request.is_pilot)
+    repo = AsyncProfileRepository()
+    results = await repo.set_user_pilot(user_id=user_id, is_pilot=request.is_pilot)
     return results
 
 @router.get("/get_user_pilot")
@@ -139,8 +139,8 @@ async def get_pilot(user_id=Depends(verify_token)) -> bool:
     Gets if the user is opted in to the pilot program.
     """
     user_id = user_id["id"]
-    repo = ProfileRepository()
-    results = repo.get_user_pilot(user_id=user_id)
+    repo = AsyncProfileRepository()
+    results = await repo.get_user_pilot(user_id=user_id)
     return results
 
 @router.get("/get_user_unlocked_care")
@@ -149,8 +149,8 @@ async def get_user_unlocked_care(user_id=Depends(verify_token)) -> bool:
     Gets if the user has unlocked the care feature.
     """
     user_id = user_id["id"]
-    repo = ProfileRepository()
-    results = repo.get_user_unlocked_care(user_id=user_id)
+    repo = AsyncProfileRepository()
+    results = await repo.get_user_unlocked_care(user_id=user_id)
     return results
 
 @router.get("/get_user_unlocked_connect")
@@ -159,7 +159,7 @@ async def get_user_unlocked_connect(user_id=Depends(verify_token)) -> bool:
     Gets if the user has unlocked the connect feature.
     """
     user_id = user_id["id"]
-    repo = ProfileRepository()
-    results = repo.get_user_unlocked_connect(user_id=user_id)
+    repo = AsyncProfileRepository()
+    results = await repo.get_user_unlocked_connect(user_id=user_id)
     return results
 
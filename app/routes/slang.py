@@ -42,8 +42,8 @@ def retrieve_slang(query: SlangRequest, user=Depends(verify_token)):
     # Instantiate the SlangExtractionService
     slang_service = SlangExtractionService(user_id)
     
-    # Convert the history to a string for similarity search
-    history_string = query.model_dump()
+    # Convert the history to a string for similarity search (plain text so the embedding cache can key it)
+    history_string = "\n".join([f"{msg.role}: {msg.content}" for msg in query.history])
     
     # Find similar stored slang
     similar_slang = slang_service.retrieve_similar_slang(history_string, top_k=5)
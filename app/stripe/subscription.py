@@ -6,6 +6,7 @@ from fastapi import HTTPException, Request, Depends, APIRouter, Header
 from pydantic import BaseModel
 from app.stripe.stripe_config import STRIPE_CONFIG
 from app.auth import verify_token
+from app.supabase.credit_ledger import credit_ledger
 from app.supabase.profiles import ProfileRepository
 
 
@@ -205,7 +206,12 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
 
                 repo = ProfileRepository()
                 updated_sub = repo.update_user_subscription(user_id, tier)
+                # charges made before the renewal are written first so they don't come off the new balance.
+                # This only flushes this worker's ledger: charges still pending in other workers (at most
+                # CREDIT_FLUSH_INTERVAL_SECONDS old) are taken off the renewed balance when they flush.
+                await credit_ledger.flush()
                 updated_credits = repo.update_user_credit(user_id, credits)
+                await credit_ledger.reconcile(user_id, credits if updated_credits else None)
 
                 logging.info("✅ Supabase update response:", "updated_sub:", updated_sub, "updated_credits:", updated_credits)
             except Exception as e:
@@ -225,6 +231,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
                 repo = ProfileRepository()
                 # For one-time purchases, simply add credits (e.g., increment existing credits)
                 updated_credits = repo.increment_user_credit(user_id, credits)
+                await credit_ledger.reconcile(user_id, updated_credits)
                 logging.info("✅ Added %s credits to user %s via one-time purchase = %s", credits, user_id, updated_credits)
             except Exception as e:
                 logging.error("❌ Failed to update credits for one-time purchase: %s", e)
@@ -279,6 +286,7 @@ async def deduct_credits_endpoint(
     
     # Get updated balance
     new_balance = repo.get_user_credit(user_id)
+    await credit_ledger.reconcile(user_id, new_balance)
     
     return {
         "user_id": user_id,
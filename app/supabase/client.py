@@ -0,0 +1,220 @@
+# app/supabase/client.py
+import asyncio
+import logging
+import os
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from postgrest import AsyncPostgrestClient, SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_TIMEOUT
+from postgrest.utils import SyncClient
+from supabase import AsyncClient, Client
+
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+# Maximum number of open connections per client (requests beyond this wait for a free connection)
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+# Idle connections are kept open for reuse for this many seconds
+SUPABASE_POOL_KEEPALIVE_SECONDS = float(os.getenv("SUPABASE_POOL_KEEPALIVE_SECONDS", "60"))
+
+
+class SupabasePoolStats:
+    """
+    Request counters for every pooled Supabase transport, plus the live connection counts,
+    exposed on /metrics. A peak_in_flight near pool_size means requests are queueing for a
+    connection and SUPABASE_POOL_SIZE should go up.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._transports: List[Any] = []
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_ms = 0.0
+
+    def register(self, transport: Any) -> None:
+        with self._lock:
+            self._transports.append(transport)
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def request_finished(self, elapsed_ms: float, failed: bool) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.total_ms += elapsed_ms
+            if failed:
+                self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            connections = idle = 0
+            for transport in self._transports:
+                # httpcore's pool; the attribute is private to httpx, so count defensively
+                for connection in getattr(getattr(transport, "_pool", None), "connections", []):
+                    connections += 1
+                    idle += connection.is_idle()
+            return {
+                "pools": len(self._transports),
+                "pool_size": SUPABASE_POOL_SIZE,
+                "connections": connections,
+                "idle_connections": idle,
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "avg_ms": round(self.total_ms / self.requests, 2) if self.requests else 0.0,
+            }
+
+
+pool_stats = SupabasePoolStats()
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=SUPABASE_POOL_SIZE,
+        max_keepalive_connections=SUPABASE_POOL_SIZE,
+        keepalive_expiry=SUPABASE_POOL_KEEPALIVE_SECONDS,
+    )
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    def __init__(self, stats: Optional[SupabasePoolStats] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats or pool_stats
+        self.stats.register(self)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.request_started()
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = super().handle_request(request)
+            failed = False
+            return response
+        finally:
+            self.stats.request_finished((time.perf_counter() - start) * 1000, failed)
+
+
+class InstrumentedAsyncTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats: Optional[SupabasePoolStats] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats or pool_stats
+        self.stats.register(self)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.request_started()
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = await super().handle_async_request(request)
+            failed = False
+            return response
+        finally:
+            self.stats.request_finished((time.perf_counter() - start) * 1000, failed)
+
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    """
+    PostgREST client whose session keeps a bounded pool of keep-alive connections and
+    reports to pool_stats.
+    """
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None) -> SyncClient:
+        return SyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            follow_redirects=True,
+            transport=InstrumentedTransport(verify=verify, proxy=proxy, http2=True, limits=_pool_limits()),
+        )
+
+
+class PooledAsyncPostgrestClient(AsyncPostgrestClient):
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            follow_redirects=True,
+            transport=InstrumentedAsyncTransport(verify=verify, proxy=proxy, http2=True, limits=_pool_limits()),
+        )
+
+
+class PooledClient(Client):
+    def _init_postgrest_client(self, rest_url, headers, schema, timeout=DEFAULT_POSTGREST_CLIENT_TIMEOUT, verify=True, proxy=None):
+        return PooledPostgrestClient(rest_url, headers=headers, schema=schema, timeout=timeout, verify=verify, proxy=proxy)
+
+
+class PooledAsyncClient(AsyncClient):
+    def _init_postgrest_client(self, rest_url, headers, schema, timeout=DEFAULT_POSTGREST_CLIENT_TIMEOUT, verify=True, proxy=None):
+        return PooledAsyncPostgrestClient(rest_url, headers=headers, schema=schema, timeout=timeout, verify=verify, proxy=proxy)
+
+
+_clients: Dict[str, Client] = {}
+_clients_lock = Lock()
+_async_clients: Dict[str, AsyncClient] = {}
+_async_clients_lock: Optional[asyncio.Lock] = None
+
+
+def get_supabase_client(key: Optional[str] = SUPABASE_SERVICE_ROLE_KEY) -> Client:
+    """
+    The process-wide Supabase client for this API key (the service role key by default),
+    created on first use. Safe to share between threads.
+
+    Not for auth sign-in flows: signing in replaces the client's Authorization header with
+    the user's token, and every other caller of the shared client would then run as that
+    user. Those create a client of their own.
+    """
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = PooledClient.create(SUPABASE_URL, key)
+                _clients[key] = client
+                logging.info("Created shared Supabase client")
+    return client
+
+
+async def get_async_supabase_client(key: Optional[str] = SUPABASE_SERVICE_ROLE_KEY) -> AsyncClient:
+    """
+    The async counterpart of get_supabase_client, for code running on the event loop.
+    """
+    global _async_clients_lock
+    client = _async_clients.get(key)
+    if client is not None:
+        return client
+
+    if _async_clients_lock is None:
+        _async_clients_lock = asyncio.Lock()
+    async with _async_clients_lock:
+        client = _async_clients.get(key)
+        if client is None:
+            client = await PooledAsyncClient.create(SUPABASE_URL, key)
+            _async_clients[key] = client
+            logging.info("Created shared async Supabase client")
+    return client
+
+
+class LazySupabaseClient:
+    """
+    Module-level stand-in for `supabase = create_client(...)`: attribute access goes to the
+    shared client for `key`, which is only created on first use, so importing a module
+    opens no connections.
+    """
+    def __init__(self, key: Optional[str] = SUPABASE_SERVICE_ROLE_KEY):
+        self._key = key
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_supabase_client(self._key), name)
@@ -1,27 +1,31 @@
 # conversation_history.py
+from collections import OrderedDict, deque
 from datetime import datetime
 import os
 import json
 import logging
-from typing import Optional
+from threading import Lock
+from typing import Deque, List, Optional, Tuple
 
 from pydantic import BaseModel
-from supabase import create_client, Client
+from app.supabase.client import LazySupabaseClient, get_async_supabase_client
 from dotenv import load_dotenv
-from agents import Agent, Runner
 
 
 # Load environment variables
 load_dotenv()
 
 # Supabase configuration
-SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 
-# Initialize the Supabase client (synchronous)
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+# Initialize the Supabase client (synchronous; the *_async functions use the shared async client)
+supabase = LazySupabaseClient(SUPABASE_SERVICE_ROLE_KEY)
 
+# Number of recent messages kept in process per user (and returned by append_message_to_history)
+HISTORY_TAIL_SIZE = int(os.getenv("HISTORY_TAIL_SIZE", "50"))
+# Maximum number of users whose history tails are cached (least recently used are evicted)
+HISTORY_TAIL_MAX_USERS = int(os.getenv("HISTORY_TAIL_MAX_USERS", "1024"))
 
 
 # Message class
@@ -82,30 +86,246 @@ def get_or_create_conversation_history(user_id: str) -> list[Message]:
         logging.error(f"Error retrieving conversation history for user {user_id}: {e}")
         return []
 
+async def get_or_create_conversation_history_async(user_id: str) -> list[Message]:
+    """
+    get_or_create_conversation_history for code running on the event loop.
+    """
+    try:
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        response = await client.table("conversation_history").select("history").eq("user_id", user_id).execute()
+        data = response.data
+
+        if data and len(data) > 0:
+            logging.info(f"Retrieved history for user {user_id}")
+            if data[0]["history"]:
+                return [Message.from_dict(msg) for msg in data[0]["history"]]
+            return []
+        else:
+            logging.info(f"No conversation history found for user {user_id}. Creating new record.")
+            await client.table("conversation_history").insert({"user_id": user_id, "history": []}).execute()
+            logging.info(f"New conversation history record created for user {user_id}.")
+            return []
+    except Exception as e:
+        logging.error(f"Error retrieving conversation history for user {user_id}: {e}")
+        return []
+
+class HistoryTail:
+    """
+    The last HISTORY_TAIL_SIZE messages of a user's history and the total number of messages
+    stored, so a turn can read its recent history without fetching the whole array.
+    """
+    def __init__(self, messages: List[Message], length: int):
+        self.messages: Deque[Message] = deque(messages, maxlen=HISTORY_TAIL_SIZE)
+        self.length = length
+
+    def covers(self, count: int) -> bool:
+        return len(self.messages) >= min(count, self.length)
+
+
+_history_tails: "OrderedDict[str, HistoryTail]" = OrderedDict()
+_history_tails_lock = Lock()
+
+
+def _cache_tail(user_id: str, messages: List[Message], length: int) -> None:
+    with _history_tails_lock:
+        _history_tails[str(user_id)] = HistoryTail(messages, length)
+        _history_tails.move_to_end(str(user_id))
+        while len(_history_tails) > HISTORY_TAIL_MAX_USERS:
+            _history_tails.popitem(last=False)
+
+
+def _drop_tail(user_id: str) -> None:
+    with _history_tails_lock:
+        _history_tails.pop(str(user_id), None)
+
+
+def _message_dict(message: Message) -> dict:
+    return json.loads(message.model_dump_json())
+
+
+def _cached_recent(user_id: str, count: int) -> Optional[List[Message]]:
+    with _history_tails_lock:
+        tail = _history_tails.get(str(user_id))
+        if tail is not None and tail.covers(count):
+            _history_tails.move_to_end(str(user_id))
+            return list(tail.messages)[-count:]
+    return None
+
+
+def _cached_length(user_id: str) -> int:
+    with _history_tails_lock:
+        tail = _history_tails.get(str(user_id))
+        return tail.length if tail is not None else 0
+
+
+def _window_params(user_id: str) -> dict:
+    return {"input_user_id": str(user_id), "message_count": HISTORY_TAIL_SIZE}
+
+
+def _parse_window(data) -> Tuple[List[Message], int]:
+    if data:
+        return [Message.from_dict(msg) for msg in data[0]["messages"]], data[0]["total"]
+    return [], 0
+
+
+def _record_append(user_id: str, new_message: Message, length) -> None:
+    with _history_tails_lock:
+        tail = _history_tails.get(str(user_id))
+        if tail is not None:
+            if isinstance(length, int) and length == tail.length + 1:
+                tail.messages.append(new_message)
+                tail.length = length
+            else:
+                # something else (another worker, a summary) changed the history; reload on next read
+                _history_tails.pop(str(user_id), None)
+
+
 def update_conversation_history(user_id: str, history: list[Message]):
     """
     Updates the conversation history for the given user_id.
     """
     try:
         # Convert Message objects to dictionaries for storage
-        history_dicts = [json.loads(msg.model_dump_json()) for msg in history]
+        history_dicts = [_message_dict(msg) for msg in history]
         response = supabase.table("conversation_history").update({"history": history_dicts}).eq("user_id", user_id).execute()
+        _cache_tail(user_id, history[-HISTORY_TAIL_SIZE:], len(history))
         logging.info(f"Updated conversation history for user {user_id}.")
     except Exception as e:
+        _drop_tail(user_id)
         logging.error(f"Error updating conversation history for user {user_id}: {e}")
 
-def append_message_to_history(user_id: str, role: str, content: str) -> list[Message]:
+async def update_conversation_history_async(user_id: str, history: list[Message]):
+    """
+    update_conversation_history for code running on the event loop.
+    """
+    try:
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        history_dicts = [_message_dict(msg) for msg in history]
+        await client.table("conversation_history").update({"history": history_dicts}).eq("user_id", user_id).execute()
+        _cache_tail(user_id, history[-HISTORY_TAIL_SIZE:], len(history))
+        logging.info(f"Updated conversation history for user {user_id}.")
+    except Exception as e:
+        _drop_tail(user_id)
+        logging.error(f"Error updating conversation history for user {user_id}: {e}")
+
+def get_recent_messages(user_id: str, count: int = HISTORY_TAIL_SIZE) -> list[Message]:
+    """
+    Returns the last `count` messages of the user's history, oldest first.
+    Served from the in-process tail when it covers them, otherwise read with get_conversation_window.
+    """
+    count = min(count, HISTORY_TAIL_SIZE)
+    cached = _cached_recent(user_id, count)
+    if cached is not None:
+        return cached
+
+    try:
+        response = supabase.rpc("get_conversation_window", _window_params(user_id)).execute()
+        messages, length = _parse_window(response.data)
+    except Exception as e:
+        # fall back to reading the whole array
+        logging.error(f"Error reading the conversation window for user {user_id}, reading full history: {e}")
+        history = get_or_create_conversation_history(user_id)
+        messages, length = history[-HISTORY_TAIL_SIZE:], len(history)
+
+    _cache_tail(user_id, messages, length)
+    return messages[-count:]
+
+async def get_recent_messages_async(user_id: str, count: int = HISTORY_TAIL_SIZE) -> list[Message]:
+    """
+    get_recent_messages for code running on the event loop.
+    """
+    count = min(count, HISTORY_TAIL_SIZE)
+    cached = _cached_recent(user_id, count)
+    if cached is not None:
+        return cached
+
+    try:
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        response = await client.rpc("get_conversation_window", _window_params(user_id)).execute()
+        messages, length = _parse_window(response.data)
+    except Exception as e:
+        logging.error(f"Error reading the conversation window for user {user_id}, reading full history: {e}")
+        history = await get_or_create_conversation_history_async(user_id)
+        messages, length = history[-HISTORY_TAIL_SIZE:], len(history)
+
+    _cache_tail(user_id, messages, length)
+    return messages[-count:]
+
+def get_history_length(user_id: str) -> int:
+    """
+    Returns the total number of messages in the user's history (from the tail when cached).
+    """
+    get_recent_messages(user_id, 1)
+    return _cached_length(user_id)
+
+async def get_history_length_async(user_id: str) -> int:
+    await get_recent_messages_async(user_id, 1)
+    return _cached_length(user_id)
+
+def append_message(user_id: str, role: str, content: str) -> Message:
     """
-    Appends a new message to the conversation history and updates the record.
-    Returns the updated history.
+    Appends one message to the user's history with the append_conversation_message RPC
+    (an atomic server-side append) and adds it to the in-process tail.
     """
-    # Retrieve the current history.
-    history = get_or_create_conversation_history(user_id)
-    # Create a new Message object with the current timestamp
     new_message = Message(role=role, content=content, created_at=datetime.now(), user_id=user_id)
-    history.append(new_message)
-    update_conversation_history(user_id, history)
-    return history
+
+    try:
+        response = supabase.rpc("append_conversation_message", {
+            "input_user_id": str(user_id),
+            "message": _message_dict(new_message),
+        }).execute()
+        length = response.data
+    except Exception as e:
+        # fall back to the read-modify-write update (not safe against concurrent appends)
+        logging.error(f"Error appending to conversation history for user {user_id}, rewriting full history: {e}")
+        history = get_or_create_conversation_history(user_id)
+        history.append(new_message)
+        update_conversation_history(user_id, history)
+        return new_message
+
+    _record_append(user_id, new_message, length)
+    return new_message
+
+async def append_message_async(user_id: str, role: str, content: str) -> Message:
+    """
+    append_message for code running on the event loop.
+    """
+    new_message = Message(role=role, content=content, created_at=datetime.now(), user_id=user_id)
+
+    try:
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        response = await client.rpc("append_conversation_message", {
+            "input_user_id": str(user_id),
+            "message": _message_dict(new_message),
+        }).execute()
+        length = response.data
+    except Exception as e:
+        logging.error(f"Error appending to conversation history for user {user_id}, rewriting full history: {e}")
+        history = await get_or_create_conversation_history_async(user_id)
+        history.append(new_message)
+        await update_conversation_history_async(user_id, history)
+        return new_message
+
+    _record_append(user_id, new_message, length)
+    return new_message
+
+def append_message_to_history(user_id: str, role: str, content: str) -> list[Message]:
+    """
+    Appends a new message to the conversation history.
+    Returns the most recent messages (at most HISTORY_TAIL_SIZE), ending with the new one.
+    """
+    # Load the tail first (no round trip once cached) so the append can be checked against it
+    get_recent_messages(user_id, 1)
+    append_message(user_id, role, content)
+    return get_recent_messages(user_id)
+
+async def append_message_to_history_async(user_id: str, role: str, content: str) -> list[Message]:
+    """
+    append_message_to_history for code running on the event loop.
+    """
+    await get_recent_messages_async(user_id, 1)
+    await append_message_async(user_id, role, content)
+    return await get_recent_messages_async(user_id)
 
 def clear_conversation_history(user_id: str) -> bool:
     """
@@ -113,62 +333,62 @@ def clear_conversation_history(user_id: str) -> bool:
     """
     try:
         response = supabase.table("conversation_history").update({"history": []}).eq("user_id", user_id).execute()
+        _cache_tail(user_id, [], 0)
         logging.info(f"Cleared conversation history for user {user_id}.")
         return True
     except Exception as e:
+        _drop_tail(user_id)
         logging.error(f"Error clearing conversation history for user {user_id}: {e}")
         return False
 
-async def replace_conversation_history_with_summary(user_id: str) -> list[Message]:
+async def clear_conversation_history_async(user_id: str) -> bool:
     """
-    Extracts knowledge from the conversation history, runs MBTI and OCEAN analyses
-    Replaces the conversation history with a summary.
-    The summary is stored as a Message object in the history.
+    clear_conversation_history for code running on the event loop.
     """
     try:
-        history = get_or_create_conversation_history(user_id)
-        
-        # get all message from history that match the user_id
-        history_string = [msg for msg in history if msg.user_id == user_id]
-        
-        # Convert the history to a string
-        history_string = "\n".join([f"{msg.role}: {msg.content}" for msg in history_string])
-    
-        # Define instructions for the summarization agent.
-        instructions = (
-            "You are an AI that summarizes a conversation. "
-            "Read the conversation below and provide a concise summary that captures the key points. "
-            "Keep it brief and to the point."
-        )
-
-        # Create the summarization agent.
-        summarization_agent = Agent(
-            name="Summary",
-            handoff_description="An agent that summarizes conversation context.",
-            instructions=instructions,
-            model= "gpt-4o-mini",
-        )
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        await client.table("conversation_history").update({"history": []}).eq("user_id", user_id).execute()
+        _cache_tail(user_id, [], 0)
+        logging.info(f"Cleared conversation history for user {user_id}.")
+        return True
+    except Exception as e:
+        _drop_tail(user_id)
+        logging.error(f"Error clearing conversation history for user {user_id}: {e}")
+        return False
 
-        # Construct the prompt with the conversation history.
-        prompt = f"Conversation:\n{history_string}\n\n"
-        
-        # Run the agent.
-        summary_result = await Runner.run(summarization_agent, prompt)
-        summary_content = summary_result.final_output.strip()
-        
-        # Create a new Message object with the summary
-        summary_message = Message(
-            role=summarization_agent.name, 
-            content=summary_content, 
-            created_at=datetime.now()
-        )
-        
-        # Clear the existing conversation and store only the summary message
-        summary_history = [summary_message]
-        update_conversation_history(user_id, summary_history)
+async def get_history_head_async(user_id: str, count: int) -> Tuple[List[Message], int]:
+    """
+    Returns the first `count` messages of the user's history, oldest first, and the total
+    number of messages, read with get_conversation_head.
+    """
+    try:
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        response = await client.rpc("get_conversation_head", {"input_user_id": str(user_id), "message_count": count}).execute()
+        return _parse_window(response.data)
+    except Exception as e:
+        logging.error(f"Error reading the start of the conversation for user {user_id}, reading full history: {e}")
+        history = await get_or_create_conversation_history_async(user_id)
+        return history[:count], len(history)
 
-        logging.info(f"Replaced conversation history with summary for user {user_id}.")
-        return summary_history
+async def fold_history_async(user_id: str, summary: Message, replaced_count: int, expected_head: Message) -> Optional[int]:
+    """
+    Replaces the first `replaced_count` messages with `summary` (fold_conversation_summary),
+    provided the history still starts with `expected_head`. Messages after them, including
+    ones appended meanwhile, are kept. Returns the new length, or None if nothing changed.
+    """
+    try:
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        response = await client.rpc("fold_conversation_summary", {
+            "input_user_id": str(user_id),
+            "summary": _message_dict(summary),
+            "replaced_count": replaced_count,
+            "expected_head": _message_dict(expected_head),
+        }).execute()
     except Exception as e:
-        logging.error(f"Error replacing conversation history for user {user_id}: {e}")
-        return []
+        logging.error(f"Error folding the conversation summary for user {user_id}: {e}")
+        return None
+    finally:
+        # the start of the array changed; the tail is reloaded on the next read
+        _drop_tail(user_id)
+
+    return response.data if isinstance(response.data, int) else None
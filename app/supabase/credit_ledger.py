@@ -0,0 +1,213 @@
+# app/supabase/credit_ledger.py
+import asyncio
+import logging
+import os
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from app.supabase.client import get_async_supabase_client
+from app.supabase.profiles import AsyncProfileRepository, apply_deduction_rows, deduction_params, profile_cache
+
+
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+# Pending deductions are written to Supabase at most this many seconds after they are made
+CREDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("CREDIT_FLUSH_INTERVAL_SECONDS", "5"))
+# Maximum number of users per deduct_credits call (larger backlogs are sent in several calls)
+CREDIT_FLUSH_BATCH_SIZE = int(os.getenv("CREDIT_FLUSH_BATCH_SIZE", "500"))
+
+
+class CreditLedger:
+    """
+    Per-turn credit charges for this process.
+
+    deduct() only records the charge locally; flush() (every CREDIT_FLUSH_INTERVAL_SECONDS
+    once start() has been called, and on shutdown) sends all pending charges in one
+    deduct_credits RPC, which decrements every balance atomically in Postgres. Alongside,
+    the ledger keeps a balance view per user, the last balance read from Supabase minus
+    the charges not yet flushed, which the websocket NO_CREDITS check reads. Other workers'
+    charges show up in it after their next flush, when this worker next loads the user.
+    """
+    def __init__(self, flush_interval: float = CREDIT_FLUSH_INTERVAL_SECONDS, batch_size: int = CREDIT_FLUSH_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._lock = Lock()
+        self._balances: Dict[str, int] = {}
+        self._pending: Dict[str, int] = {}
+        # charges taken out of _pending by a flush that has not completed yet
+        self._in_flight: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.deductions = 0
+        self.flushes = 0
+        self.flushed_credits = 0
+        self.shortfall_credits = 0
+        self.errors = 0
+
+    def set_balance(self, user_id: str, credits: Optional[int]) -> None:
+        """
+        Records the balance stored in Supabase (which does not include pending charges).
+        """
+        if credits is None:
+            return
+        with self._lock:
+            self._balances[str(user_id)] = credits
+        self._patch_profile(user_id)
+
+    def balance(self, user_id: str) -> Optional[int]:
+        """
+        The user's balance with pending charges applied, or None if it was never loaded.
+        """
+        with self._lock:
+            return self._available(str(user_id))
+
+    def has_credits(self, user_id: str, minimum: int = 1) -> bool:
+        balance = self.balance(user_id)
+        return balance is not None and balance >= minimum
+
+    async def load(self, user_id: str) -> Optional[int]:
+        """
+        Reads the user's balance from Supabase (one query) and returns it with pending
+        charges applied.
+        """
+        row = await AsyncProfileRepository().get_profile_row(user_id, refresh=True)
+        if row is None:
+            return None
+        self.set_balance(user_id, row.get("credits"))
+        return self.balance(user_id)
+
+    def deduct(self, user_id: str, amount: int) -> bool:
+        """
+        Records a charge; it reaches Supabase with the next flush.
+        """
+        if amount < 0:
+            logging.error(f"Amount to deduct is negative for user {user_id}")
+            return False
+        if amount == 0:
+            return True
+
+        with self._lock:
+            key = str(user_id)
+            self._pending[key] = self._pending.get(key, 0) + amount
+            self.deductions += 1
+        self._patch_profile(user_id)
+        return True
+
+    async def flush(self) -> int:
+        """
+        Sends every pending charge to Supabase. Returns the number of users flushed.
+        Charges that fail to send stay pending for the next flush.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._add(self._in_flight, pending)
+        if not pending:
+            return 0
+
+        flushed = 0
+        users = list(pending)
+        for start in range(0, len(users), self.batch_size):
+            batch = {user_id: pending[user_id] for user_id in users[start:start + self.batch_size]}
+            try:
+                client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+                response = await client.rpc("deduct_credits", deduction_params(batch)).execute()
+            except Exception as e:
+                logging.error(f"Error flushing credit deductions for {len(batch)} users: {e}")
+                with self._lock:
+                    self.errors += 1
+                    self._add(self._in_flight, {user_id: -amount for user_id, amount in batch.items()})
+                    self._add(self._pending, batch)
+                continue
+
+            charged = apply_deduction_rows(response.data)
+            with self._lock:
+                self.flushes += 1
+                self._add(self._in_flight, {user_id: -amount for user_id, amount in batch.items()})
+                for row in response.data or []:
+                    self._balances[str(row["id"])] = row["credits"]
+                for user_id, amount in batch.items():
+                    self.flushed_credits += charged.get(user_id, 0)
+                    if charged.get(user_id, 0) < amount:
+                        self.shortfall_credits += amount - charged.get(user_id, 0)
+                        logging.warning(f"Insufficient credits for user {user_id}: charged {charged.get(user_id, 0)} of {amount}")
+            for user_id in batch:
+                self._patch_profile(user_id)
+            flushed += len(batch)
+        return flushed
+
+    async def reconcile(self, user_id: str, credits: Optional[int] = None) -> None:
+        """
+        Brings the balance view up to date after a change made outside the ledger (a Stripe
+        top-up). `credits` is the new stored balance if the caller has it; otherwise it is
+        read from Supabase. This does not flush: a caller about to overwrite the stored
+        balance outright calls flush() before the write, since a flush afterwards would
+        take the pending charges off the new balance.
+        """
+        if credits is None:
+            await self.load(user_id)
+        else:
+            self.set_balance(user_id, credits)
+
+    def start(self) -> None:
+        """
+        Starts the periodic flush on the running event loop.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the periodic flush and sends whatever is still pending.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Error in credit ledger flush: {e}")
+
+    def _available(self, key: str) -> Optional[int]:
+        balance = self._balances.get(key)
+        if balance is None:
+            return None
+        return max(balance - self._pending.get(key, 0) - self._in_flight.get(key, 0), 0)
+
+    @staticmethod
+    def _add(totals: Dict[str, int], amounts: Dict[str, int]) -> None:
+        for key, amount in amounts.items():
+            total = totals.get(key, 0) + amount
+            if total:
+                totals[key] = total
+            else:
+                totals.pop(key, None)
+
+    def _patch_profile(self, user_id: str) -> None:
+        # keep the profile snapshot (GET /profiles/credits) in line with the balance view
+        balance = self.balance(user_id)
+        if balance is not None:
+            profile_cache.patch(user_id, {"credits": balance})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users": len(self._balances),
+                "pending_users": len(self._pending),
+                "pending_credits": sum(self._pending.values()) + sum(self._in_flight.values()),
+                "deductions": self.deductions,
+                "flushes": self.flushes,
+                "flushed_credits": self.flushed_credits,
+                "shortfall_credits": self.shortfall_credits,
+                "errors": self.errors,
+            }
+
+
+credit_ledger = CreditLedger()
@@ -3,13 +3,12 @@ from typing import cast
 from agents import Runner
 from fastapi import HTTPException
 from pydantic import BaseModel
-from supabase import create_client
+from app.supabase.client import LazySupabaseClient
 import os
 
 # Setup Supabase client
-SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # Use service role for writes
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase = LazySupabaseClient(SUPABASE_KEY)
 
 
 class SimplifiedFeedbackPayload(BaseModel):
@@ -5,15 +5,14 @@ import os
 from pydantic import BaseModel
 from typing import Dict, List, Optional
 from uuid import UUID
-from supabase import create_client
+from app.supabase.client import LazySupabaseClient, get_async_supabase_client
 import datetime
-from app.utils.similarity import cosine_similarity
+from app.supabase.memory_index import get_user_memory_index
 
 
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = LazySupabaseClient(SUPABASE_SERVICE_ROLE_KEY)
 
 
 
@@ -164,71 +163,47 @@ def get_relation_type(memory_a: Dict, memory_b: Dict) -> List[str]:
 
 def create_knowledge_edges(user_id: UUID, source_id: UUID, source_embedding: List[float], source_metadata: dict, top_k: int = 5):
     try:
-        # 1. Get all other memories for this user
-        response = supabase.table("user_knowledge") \
-            .select("id, embedding, metadata") \
-            .eq("user_id", str(user_id)) \
-            .neq("id", str(source_id)) \
-            .execute()
-            
-        memories = response.data or []
-        if not memories:
+        # 1. Score the new memory against all of the user's other memories in one pass
+        user_index = get_user_memory_index(user_id)
+        top_matches = user_index.top_k(source_embedding, top_k, SIMILARITY_THRESHOLD, str(source_id))
+
+        # Keep the index current for the next memory
+        user_index.add(source_id, source_embedding, {"metadata": source_metadata})
+
+        if not top_matches:
             return
-        
-        # 2. Compute similarity scores
-        scored = []
-        for mem in memories:
-            target_id = UUID(mem["id"])
-            target_embedding = json.loads(mem["embedding"])
-            score = cosine_similarity(source_embedding, target_embedding)
-            
-            if score >= SIMILARITY_THRESHOLD and target_id != source_id:
-                scored.append((target_id, score))
-        
-        # 3. Sort and filter top K
-        scored.sort(key=lambda x: x[1], reverse=True)
-        top_matches = scored[:top_k]
-        
-        # Now print only what you're going to insert
+
         for target_id, score in top_matches:
-            print(f"Edge to insert — Target ID: {target_id}, Score: {score}")
+            logging.info(f"Edge to insert — Target ID: {target_id}, Score: {score}")
 
-        # 4. Insert edges (skip duplicates)
+        # 2. Skip edges that already exist (one query for all candidates)
+        existing = supabase.table("knowledge_edges") \
+            .select("target_id") \
+            .eq("user_id", str(user_id)) \
+            .eq("source_id", str(source_id)) \
+            .in_("target_id", [target_id for target_id, _ in top_matches]) \
+            .execute()
+        existing_ids = {str(row["target_id"]) for row in existing.data or []}
+
+        # 3. Insert the new edges in bulk
+        edges = []
         for target_id, score in top_matches:
-            
-            target_row = next((m for m in memories if UUID(m["id"]) == target_id), None)
-            if not target_row:
+            if target_id in existing_ids:
                 continue
 
-            # convert metadata to dict if not already
-            target_metadata_raw = target_row.get("metadata")
-            if isinstance(target_metadata_raw, str):
-                target_metadata = json.loads(target_metadata_raw)
-            elif isinstance(target_metadata_raw, dict):
-                target_metadata = target_metadata_raw
-            else:
-                target_metadata = {} 
-            
-                      
-            existing = supabase.table("knowledge_edges") \
-                .select("id") \
-                .eq("user_id", str(user_id)) \
-                .eq("source_id", str(source_id)) \
-                .eq("target_id", str(target_id)) \
-                .execute()
-            
-            if existing.data:
-                continue  # already exists
-            
+            target_metadata = user_index.rows.get(target_id, {}).get("metadata", {})
             relation_type = get_relation_type(source_metadata, target_metadata)
 
-            supabase.table("knowledge_edges").insert({
+            edges.append({
                 "user_id": str(user_id),
                 "source_id": str(source_id),
-                "target_id": str(target_id),
+                "target_id": target_id,
                 "similarity_score": score,
                 "relation_type": relation_type
-            }).execute()
+            })
+
+        if edges:
+            supabase.table("knowledge_edges").insert(edges).execute()
 
     except Exception as e:
         logging.error(f"Error creating knowledge edges: {e}")
@@ -277,6 +252,33 @@ def get_connected_memories(user_id: UUID, source_id: UUID, relation_type: Option
     return simplified_response
 
 
+async def get_connected_memories_async(user_id: UUID, source_id: UUID, relation_type: Optional[str] = None, min_score: float = 0.75):
+    """
+    get_connected_memories for code running on the event loop.
+    """
+    client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+    filters = (
+        client.table("knowledge_edges")
+        .select("target_id")
+        .eq("user_id", str(user_id))
+        .eq("source_id", str(source_id))
+        .gte("similarity_score", min_score)
+    )
+
+    if relation_type:
+        filters = filters.eq("relation_type", relation_type)
+
+    edge_response = await filters.execute()
+
+    target_ids = [edge["target_id"] for edge in edge_response.data]
+
+    if not target_ids:
+        return []
+
+    memory_response = await client.table("user_knowledge").select("*").in_("id", target_ids).execute()
+    return simplify_related_memories(memory_response.data)
+
+
 
 
 def simplify_related_memories(memories: List[Dict]) -> List[SimplifiedMemory]:
@@ -0,0 +1,256 @@
+# app/supabase/memory_index.py
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional
+from uuid import UUID
+import numpy as np
+from app.supabase.client import LazySupabaseClient
+from app.utils.match_filter import MemoryFilter
+from app.utils.vector_index import IVFFlatIndex, parse_embedding
+
+
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+supabase = LazySupabaseClient(SUPABASE_SERVICE_ROLE_KEY)
+
+
+# Serve memory vector searches from the in-process index (falls back to the find_similar_memories RPC when off or cold)
+MEMORY_INDEX_ENABLED = os.getenv("MEMORY_INDEX_ENABLED", "true").lower() == "true"
+# Cached indexes are reloaded after this many seconds (other workers may have added memories)
+MEMORY_INDEX_TTL_SECONDS = int(os.getenv("MEMORY_INDEX_TTL_SECONDS", "300"))
+# Maximum number of users whose indexes are kept in memory (least recently used are evicted)
+MEMORY_INDEX_MAX_USERS = int(os.getenv("MEMORY_INDEX_MAX_USERS", "32"))
+# Number of IVF cells scanned per query once a user has enough memories to cluster
+MEMORY_INDEX_NPROBE = int(os.getenv("MEMORY_INDEX_NPROBE", "8"))
+# PostgREST caps a single select, so memories are loaded in pages of this size
+MEMORY_INDEX_PAGE_SIZE = 1000
+
+# Columns returned by the find_similar_memories RPC (plus similarity)
+MEMORY_COLUMNS = "id, knowledge_text, embedding, metadata, mention_count, last_updated, created_at"
+
+
+def parse_metadata(raw) -> dict:
+    """
+    Memory metadata is stored as JSON, but older rows hold it as a string.
+    """
+    if isinstance(raw, str):
+        return json.loads(raw)
+    if isinstance(raw, dict):
+        return raw
+    return {}
+
+
+class UserMemoryIndex:
+    """
+    All of a user's memories held in process: an IVF-flat index over their embeddings plus
+    the remaining user_knowledge columns, so vector searches need no database round trip.
+    """
+    def __init__(self, user_id: str):
+        self.user_id = str(user_id)
+        self.index = IVFFlatIndex(nprobe=MEMORY_INDEX_NPROBE)
+        self.rows: Dict[str, dict] = {}
+        self.loaded_at = time.monotonic()
+        self.refreshing = False
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.loaded_at > MEMORY_INDEX_TTL_SECONDS
+
+    def add(self, memory_id: str, embedding: List[float], row: Optional[dict] = None) -> None:
+        """
+        Adds or updates a memory. Columns in row are merged into what is already known.
+        """
+        memory_id = str(memory_id)
+        row = dict(row or {})
+        row.pop("embedding", None)
+        if "metadata" in row:
+            row["metadata"] = parse_metadata(row["metadata"])
+
+        with self.lock:
+            self.index.add(memory_id, embedding)
+            self.rows.setdefault(memory_id, {"id": memory_id}).update(row)
+
+    def remove(self, memory_id: str) -> None:
+        with self.lock:
+            self.index.remove(str(memory_id))
+            self.rows.pop(str(memory_id), None)
+
+    def top_k(self, embedding: List[float], k: int, threshold: float, exclude_id: str) -> List[tuple]:
+        """
+        Exact top-k, used for edge building where missing a neighbour would drop an edge.
+        """
+        with self.lock:
+            return self.index.matrix.top_k(embedding, k, threshold=threshold, exclude=[exclude_id])
+
+    def search(self, embedding: List[float], limit: int, memory_filter: Optional[MemoryFilter] = None) -> List[dict]:
+        """
+        Nearest memories in the same shape as the find_similar_memories RPC.
+        Without a filter the IVF index answers approximately; with one, every memory is scored
+        and the filter runs before the top-k cut (like find_similar_memories_filtered).
+        """
+        with self.lock:
+            if memory_filter is None:
+                matches = [(memory_id, score, None) for memory_id, score in self.index.search(embedding, limit)]
+            else:
+                matches = self._filtered_matches(embedding, limit, memory_filter)
+
+            results = []
+            for memory_id, score, row in matches:
+                position = self.index.matrix.position(memory_id)
+                results.append({
+                    **(row or self._row(memory_id, score)),
+                    # ada-002 embeddings are unit length, so the stored normalized row is the original vector
+                    "embedding": self.index.matrix.vectors[position].tolist(),
+                })
+            return results
+
+    def _row(self, memory_id: str, score: float) -> dict:
+        return {**self.rows.get(memory_id, {"id": memory_id}), "similarity": score}
+
+    def _filtered_matches(self, embedding: List[float], limit: int, memory_filter: MemoryFilter) -> List[tuple]:
+        if limit <= 0:
+            return []
+        scores = self.index.matrix.scores(embedding)
+        ids = self.index.matrix.ids
+        matches = []
+        for position in np.argsort(-scores, kind="stable"):
+            row = self._row(ids[position], float(scores[position]))
+            if memory_filter.matches(row):
+                matches.append((row["id"], row["similarity"], row))
+                if len(matches) == limit:
+                    break
+        return matches
+
+
+_user_indexes: "OrderedDict[str, UserMemoryIndex]" = OrderedDict()
+_user_indexes_lock = Lock()
+
+
+def load_user_memory_index(user_id: UUID) -> UserMemoryIndex:
+    """
+    Loads every memory for the user into a fresh index.
+    """
+    user_index = UserMemoryIndex(user_id)
+    ids, embeddings = [], []
+
+    offset = 0
+    while True:
+        response = supabase.table("user_knowledge") \
+            .select(MEMORY_COLUMNS) \
+            .eq("user_id", str(user_id)) \
+            .range(offset, offset + MEMORY_INDEX_PAGE_SIZE - 1) \
+            .execute()
+
+        rows = response.data or []
+        for row in rows:
+            if not row.get("embedding"):
+                continue
+            memory_id = str(row["id"])
+            ids.append(memory_id)
+            embeddings.append(parse_embedding(row.pop("embedding")))
+            row["id"] = memory_id
+            row["metadata"] = parse_metadata(row.get("metadata"))
+            user_index.rows[memory_id] = row
+
+        if len(rows) < MEMORY_INDEX_PAGE_SIZE:
+            break
+        offset += MEMORY_INDEX_PAGE_SIZE
+
+    if ids:
+        user_index.index.add_many(ids, embeddings)
+    return user_index
+
+
+def _cache_index(user_index: UserMemoryIndex) -> None:
+    with _user_indexes_lock:
+        _user_indexes[user_index.user_id] = user_index
+        _user_indexes.move_to_end(user_index.user_id)
+        while len(_user_indexes) > MEMORY_INDEX_MAX_USERS:
+            _user_indexes.popitem(last=False)
+
+
+def get_user_memory_index(user_id: UUID) -> UserMemoryIndex:
+    """
+    Returns the cached index for the user, loading it on first use or once it is stale.
+    """
+    key = str(user_id)
+    with _user_indexes_lock:
+        cached = _user_indexes.get(key)
+        if cached and not cached.is_stale():
+            _user_indexes.move_to_end(key)
+            return cached
+
+    loaded = load_user_memory_index(user_id)
+    _cache_index(loaded)
+    return loaded
+
+
+def _refresh(user_id: str) -> None:
+    try:
+        _cache_index(load_user_memory_index(user_id))
+    except Exception as e:
+        logging.error(f"Error refreshing memory index for user {user_id}: {e}")
+        with _user_indexes_lock:
+            cached = _user_indexes.get(user_id)
+        if cached:
+            cached.refreshing = False
+
+
+def peek_user_memory_index(user_id: UUID) -> Optional[UserMemoryIndex]:
+    """
+    Returns the cached index without loading it (None on a cold miss).
+    A stale index is still returned while a fresh copy loads in the background.
+    """
+    if not MEMORY_INDEX_ENABLED:
+        return None
+
+    key = str(user_id)
+    with _user_indexes_lock:
+        cached = _user_indexes.get(key)
+        if cached is None:
+            return None
+        _user_indexes.move_to_end(key)
+        if cached.is_stale() and not cached.refreshing:
+            cached.refreshing = True
+            threading.Thread(target=_refresh, args=(key,), daemon=True).start()
+    return cached
+
+
+def warm_user_memory_index(user_id: UUID) -> None:
+    """
+    Loads the user's index ahead of their first memory search (called at websocket connect).
+    """
+    if not MEMORY_INDEX_ENABLED:
+        return
+    try:
+        user_index = get_user_memory_index(user_id)
+        logging.info(f"Memory index warmed for user {user_id}: {len(user_index)} memories")
+    except Exception as e:
+        logging.error(f"Error warming memory index for user {user_id}: {e}")
+
+
+def remember_memory(user_id: UUID, row: dict, embedding: List[float]) -> None:
+    """
+    Adds a stored or updated user_knowledge row to the user's index if it is loaded.
+    """
+    with _user_indexes_lock:
+        cached = _user_indexes.get(str(user_id))
+    if cached and embedding:
+        cached.add(row["id"], embedding, row)
+
+
+def forget_memory(user_id: UUID, knowledge_id: UUID) -> None:
+    """
+    Drops a deleted memory from the user's index so it is no longer searched or linked.
+    """
+    with _user_indexes_lock:
+        cached = _user_indexes.get(str(user_id))
+    if cached:
+        cached.remove(knowledge_id)
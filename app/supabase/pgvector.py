@@ -1,16 +1,18 @@
 import json
 import os
-from supabase import create_client
+from app.supabase.client import LazySupabaseClient, get_async_supabase_client
 from dotenv import load_dotenv
 from openai import OpenAI
 import logging
 from app.supabase.knowledge_edges import create_knowledge_edges
+from app.supabase.memory_index import forget_memory, remember_memory
+from app.openai.embeddings import EMBEDDING_MODEL, embedding_batcher
+from app.utils.embedding_cache import embedding_cache
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = LazySupabaseClient(SUPABASE_SERVICE_ROLE_KEY)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 client = OpenAI(api_key=OPENAI_API_KEY)
@@ -19,10 +21,35 @@ client = OpenAI(api_key=OPENAI_API_KEY)
 def generate_embedding(text):
     """
     Converts text into an embedding vector using OpenAI's latest embedding model.
+    Embeddings are served from the process-wide embedding cache when the same text was embedded before.
+    """
+    if not isinstance(text, str):
+        return request_embedding(text)
+    return embedding_cache.get_or_create(EMBEDDING_MODEL, text, request_embedding)
+
+
+async def generate_embedding_async(text: str):
+    """
+    Non-blocking generate_embedding for async handlers.
+    Cache misses go through the shared micro-batcher, so concurrent callers share one API request.
+    """
+    cached = embedding_cache.get(EMBEDDING_MODEL, text)
+    if cached is not None:
+        return cached
+
+    embedding = await embedding_batcher.embed(text)
+    if embedding is not None:
+        embedding_cache.set(EMBEDDING_MODEL, text, embedding)
+    return embedding
+
+
+def request_embedding(text):
+    """
+    Calls the OpenAI embeddings API for a single input, bypassing the cache.
     """
     try:
         response = client.embeddings.create(
-            model="text-embedding-ada-002",  # Use the latest embedding model
+            model=EMBEDDING_MODEL,  # Use the latest embedding model
             input=text
         )
         embedding = response.data[0].embedding
@@ -55,6 +82,7 @@ def store_user_knowledge(user_id: str, knowledge_text: str, metadata: dict):
     # Edge creation
     new_id = response.data[0]["id"]
     create_knowledge_edges(user_id, new_id, embedding, metadata)
+    remember_memory(user_id, response.data[0], embedding)
     return response.data
 
 def find_similar_knowledge(user_id: str, query: str, top_k=5):
@@ -91,6 +119,23 @@ def store_user_slang(user_id: str, slang_text: str, metadata: dict):
 
     return response.data
 
+async def store_user_slang_async(user_id: str, slang_text: str, metadata: dict):
+    """
+    store_user_slang for code running on the event loop.
+    """
+    embedding = await generate_embedding_async(slang_text)
+    client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+
+    existing = await client.table("user_slang").select("*").eq("user_id", user_id).eq("slang_text", slang_text).execute()
+
+    if existing.data:
+        new_count = existing.data[0]["mention_count"] + 1
+        response = await client.table("user_slang").update({"metadata": json.dumps(metadata), "last_updated": "now()", "mention_count": new_count}).eq("id", existing.data[0]["id"]).execute()
+    else:
+        response = await client.table("user_slang").insert({"user_id": user_id, "slang_text": slang_text, "embedding": embedding, "metadata": json.dumps(metadata), "mention_count": 1}).execute()
+
+    return response.data
+
 def find_similar_slang(user_id: str, query: str, top_k=5):
     """
     Finds the most similar slang entries for a user based on a query.
@@ -110,6 +155,25 @@ def find_similar_slang(user_id: str, query: str, top_k=5):
     
     return response.data if response.data else {"message": "No similar slang found."}
 
+async def find_similar_slang_async(user_id: str, query: str, top_k=5):
+    """
+    find_similar_slang for code running on the event loop.
+    """
+    query_embedding = await generate_embedding_async(query)
+    client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+
+    existing = await client.table("user_slang").select("id").eq("user_id", user_id).limit(1).execute()
+    if not existing.data:
+        return {"message": "No slang stored for this user."}
+
+    response = await client.rpc("find_similar_slang", {
+        "user_id": user_id,
+        "embedding": query_embedding,
+        "top_k": top_k
+    }).execute()
+
+    return response.data if response.data else {"message": "No similar slang found."}
+
 def get_user_knowledge_vectors(user_id: str, limit: int = 10):
     """
     Retrieves a list of knowledge vectors for a specific user.
@@ -140,6 +204,7 @@ def remove_user_knowledge(user_id: str, knowledge_id: str):
     """
     try:
         supabase.table("user_knowledge").delete().eq("user_id", user_id).eq("id", knowledge_id).execute()
+        forget_memory(user_id, knowledge_id)
         return {"message": "Knowledge vector removed successfully."}
     except Exception as e:
         return {"message": f"Error removing knowledge vector: {e}"}
@@ -2,11 +2,11 @@ import os
 import logging
 from typing import Literal, Optional
 from uuid import UUID
-from supabase import create_client, Client
+from supabase import Client
+from app.supabase.client import get_async_supabase_client, get_supabase_client
 from pydantic import BaseModel, Field
 
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 class Phq4Questionaire(BaseModel):
@@ -27,7 +27,7 @@ class Phq4Repository:
     Repository class responsible for all Supabase CRUD PHQ4 table operations
     """
     def __init__(self):
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.supabase: Client = get_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
         self.table_name = "phq4_questionaires"
 
     def create_phq4(self, phq4: Phq4Questionaire):
@@ -46,4 +46,29 @@ class Phq4Repository:
                 return []
         except Exception as e:
             logging.error(f"Error getting PHQ4 for user {user_id}: {e}")
-            return []
\ No newline at end of file
+            return []
+
+class AsyncPhq4Repository:
+    """
+    Phq4Repository for code running on the event loop, backed by the shared async client.
+    """
+    def __init__(self):
+        self.table_name = "phq4_questionaires"
+
+    async def _table(self):
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        return client.table(self.table_name)
+
+    async def create_phq4(self, phq4: Phq4Questionaire):
+        try:
+            await (await self._table()).insert(phq4.model_dump()).execute()
+        except Exception as e:
+            logging.error(f"Error creating PHQ4 for user {phq4.user_id}: {e}")
+
+    async def get_phq4(self, user_id: str):
+        try:
+            response = await (await self._table()).select("*").eq("user_id", user_id).execute()
+            return response.data or []
+        except Exception as e:
+            logging.error(f"Error getting PHQ4 for user {user_id}: {e}")
+            return []
@@ -1,13 +1,21 @@
 import os
 import logging
-from typing import Optional
-from supabase import create_client, Client
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Iterable, Optional, Tuple
+from supabase import Client
+from app.supabase.client import get_async_supabase_client, get_supabase_client
 from pydantic import BaseModel
 
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
+# Cached profile rows are reloaded after this many seconds (another worker or a webhook may have changed them)
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+# Maximum number of profile rows kept in memory (least recently used are evicted)
+PROFILE_CACHE_MAX_USERS = int(os.getenv("PROFILE_CACHE_MAX_USERS", "4096"))
+
 class Profile(BaseModel):
     id: str
     email: str
@@ -26,65 +34,182 @@ class Profile(BaseModel):
     unlocked_connect: Optional[bool] = False
 
 
+class ProfileSnapshotCache:
+    """
+    Full profile rows by user id, shared by every ProfileRepository in the process so the
+    per-field getters are served from one query. Updates made through ProfileRepository are
+    applied to the cached row; other changes are picked up after PROFILE_CACHE_TTL_SECONDS.
+    """
+    def __init__(self, ttl_seconds: int = PROFILE_CACHE_TTL_SECONDS, max_users: int = PROFILE_CACHE_MAX_USERS):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self._lock = Lock()
+        self._rows: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[dict]:
+        key = str(user_id)
+        with self._lock:
+            entry = self._rows.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._rows.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, user_id: str, row: dict) -> None:
+        key = str(user_id)
+        with self._lock:
+            self._rows[key] = (time.monotonic(), dict(row))
+            self._rows.move_to_end(key)
+            while len(self._rows) > self.max_users:
+                self._rows.popitem(last=False)
+
+    def patch(self, user_id: str, fields: Dict[str, Any]) -> None:
+        """
+        Applies an update that was written to Supabase to the cached row, if there is one.
+        """
+        with self._lock:
+            entry = self._rows.get(str(user_id))
+            if entry is not None:
+                entry[1].update(fields)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._rows.pop(str(user_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._rows),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+profile_cache = ProfileSnapshotCache()
+
+
+def invalidate_profile(user_id: str) -> None:
+    """
+    Drops the cached profile row, e.g. after a change made outside ProfileRepository.
+    """
+    profile_cache.invalidate(user_id)
+
+
+def deduction_params(deductions: Dict[str, int], strict: bool = False) -> dict:
+    """
+    Parameters of the deduct_credits RPC. With `strict`, a user whose balance does not cover
+    the whole amount is not charged at all; otherwise what is left is charged.
+    """
+    return {
+        "deductions": [{"user_id": str(user_id), "amount": amount} for user_id, amount in deductions.items()],
+        "strict": strict,
+    }
+
+
+def apply_deduction_rows(rows: Optional[list]) -> Dict[str, int]:
+    """
+    Applies the balances returned by the deduct_credits RPC to the snapshot cache and
+    returns the credits actually charged per user.
+    """
+    charged = {}
+    for row in rows or []:
+        profile_cache.patch(row["id"], {"credits": row["credits"], "credits_used": row["credits_used"]})
+        charged[str(row["id"])] = row["charged"]
+    return charged
+
+
 class ProfileRepository:
     """
     Repository class responsible for all Supabase CRUD operations
     for the profiles table.
     """
     def __init__(self):
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.supabase: Client = get_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
         self.table_name = "profiles"
 
-    def get_user_email(self, user_id: str) -> Optional[str]:
+    def get_profile_row(self, user_id: str, refresh: bool = False) -> Optional[dict]:
         """
-        Retrieves the email from the profile record in Supabase.
-        Returns the email or None if no record is found.
+        Retrieves the full profile record, from the snapshot cache unless refresh is set.
+        Returns the record as a dict or None if no record is found.
         """
-        try:    
-            response = self.supabase.table(self.table_name).select("email").eq("id", user_id).execute()
+        if not refresh:
+            row = profile_cache.get(user_id)
+            if row is not None:
+                return row
+        try:
+            response = self.supabase.table(self.table_name).select("*").eq("id", user_id).execute()
             data = response.data
             if data and len(data) > 0:
-                return data[0]["email"]
+                profile_cache.put(user_id, data[0])
+                return dict(data[0])
             else:
                 logging.info(f"No profile record found for user_id: {user_id}")
                 return None
         except Exception as e:
-            logging.error(f"Error fetching email for user_id: {user_id}: {e}")
+            logging.error(f"Error fetching profile for user_id: {user_id}: {e}")
             return None
+
+    def get_profiles(self, user_ids: Iterable[str]) -> Dict[str, Profile]:
+        """
+        Retrieves many profiles at once (for background jobs): cached rows are reused and the
+        rest are loaded with a single query. Users without a record are left out.
+        """
+        rows = {}
+        missing = []
+        for user_id in dict.fromkeys(str(user_id) for user_id in user_ids):
+            row = profile_cache.get(user_id)
+            if row is not None:
+                rows[user_id] = row
+            else:
+                missing.append(user_id)
+
+        if missing:
+            try:
+                response = self.supabase.table(self.table_name).select("*").in_("id", missing).execute()
+                for record in response.data or []:
+                    profile_cache.put(record["id"], record)
+                    rows[str(record["id"])] = record
+            except Exception as e:
+                logging.error(f"Error fetching profiles for {len(missing)} users: {e}")
+
+        return {user_id: Profile(**row) for user_id, row in rows.items()}
+
+    def _get_field(self, user_id: str, field: str, refresh: bool = False) -> Any:
+        row = self.get_profile_row(user_id, refresh=refresh)
+        if row is None:
+            return None
+        return row.get(field)
+
+    def get_user_email(self, user_id: str) -> Optional[str]:
+        """
+        Retrieves the email from the profile record in Supabase.
+        Returns the email or None if no record is found.
+        """
+        return self._get_field(user_id, "email")
         
     def get_user_name(self, user_id: str) -> Optional[str]:
         """
         Retrieves the name from the profile record in Supabase.
         Returns the name or None if no record is found.
         """
-        try:
-            response = self.supabase.table(self.table_name).select("name").eq("id", user_id).execute()
-            data = response.data    
-            if data and len(data) > 0:
-                return data[0]["name"]
-            else:
-                logging.info(f"No profile record found for user_id: {user_id}")
-                return None
-        except Exception as e:
-            logging.error(f"Error fetching name for user_id: {user_id}: {e}")
-            return None
+        return self._get_field(user_id, "name")
         
     def get_user_image(self, user_id: str) -> Optional[str]:
         """
         Retrieves the image from the profile record in Supabase.
         Returns the image or None if no record is found.    
         """
-        try:
-            response = self.supabase.table(self.table_name).select("image").eq("id", user_id).execute()
-            data = response.data
-            if data and len(data) > 0:
-                return data[0]["image"]     
-            else:
-                logging.info(f"No profile record found for user_id: {user_id}")
-                return None
-        except Exception as e:
-            logging.error(f"Error fetching image for user_id: {user_id}: {e}")
-            return None
+        return self._get_field(user_id, "image")
         
     def update_user_name(self, user_id: str, name: str) -> str:
         """
@@ -93,6 +218,7 @@ class ProfileRepository:
         """
         try:
             response = self.supabase.table(self.table_name).update({"name": name}).eq("id", user_id).execute()
+            profile_cache.patch(user_id, {"name": name})
             return "Name updated successfully"
         except Exception as e:
             logging.error(f"Error updating name for user_id: {user_id}: {e}")
@@ -103,17 +229,7 @@ class ProfileRepository:
         Retrieves the credit from the profile record in Supabase.
         Returns the credit or None if no record is found.
         """
-        try:
-            response = self.supabase.table(self.table_name).select("credits").eq("id", user_id).execute()
-            data = response.data    
-            if data and len(data) > 0:
-                return data[0]["credits"]
-            else:
-                logging.info(f"No profile record found for user_id: {user_id}")
-                return None
-        except Exception as e:
-            logging.error(f"Error fetching credits for user_id: {user_id}: {e}")
-            return None
+        return self._get_field(user_id, "credits")
         
     def update_user_credit(self, user_id: str, credit: int) -> bool:
         """
@@ -122,32 +238,29 @@ class ProfileRepository:
         """
         try:
             response = self.supabase.table(self.table_name).update({"credits": credit}).eq("id", user_id).execute()
+            profile_cache.patch(user_id, {"credits": credit})
             return True
         except Exception as e:
             logging.error(f"Error updating credits for user_id: {user_id}: {e}")
             return False    
             
     def deduct_credits(self, user_id: str, amount: int) -> bool:
-        """Atomically deduct credits from user's balance"""
+        """
+        Atomically deduct credits from user's balance with the deduct_credits RPC.
+        All or nothing: returns False, and charges nothing, if the balance does not cover
+        the whole amount. Per-turn charges go through credit_ledger instead, which batches them.
+        """
         try:
             # make sure the amount is positive
             if amount < 0:
                 logging.error(f"Amount to deduct is negative for user {user_id}")
                 return False
-            
-            current_credits = self.get_user_credit(user_id)
-            current_credits_used = self.get_user_credits_used(user_id)
-            
-            if current_credits is None or current_credits < amount:
+
+            response = self.supabase.rpc("deduct_credits", deduction_params({user_id: amount}, strict=True)).execute()
+            charged = apply_deduction_rows(response.data).get(str(user_id))
+            if charged != amount:
                 logging.error(f"Insufficient credits for user {user_id}")
                 return False
-            
-            deducted_credits = current_credits - amount
-            new_used_credits = current_credits_used + amount
-            
- 
-            credits = self.supabase.table(self.table_name).update({"credits": deducted_credits}).eq("id", user_id).execute()
-            credits_used = self.supabase.table(self.table_name).update({"credits_used": new_used_credits}).eq("id", user_id).execute()
             return True
         except Exception as e:
             logging.error(f"Failed to deduct credits for user {user_id}: {e}")
@@ -158,17 +271,7 @@ class ProfileRepository:
         Retrieves the credits used from the profile record in Supabase.
         Returns the credits used or None if no record is found.
         """
-        try:
-            response = self.supabase.table(self.table_name).select("credits_used").eq("id", user_id).execute()
-            data = response.data
-            if data and len(data) > 0:
-                return data[0]["credits_used"]
-            else:
-                logging.info(f"No profile record found for user_id: {user_id}")
-                return None
-        except Exception as e:
-            logging.error(f"Error fetching credits used for user_id: {user_id}: {e}")
-            return None
+        return self._get_field(user_id, "credits_used")
     
     def get_profile(self, user_id: str) -> Optional[Profile]:
         """
@@ -176,14 +279,10 @@ class ProfileRepository:
         Returns a Profile object or None if no record is found.
         """
         try:
-            response = self.supabase.table(self.table_name).select("*").eq("id", user_id).execute()
-            data = response.data
-            if data and len(data) > 0:
-                record = data[0]
+            record = self.get_profile_row(user_id)
+            if record is not None:
                 return Profile(**record)
-            else:
-                logging.info(f"No profile record found for user_id: {user_id}")
-                return None
+            return None
         except Exception as e:
             logging.error(f"Error fetching profile data for user {user_id}: {e}")
             return None
@@ -197,11 +296,11 @@ class ProfileRepository:
                 logging.error(f"Amount to increment is negative for user {user_id}")
                 return False
             
-            # Retrieve the current credits (example using a synchronous call)
-            current = self.get_user_credit(user_id)
-            new_total = current + additional_credits
-            response = self.supabase.table("profiles").update({"credits": new_total}).eq("id", user_id).execute()
-            return self.get_user_credit(user_id)
+            # add_credits increments in place, so it cannot race with deduct_credits
+            response = self.supabase.rpc("add_credits", {"input_user_id": str(user_id), "amount": additional_credits}).execute()
+            new_total = response.data
+            profile_cache.patch(user_id, {"credits": new_total})
+            return new_total
         except Exception as e:
             logging.error(f"Failed to increment credits for user {user_id}: {e}")
             raise
@@ -211,17 +310,7 @@ class ProfileRepository:
         Retrieves the birthdate from the profile record in Supabase.
         Returns the birthdate or None if no record is found.
         """
-        try:
-            response = self.supabase.table(self.table_name).select("birthdate").eq("id", user_id).execute()
-            data = response.data
-            if data and len(data) > 0:
-                return data[0]["birthdate"]
-            else:
-                logging.info(f"No profile record found for user_id: {user_id}")
-                return None
-        except Exception as e:
-            logging.error(f"Error fetching birthdate for user_id: {user_id}: {e}")
-            return None
+        return self._get_field(user_id, "birthdate")
 
     def update_user_birthdate(self, user_id: str, birthdate: str) -> bool:
         """
@@ -230,6 +319,7 @@ class ProfileRepository:
         """
         try:
             response = self.supabase.table(self.table_name).update({"birthdate": birthdate}).eq("id", user_id).execute()
+            profile_cache.patch(user_id, {"birthdate": birthdate})
             return True
         except Exception as e:
             logging.error(f"Error updating birthdate for user_id: {user_id}: {e}")
@@ -240,17 +330,7 @@ class ProfileRepository:
         Retrieves the location from the profile record in Supabase.
         Returns the location or None if no record is found.
         """
-        try:
-            response = self.supabase.table(self.table_name).select("location").eq("id", user_id).execute()
-            data = response.data
-            if data and len(data) > 0:
-                return data[0]["location"]
-            else:
-                logging.info(f"No profile record found for user_id: {user_id}")
-                return None
-        except Exception as e:
-            logging.error(f"Error fetching location for user_id: {user_id}: {e}")
-            return None
+        return self._get_field(user_id, "location")
 
     def update_user_location(self, user_id: str, location: str) -> bool:
         """
@@ -259,6 +339,7 @@ class ProfileRepository:
         """
         try:
             response = self.supabase.table(self.table_name).update({"location": location}).eq("id", user_id).execute()
+            profile_cache.patch(user_id, {"location": location})
             return True
         except Exception as e:
             logging.error(f"Error updating location for user_id: {user_id}: {e}")
@@ -269,17 +350,7 @@ class ProfileRepository:
         Retrieves the gender from the profile record in Supabase.
         Returns the gender or None if no record is found.
         """
-        try:
-            response = self.supabase.table(self.table_name).select("gender").eq("id", user_id).execute()
-            data = response.data
-            if data and len(data) > 0:
-                return data[0]["gender"]
-            else:
-                logging.info(f"No profile record found for user_id: {user_id}")
-                return None
-        except Exception as e:
-            logging.error(f"Error fetching gender for user_id: {user_id}: {e}")
-            return None
+        return self._get_field(user_id, "gender")
         
     def update_user_gender(self, user_id: str, gender: str) -> bool:
         """
@@ -288,6 +359,7 @@ class ProfileRepository:
         """
         try:
             response = self.supabase.table(self.table_name).update({"gender": gender}).eq("id", user_id).execute()
+            profile_cache.patch(user_id, {"gender": gender})
             return True
         except Exception as e:
             logging.error(f"Error updating gender for user_id: {user_id}: {e}")
@@ -340,6 +412,7 @@ class ProfileRepository:
             # Step 3: Delete auth record using admin API
             # This will cascade to profiles and all other tables with CASCADE constraints
             auth_deleted = self.supabase.auth.admin.delete_user(user_id)
+            profile_cache.invalidate(user_id)
             results["auth_deleted"] = True
             
             results["message"] = "User account completely deleted"
@@ -422,6 +495,7 @@ class ProfileRepository:
         """
         try:
             response = self.supabase.table(self.table_name).update({"is_pilot": is_pilot}).eq("id", user_id).execute()
+            profile_cache.patch(user_id, {"is_pilot": is_pilot})
             return True
         except Exception as e:
             logging.error(f"Error setting user as pilot for user_id: {user_id}: {e}")
@@ -432,9 +506,7 @@ class ProfileRepository:
         Gets if the user is opted in to the pilot program.
         """
         try:
-            response = self.supabase.table(self.table_name).select("is_pilot").eq("id", user_id).execute()
-            
-            return response.data[0]["is_pilot"]
+            return self.get_profile_row(user_id)["is_pilot"]
         except Exception as e:
             logging.error(f"Error getting user pilot for user_id: {user_id}: {e}")
             return False
@@ -444,8 +516,7 @@ class ProfileRepository:
         Gets if the user has unlocked the care feature.
         """
         try:
-            response = self.supabase.table(self.table_name).select("unlocked_care").eq("id", user_id).execute()
-            return response.data[0]["unlocked_care"]
+            return self.get_profile_row(user_id)["unlocked_care"]
         except Exception as e:
             logging.error(f"Error getting user unlocked care for user_id: {user_id}: {e}")
             return False
@@ -455,9 +526,164 @@ class ProfileRepository:
         Gets if the user has unlocked the care feature.
         """
         try:
-            response = self.supabase.table(self.table_name).select("unlocked_connect").eq("id", user_id).execute()
-            return response.data[0]["unlocked_connect"]
+            return self.get_profile_row(user_id)["unlocked_connect"]
         except Exception as e:
             logging.error(f"Error getting user unlocked care for user_id: {user_id}: {e}")
             return False
         
+
+
+class AsyncProfileRepository:
+    """
+    ProfileRepository for code running on the event loop: the same data methods, backed by
+    the shared async client and the same snapshot cache. (The auth-admin methods are only
+    on ProfileRepository.)
+    """
+    def __init__(self):
+        self.table_name = "profiles"
+
+    async def _table(self):
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        return client.table(self.table_name)
+
+    async def get_profile_row(self, user_id: str, refresh: bool = False) -> Optional[dict]:
+        if not refresh:
+            row = profile_cache.get(user_id)
+            if row is not None:
+                return row
+        try:
+            response = await (await self._table()).select("*").eq("id", user_id).execute()
+            data = response.data
+            if data and len(data) > 0:
+                profile_cache.put(user_id, data[0])
+                return dict(data[0])
+            else:
+                logging.info(f"No profile record found for user_id: {user_id}")
+                return None
+        except Exception as e:
+            logging.error(f"Error fetching profile for user_id: {user_id}: {e}")
+            return None
+
+    async def get_profiles(self, user_ids: Iterable[str]) -> Dict[str, Profile]:
+        rows = {}
+        missing = []
+        for user_id in dict.fromkeys(str(user_id) for user_id in user_ids):
+            row = profile_cache.get(user_id)
+            if row is not None:
+                rows[user_id] = row
+            else:
+                missing.append(user_id)
+
+        if missing:
+            try:
+                response = await (await self._table()).select("*").in_("id", missing).execute()
+                for record in response.data or []:
+                    profile_cache.put(record["id"], record)
+                    rows[str(record["id"])] = record
+            except Exception as e:
+                logging.error(f"Error fetching profiles for {len(missing)} users: {e}")
+
+        return {user_id: Profile(**row) for user_id, row in rows.items()}
+
+    async def _get_field(self, user_id: str, field: str, refresh: bool = False) -> Any:
+        row = await self.get_profile_row(user_id, refresh=refresh)
+        if row is None:
+            return None
+        return row.get(field)
+
+    async def _update(self, user_id: str, fields: Dict[str, Any]) -> bool:
+        try:
+            await (await self._table()).update(fields).eq("id", user_id).execute()
+            profile_cache.patch(user_id, fields)
+            return True
+        except Exception as e:
+            logging.error(f"Error updating {', '.join(fields)} for user_id: {user_id}: {e}")
+            return False
+
+    async def get_profile(self, user_id: str) -> Optional[Profile]:
+        record = await self.get_profile_row(user_id)
+        return Profile(**record) if record is not None else None
+
+    async def get_user_email(self, user_id: str) -> Optional[str]:
+        return await self._get_field(user_id, "email")
+
+    async def get_user_name(self, user_id: str) -> Optional[str]:
+        return await self._get_field(user_id, "name")
+
+    async def get_user_image(self, user_id: str) -> Optional[str]:
+        return await self._get_field(user_id, "image")
+
+    async def get_user_credit(self, user_id: str) -> Optional[int]:
+        return await self._get_field(user_id, "credits")
+
+    async def get_user_credits_used(self, user_id: str) -> Optional[int]:
+        return await self._get_field(user_id, "credits_used")
+
+    async def get_user_birthdate(self, user_id: str) -> Optional[str]:
+        return await self._get_field(user_id, "birthdate")
+
+    async def get_user_location(self, user_id: str) -> Optional[str]:
+        return await self._get_field(user_id, "location")
+
+    async def get_user_gender(self, user_id: str) -> Optional[str]:
+        return await self._get_field(user_id, "gender")
+
+    async def get_user_pilot(self, user_id: str) -> bool:
+        return bool(await self._get_field(user_id, "is_pilot"))
+
+    async def get_user_unlocked_care(self, user_id: str) -> bool:
+        return bool(await self._get_field(user_id, "unlocked_care"))
+
+    async def get_user_unlocked_connect(self, user_id: str) -> bool:
+        return bool(await self._get_field(user_id, "unlocked_connect"))
+
+    async def update_user_name(self, user_id: str, name: str) -> str:
+        if await self._update(user_id, {"name": name}):
+            return "Name updated successfully"
+        return "Error updating name"
+
+    async def update_user_credit(self, user_id: str, credit: int) -> bool:
+        return await self._update(user_id, {"credits": credit})
+
+    async def update_user_birthdate(self, user_id: str, birthdate: str) -> bool:
+        return await self._update(user_id, {"birthdate": birthdate})
+
+    async def update_user_location(self, user_id: str, location: str) -> bool:
+        return await self._update(user_id, {"location": location})
+
+    async def update_user_gender(self, user_id: str, gender: str) -> bool:
+        return await self._update(user_id, {"gender": gender})
+
+    async def set_user_pilot(self, user_id: str, is_pilot: bool) -> bool:
+        return await self._update(user_id, {"is_pilot": is_pilot})
+
+    async def deduct_credits(self, user_id: str, amount: int) -> bool:
+        if amount < 0:
+            logging.error(f"Amount to deduct is negative for user {user_id}")
+            return False
+
+        try:
+            client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+            response = await client.rpc("deduct_credits", deduction_params({user_id: amount}, strict=True)).execute()
+        except Exception as e:
+            logging.error(f"Failed to deduct credits for user {user_id}: {e}")
+            return False
+
+        if apply_deduction_rows(response.data).get(str(user_id)) != amount:
+            logging.error(f"Insufficient credits for user {user_id}")
+            return False
+        return True
+
+    async def increment_user_credit(self, user_id: str, additional_credits: int):
+        if additional_credits < 0:
+            logging.error(f"Amount to increment is negative for user {user_id}")
+            return False
+
+        try:
+            client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+            response = await client.rpc("add_credits", {"input_user_id": str(user_id), "amount": additional_credits}).execute()
+        except Exception as e:
+            logging.error(f"Failed to increment credits for user {user_id}: {e}")
+            raise
+        profile_cache.patch(user_id, {"credits": response.data})
+        return response.data
@@ -0,0 +1,186 @@
+# app/supabase/rolling_summary.py
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from agents import Agent, Runner
+from fastapi.concurrency import run_in_threadpool
+
+from app.supabase.conversation_history import Message, fold_history_async, get_history_head_async
+
+
+# Raw messages left after a fold (the rest of the history is the rolling summary)
+SUMMARY_KEEP_MESSAGES = int(os.getenv("SUMMARY_KEEP_MESSAGES", "4"))
+# Most messages folded into the summary in one call (a longer backlog is folded over several)
+SUMMARY_MAX_FOLD_MESSAGES = int(os.getenv("SUMMARY_MAX_FOLD_MESSAGES", "40"))
+# Seconds a scheduled summary waits, so a burst of messages for one user becomes one fold
+SUMMARY_COALESCE_SECONDS = float(os.getenv("SUMMARY_COALESCE_SECONDS", "2"))
+# Number of summaries folded concurrently
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "2"))
+
+SUMMARY_ROLE = "Summary"
+
+
+summarization_agent = Agent(
+    name=SUMMARY_ROLE,
+    handoff_description="An agent that summarizes conversation context.",
+    instructions=(
+        "You are an AI that keeps a running summary of a conversation. "
+        "You are given the summary so far (which may be empty) and the messages that came after it. "
+        "Return one updated summary that captures the key points of both. "
+        "Keep it brief and to the point."
+    ),
+    model="gpt-4o-mini",
+)
+
+
+async def summarize_messages(previous_summary: str, messages: List[Message]) -> str:
+    """
+    Folds `messages` into `previous_summary` and returns the new summary.
+    """
+    conversation = "\n".join([f"{msg.role}: {msg.content}" for msg in messages])
+    prompt = f"Summary so far:\n{previous_summary or '(none)'}\n\nNew messages:\n{conversation}\n\n"
+    result = await Runner.run(summarization_agent, prompt)
+    return result.final_output.strip()
+
+
+async def fold_history(user_id: str, threshold: int, keep: int = SUMMARY_KEEP_MESSAGES, extract: bool = False) -> Optional[Message]:
+    """
+    Rolls the oldest messages of the user's history into its summary.
+
+    The history is [summary, message, message, ...] (the summary once there has been a fold).
+    When it holds more than `threshold` raw messages, all but the last `keep` of them are
+    summarized together with the current summary, and replaced by the new summary in one
+    atomic update. Only the summary and the folded messages are read and sent to the model.
+    With `extract`, the folded messages (and only those) are queued for the memory and
+    personality analyses, so each message is analyzed once, when it leaves the window.
+    Returns the new summary message, or None if there was nothing to fold.
+    """
+    keep = min(keep, threshold)
+    head, total = await get_history_head_async(user_id, 1 + SUMMARY_MAX_FOLD_MESSAGES)
+    if not head:
+        return None
+
+    has_summary = int(head[0].role == SUMMARY_ROLE)
+    raw_count = total - has_summary
+    if raw_count <= threshold:
+        return None
+
+    fold_count = min(raw_count - keep, SUMMARY_MAX_FOLD_MESSAGES)
+    previous_summary = head[0].content if has_summary else ""
+    folded = head[has_summary:has_summary + fold_count]
+
+    summary = Message(role=SUMMARY_ROLE, content=await summarize_messages(previous_summary, folded), created_at=datetime.now())
+    length = await fold_history_async(user_id, summary, has_summary + fold_count, head[0])
+    if length is None:
+        logging.warning(f"Conversation history for user {user_id} changed before its summary was stored; skipping this fold")
+        return None
+
+    logging.info(f"Folded {fold_count} messages into the conversation summary for user {user_id} ({length} messages left).")
+
+    if extract:
+        transcript = "\n".join([f"{msg.role}: {msg.content}" for msg in folded if msg.user_id == user_id])
+        if transcript:
+            # imported here: the analysis services build their model clients at import
+            from app.function.analysis_jobs import enqueue_analysis
+
+            # Memory, MBTI, OCEAN and slang analyses run on the analysis worker (see analysis_jobs)
+            await run_in_threadpool(enqueue_analysis, user_id, transcript)
+    return summary
+
+
+class SummaryQueue:
+    """
+    Background rolling summaries with per-user coalescing.
+
+    schedule() returns immediately. A user's fold runs SUMMARY_COALESCE_SECONDS later on one
+    of SUMMARY_WORKERS worker tasks; scheduling the user again before then (or while the
+    fold is running, which queues one more check afterwards) does not add another fold.
+    """
+    def __init__(
+        self,
+        fold: Callable[..., Awaitable[Any]] = fold_history,
+        delay: float = SUMMARY_COALESCE_SECONDS,
+        workers: int = SUMMARY_WORKERS,
+    ):
+        self.fold = fold
+        self.delay = delay
+        self.workers = workers
+        self._pending: "OrderedDict[str, Tuple[int, bool]]" = OrderedDict()
+        self._running: Set[str] = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.scheduled = 0
+        self.coalesced = 0
+        self.folds = 0
+        self.errors = 0
+
+    def schedule(self, user_id: str, threshold: int, extract: bool = False) -> None:
+        """
+        Summarizes the user's history in the background if it has more than `threshold`
+        raw messages, queueing the folded messages for analysis with `extract`.
+        """
+        key = str(user_id)
+        self.scheduled += 1
+        if key in self._pending:
+            self._pending[key] = (threshold, extract or self._pending[key][1])
+            self.coalesced += 1
+            return
+        self._pending[key] = (threshold, extract)
+        if key in self._running:
+            # the running fold re-queues the user when it finishes
+            return
+        self._ensure_workers()
+        self._loop.call_later(self.delay, self._queue.put_nowait, key)
+
+    def _ensure_workers(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._tasks = []
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(loop.create_task(self._work()))
+
+    async def _work(self) -> None:
+        while True:
+            key = await self._queue.get()
+            pending = self._pending.pop(key, None)
+            if pending is None:
+                continue
+            threshold, extract = pending
+            self._running.add(key)
+            try:
+                if await self.fold(key, threshold, extract=extract) is not None:
+                    self.folds += 1
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Error summarizing conversation history for user {key}: {e}")
+            finally:
+                self._running.discard(key)
+            if key in self._pending:
+                self._loop.call_later(self.delay, self._queue.put_nowait, key)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "scheduled": self.scheduled,
+            "coalesced": self.coalesced,
+            "pending": len(self._pending),
+            "running": len(self._running),
+            "folds": self.folds,
+            "errors": self.errors,
+        }
+
+
+summary_queue = SummaryQueue()
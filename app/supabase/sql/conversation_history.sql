@@ -0,0 +1,122 @@
+-- Incremental access to conversation_history.history (a JSONB array of messages).
+--
+-- append_conversation_message appends one message server-side in a single statement, so a
+-- turn no longer downloads and re-uploads the whole array, and concurrent appends cannot
+-- overwrite each other. It returns the new number of messages, which the caller uses to
+-- check that its in-process tail of the history is still current.
+--
+-- get_conversation_window returns only the last message_count messages, plus the total;
+-- get_conversation_head the first message_count messages, plus the total.
+--
+-- fold_conversation_summary replaces the first replaced_count messages (the previous
+-- rolling summary and the oldest raw messages) with a new summary message, leaving the
+-- rest of the array, including anything appended meanwhile, in place. It only applies if
+-- the first message is still expected_head, so a fold computed from a stale head (another
+-- worker folded first) changes nothing; it then returns null, otherwise the new length.
+--
+-- Message shape: {"role": text, "content": text, "created_at": iso timestamp, "user_id": text}
+-- (see Message in app/supabase/conversation_history.py).
+
+
+create or replace function append_conversation_message(
+    input_user_id uuid,
+    message jsonb
+)
+returns integer
+language plpgsql
+as $$
+declare
+    new_length integer;
+begin
+    update conversation_history
+    set history = coalesce(history, '[]'::jsonb) || jsonb_build_array(message)
+    where user_id = input_user_id
+    returning jsonb_array_length(history) into new_length;
+
+    if not found then
+        insert into conversation_history (user_id, history)
+        values (input_user_id, jsonb_build_array(message));
+        new_length := 1;
+    end if;
+
+    return new_length;
+end;
+$$;
+
+
+create or replace function get_conversation_window(
+    input_user_id uuid,
+    message_count integer
+)
+returns table (
+    messages jsonb,
+    total integer
+)
+language sql
+stable
+as $$
+    select
+        coalesce(
+            (
+                select jsonb_agg(message order by position)
+                from jsonb_array_elements(ch.history) with ordinality as m(message, position)
+                where position > jsonb_array_length(ch.history) - message_count
+            ),
+            '[]'::jsonb
+        ) as messages,
+        jsonb_array_length(ch.history) as total
+    from conversation_history ch
+    where ch.user_id = input_user_id
+      and ch.history is not null;
+$$;
+
+
+create or replace function get_conversation_head(
+    input_user_id uuid,
+    message_count integer
+)
+returns table (
+    messages jsonb,
+    total integer
+)
+language sql
+stable
+as $$
+    select
+        coalesce(
+            (
+                select jsonb_agg(message order by position)
+                from jsonb_array_elements(ch.history) with ordinality as m(message, position)
+                where position <= message_count
+            ),
+            '[]'::jsonb
+        ) as messages,
+        jsonb_array_length(ch.history) as total
+    from conversation_history ch
+    where ch.user_id = input_user_id
+      and ch.history is not null;
+$$;
+
+
+create or replace function fold_conversation_summary(
+    input_user_id uuid,
+    summary jsonb,
+    replaced_count integer,
+    expected_head jsonb
+)
+returns integer
+language sql
+as $$
+    update conversation_history ch
+    set history = jsonb_build_array(summary) || coalesce(
+        (
+            select jsonb_agg(message order by position)
+            from jsonb_array_elements(ch.history) with ordinality as m(message, position)
+            where position > replaced_count
+        ),
+        '[]'::jsonb
+    )
+    where ch.user_id = input_user_id
+      and ch.history -> 0 = expected_head
+    returning jsonb_array_length(ch.history);
+$$;
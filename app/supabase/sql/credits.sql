@@ -0,0 +1,64 @@
+-- Atomic credit changes on profiles.credits / profiles.credits_used.
+--
+-- deduct_credits applies a batch of deductions in one statement. Each row is locked and
+-- decremented in place, so concurrent sessions (or workers) for the same user cannot
+-- overwrite each other's deductions. A user is never taken below 0 credits: `charged` is
+-- what was actually deducted. By default that is what was left when the balance ran out
+-- (the ledger's batches charge for turns already served); with `strict`, a user whose
+-- balance does not cover the whole amount is not charged at all (charged = 0).
+-- The batch may contain the same user more than once; the amounts are summed.
+--
+-- Batch shape: [{"user_id": uuid, "amount": integer}, ...]
+-- (see CreditLedger in app/supabase/credit_ledger.py).
+--
+-- add_credits increments the balance in place for Stripe top-ups and returns the new balance.
+
+
+-- replaces the earlier one-argument version, which would make calls ambiguous
+drop function if exists deduct_credits(jsonb);
+
+create or replace function deduct_credits(deductions jsonb, strict boolean default false)
+returns table (
+    id uuid,
+    credits integer,
+    credits_used integer,
+    charged integer
+)
+language sql
+as $$
+    with requested as (
+        select (d->>'user_id')::uuid as user_id, sum((d->>'amount')::integer) as amount
+        from jsonb_array_elements(deductions) as d
+        group by 1
+    ),
+    locked as (
+        select p.id,
+            case
+                when strict and coalesce(p.credits, 0) < r.amount then 0
+                else least(r.amount, greatest(coalesce(p.credits, 0), 0))
+            end as charged
+        from profiles p
+        join requested r on r.user_id = p.id
+        for update of p
+    )
+    update profiles p
+    set credits = coalesce(p.credits, 0) - l.charged,
+        credits_used = coalesce(p.credits_used, 0) + l.charged
+    from locked l
+    where p.id = l.id
+    returning p.id, p.credits, p.credits_used, l.charged;
+$$;
+
+
+create or replace function add_credits(
+    input_user_id uuid,
+    amount integer
+)
+returns integer
+language sql
+as $$
+    update profiles
+    set credits = coalesce(credits, 0) + amount
+    where id = input_user_id
+    returning credits;
+$$;
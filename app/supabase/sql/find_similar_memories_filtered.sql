@@ -0,0 +1,159 @@
+-- Filtered similarity search over user_knowledge.
+--
+-- Same result shape as find_similar_memories, but rows are filtered by a MemoryFilter spec
+-- (see MemoryFilter.to_spec in app/utils/match_filter.py) BEFORE the top-k cut, so selective
+-- filters still return up to top_k matches in one round trip.
+--
+-- Spec: {"all": [clause, ...], "any": [clause, ...], "sort": ...}
+--   clause: {"op": "eq" | "gte" | "lte" | "contains" | "contains_any" | "contains_all",
+--            "key": "<metadata key or column>", "value": <json>}
+-- A row matches when every "all" clause holds or any "any" clause holds. Keys are read from
+-- metadata first, then from the row's own columns. "sort" is applied by the caller.
+-- matches_spec in match_filter.py is the Python reference for these semantics.
+
+
+create or replace function memory_filter_try_timestamp(value text)
+returns timestamp
+language plpgsql
+immutable
+as $$
+begin
+    return value::timestamp;
+exception when others then
+    return null;
+end;
+$$;
+
+
+create or replace function memory_filter_contains(value jsonb, item jsonb)
+returns boolean
+language sql
+immutable
+as $$
+    select case
+        when value is null then false
+        when jsonb_typeof(value) = 'array' then value @> jsonb_build_array(item)
+        when jsonb_typeof(value) = 'string' and jsonb_typeof(item) = 'string'
+            then strpos(value #>> '{}', item #>> '{}') > 0
+        else false
+    end;
+$$;
+
+
+create or replace function memory_filter_clause(memory jsonb, clause jsonb)
+returns boolean
+language plpgsql
+immutable
+as $$
+declare
+    key text := clause ->> 'key';
+    op text := clause ->> 'op';
+    expected jsonb := clause -> 'value';
+    value jsonb;
+    value_ts timestamp;
+    expected_ts timestamp;
+    cmp integer;
+begin
+    if jsonb_typeof(memory -> 'metadata') = 'object' and (memory -> 'metadata') ? key then
+        value := memory -> 'metadata' -> key;
+    else
+        value := memory -> key;
+    end if;
+
+    if op = 'eq' then
+        return coalesce(value, 'null'::jsonb) = expected;
+
+    elsif op in ('gte', 'lte') then
+        if value is null or jsonb_typeof(value) = 'null' then
+            return false;
+        end if;
+
+        if jsonb_typeof(value) = 'number' and jsonb_typeof(expected) = 'number' then
+            cmp := sign((value #>> '{}')::numeric - (expected #>> '{}')::numeric);
+        elsif jsonb_typeof(value) = 'string' and jsonb_typeof(expected) = 'string' then
+            value_ts := memory_filter_try_timestamp(value #>> '{}');
+            expected_ts := memory_filter_try_timestamp(expected #>> '{}');
+            if value_ts is not null and expected_ts is not null then
+                cmp := case when value_ts > expected_ts then 1 when value_ts < expected_ts then -1 else 0 end;
+            elsif value_ts is null and expected_ts is null then
+                cmp := case
+                    when (value #>> '{}') collate "C" > (expected #>> '{}') collate "C" then 1
+                    when (value #>> '{}') collate "C" < (expected #>> '{}') collate "C" then -1
+                    else 0 end;
+            else
+                return false;
+            end if;
+        elsif jsonb_typeof(value) = 'boolean' and jsonb_typeof(expected) = 'boolean' then
+            cmp := sign((value #>> '{}')::boolean::int - (expected #>> '{}')::boolean::int);
+        else
+            return false;
+        end if;
+
+        return case when op = 'gte' then cmp >= 0 else cmp <= 0 end;
+
+    elsif op = 'contains' then
+        return memory_filter_contains(value, expected);
+
+    elsif op = 'contains_any' then
+        return exists (select 1 from jsonb_array_elements(expected) item where memory_filter_contains(value, item));
+
+    elsif op = 'contains_all' then
+        return not exists (select 1 from jsonb_array_elements(expected) item where not memory_filter_contains(value, item));
+    end if;
+
+    raise exception 'Unknown filter op: %', op;
+end;
+$$;
+
+
+create or replace function memory_filter_matches(memory jsonb, spec jsonb)
+returns boolean
+language sql
+immutable
+as $$
+    select
+        not exists (
+            select 1 from jsonb_array_elements(coalesce(spec -> 'all', '[]'::jsonb)) clause
+            where not memory_filter_clause(memory, clause)
+        )
+        or exists (
+            select 1 from jsonb_array_elements(coalesce(spec -> 'any', '[]'::jsonb)) clause
+            where memory_filter_clause(memory, clause)
+        );
+$$;
+
+
+create or replace function find_similar_memories_filtered(
+    input_user_id uuid,
+    query_embedding vector(1536),
+    top_k integer,
+    filter_spec jsonb
+)
+returns table (
+    id uuid,
+    knowledge_text text,
+    embedding vector(1536),
+    metadata jsonb,
+    mention_count integer,
+    last_updated timestamptz,
+    created_at timestamptz,
+    similarity double precision
+)
+language sql
+stable
+as $$
+    select
+        uk.id,
+        uk.knowledge_text,
+        uk.embedding,
+        uk.metadata,
+        uk.mention_count,
+        uk.last_updated,
+        uk.created_at,
+        1 - (uk.embedding <=> query_embedding) as similarity
+    from user_knowledge uk
+    where uk.user_id = input_user_id
+      and memory_filter_matches(to_jsonb(uk) - 'embedding', filter_spec)
+    order by uk.embedding <=> query_embedding
+    limit top_k;
+$$;
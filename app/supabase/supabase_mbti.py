@@ -1,12 +1,12 @@
 import os
 import logging
 from typing import Optional
-from supabase import create_client, Client
+from supabase import Client
+from app.supabase.client import get_async_supabase_client, get_supabase_client
 from pydantic import BaseModel
 
 logging.basicConfig(level=logging.INFO)
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 class MBTI(BaseModel):
@@ -24,7 +24,7 @@ class MBTIRepository:
     for the MBTI data.
     """
     def __init__(self):
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.supabase: Client = get_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
         self.table_name = "mbti_personality"  # Update if needed
 
     def get_mbti(self, user_id: str) -> Optional[MBTI]:
@@ -83,3 +83,62 @@ class MBTIRepository:
         self.supabase.table(self.table_name).delete().eq("user_id", user_id).execute()
         logging.info(f"Reset MBTI record for user_id: {user_id}")
 
+
+
+class AsyncMBTIRepository:
+    """
+    MBTIRepository for code running on the event loop, backed by the shared async client.
+    """
+    def __init__(self):
+        self.table_name = "mbti_personality"
+
+    async def _table(self):
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        return client.table(self.table_name)
+
+    async def get_mbti(self, user_id: str) -> Optional[MBTI]:
+        """
+        Retrieves the MBTI record for a specific user from Supabase.
+        If none exists, creates a new default record and returns it.
+        """
+        try:
+            response = await (await self._table()).select("*").eq("user_id", user_id).execute()
+            data = response.data
+            if data and len(data) > 0:
+                return MBTI(**data[0])
+
+            logging.info(f"No MBTI record found for user_id: {user_id}. Creating a new one.")
+            new_mbti_data = MBTI().dict()
+            new_mbti_data["user_id"] = user_id
+            insert_response = await (await self._table()).insert(new_mbti_data).execute()
+            if insert_response.data and len(insert_response.data) > 0:
+                return MBTI(**insert_response.data[0])
+            logging.error(f"Failed to create MBTI record for user {user_id}.")
+            return None
+        except Exception as e:
+            logging.error(f"Error fetching MBTI data for user {user_id}: {e}")
+            return None
+
+    async def upsert_mbti(self, user_id: str, mbti: MBTI) -> None:
+        """
+        Inserts or updates (upserts) the MBTI record for a specific user.
+        """
+        record_dict = mbti.dict()
+        record_dict["user_id"] = user_id
+        try:
+            existing = await (await self._table()).select("*").eq("user_id", user_id).execute()
+            if existing.data and len(existing.data) > 0:
+                await (await self._table()).update(record_dict).eq("user_id", user_id).execute()
+                logging.info(f"Updated MBTI record for user_id: {user_id}")
+            else:
+                await (await self._table()).insert(record_dict).execute()
+                logging.info(f"Inserted new MBTI record for user_id: {user_id}")
+        except Exception as e:
+            logging.error(f"Error upserting MBTI data for user {user_id}: {e}")
+
+    async def reset_mbti(self, user_id: str) -> None:
+        """
+        Resets the MBTI record for a specific user.
+        """
+        await (await self._table()).delete().eq("user_id", user_id).execute()
+        logging.info(f"Reset MBTI record for user_id: {user_id}")
@@ -1,12 +1,12 @@
 import os
 import logging
 from typing import Optional
-from supabase import create_client, Client
+from supabase import Client
+from app.supabase.client import get_async_supabase_client, get_supabase_client
 from pydantic import BaseModel
 
 logging.basicConfig(level=logging.INFO)
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 class Ocean(BaseModel):
@@ -26,7 +26,7 @@ class OceanResponse(BaseModel):
 
 class OceanRepository:
     def __init__(self):
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.supabase: Client = get_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
         self.table_name = "ocean_personality"
 
     def get_ocean(self, user_id: str) -> Optional[Ocean]:
@@ -80,3 +80,58 @@ class OceanRepository:
         """
         self.supabase.table(self.table_name).delete().eq("user_id", user_id).execute()
         logging.info(f"Reset OCEAN record for user_id: {user_id}")
+
+
+class AsyncOceanRepository:
+    """
+    OceanRepository for code running on the event loop, backed by the shared async client.
+    """
+    def __init__(self):
+        self.table_name = "ocean_personality"
+
+    async def _table(self):
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        return client.table(self.table_name)
+
+    async def get_ocean(self, user_id: str) -> Optional[Ocean]:
+        """
+        Get the OCEAN record for a user. If no record exists, create a new one.
+        """
+        try:
+            response = await (await self._table()).select("*").eq("user_id", user_id).execute()
+            data = response.data
+            if data and len(data) > 0:
+                return Ocean(**data[0])
+
+            logging.info(f"No OCEAN record found for user_id: {user_id}. Creating a new one.")
+            new_ocean_data = Ocean().dict()
+            new_ocean_data["user_id"] = user_id
+            insert_response = await (await self._table()).insert(new_ocean_data).execute()
+            if insert_response.data and len(insert_response.data) > 0:
+                return Ocean(**insert_response.data[0])
+            logging.error(f"Failed to create OCEAN record for user {user_id}.")
+            return None
+        except Exception as e:
+            logging.error(f"Error fetching OCEAN data for user {user_id}: {e}")
+            return None
+
+    async def upsert_ocean(self, user_id: str, ocean: Ocean) -> None:
+        record_dict = ocean.dict()
+        record_dict["user_id"] = user_id
+        try:
+            existing = await (await self._table()).select("*").eq("user_id", user_id).execute()
+            if existing.data and len(existing.data) > 0:
+                await (await self._table()).update(record_dict).eq("user_id", user_id).execute()
+                logging.info(f"Updated OCEAN record for user_id: {user_id}")
+            else:
+                await (await self._table()).insert(record_dict).execute()
+                logging.info(f"Inserted new OCEAN record for user_id: {user_id}")
+        except Exception as e:
+            logging.error(f"Error upserting OCEAN data for user {user_id}: {e}")
+
+    async def reset_ocean(self, user_id: str) -> None:
+        """
+        Resets the OCEAN record for a specific user.
+        """
+        await (await self._table()).delete().eq("user_id", user_id).execute()
+        logging.info(f"Reset OCEAN record for user_id: {user_id}")
@@ -3,10 +3,10 @@ import logging
 import os
 from typing import List, Optional
 from pydantic import BaseModel
-from supabase import create_client, Client
+from supabase import Client
+from app.supabase.client import get_async_supabase_client, get_supabase_client
 
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 
@@ -18,7 +18,7 @@ class UserFeedback(BaseModel):
 
 class UserFeedbackRepository:
     def __init__(self):
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.supabase: Client = get_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
         self.table_name = "user_feedback"
 
     def create_user_feedback(self, user_feedback: UserFeedback) -> bool:
@@ -38,3 +38,29 @@ class UserFeedbackRepository:
             return None
 
 
+class AsyncUserFeedbackRepository:
+    """
+    UserFeedbackRepository for code running on the event loop, backed by the shared async client.
+    """
+    def __init__(self):
+        self.table_name = "user_feedback"
+
+    async def _table(self):
+        client = await get_async_supabase_client(SUPABASE_SERVICE_ROLE_KEY)
+        return client.table(self.table_name)
+
+    async def create_user_feedback(self, user_feedback: UserFeedback) -> bool:
+        try:
+            await (await self._table()).insert(user_feedback.model_dump()).execute()
+            return True
+        except Exception as e:
+            logging.error(f"Error creating user feedback: {e}")
+            raise
+
+    async def get_user_feedback(self, user_id: str) -> Optional[List[UserFeedback]]:
+        try:
+            response = await (await self._table()).select("*").eq("user_id", user_id).execute()
+            return response.data
+        except Exception as e:
+            logging.error(f"Error fetching user feedback for user_id: {user_id}: {e}")
+            return None
@@ -0,0 +1,227 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapses whitespace so "hey  there " and "hey there" share a cache entry.
+    Case is kept because it changes the embedding.
+    """
+    return " ".join(text.split())
+
+
+def make_key(model: str, text: str) -> str:
+    """
+    Cache key for an embedding: sha256 over the model name and the normalized text.
+    """
+    digest = hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Second-tier storage behind the in-process LRU. Subclasses persist vectors across restarts.
+    """
+    def get(self, key: str) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+    def set(self, key: str, model: str, vector: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class SqliteEmbeddingStore(EmbeddingStore):
+    """
+    On-disk tier backed by a single sqlite file. Vectors are stored as float32 blobs.
+    """
+    def __init__(self, path: str, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        vector, created_at = row
+        if self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds:
+            with self.lock:
+                self.connection.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self.connection.commit()
+            return None
+        return np.frombuffer(vector, dtype=np.float32)
+
+    def set(self, key: str, model: str, vector: np.ndarray) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, created_at) VALUES (?, ?, ?, ?)",
+                (key, model, np.asarray(vector, dtype=np.float32).tobytes(), time.time()),
+            )
+            self.connection.commit()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM embeddings")
+            self.connection.commit()
+
+
+class EmbeddingCache:
+    """
+    In-process LRU of embeddings keyed by (model, normalized text hash), with a size limit,
+    a TTL and an optional EmbeddingStore tier that survives restarts.
+
+    Vectors are held as float32 arrays (about 6KB for a 1536-dim embedding) and handed
+    back as plain lists, which is what the OpenAI client returns.
+    """
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl_seconds: Optional[float] = 24 * 60 * 60,
+        store: Optional[EmbeddingStore] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self.clock = clock
+        self.lock = Lock()
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.store_hits = 0
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingCache":
+        """
+        Builds the process-wide cache from EMBEDDING_CACHE_* environment variables.
+        """
+        path = os.getenv("EMBEDDING_CACHE_PATH")
+        store = None
+        if path:
+            try:
+                store = SqliteEmbeddingStore(path, ttl_seconds=float(os.getenv("EMBEDDING_CACHE_DISK_TTL_SECONDS", 30 * 24 * 60 * 60)))
+            except Exception as e:
+                logging.error(f"Could not open embedding cache at {path}: {e}")
+
+        return cls(
+            max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "2048")),
+            ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", 24 * 60 * 60)),
+            store=store,
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = make_key(model, text)
+        now = self.clock()
+
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, stored_at = entry
+                if self.ttl_seconds is None or now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector.tolist()
+                del self._entries[key]
+                self.evictions += 1
+
+        if self.store is not None:
+            try:
+                vector = self.store.get(key)
+            except Exception as e:
+                logging.error(f"Error reading embedding cache store: {e}")
+                vector = None
+
+            if vector is not None:
+                with self.lock:
+                    self.hits += 1
+                    self.store_hits += 1
+                    self._insert(key, vector, now)
+                return vector.tolist()
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, model: str, text: str, embedding: List[float]) -> None:
+        key = make_key(model, text)
+        vector = np.asarray(embedding, dtype=np.float32)
+
+        with self.lock:
+            self._insert(key, vector, self.clock())
+
+        if self.store is not None:
+            try:
+                self.store.set(key, model, vector)
+            except Exception as e:
+                logging.error(f"Error writing embedding cache store: {e}")
+
+    def get_or_create(self, model: str, text: str, create: Callable[[str], Optional[List[float]]]) -> Optional[List[float]]:
+        """
+        Returns the cached embedding or computes it with create(text) and caches the result.
+        Failed computations (None) are not cached.
+        """
+        cached = self.get(model, text)
+        if cached is not None:
+            return cached
+
+        embedding = create(text)
+        if embedding is not None:
+            self.set(model, text, embedding)
+        return embedding
+
+    def _insert(self, key: str, vector: np.ndarray, now: float) -> None:
+        # caller holds self.lock
+        self._entries[key] = (vector, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self._entries.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "store_hits": self.store_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Process-wide cache used by generate_embedding
+embedding_cache = EmbeddingCache.from_env()
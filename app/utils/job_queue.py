@@ -0,0 +1,270 @@
+# app/utils/job_queue.py
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+# Seconds a claimed job may run before another worker is allowed to take it over (a crashed worker)
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+# Attempts per job before it is given up on
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# Delay before the first retry of a failed job; doubled on every further attempt
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+# Seconds an idle worker waits before looking for new jobs
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+
+
+SCHEMA = """
+create table if not exists jobs (
+    id integer primary key autoincrement,
+    user_id text not null,
+    kind text not null,
+    payload text not null,
+    status text not null default 'pending',
+    attempts integer not null default 0,
+    created_at real not null,
+    available_at real not null,
+    started_at real,
+    last_error text
+);
+create index if not exists jobs_pending on jobs (status, available_at);
+create index if not exists jobs_user_kind on jobs (user_id, kind, status);
+create table if not exists job_counters (
+    kind text primary key,
+    completed integer not null default 0,
+    failed integer not null default 0,
+    retried integer not null default 0,
+    coalesced integer not null default 0,
+    total_latency_ms real not null default 0,
+    max_latency_ms real not null default 0
+);
+"""
+
+
+@dataclass
+class Job:
+    id: int
+    user_id: str
+    kind: str
+    payload: str
+    attempts: int
+    created_at: float
+
+
+def append_new_lines(old: str, new: str) -> str:
+    """
+    Coalesces two payloads made of lines (transcripts): the old lines, then the new lines
+    that are not already in them.
+    """
+    seen = set(old.split("\n"))
+    added = [line for line in new.split("\n") if line not in seen]
+    return "\n".join([old] + added) if added else old
+
+
+class JobQueue:
+    """
+    A durable job queue in a local SQLite file, shared by every process on the host.
+
+    enqueue() adds a job, or folds it into the job already waiting for the same user and
+    kind (with `merge`), so a backlog holds at most one pending job per user and kind.
+    Workers claim jobs with a lease; a job whose worker died is claimed again once the lease
+    has expired. A failed job is retried after JOB_RETRY_BASE_SECONDS, doubling per attempt,
+    until JOB_MAX_ATTEMPTS. Each call uses its own short-lived connection.
+    """
+    def __init__(self, path: str, merge: Callable[[str, str], str] = append_new_lines):
+        self.path = path
+        self.merge = merge
+        with closing(self._connect()) as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: transactions are opened explicitly with "begin immediate"
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _transaction(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        conn = self._connect()
+        try:
+            conn.execute("begin immediate")
+            try:
+                result = work(conn)
+            except BaseException:
+                conn.execute("rollback")
+                raise
+            conn.execute("commit")
+            return result
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection, kind: str, **increments: float) -> None:
+        conn.execute("insert or ignore into job_counters (kind) values (?)", (kind,))
+        for column, amount in increments.items():
+            conn.execute(f"update job_counters set {column} = {column} + ? where kind = ?", (amount, kind))
+
+    def _merge_into_pending(self, conn: sqlite3.Connection, user_id: str, kind: str, payload: str, older: bool = False) -> bool:
+        """
+        Merges `payload` into the user's pending job of this kind, if there is one. `older`
+        means the payload predates the pending job's (a retried job).
+        """
+        row = conn.execute(
+            "select id, payload from jobs where user_id = ? and kind = ? and status = 'pending'",
+            (user_id, kind),
+        ).fetchone()
+        if row is None:
+            return False
+        merged = self.merge(payload, row[1]) if older else self.merge(row[1], payload)
+        conn.execute("update jobs set payload = ? where id = ?", (merged, row[0]))
+        self._count(conn, kind, coalesced=1)
+        return True
+
+    def enqueue(self, user_id: str, kind: str, payload: str) -> None:
+        def work(conn):
+            if self._merge_into_pending(conn, str(user_id), kind, payload):
+                return
+            now = time.time()
+            conn.execute(
+                "insert into jobs (user_id, kind, payload, created_at, available_at) values (?, ?, ?, ?, ?)",
+                (str(user_id), kind, payload, now, now),
+            )
+        self._transaction(work)
+
+    def claim(self, limit: int, lease: float = JOB_LEASE_SECONDS) -> List[Job]:
+        """
+        Takes up to `limit` jobs that are due (oldest first) and marks them running.
+        """
+        def work(conn):
+            now = time.time()
+            rows = conn.execute(
+                "select id, user_id, kind, payload, attempts, created_at from jobs "
+                "where (status = 'pending' and available_at <= ?) or (status = 'running' and started_at < ?) "
+                "order by available_at limit ?",
+                (now, now - lease, limit),
+            ).fetchall()
+            for row in rows:
+                conn.execute("update jobs set status = 'running', started_at = ?, attempts = attempts + 1 where id = ?", (now, row[0]))
+            return [Job(id=row[0], user_id=row[1], kind=row[2], payload=row[3], attempts=row[4] + 1, created_at=row[5]) for row in rows]
+        return self._transaction(work)
+
+    def complete(self, job: Job) -> None:
+        def work(conn):
+            conn.execute("delete from jobs where id = ?", (job.id,))
+            latency_ms = (time.time() - job.created_at) * 1000
+            self._count(conn, job.kind, completed=1, total_latency_ms=latency_ms)
+            conn.execute("update job_counters set max_latency_ms = max(max_latency_ms, ?) where kind = ?", (latency_ms, job.kind))
+        self._transaction(work)
+
+    def fail(self, job: Job, error: str, max_attempts: int = JOB_MAX_ATTEMPTS, retry_base: float = JOB_RETRY_BASE_SECONDS) -> None:
+        def work(conn):
+            if job.attempts >= max_attempts:
+                conn.execute("delete from jobs where id = ?", (job.id,))
+                self._count(conn, job.kind, failed=1)
+                logging.error(f"Giving up on {job.kind} job for user {job.user_id} after {job.attempts} attempts: {error}")
+                return
+            self._count(conn, job.kind, retried=1)
+            # a newer job for the same user and kind may be waiting; retry as part of it
+            if self._merge_into_pending(conn, job.user_id, job.kind, job.payload, older=True):
+                conn.execute("delete from jobs where id = ?", (job.id,))
+                return
+            conn.execute(
+                "update jobs set status = 'pending', available_at = ?, last_error = ? where id = ?",
+                (time.time() + retry_base * 2 ** (job.attempts - 1), error, job.id),
+            )
+        self._transaction(work)
+
+    def stats(self) -> Dict[str, Any]:
+        with closing(self._connect()) as conn:
+            depth = dict(conn.execute("select kind, count(*) from jobs where status = 'pending' group by kind").fetchall())
+            running = dict(conn.execute("select kind, count(*) from jobs where status = 'running' group by kind").fetchall())
+            oldest = conn.execute("select min(created_at) from jobs where status = 'pending'").fetchone()[0]
+            counters = conn.execute(
+                "select kind, completed, failed, retried, coalesced, total_latency_ms, max_latency_ms from job_counters"
+            ).fetchall()
+        kinds = {}
+        for kind, completed, failed, retried, coalesced, total_latency_ms, max_latency_ms in counters:
+            kinds[kind] = {
+                "pending": depth.get(kind, 0),
+                "running": running.get(kind, 0),
+                "completed": completed,
+                "failed": failed,
+                "retried": retried,
+                "coalesced": coalesced,
+                "avg_latency_ms": round(total_latency_ms / completed, 1) if completed else 0.0,
+                "max_latency_ms": round(max_latency_ms, 1),
+            }
+        for kind in set(depth) | set(running):
+            kinds.setdefault(kind, {"pending": depth.get(kind, 0), "running": running.get(kind, 0)})
+        return {
+            "depth": sum(depth.values()),
+            "running": sum(running.values()),
+            "oldest_pending_s": round(time.time() - oldest, 1) if oldest else 0.0,
+            "kinds": kinds,
+        }
+
+
+class JobWorker:
+    """
+    Runs queued jobs with up to `concurrency` at a time on the current event loop.
+    `handlers` maps a job kind to an async function of (user_id, payload).
+    """
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, Callable[[str, str], Awaitable[Any]]],
+        concurrency: int = 4,
+        poll_interval: float = JOB_POLL_SECONDS,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._running: Dict[int, asyncio.Task] = {}
+
+    async def run_job(self, job: Job) -> None:
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for job kind '{job.kind}'")
+            await handler(job.user_id, job.payload)
+        except Exception as e:
+            logging.error(f"Error running {job.kind} job for user {job.user_id} (attempt {job.attempts}): {e}")
+            await asyncio.to_thread(self.queue.fail, job, str(e))
+        else:
+            await asyncio.to_thread(self.queue.complete, job)
+
+    async def run_once(self) -> int:
+        """
+        Starts as many due jobs as there are free slots. Returns the number started.
+        """
+        free = self.concurrency - len(self._running)
+        if free <= 0:
+            return 0
+        jobs = await asyncio.to_thread(self.queue.claim, free)
+        for job in jobs:
+            task = asyncio.get_running_loop().create_task(self.run_job(job))
+            self._running[job.id] = task
+            task.add_done_callback(lambda _, job_id=job.id: self._running.pop(job_id, None))
+        return len(jobs)
+
+    async def run(self, stop: Optional[asyncio.Event] = None) -> None:
+        while stop is None or not stop.is_set():
+            try:
+                started = await self.run_once()
+            except Exception as e:
+                logging.error(f"Error claiming jobs: {e}")
+                started = 0
+            if not started:
+                await asyncio.sleep(self.poll_interval)
+        await self.drain()
+
+    async def drain(self) -> None:
+        """
+        Waits for the jobs that are running.
+        """
+        if self._running:
+            await asyncio.gather(*list(self._running.values()), return_exceptions=True)
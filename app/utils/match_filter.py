@@ -1,45 +1,60 @@
-from datetime import datetime
-from typing import Callable, List, Any, Dict
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Callable, List, Any, Dict, Optional, Tuple
+
+import numpy as np
 
 class MemoryFilter:
     def __init__(self):
         self.conditions: List[Callable[[Dict[str, Any]], bool]] = []
         self.or_conditions: List[Callable[[Dict[str, Any]], bool]] = [] 
+        # Declarative copy of the conditions above, compiled by to_spec() for server-side filtering
+        self.clauses: List[Dict[str, Any]] = []
+        self.or_clauses: List[Dict[str, Any]] = []
         self.sort_order: str = None
         self.sort_key: str = "timestamp"
+        self._compiled: Optional[Tuple[tuple, "CompiledMemoryFilter"]] = None
 
         
     def match(self, key: str, expected_value: Any) -> "MemoryFilter":
         self.conditions.append(lambda memory: self._get_value(memory, key) == expected_value)
+        self.clauses.append({"op": "eq", "key": key, "value": expected_value})
         return self
     
     def or_match(self, key: str, expected_value: Any) -> "MemoryFilter":
         self.or_conditions.append(lambda memory: self._get_value(memory, key) == expected_value)
+        self.or_clauses.append({"op": "eq", "key": key, "value": expected_value})
         return self
 
     def greater_than_or_equal(self, key: str, threshold: Any) -> "MemoryFilter":
         self.conditions.append(lambda memory: self._compare(self._get_value(memory, key), threshold, op="gte"))
+        self.clauses.append({"op": "gte", "key": key, "value": threshold})
         return self
 
     def less_than_or_equal(self, key: str, threshold: Any) -> "MemoryFilter":
         self.conditions.append(lambda memory: self._compare(self._get_value(memory, key), threshold, op="lte"))
+        self.clauses.append({"op": "lte", "key": key, "value": threshold})
         return self
 
     def contains(self, key: str, expected_item: Any) -> "MemoryFilter":
         self.conditions.append(lambda memory: expected_item in self._get_value(memory, key, default=[]))
+        self.clauses.append({"op": "contains", "key": key, "value": expected_item})
         return self
     
     def or_contains(self, key: str, expected_item: Any) -> "MemoryFilter":
         self.or_conditions.append(lambda memory: expected_item in self._get_value(memory, key, default=[]))
+        self.or_clauses.append({"op": "contains", "key": key, "value": expected_item})
         return self
     
     def contains_any(self, key: str, items: List[Any]) -> "MemoryFilter":
         print("contains_any: ", key, items)
         self.conditions.append(lambda memory: any(item in self._get_value(memory, key, default=[]) for item in items))
+        self.clauses.append({"op": "contains_any", "key": key, "value": list(items)})
         return self
     
     def contains_all(self, key: str, items: List[Any]) -> "MemoryFilter":
         self.conditions.append(lambda memory: all(item in self._get_value(memory, key, default=[]) for item in items))
+        self.clauses.append({"op": "contains_all", "key": key, "value": list(items)})
         return self
 
     def sort_by_date(self, order: str = "desc") -> "MemoryFilter":
@@ -55,28 +70,34 @@ class MemoryFilter:
         self.sort_key = "similarity"
         return self
 
+    def matches(self, memory: Dict[str, Any]) -> bool:
+        return self.compile().matches(memory)
+
+    def compile(self) -> "CompiledMemoryFilter":
+        """
+        Returns the compiled form of the chain (cached until another condition is added).
+        """
+        # builders only ever append, so the clause counts identify the chain's state
+        signature = (len(self.clauses), len(self.or_clauses), self.sort_order, self.sort_key)
+        if self._compiled is None or self._compiled[0] != signature:
+            compiled = CompiledMemoryFilter(self.clauses, self.or_clauses, self.sort_order, self.sort_key)
+            self._compiled = (signature, compiled)
+        return self._compiled[1]
+
+    def to_spec(self) -> Dict[str, Any]:
+        """
+        Compiles the chain into the JSON filter spec evaluated by the
+        find_similar_memories_filtered RPC (app/supabase/sql/find_similar_memories_filtered.sql)
+        before its top-k cut. matches_spec() is the Python reference for that SQL.
+        """
+        return {
+            "all": [_serialize_clause(clause) for clause in self.clauses],
+            "any": [_serialize_clause(clause) for clause in self.or_clauses],
+            "sort": {"key": self.sort_key, "order": self.sort_order} if self.sort_order else None,
+        }
+
     def apply(self, memories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        filtered = [
-            memory for memory in memories
-            if (all(condition(memory) for condition in self.conditions) or
-                any(condition(memory) for condition in self.or_conditions))
-        ]
-        
-        if self.sort_order:
-            if self.sort_key == "timestamp":
-                filtered = sorted(
-                    filtered,
-                    key=lambda m: datetime.fromisoformat(str(m.get("timestamp"))) if m.get("timestamp") else datetime.min,
-                    reverse=(self.sort_order == "desc")
-                )
-            elif self.sort_key == "similarity":
-                filtered = sorted(
-                    filtered,
-                    key=lambda m: m.get("similarity", 0.0),
-                    reverse=(self.sort_order == "desc")
-                )
-                
-        return filtered
+        return self.compile().apply(memories)
     
     def _get_value(self, memory: Dict[str, Any], key: str, default: Any = None) -> Any:
         """
@@ -111,3 +132,273 @@ class MemoryFilter:
             return True
         except ValueError:
             return False
+
+
+
+def _serialize_clause(clause: Dict[str, Any]) -> Dict[str, Any]:
+    value = clause["value"]
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    return {**clause, "value": value}
+
+
+def _parse_date(value: str) -> Optional[datetime]:
+    # Postgres casts to timestamp without time zone, which drops any offset
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _spec_kind(value: Any) -> Optional[str]:
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return None
+
+
+def _spec_value(memory: Dict[str, Any], key: str) -> Any:
+    metadata = memory.get("metadata")
+    if isinstance(metadata, dict) and key in metadata:
+        return metadata[key]
+    return memory.get(key)
+
+
+def _spec_contains(value: Any, item: Any) -> bool:
+    if isinstance(value, list):
+        return item in value
+    if isinstance(value, str) and isinstance(item, str):
+        return item in value
+    return False
+
+
+def _spec_clause(memory: Dict[str, Any], clause: Dict[str, Any]) -> bool:
+    op, expected = clause["op"], clause["value"]
+    value = _spec_value(memory, clause["key"])
+
+    if op == "eq":
+        # jsonb never equates booleans with numbers
+        if isinstance(value, bool) != isinstance(expected, bool):
+            return False
+        return value == expected
+    if op in ("gte", "lte"):
+        kind = _spec_kind(value)
+        if kind is None or kind != _spec_kind(expected):
+            return False
+        if kind == "string":
+            value_date, expected_date = _parse_date(value), _parse_date(expected)
+            if (value_date is None) != (expected_date is None):
+                return False
+            if value_date is not None:
+                value, expected = value_date, expected_date
+        return value >= expected if op == "gte" else value <= expected
+    if op == "contains":
+        return _spec_contains(value, expected)
+    if op == "contains_any":
+        return any(_spec_contains(value, item) for item in expected)
+    if op == "contains_all":
+        return all(_spec_contains(value, item) for item in expected)
+    raise ValueError(f"Unknown filter op: {op}")
+
+
+def matches_spec(memory: Dict[str, Any], spec: Dict[str, Any]) -> bool:
+    """
+    Evaluates a MemoryFilter.to_spec() spec against one memory, clause for clause the way
+    the find_similar_memories_filtered SQL does. Mismatched types (which make the closures
+    raise) evaluate to False here, as they do in SQL.
+    """
+    return (all(_spec_clause(memory, clause) for clause in spec["all"]) or
+            any(_spec_clause(memory, clause) for clause in spec["any"]))
+
+
+# Distinct ISO strings seen by compiled filters are parsed once. Invalid strings raise like
+# datetime.fromisoformat (exceptions are not cached).
+_fromisoformat = lru_cache(maxsize=65536)(datetime.fromisoformat)
+
+
+@lru_cache(maxsize=65536)
+def _as_date(value: str) -> Any:
+    """The datetime a string parses to, or the string itself (MemoryFilter._compare semantics)."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return value
+
+
+_MISSING = object()
+_NUMERIC_TYPES = (int, float, bool, type(None), type(_MISSING))
+
+
+def _as_numbers(values: List[Any]) -> Optional[np.ndarray]:
+    """
+    The values as float64 with NaN for missing ones (NaN fails >= and <= like None does),
+    or None if any value is not a number.
+    """
+    if not all(type(value) in _NUMERIC_TYPES for value in values):
+        return None
+    return np.array([np.nan if value is None or value is _MISSING else value for value in values], dtype=np.float64)
+
+
+class _CompiledClause:
+    def __init__(self, clause: Dict[str, Any]):
+        self.op = clause["op"]
+        self.key = clause["key"]
+        self.value = clause["value"]
+        if self.op in ("gte", "lte") and isinstance(self.value, str):
+            self.value = _as_date(self.value)
+        # numeric thresholds can be compared against a whole column at once
+        self.vectorizable = self.op in ("gte", "lte") and isinstance(self.value, (int, float))
+        if self.op in ("contains_any", "contains_all"):
+            self.value = list(self.value)
+
+    def get(self, memory: Dict[str, Any]) -> Any:
+        # same lookup as MemoryFilter._get_value, returning _MISSING instead of a default
+        if "metadata" in memory and self.key in memory["metadata"]:
+            return memory["metadata"].get(self.key)
+        return memory.get(self.key, _MISSING)
+
+    def test_value(self, value: Any) -> bool:
+        op = self.op
+        if op == "eq":
+            return (None if value is _MISSING else value) == self.value
+        if op == "gte" or op == "lte":
+            if value is None or value is _MISSING:
+                return False
+            if isinstance(value, str):
+                value = _as_date(value)
+            return value >= self.value if op == "gte" else value <= self.value
+        if value is _MISSING:
+            value = []
+        if op == "contains":
+            return self.value in value
+        if op == "contains_any":
+            return any(item in value for item in self.value)
+        return all(item in value for item in self.value)
+
+    def test(self, memory: Dict[str, Any]) -> bool:
+        return self.test_value(self.get(memory))
+
+    def extract(self, memories: List[Dict[str, Any]]) -> List[Any]:
+        """
+        The clause's key read from every memory (get() inlined for speed).
+        """
+        key = self.key
+        return [
+            memory["metadata"].get(key) if "metadata" in memory and key in memory["metadata"] else memory.get(key, _MISSING)
+            for memory in memories
+        ]
+
+    def test_column(self, values: List[Any], numbers: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Evaluates the clause over a column of extracted values.
+        numbers is the same column as float64 (NaN for missing) when every value is numeric.
+        """
+        op, expected = self.op, self.value
+        if self.vectorizable and numbers is not None:
+            return numbers >= expected if op == "gte" else numbers <= expected
+
+        if op == "eq" and expected is not None:
+            # _MISSING never equals a non-None value
+            results = [value == expected for value in values]
+        elif op == "contains":
+            results = [expected in ([] if value is _MISSING else value) for value in values]
+        elif op == "contains_any":
+            results = [any(item in ([] if value is _MISSING else value) for item in expected) for value in values]
+        else:
+            test_value = self.test_value
+            results = [test_value(value) for value in values]
+        return np.array(results, dtype=bool)
+
+
+class CompiledMemoryFilter:
+    """
+    MemoryFilter with keys resolved, threshold dates parsed and timestamp parsing cached.
+
+    Small inputs are filtered row by row. Inputs of COLUMNAR_THRESHOLD memories or more are
+    filtered column-wise: each referenced key is extracted once and each clause produces a
+    boolean mask over the rows still undecided, preserving the short-circuit order of
+    all(conditions) or any(or_conditions) so results (and errors) match the closures.
+    """
+
+    COLUMNAR_THRESHOLD = 256
+
+    def __init__(self, clauses: List[Dict[str, Any]], or_clauses: List[Dict[str, Any]], sort_order: Optional[str], sort_key: str):
+        self.clauses = [_CompiledClause(clause) for clause in clauses]
+        self.or_clauses = [_CompiledClause(clause) for clause in or_clauses]
+        self.sort_order = sort_order
+        self.sort_key = sort_key
+
+    def matches(self, memory: Dict[str, Any]) -> bool:
+        return (all(clause.test(memory) for clause in self.clauses) or
+                any(clause.test(memory) for clause in self.or_clauses))
+
+    def mask(self, memories: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Boolean mask of the memories that pass the filter, evaluated column-wise.
+        """
+        columns: Dict[str, List[Any]] = {}
+        numeric: Dict[str, Optional[np.ndarray]] = {}
+
+        def evaluate(clause: _CompiledClause, rows: np.ndarray) -> np.ndarray:
+            full = rows.size == len(memories)
+            if clause.key in columns:
+                column = columns[clause.key]
+                values = column if full else [column[row] for row in rows.tolist()]
+            elif full:
+                values = columns[clause.key] = clause.extract(memories)
+            else:
+                # only some rows are still undecided; don't extract the whole column
+                values = clause.extract([memories[row] for row in rows.tolist()])
+
+            numbers = None
+            if clause.vectorizable:
+                if full and clause.key not in numeric:
+                    numeric[clause.key] = _as_numbers(values)
+                if clause.key in numeric:
+                    numbers = numeric[clause.key]
+                    if numbers is not None and not full:
+                        numbers = numbers[rows]
+                else:
+                    numbers = _as_numbers(values)
+            return clause.test_column(values, numbers)
+
+        passed_all = np.ones(len(memories), dtype=bool)
+        for clause in self.clauses:
+            rows = np.flatnonzero(passed_all)
+            if rows.size == 0:
+                break
+            passed_all[rows] = evaluate(clause, rows)
+
+        passed = passed_all.copy()
+        for clause in self.or_clauses:
+            rows = np.flatnonzero(~passed)
+            if rows.size == 0:
+                break
+            passed[rows] = evaluate(clause, rows)
+        return passed
+
+    def apply(self, memories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if len(memories) >= self.COLUMNAR_THRESHOLD:
+            mask = self.mask(memories)
+            filtered = [memories[row] for row in np.flatnonzero(mask)]
+        else:
+            filtered = [memory for memory in memories if self.matches(memory)]
+
+        if self.sort_order:
+            if self.sort_key == "timestamp":
+                filtered = sorted(
+                    filtered,
+                    key=lambda m: _fromisoformat(str(m.get("timestamp"))) if m.get("timestamp") else datetime.min,
+                    reverse=(self.sort_order == "desc")
+                )
+            elif self.sort_key == "similarity":
+                filtered = sorted(
+                    filtered,
+                    key=lambda m: m.get("similarity", 0.0),
+                    reverse=(self.sort_order == "desc")
+                )
+
+        return filtered
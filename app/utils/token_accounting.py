@@ -0,0 +1,174 @@
+# app/utils/token_accounting.py
+import logging
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.utils.token_count import calculate_credits_to_deduct, calculate_token_cost, count_tokens
+
+
+class TurnUsage:
+    """
+    Token usage of one streamed response, for billing.
+
+    The completion is counted delta by delta as the stream arrives, so the reply is never
+    re-tokenized afterwards. The prompt is the one actually sent (instructions with history,
+    memories and slang, plus the input); it is only tokenized if the API did not report
+    usage. When the API reports usage (the response.completed event, once per model
+    request, so tool calls are included) those numbers are billed instead of the estimates.
+    """
+    def __init__(self, model: Optional[str] = "gpt-4o-mini"):
+        self.model = model
+        self.completion_tokens = 0
+        self.api_input_tokens = 0
+        self.api_output_tokens = 0
+        self.api_cached_tokens = 0
+        self.api_requests = 0
+        self.discarded_input_tokens = 0
+        self.discarded_output_tokens = 0
+        self._prompt_parts: List[str] = []
+
+    def add_prompt(self, *parts: Any) -> None:
+        """
+        Records text that was sent to the model.
+        """
+        self._prompt_parts.extend(part for part in parts if isinstance(part, str) and part)
+
+    def add_delta(self, delta: str) -> None:
+        self.completion_tokens += count_tokens(delta)
+
+    def add_usage(self, usage: Any) -> None:
+        """
+        Records the usage reported for one model request (a Responses API usage object).
+        """
+        if usage is None:
+            return
+        self.api_requests += 1
+        self.api_input_tokens += getattr(usage, "input_tokens", 0) or 0
+        self.api_output_tokens += getattr(usage, "output_tokens", 0) or 0
+        details = getattr(usage, "input_tokens_details", None)
+        self.api_cached_tokens += getattr(details, "cached_tokens", 0) or 0
+
+    def observe(self, event: Any) -> None:
+        """
+        Feeds one event from RunResultStreaming.stream_events().
+        """
+        if getattr(event, "type", None) != "raw_response_event":
+            return
+        data = event.data
+        data_type = getattr(data, "type", None)
+        if data_type == "response.output_text.delta":
+            self.add_delta(data.delta)
+        elif data_type == "response.completed":
+            self.add_usage(getattr(data.response, "usage", None))
+
+    def observe_run(self, run: Any) -> None:
+        """
+        Records the prompt of a finished run: its agent's instructions and its input.
+        """
+        agent = getattr(run, "last_agent", None) or getattr(run, "current_agent", None)
+        if agent is not None:
+            if isinstance(agent.model, str):
+                self.model = agent.model
+            self.add_prompt(agent.instructions)
+        run_input = getattr(run, "input", None)
+        if isinstance(run_input, str):
+            self.add_prompt(run_input)
+        else:
+            for item in run_input or []:
+                content = item.get("content") if isinstance(item, dict) else None
+                self.add_prompt(content)
+
+    def add_discarded(self, run: Any, events: Iterable[Any]) -> None:
+        """
+        Records a response that was started and then thrown away (a restarted speculative
+        response): the usage the API reported for it, or else its prompt and streamed deltas.
+        """
+        discarded = TurnUsage(self.model)
+        for event in events:
+            discarded.observe(event)
+        discarded.observe_run(run)
+        self.discarded_input_tokens += discarded.input_tokens
+        self.discarded_output_tokens += discarded.output_tokens
+
+    @property
+    def reported(self) -> bool:
+        return self.api_requests > 0
+
+    @property
+    def input_tokens(self) -> int:
+        if self.reported:
+            return self.api_input_tokens + self.discarded_input_tokens
+        return sum(count_tokens(part) for part in self._prompt_parts) + self.discarded_input_tokens
+
+    @property
+    def output_tokens(self) -> int:
+        return (self.api_output_tokens if self.reported else self.completion_tokens) + self.discarded_output_tokens
+
+    @property
+    def cached_ratio(self) -> Optional[float]:
+        """
+        Share of the input tokens the provider served from its prompt cache, or None if the
+        API did not report usage.
+        """
+        if not self.api_input_tokens:
+            return None
+        return self.api_cached_tokens / self.api_input_tokens
+
+    def cost(self) -> float:
+        try:
+            return calculate_token_cost(self.input_tokens, self.output_tokens, self.model)
+        except Exception as e:
+            logging.error(f"Error calculating token cost for model {self.model}: {e}")
+            return 0.0
+
+    def credits(self) -> int:
+        return calculate_credits_to_deduct(self.cost())
+
+
+class TokenUsageStats:
+    """
+    Billed token totals across turns, exposed on /metrics. cached_ratio is the share of
+    reported input tokens served from the provider's prompt cache; estimate_error compares
+    the streamed completion count with the API's output_tokens on turns that have both.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.turns = 0
+        self.reported_turns = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.credits = 0
+        self._reported_input = 0
+        self._estimated_output = 0
+        self._reported_output = 0
+
+    def record(self, usage: TurnUsage, credits: int) -> None:
+        input_tokens, output_tokens = usage.input_tokens, usage.output_tokens
+        with self._lock:
+            self.turns += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.credits += credits
+            if usage.reported:
+                self.reported_turns += 1
+                self.cached_tokens += usage.api_cached_tokens
+                self._reported_input += usage.api_input_tokens
+                self._estimated_output += usage.completion_tokens
+                self._reported_output += usage.api_output_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "reported_turns": self.reported_turns,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cached_ratio": round(self.cached_tokens / self._reported_input, 4) if self._reported_input else 0.0,
+                "credits": self.credits,
+                "estimate_error": round(self._estimated_output / self._reported_output - 1, 4) if self._reported_output else 0.0,
+            }
+
+
+token_usage_stats = TokenUsageStats()
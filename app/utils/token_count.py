@@ -1,5 +1,9 @@
 import logging
 import math
+import time
+from functools import lru_cache
+from typing import Optional
+
 import tiktoken
 
 
@@ -83,31 +87,67 @@ LLM_PRICING_USD_PER_TOKEN = {
 }
 
 
+# After the encoder fails to load (its BPE file is downloaded on first use), wait this long before trying again
+ENCODING_RETRY_SECONDS = 60
+_encoding_failed_at: Optional[float] = None
+
+
+class EncodingUnavailable(RuntimeError):
+    pass
+
+
+def get_encoding(name: str = ENCODING) -> "tiktoken.Encoding":
+    """The process-wide tiktoken encoder (loading one parses its whole BPE table)."""
+    global _encoding_failed_at
+    if _encoding_failed_at is not None and time.monotonic() - _encoding_failed_at < ENCODING_RETRY_SECONDS:
+        raise EncodingUnavailable(f"tiktoken encoding {name} is unavailable")
+    try:
+        encoding = _load_encoding(name)
+    except Exception as e:
+        logging.warning(f"Could not load tiktoken encoding {name}, estimating token counts for {ENCODING_RETRY_SECONDS}s: {e}")
+        _encoding_failed_at = time.monotonic()
+        raise EncodingUnavailable(str(e)) from e
+    _encoding_failed_at = None
+    return encoding
+
+
+@lru_cache(maxsize=None)
+def _load_encoding(name: str) -> "tiktoken.Encoding":
+    return tiktoken.get_encoding(name)
+
+
+# Texts that recur turn after turn (instructions, history messages) are only tokenized once
+@lru_cache(maxsize=4096)
+def _cached_token_count(text: str) -> int:
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
 def count_tokens(text: str) -> int:
     """Counts tokens using tiktoken for a given text and model."""
+    if not text:
+        return 0
     try:
-        encoding = tiktoken.get_encoding(ENCODING)
-        num_tokens = len(encoding.encode(text))
-        return num_tokens
-    
+        return _cached_token_count(text)
+    except EncodingUnavailable:
+        return len(text) // 4
     except Exception as e:
         logging.warning(f"Warning: Could not count tokens encoding failed and defaulted to fallback. Error: {e}")
         # Fallback or default logic if needed, e.g., estimate based on chars/words
         return len(text) // 4 # Very rough estimate everthing is 4 characters
     
+def calculate_token_cost(input_tokens: int, output_tokens: int, model: Optional[str] = "gpt-4o-mini") -> float:
+    """Calculates the cost of a number of input and output tokens for a model."""
+    if model not in LLM_PRICING_USD_PER_TOKEN:
+        logging.warning(f"Warning: Model {model} not found in LLM_PRICING_USD_PER_TOKEN. Using DEFAULT_FALLBACK.")
+        model = "DEFAULT_FALLBACK"
+
+    pricing = LLM_PRICING_USD_PER_TOKEN[model]
+    return (pricing["prompt"] * input_tokens) + (pricing["completion"] * output_tokens)
+
 def calculate_provider_cost(input_text: str ="", output_text: str ="", model: str = "gpt-4o-mini") -> float:
     """Calculates the cost of tokens for a given input and output text and model."""
-    global LLM_PRICING_USD_PER_TOKEN
     try:
-        if model not in LLM_PRICING_USD_PER_TOKEN:
-            logging.warning(f"Warning: Model {model} not found in LLM_PRICING_USD_PER_TOKEN. Using DEFAULT_FALLBACK.")
-            model = "DEFAULT_FALLBACK"
-            
-        pricing = LLM_PRICING_USD_PER_TOKEN[model]
-        input_tokens = count_tokens(input_text)
-        output_tokens = count_tokens(output_text)
-        cost = (pricing["prompt"] * input_tokens) + (pricing["completion"] * output_tokens)
-        return cost
+        return calculate_token_cost(count_tokens(input_text), count_tokens(output_text), model)
     except Exception as e:
         logging.error(f"Error calculating token cost for model {model}: {e}")
         return 0.0
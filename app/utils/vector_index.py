@@ -0,0 +1,343 @@
+import json
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+def parse_embedding(raw: Union[str, Sequence[float], np.ndarray]) -> np.ndarray:
+    """
+    Converts an embedding as returned by Supabase (a pgvector string like "[0.1,0.2]"
+    or a plain list) into a float32 numpy array.
+    """
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    return np.asarray(raw, dtype=np.float32)
+
+
+def normalize(vec: Union[Sequence[float], np.ndarray]) -> np.ndarray:
+    """
+    Returns an L2-normalized float32 copy of the vector (zero vectors stay zero).
+    """
+    vec = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    if norm == 0:
+        return np.zeros_like(vec)
+    return vec / norm
+
+
+class EmbeddingMatrix:
+    """
+    Contiguous float32 matrix of pre-normalized embeddings with a parallel list of ids.
+
+    Scoring a query against every row is a single matrix-vector product, so the cosine
+    similarity of one new embedding against N stored ones costs one BLAS call instead of
+    N Python-level `cosine_similarity` calls.
+    """
+
+    def __init__(self, dim: Optional[int] = None, capacity: int = 256):
+        self.dim = dim
+        self._capacity = capacity
+        self._data: Optional[np.ndarray] = None
+        self.ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+
+        if dim is not None:
+            self._data = np.empty((capacity, dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, item_id: str) -> bool:
+        return str(item_id) in self._positions
+
+    def position(self, item_id: str) -> Optional[int]:
+        """Row index currently holding item_id, or None."""
+        return self._positions.get(str(item_id))
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """View of the populated rows (no copy)."""
+        if self._data is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._data[:len(self.ids)]
+
+    def _ensure_capacity(self, dim: int, extra: int) -> None:
+        if self._data is None:
+            self.dim = dim
+            self._capacity = max(self._capacity, extra)
+            self._data = np.empty((self._capacity, dim), dtype=np.float32)
+            return
+
+        if dim != self.dim:
+            raise ValueError(f"Embedding dimension {dim} does not match matrix dimension {self.dim}")
+
+        needed = len(self.ids) + extra
+        if needed > self._capacity:
+            new_capacity = max(needed, self._capacity * 2)
+            grown = np.empty((new_capacity, self.dim), dtype=np.float32)
+            grown[:len(self.ids)] = self._data[:len(self.ids)]
+            self._data = grown
+            self._capacity = new_capacity
+
+    def add(self, item_id: str, embedding: Union[Sequence[float], np.ndarray]) -> None:
+        """
+        Adds (or replaces) the embedding stored for item_id.
+        """
+        item_id = str(item_id)
+        vec = normalize(embedding)
+
+        position = self._positions.get(item_id)
+        if position is not None:
+            self._data[position] = vec
+            return
+
+        self._ensure_capacity(vec.shape[0], 1)
+        self._data[len(self.ids)] = vec
+        self._positions[item_id] = len(self.ids)
+        self.ids.append(item_id)
+
+    def add_many(self, item_ids: Iterable[str], embeddings: Union[Sequence[Sequence[float]], np.ndarray]) -> None:
+        """
+        Bulk-adds embeddings, normalizing them row-wise in one pass.
+        Ids that are already present are replaced in place.
+        """
+        item_ids = [str(item_id) for item_id in item_ids]
+        if not item_ids:
+            return
+
+        block = np.asarray(embeddings, dtype=np.float32)
+        if block.ndim != 2 or block.shape[0] != len(item_ids):
+            raise ValueError("Expected one embedding row per id")
+
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        block = block / norms
+
+        new_rows = []
+        for row, item_id in enumerate(item_ids):
+            position = self._positions.get(item_id)
+            if position is not None:
+                self._data[position] = block[row]
+            else:
+                new_rows.append(row)
+
+        if not new_rows:
+            return
+
+        self._ensure_capacity(block.shape[1], len(new_rows))
+        start = len(self.ids)
+        self._data[start:start + len(new_rows)] = block[new_rows]
+        for offset, row in enumerate(new_rows):
+            self._positions[item_ids[row]] = start + offset
+            self.ids.append(item_ids[row])
+
+    def remove(self, item_id: str) -> bool:
+        """
+        Removes item_id by moving the last row into its slot. Returns False if missing.
+        """
+        item_id = str(item_id)
+        position = self._positions.pop(item_id, None)
+        if position is None:
+            return False
+
+        last = len(self.ids) - 1
+        if position != last:
+            moved_id = self.ids[last]
+            self._data[position] = self._data[last]
+            self.ids[position] = moved_id
+            self._positions[moved_id] = position
+        self.ids.pop()
+        return True
+
+    def scores(self, query: Union[Sequence[float], np.ndarray]) -> np.ndarray:
+        """
+        Cosine similarity of the query against every stored row.
+        """
+        if not self.ids:
+            return np.empty(0, dtype=np.float32)
+        return self.vectors @ normalize(query)
+
+    def top_k(
+        self,
+        query: Union[Sequence[float], np.ndarray],
+        k: int,
+        threshold: Optional[float] = None,
+        exclude: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (id, score) pairs sorted by descending similarity.
+
+        Uses argpartition so only the k best rows are fully sorted.
+        """
+        if k <= 0 or not self.ids:
+            return []
+
+        scores = self.scores(query)
+
+        for item_id in exclude or ():
+            position = self._positions.get(str(item_id))
+            if position is not None:
+                scores[position] = -np.inf
+
+        if threshold is not None:
+            candidates = np.flatnonzero(scores >= threshold)
+        else:
+            candidates = np.flatnonzero(scores > -np.inf)
+
+        if candidates.size > k:
+            best = np.argpartition(scores[candidates], -k)[-k:]
+            candidates = candidates[best]
+
+        ordered = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in ordered]
+
+
+def _spherical_kmeans(vectors: np.ndarray, nlist: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    K-means on unit vectors using cosine similarity; returns normalized centroids.
+    """
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        sums[~empty] /= norms[~empty]
+        # keep the previous centroid for clusters that lost all their members
+        sums[empty] = centroids[empty]
+        centroids = sums
+    return centroids
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file (IVF-flat) approximate nearest neighbour index over an EmbeddingMatrix.
+
+    Rows are clustered into nlist ≈ sqrt(N) cells with spherical k-means. A query is compared
+    to the centroids first and only rows in the nprobe closest cells are scored exactly.
+    Below min_train_rows the index is not trained and every search is exact.
+    """
+
+    TRAINING_SAMPLE = 20000
+    ASSIGN_CHUNK = 8192
+
+    def __init__(self, nprobe: int = 8, min_train_rows: int = 2048, kmeans_iterations: int = 10, seed: int = 0):
+        self.nprobe = nprobe
+        self.min_train_rows = min_train_rows
+        self.kmeans_iterations = kmeans_iterations
+        self.rng = np.random.default_rng(seed)
+
+        self.matrix = EmbeddingMatrix()
+        self.centroids: Optional[np.ndarray] = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._trained_rows = 0
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.matrix
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _sync_assignments(self, start: int) -> None:
+        # assignments mirror matrix rows; (re)assign rows from `start` onwards
+        count = len(self.matrix)
+        if self._assignments.shape[0] < count:
+            grown = np.zeros(max(count, self._assignments.shape[0] * 2), dtype=np.int32)
+            grown[:start] = self._assignments[:start]
+            self._assignments = grown
+        if self.is_trained and count > start:
+            for chunk in range(start, count, self.ASSIGN_CHUNK):
+                end = min(chunk + self.ASSIGN_CHUNK, count)
+                self._assignments[chunk:end] = self._assign(self.matrix.vectors[chunk:end])
+
+    def train(self) -> None:
+        """
+        (Re)clusters all rows. Called automatically once the index doubles in size.
+        """
+        count = len(self.matrix)
+        if count < self.min_train_rows:
+            self.centroids = None
+            self._trained_rows = 0
+            return
+
+        vectors = self.matrix.vectors
+        if count > self.TRAINING_SAMPLE:
+            vectors = vectors[self.rng.choice(count, self.TRAINING_SAMPLE, replace=False)]
+
+        nlist = max(1, int(np.sqrt(count)))
+        self.centroids = _spherical_kmeans(vectors, nlist, self.kmeans_iterations, self.rng)
+        self._trained_rows = count
+        self._sync_assignments(0)
+
+    def _maybe_train(self) -> None:
+        count = len(self.matrix)
+        if (not self.is_trained and count >= self.min_train_rows) or (self.is_trained and count >= 2 * self._trained_rows):
+            self.train()
+
+    def add(self, item_id: str, embedding: Union[Sequence[float], np.ndarray]) -> None:
+        existing = self.matrix.position(item_id)
+        self.matrix.add(item_id, embedding)
+        position = existing if existing is not None else len(self.matrix) - 1
+        self._sync_assignments(position)
+        if existing is not None and self.is_trained:
+            self._assignments[position] = self._assign(self.matrix.vectors[position:position + 1])[0]
+        self._maybe_train()
+
+    def add_many(self, item_ids: Iterable[str], embeddings: Union[Sequence[Sequence[float]], np.ndarray]) -> None:
+        self.matrix.add_many(item_ids, embeddings)
+        # replaced rows may have moved cells, so reassign everything
+        self._sync_assignments(0)
+        self._maybe_train()
+
+    def remove(self, item_id: str) -> bool:
+        position = self.matrix.position(item_id)
+        if position is None:
+            return False
+        last = len(self.matrix) - 1
+        self.matrix.remove(item_id)
+        if position != last:
+            self._assignments[position] = self._assignments[last]
+        return True
+
+    def search(
+        self,
+        query: Union[Sequence[float], np.ndarray],
+        k: int,
+        exact: bool = False,
+        exclude: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (id, score) pairs by descending cosine similarity.
+        """
+        if exact or not self.is_trained:
+            return self.matrix.top_k(query, k, exclude=exclude)
+        if k <= 0 or not len(self.matrix):
+            return []
+
+        q = normalize(query)
+        centroid_scores = self.centroids @ q
+        nprobe = min(self.nprobe, len(centroid_scores))
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        candidates = np.flatnonzero(np.isin(self._assignments[:len(self.matrix)], probe))
+        excluded = {self.matrix.position(item_id) for item_id in exclude or ()}
+        if excluded - {None}:
+            candidates = candidates[~np.isin(candidates, list(excluded - {None}))]
+        if candidates.size == 0:
+            return []
+
+        scores = self.matrix.vectors[candidates] @ q
+        if candidates.size > k:
+            best = np.argpartition(scores, -k)[-k:]
+            candidates, scores = candidates[best], scores[best]
+
+        order = np.argsort(-scores, kind="stable")
+        return [(self.matrix.ids[candidates[i]], float(scores[i])) for i in order]
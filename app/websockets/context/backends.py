@@ -0,0 +1,532 @@
+# app/websockets/context/backends.py
+import logging
+import pickle
+import sqlite3
+import sys
+import time
+from threading import Lock
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+from pydantic import BaseModel
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Rough size of a context value in bytes (string length for text and models).
+    """
+    # exact type checks first: this runs on every write, and most values are text or dicts of text
+    kind = type(value)
+    if kind is str or kind is bytes:
+        return len(value)
+    if value is None:
+        return 0
+    if kind is dict:
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(value, BaseModel):
+        return sum(estimate_size(getattr(value, name)) for name in kind.model_fields)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class ContextBackend:
+    """
+    Where the per-user context values live. Every call is one round trip to the backend.
+    `ttl` and the idle and disconnect TTLs are in seconds. A `blocking` backend does I/O, so
+    code on the event loop calls it through the threadpool (see ContextStore.run).
+    """
+    name = "base"
+    blocking = False
+
+    def get_all(self, user_id: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def get_many(self, user_id: str, keys: Iterable[str]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def snapshot(self, user_id: str) -> Mapping[str, Any]:
+        """
+        A read-only view of the user's whole context that later writes do not change.
+        """
+        return MappingProxyType(self.get_all(user_id))
+
+    def set(self, user_id: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, user_id: str) -> None:
+        raise NotImplementedError
+
+    def delete_key(self, user_id: str, key: str) -> None:
+        raise NotImplementedError
+
+    def expire(self, user_id: str, ttl: float) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class UserContext:
+    """
+    One user's context values, with their sizes and expiry times.
+
+    `snapshot` is an immutable view that is replaced, never changed, on every write, so it
+    can be read without a lock and a reader holding it sees one consistent version.
+    """
+    def __init__(self, now: float):
+        self.values: Dict[str, Any] = {}
+        self.snapshot: Mapping[str, Any] = MappingProxyType({})
+        self.sizes: Dict[str, int] = {}
+        self.key_expiry: Dict[str, float] = {}
+        self.next_key_expiry: Optional[float] = None
+        self.last_access = now
+        self.expires_at: Optional[float] = None
+        self.size = 0
+
+    def _changed(self) -> None:
+        self.snapshot = MappingProxyType(dict(self.values))
+        self.next_key_expiry = min(self.key_expiry.values(), default=None)
+
+    def set(self, key: str, value: Any, size: int, expires_at: Optional[float]) -> int:
+        delta = size - self.sizes.get(key, 0)
+        self.values[key] = value
+        self.sizes[key] = size
+        if expires_at is None:
+            self.key_expiry.pop(key, None)
+        else:
+            self.key_expiry[key] = expires_at
+        self.size += delta
+        self._changed()
+        return delta
+
+    def pop(self, key: str) -> int:
+        if key not in self.values:
+            return 0
+        self.values.pop(key)
+        self.key_expiry.pop(key, None)
+        size = self.sizes.pop(key, 0)
+        self.size -= size
+        self._changed()
+        return size
+
+    def expire_keys(self, now: float) -> int:
+        """
+        Drops the keys whose TTL has passed. Returns the bytes freed.
+        """
+        expired = [key for key, expires_at in self.key_expiry.items() if expires_at <= now]
+        return sum(self.pop(key) for key in expired)
+
+
+class ContextShard:
+    """
+    The users whose id hashes to one stripe of a MemoryContextBackend, with their own lock.
+    """
+    def __init__(self, now: float):
+        self.lock = Lock()
+        self.users: Dict[str, UserContext] = {}
+        self.bytes = 0
+        self.last_sweep = now
+        self.idle_evictions = 0
+        self.size_evictions = 0
+        self.expired_keys = 0
+
+
+class MemoryContextBackend(ContextBackend):
+    """
+    Context held in this process, bounded in time and size, in `shards` lock stripes keyed
+    by a hash of the user id.
+
+    Reads take no lock: they return the user's current snapshot (see UserContext) unless
+    the user or one of their keys is due to expire, which is handled under the stripe's
+    lock like every write. A user's context is dropped after `idle_ttl` seconds without use
+    (or at the deadline set by expire(), unless it is used again first), and least recently
+    used users of a stripe are dropped when it passes its share of `max_bytes`. Expired
+    users are also removed by a sweep of each stripe at most every `sweep_interval` seconds.
+    """
+    name = "memory"
+
+    def __init__(
+        self,
+        idle_ttl: float,
+        max_bytes: int,
+        sweep_interval: float = 60.0,
+        shards: int = 16,
+        clock=time.monotonic,
+    ):
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._shards = [ContextShard(clock()) for _ in range(max(1, shards))]
+        self._shard_max_bytes = max_bytes // len(self._shards)
+
+    def _shard(self, user_id: str) -> ContextShard:
+        return self._shards[hash(user_id) % len(self._shards)]
+
+    def _expired(self, entry: UserContext, now: float) -> bool:
+        if entry.expires_at is not None and entry.expires_at <= now:
+            return True
+        return now - entry.last_access > self.idle_ttl
+
+    @staticmethod
+    def _drop(shard: ContextShard, user_id: str) -> None:
+        entry = shard.users.pop(user_id, None)
+        if entry is not None:
+            shard.bytes -= entry.size
+
+    def _entry(self, shard: ContextShard, user_id: str, now: float, create: bool = False) -> Optional[UserContext]:
+        """
+        The live entry for the user (expired keys removed), marked as used. Lock held.
+        """
+        entry = shard.users.get(user_id)
+        if entry is not None and self._expired(entry, now):
+            self._drop(shard, user_id)
+            shard.idle_evictions += 1
+            entry = None
+        if entry is None:
+            if not create:
+                return None
+            entry = shard.users[user_id] = UserContext(now)
+        if entry.next_key_expiry is not None and entry.next_key_expiry <= now:
+            shard.bytes -= entry.expire_keys(now)
+            shard.expired_keys += 1
+        entry.last_access = now
+        # in use again: a disconnect deadline no longer applies once the user is back
+        entry.expires_at = None
+        return entry
+
+    def _sweep(self, shard: ContextShard, now: float) -> None:
+        if now - shard.last_sweep < self.sweep_interval:
+            return
+        shard.last_sweep = now
+        for user_id in [user_id for user_id, entry in shard.users.items() if self._expired(entry, now)]:
+            self._drop(shard, user_id)
+            shard.idle_evictions += 1
+
+    def _evict_to_fit(self, shard: ContextShard, keep: str) -> None:
+        while shard.bytes > self._shard_max_bytes and len(shard.users) > 1:
+            user_id = min((user_id for user_id in shard.users if user_id != keep), key=lambda user_id: shard.users[user_id].last_access)
+            logging.warning(f"Context store over {self.max_bytes} bytes, dropping the context of user {user_id}")
+            self._drop(shard, user_id)
+            shard.size_evictions += 1
+
+    def snapshot(self, user_id: str) -> Mapping[str, Any]:
+        now = self.clock()
+        shard = self._shard(user_id)
+        entry = shard.users.get(user_id)
+        if entry is None:
+            return MappingProxyType({})
+        if not self._expired(entry, now) and entry.expires_at is None and (entry.next_key_expiry is None or entry.next_key_expiry > now):
+            # a plain attribute write; a racing reader can only move it forward by a few microseconds
+            entry.last_access = now
+            return entry.snapshot
+        with shard.lock:
+            entry = self._entry(shard, user_id, now)
+            return entry.snapshot if entry is not None else MappingProxyType({})
+
+    def get_all(self, user_id: str) -> Dict[str, Any]:
+        return dict(self.snapshot(user_id))
+
+    def get_many(self, user_id: str, keys: Iterable[str]) -> Dict[str, Any]:
+        snapshot = self.snapshot(user_id)
+        return {key: snapshot[key] for key in keys if key in snapshot}
+
+    def set(self, user_id: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        size = estimate_size(key) + estimate_size(value)
+        shard = self._shard(user_id)
+        with shard.lock:
+            now = self.clock()
+            self._sweep(shard, now)
+            entry = self._entry(shard, user_id, now, create=True)
+            shard.bytes += entry.set(key, value, size, now + ttl if ttl is not None else None)
+            self._evict_to_fit(shard, user_id)
+
+    def delete(self, user_id: str) -> None:
+        shard = self._shard(user_id)
+        with shard.lock:
+            self._drop(shard, user_id)
+
+    def delete_key(self, user_id: str, key: str) -> None:
+        shard = self._shard(user_id)
+        with shard.lock:
+            entry = self._entry(shard, user_id, self.clock())
+            if entry is not None:
+                shard.bytes -= entry.pop(key)
+
+    def expire(self, user_id: str, ttl: float) -> None:
+        shard = self._shard(user_id)
+        with shard.lock:
+            entry = shard.users.get(user_id)
+            if entry is not None:
+                entry.expires_at = self.clock() + ttl
+
+    def stats(self) -> Dict[str, Any]:
+        users = bytes_ = largest = idle_evictions = size_evictions = expired_keys = 0
+        now = self.clock()
+        for shard in self._shards:
+            with shard.lock:
+                self._sweep(shard, now)
+                users += len(shard.users)
+                bytes_ += shard.bytes
+                largest = max([largest] + [entry.size for entry in shard.users.values()])
+                idle_evictions += shard.idle_evictions
+                size_evictions += shard.size_evictions
+                expired_keys += shard.expired_keys
+        return {
+            "users": users,
+            "bytes": bytes_,
+            "max_bytes": self.max_bytes,
+            "shards": len(self._shards),
+            "largest_user_bytes": largest,
+            "idle_evictions": idle_evictions,
+            "size_evictions": size_evictions,
+            "expired_keys": expired_keys,
+        }
+
+
+SQLITE_SCHEMA = """
+create table if not exists context_users (
+    user_id text primary key,
+    last_access real not null,
+    expires_at real
+);
+create index if not exists context_users_access on context_users (last_access);
+create table if not exists context_values (
+    user_id text not null,
+    key text not null,
+    value blob not null,
+    size integer not null,
+    expires_at real,
+    primary key (user_id, key)
+);
+create table if not exists context_counters (
+    name text primary key,
+    value integer not null default 0
+);
+"""
+
+
+class SqliteContextBackend(ContextBackend):
+    """
+    Context in a local SQLite file (WAL), shared by every worker process on the host, so a
+    user's messages may land on any worker.
+
+    Values are pickled: the file is private to this host's workers, like the analysis queue.
+    Times are wall-clock seconds because they are compared across processes. Reads run in
+    deferred transactions, which do not take the database's write lock, so workers read
+    concurrently. A read renews the user's idle deadline at most every `touch_interval`
+    seconds, in a short write transaction of its own. Idle users, expired keys and (least
+    recently used first) users over `max_bytes` are removed by a sweep at most every
+    `sweep_interval` seconds. A call waits up to `busy_timeout` seconds for another
+    worker's write.
+    """
+    name = "sqlite"
+    blocking = True
+
+    def __init__(
+        self,
+        path: str,
+        idle_ttl: float,
+        max_bytes: int,
+        sweep_interval: float = 60.0,
+        touch_interval: float = 60.0,
+        busy_timeout: float = 5.0,
+        clock=time.time,
+    ):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.touch_interval = touch_interval
+        self.clock = clock
+        self._lock = Lock()
+        self._last_sweep = clock()
+        # isolation_level=None: transactions are opened explicitly (see _transaction)
+        self.connection = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self.connection.execute("pragma journal_mode=wal")
+        self.connection.execute("pragma synchronous=normal")
+        self.connection.executescript(SQLITE_SCHEMA)
+
+    def _transaction(self, work, write: bool = True):
+        """
+        Runs work(connection) in one transaction. Writes take the write lock up front
+        ("begin immediate"), so they never fail halfway on a lock; reads do not take it.
+        """
+        with self._lock:
+            self.connection.execute("begin immediate" if write else "begin deferred")
+            try:
+                result = work(self.connection)
+            except BaseException:
+                self.connection.execute("rollback")
+                raise
+            self.connection.execute("commit")
+            return result
+
+    def _count(self, conn: sqlite3.Connection, name: str, amount: int = 1) -> None:
+        if amount:
+            conn.execute(
+                "insert into context_counters (name, value) values (?, ?) "
+                "on conflict (name) do update set value = value + excluded.value",
+                (name, amount),
+            )
+
+    def _live_user(self, conn: sqlite3.Connection, user_id: str, now: float) -> Optional[tuple]:
+        """
+        The user's (last_access, expires_at), or None if they have no context (an expired
+        one is removed).
+        """
+        row = conn.execute("select last_access, expires_at from context_users where user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        last_access, expires_at = row
+        if (expires_at is not None and expires_at <= now) or now - last_access > self.idle_ttl:
+            self._drop(conn, user_id)
+            self._count(conn, "idle_evictions")
+            return None
+        return row
+
+    @staticmethod
+    def _drop(conn: sqlite3.Connection, user_id: str) -> None:
+        conn.execute("delete from context_values where user_id = ?", (user_id,))
+        conn.execute("delete from context_users where user_id = ?", (user_id,))
+
+    def _read(self, user_id: str, keys: Optional[list]) -> Dict[str, Any]:
+        def read(conn):
+            now = self.clock()
+            user = conn.execute("select last_access, expires_at from context_users where user_id = ?", (user_id,)).fetchone()
+            if user is None:
+                return now, None, []
+            last_access, expires_at = user
+            if (expires_at is not None and expires_at <= now) or now - last_access > self.idle_ttl:
+                # removed by touch() below
+                return now, user, []
+            query = "select key, value from context_values where user_id = ? and (expires_at is null or expires_at > ?)"
+            params = [user_id, now]
+            if keys is not None:
+                query += f" and key in ({', '.join('?' * len(keys))})"
+                params += keys
+            return now, user, conn.execute(query, params).fetchall()
+
+        def touch(conn):
+            # checked again under the write lock: another worker may have touched or dropped the user
+            user = self._live_user(conn, user_id, now)
+            if user is None:
+                return
+            last_access, expires_at = user
+            # in use again: a disconnect deadline no longer applies once the user is back
+            if now - last_access >= self.touch_interval or expires_at is not None:
+                conn.execute("update context_users set last_access = ?, expires_at = null where user_id = ?", (now, user_id))
+
+        now, user, rows = self._transaction(read, write=False)
+        if user is not None and (user[1] is not None or now - user[0] >= self.touch_interval):
+            try:
+                self._transaction(touch)
+            except sqlite3.OperationalError as e:
+                # the values are read; the deadline is renewed by a later read
+                logging.warning(f"Could not renew the context deadline of user {user_id}: {e}")
+
+        values = {}
+        for key, blob in rows:
+            try:
+                values[key] = pickle.loads(blob)
+            except Exception as e:
+                logging.error(f"Error reading context key {key} for user {user_id}: {e}")
+        return values
+
+    def get_all(self, user_id: str) -> Dict[str, Any]:
+        return self._read(user_id, None)
+
+    def get_many(self, user_id: str, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        return self._read(user_id, keys) if keys else {}
+
+    def set(self, user_id: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+        def work(conn):
+            now = self.clock()
+            self._live_user(conn, user_id, now)
+            conn.execute(
+                "insert into context_users (user_id, last_access) values (?, ?) "
+                "on conflict (user_id) do update set last_access = excluded.last_access, expires_at = null",
+                (user_id, now),
+            )
+            conn.execute(
+                "insert or replace into context_values (user_id, key, value, size, expires_at) values (?, ?, ?, ?, ?)",
+                (user_id, key, blob, len(key) + len(blob), now + ttl if ttl is not None else None),
+            )
+            if now - self._last_sweep >= self.sweep_interval:
+                self._last_sweep = now
+                self._sweep(conn, now, keep=user_id)
+
+        self._transaction(work)
+
+    def _sweep(self, conn: sqlite3.Connection, now: float, keep: Optional[str] = None) -> None:
+        idle = conn.execute(
+            "select user_id from context_users where last_access < ? or expires_at <= ?",
+            (now - self.idle_ttl, now),
+        ).fetchall()
+        for (user_id,) in idle:
+            self._drop(conn, user_id)
+        self._count(conn, "idle_evictions", len(idle))
+        expired = conn.execute("delete from context_values where expires_at <= ?", (now,)).rowcount
+        self._count(conn, "expired_keys", expired)
+
+        total = conn.execute("select coalesce(sum(size), 0) from context_values").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        users = conn.execute(
+            "select u.user_id, coalesce(sum(v.size), 0) from context_users u "
+            "left join context_values v on v.user_id = u.user_id "
+            "group by u.user_id order by u.last_access"
+        ).fetchall()
+        for user_id, size in users:
+            if total <= self.max_bytes:
+                break
+            if user_id == keep:
+                continue
+            logging.warning(f"Context store over {self.max_bytes} bytes, dropping the context of user {user_id}")
+            self._drop(conn, user_id)
+            self._count(conn, "size_evictions")
+            total -= size
+
+    def delete(self, user_id: str) -> None:
+        self._transaction(lambda conn: self._drop(conn, user_id))
+
+    def delete_key(self, user_id: str, key: str) -> None:
+        self._transaction(lambda conn: conn.execute("delete from context_values where user_id = ? and key = ?", (user_id, key)))
+
+    def expire(self, user_id: str, ttl: float) -> None:
+        self._transaction(lambda conn: conn.execute(
+            "update context_users set expires_at = ? where user_id = ?", (self.clock() + ttl, user_id)
+        ))
+
+    def sweep(self) -> None:
+        def work(conn):
+            now = self.clock()
+            self._last_sweep = now
+            self._sweep(conn, now)
+        self._transaction(work)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            users = self.connection.execute("select count(*) from context_users").fetchone()[0]
+            sizes = self.connection.execute(
+                "select coalesce(sum(total), 0), coalesce(max(total), 0) from "
+                "(select sum(size) as total from context_values group by user_id)"
+            ).fetchone()
+            counters = dict(self.connection.execute("select name, value from context_counters").fetchall())
+        return {
+            "users": users,
+            "bytes": sizes[0],
+            "max_bytes": self.max_bytes,
+            "largest_user_bytes": sizes[1],
+            "idle_evictions": counters.get("idle_evictions", 0),
+            "size_evictions": counters.get("size_evictions", 0),
+            "expired_keys": counters.get("expired_keys", 0),
+        }
@@ -1,39 +1,288 @@
 # app/context/store.py
-from typing import Any, Dict
+import logging
+import os
+import time
+from collections import OrderedDict
 from threading import Lock
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from app.websockets.context.backends import ContextBackend, MemoryContextBackend, SqliteContextBackend
+
+
+# A user's context is dropped after this many seconds without a read or write
+CONTEXT_IDLE_TTL_SECONDS = float(os.getenv("CONTEXT_IDLE_TTL_SECONDS", "21600"))
+# ... or this many seconds after their websocket disconnects, unless they come back
+CONTEXT_DISCONNECTED_TTL_SECONDS = float(os.getenv("CONTEXT_DISCONNECTED_TTL_SECONDS", "900"))
+# Upper bound on the estimated size of all contexts (least recently used users are dropped first)
+CONTEXT_MAX_BYTES = int(os.getenv("CONTEXT_MAX_BYTES", str(64 * 1024 * 1024)))
+# Text fields of a stored message larger than this (base64 audio, image data) are emptied before storing
+CONTEXT_MAX_FIELD_BYTES = int(os.getenv("CONTEXT_MAX_FIELD_BYTES", str(16 * 1024)))
+# Seconds the last image analysis stays in the context
+CONTEXT_IMAGE_TTL_SECONDS = float(os.getenv("CONTEXT_IMAGE_TTL_SECONDS", "3600"))
+# Lock stripes of the in-memory backend (users are spread over them by a hash of their id)
+CONTEXT_SHARDS = int(os.getenv("CONTEXT_SHARDS", "16"))
+# "memory": this process only; "sqlite": a file shared by every worker on the host (no sticky sessions needed)
+CONTEXT_BACKEND = os.getenv("CONTEXT_BACKEND", "memory").lower()
+# SQLite file for the shared context backend
+CONTEXT_SQLITE_PATH = os.getenv("CONTEXT_SQLITE_PATH", "context_store.sqlite3")
+# Seconds a call to the shared context backend waits for another worker's write before failing
+CONTEXT_SQLITE_BUSY_SECONDS = float(os.getenv("CONTEXT_SQLITE_BUSY_SECONDS", "5"))
+# Seconds a worker serves a user's context from its near-cache before reading the shared backend again
+CONTEXT_NEAR_CACHE_SECONDS = float(os.getenv("CONTEXT_NEAR_CACHE_SECONDS", "1"))
+# Users held in the near-cache
+CONTEXT_NEAR_CACHE_USERS = int(os.getenv("CONTEXT_NEAR_CACHE_USERS", "1024"))
+
+# Keys that expire on their own, in seconds (others live as long as the user's context)
+KEY_TTL_SECONDS = {
+    "last_image_analysis": CONTEXT_IMAGE_TTL_SECONDS,
+}
+
+
+def slim_value(value: Any, max_field_bytes: int = CONTEXT_MAX_FIELD_BYTES) -> Tuple[Any, int]:
+    """
+    Returns the value with oversized text fields of a message model emptied, and the number
+    of fields emptied. The context keeps a message for its settings (type, voice), not its payload.
+    """
+    if not isinstance(value, BaseModel):
+        return value, 0
+    update = {}
+    for name in type(value).model_fields:
+        field = getattr(value, name)
+        if isinstance(field, (str, bytes)) and len(field) > max_field_bytes:
+            update[name] = type(field)()
+    if not update:
+        return value, 0
+    return value.model_copy(update=update), len(update)
+
+
+class ContextStore:
+    """
+    Per-user context for websocket sessions, in a ContextBackend.
+
+    Message models are stored without their large payloads (see slim_value), and keys in
+    KEY_TTL_SECONDS expire on their own. With a shared backend, each user's whole context is
+    kept in a near-cache for `near_cache_seconds` after it is read, so the reads of a turn
+    stay in the process: writes made here update it, writes made by another worker are seen
+    once it expires. A turn should read one snapshot() rather than key by key. Code on the
+    event loop goes through run() (the *_async functions below), which keeps a blocking
+    backend's I/O off the loop.
+    """
+    def __init__(
+        self,
+        backend: Optional[ContextBackend] = None,
+        disconnected_ttl: float = CONTEXT_DISCONNECTED_TTL_SECONDS,
+        max_field_bytes: int = CONTEXT_MAX_FIELD_BYTES,
+        near_cache_seconds: float = 0.0,
+        near_cache_users: int = CONTEXT_NEAR_CACHE_USERS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.backend = backend or MemoryContextBackend(CONTEXT_IDLE_TTL_SECONDS, CONTEXT_MAX_BYTES, shards=CONTEXT_SHARDS)
+        self.disconnected_ttl = disconnected_ttl
+        self.max_field_bytes = max_field_bytes
+        self.near_cache_seconds = near_cache_seconds
+        self.near_cache_users = near_cache_users
+        self.clock = clock
+        self._lock = Lock()
+        self._near: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.slimmed_fields = 0
+        self.near_hits = 0
+        self.near_misses = 0
+
+    @classmethod
+    def from_env(cls) -> "ContextStore":
+        """
+        Builds the process-wide store from the CONTEXT_* environment variables.
+        """
+        if CONTEXT_BACKEND == "sqlite":
+            try:
+                backend = SqliteContextBackend(CONTEXT_SQLITE_PATH, CONTEXT_IDLE_TTL_SECONDS, CONTEXT_MAX_BYTES, busy_timeout=CONTEXT_SQLITE_BUSY_SECONDS)
+                return cls(backend, near_cache_seconds=CONTEXT_NEAR_CACHE_SECONDS)
+            except Exception as e:
+                logging.error(f"Could not open the context store at {CONTEXT_SQLITE_PATH}, keeping context in memory: {e}")
+        elif CONTEXT_BACKEND != "memory":
+            logging.error(f"Unknown CONTEXT_BACKEND '{CONTEXT_BACKEND}', keeping context in memory")
+        return cls()
+
+    async def run(self, method: Callable[..., Any], *args: Any) -> Any:
+        """
+        Calls one of this store's methods from the event loop: in the threadpool if the
+        backend blocks (SQLite), directly otherwise.
+        """
+        if self.backend.blocking:
+            return await run_in_threadpool(method, *args)
+        return method(*args)
+
+    def _cached(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        The user's near-cached context, if fresh. Lock held.
+        """
+        cached = self._near.get(user_id)
+        if cached is None or self.clock() - cached[0] > self.near_cache_seconds:
+            self.near_misses += 1
+            return None
+        self.near_hits += 1
+        return cached[1]
+
+    def _load(self, user_id: str) -> Dict[str, Any]:
+        """
+        The user's whole context, from the near-cache when it is on.
+        """
+        if not self.near_cache_seconds:
+            return self.backend.get_all(user_id)
+        with self._lock:
+            cached = self._cached(user_id)
+        if cached is not None:
+            return cached
+        values = self.backend.get_all(user_id)
+        with self._lock:
+            self._near[user_id] = (self.clock(), values)
+            self._near.move_to_end(user_id)
+            while len(self._near) > self.near_cache_users:
+                self._near.popitem(last=False)
+        return values
+
+    def _forget(self, user_id: str) -> None:
+        with self._lock:
+            self._near.pop(user_id, None)
+
+    def get(self, user_id: str) -> Dict[str, Any]:
+        return dict(self._load(str(user_id)))
+
+    def snapshot(self, user_id: str) -> Mapping[str, Any]:
+        """
+        A read-only view of the user's whole context, as of now, in one read. Later writes
+        do not change it.
+        """
+        if not self.near_cache_seconds:
+            return self.backend.snapshot(str(user_id))
+        # near-cached dicts are replaced on write, never changed
+        return MappingProxyType(self._load(str(user_id)))
+
+    def get_many(self, user_id: str, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        The given keys of the user's context (those that are set), in one backend read.
+        """
+        if not self.near_cache_seconds:
+            return self.backend.get_many(str(user_id), keys)
+        values = self._load(str(user_id))
+        return {key: values[key] for key in keys if key in values}
+
+    def get_key(self, user_id: str, key: str) -> Any:
+        if not self.near_cache_seconds:
+            return self.backend.snapshot(str(user_id)).get(key)
+        return self._load(str(user_id)).get(key)
+
+    def set(self, user_id: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        user_id = str(user_id)
+        value, slimmed = slim_value(value, self.max_field_bytes)
+        self.backend.set(user_id, key, value, ttl if ttl is not None else KEY_TTL_SECONDS.get(key))
+        with self._lock:
+            self.slimmed_fields += slimmed
+            cached = self._near.get(user_id)
+            if cached is not None:
+                # copy on write: readers may hold the previous dict
+                self._near[user_id] = (cached[0], {**cached[1], key: value})
+
+    def replace(self, user_id: str, key: str, value: Any) -> None:
+        """
+        Sets the key only if the user already has a context.
+        """
+        if self.get(user_id):
+            self.set(user_id, key, value)
+
+    def delete(self, user_id: str) -> None:
+        self.backend.delete(str(user_id))
+        self._forget(str(user_id))
+
+    def delete_key(self, user_id: str, key: str) -> None:
+        user_id = str(user_id)
+        self.backend.delete_key(user_id, key)
+        with self._lock:
+            cached = self._near.get(user_id)
+            if cached is not None and key in cached[1]:
+                self._near[user_id] = (cached[0], {k: v for k, v in cached[1].items() if k != key})
+
+    def expire(self, user_id: str, ttl: Optional[float] = None) -> None:
+        """
+        Drops the user's context `ttl` seconds from now (disconnected_ttl by default) unless
+        it is used again before then.
+        """
+        self.backend.expire(str(user_id), ttl if ttl is not None else self.disconnected_ttl)
+        self._forget(str(user_id))
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            backend_stats = self.backend.stats()
+        except Exception as e:
+            logging.error(f"Error reading context store stats: {e}")
+            backend_stats = {}
+        with self._lock:
+            return {
+                "backend": self.backend.name,
+                **backend_stats,
+                "slimmed_fields": self.slimmed_fields,
+                "near_cache": {
+                    "users": len(self._near),
+                    "hits": self.near_hits,
+                    "misses": self.near_misses,
+                },
+            }
+
+
+# Shared context store (per user)
+context_store = ContextStore.from_env()
 
-# Shared in-memory context store (per user)
-user_context_store: Dict[str, Dict[str, Any]] = {}
-store_lock = Lock()
 
 def get_context(user_id: str) -> Dict[str, Any]:
-    with store_lock:
-        return user_context_store.get(user_id, {})
-    
+    return context_store.get(user_id)
+
 def get_context_key(user_id: str, key: str) -> Any:
-    with store_lock:
-        return user_context_store.get(user_id, {}).get(key)
+    return context_store.get_key(user_id, key)
+
+def get_context_keys(user_id: str, keys: Iterable[str]) -> Dict[str, Any]:
+    return context_store.get_many(user_id, keys)
+
+def get_context_snapshot(user_id: str) -> Mapping[str, Any]:
+    return context_store.snapshot(user_id)
 
-def update_context(user_id: str, key: str, value: Any) -> None:
-    with store_lock:
-        user_context_store.setdefault(user_id, {})[key] = value
+def update_context(user_id: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+    context_store.set(user_id, key, value, ttl)
 
 def delete_context(user_id: str) -> None:
-    with store_lock:
-        user_context_store.pop(user_id, None)
-        
+    context_store.delete(user_id)
+
 def delete_context_key(user_id: str, key: str) -> None:
-    with store_lock:
-        user_data = user_context_store.get(user_id)
-        if user_data and key in user_data:
-            del user_data[key]
+    context_store.delete_key(user_id, key)
 
 def dump_context(user_id: str) -> Dict[str, Any]:
-    with store_lock:
-        return dict(user_context_store.get(user_id, {}))
-      
+    return context_store.get(user_id)
+
 def replace_context(user_id: str, key: str, value: Any) -> None:
-    with store_lock:
-        if user_id in user_context_store:
-            user_context_store(user_id, {})[key] = value
-            
+    context_store.replace(user_id, key, value)
+
+def expire_context(user_id: str, ttl: Optional[float] = None) -> None:
+    context_store.expire(user_id, ttl)
+
+
+# For code on the event loop (see ContextStore.run)
+async def get_context_async(user_id: str) -> Dict[str, Any]:
+    return await context_store.run(context_store.get, user_id)
+
+async def get_context_key_async(user_id: str, key: str) -> Any:
+    return await context_store.run(context_store.get_key, user_id, key)
+
+async def get_context_snapshot_async(user_id: str) -> Mapping[str, Any]:
+    return await context_store.run(context_store.snapshot, user_id)
+
+async def update_context_async(user_id: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+    await context_store.run(context_store.set, user_id, key, value, ttl)
+
+async def delete_context_key_async(user_id: str, key: str) -> None:
+    await context_store.run(context_store.delete_key, user_id, key)
+
+async def expire_context_async(user_id: str, ttl: Optional[float] = None) -> None:
+    await context_store.run(context_store.expire, user_id, ttl)
@@ -0,0 +1,147 @@
+# app/websockets/context_pipeline.py
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from fastapi.concurrency import run_in_threadpool
+
+
+# Default time limits for pipeline stages; a stage that runs over falls back to its default
+CONTEXT_LLM_TIMEOUT_SECONDS = float(os.getenv("CONTEXT_LLM_TIMEOUT_SECONDS", "8"))
+CONTEXT_LOOKUP_TIMEOUT_SECONDS = float(os.getenv("CONTEXT_LOOKUP_TIMEOUT_SECONDS", "4"))
+
+
+@dataclass
+class Stage:
+    """
+    One step of context gathering.
+
+    func receives the results gathered so far (every stage in `after` is guaranteed to be
+    in it) and returns this stage's result. Blocking functions (sync Supabase/OpenAI calls)
+    are run in the threadpool. If the stage fails or exceeds `timeout` seconds, its result
+    is `default` and the stages after it still run.
+    """
+    name: str
+    func: Callable[[Dict[str, Any]], Any]
+    after: Sequence[str] = ()
+    timeout: Optional[float] = None
+    default: Any = None
+    blocking: bool = False
+
+
+class ContextPipelineStats:
+    """
+    Per-stage counters across all pipeline runs, exposed on /metrics.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self.runs = 0
+        self.total_ms = 0.0
+
+    def record(self, timings: Dict[str, float], statuses: Dict[str, str], total_ms: float) -> None:
+        with self._lock:
+            self.runs += 1
+            self.total_ms += total_ms
+            for name, elapsed in timings.items():
+                stage = self._stages.setdefault(name, {"runs": 0, "total_ms": 0.0, "max_ms": 0.0, "timeouts": 0, "errors": 0})
+                stage["runs"] += 1
+                stage["total_ms"] += elapsed
+                stage["max_ms"] = max(stage["max_ms"], elapsed)
+                if statuses.get(name) == "timeout":
+                    stage["timeouts"] += 1
+                elif statuses.get(name) == "error":
+                    stage["errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "avg_ms": round(self.total_ms / self.runs, 2) if self.runs else 0.0,
+                "stages": {
+                    name: {
+                        "avg_ms": round(stage["total_ms"] / stage["runs"], 2),
+                        "max_ms": round(stage["max_ms"], 2),
+                        "timeouts": stage["timeouts"],
+                        "errors": stage["errors"],
+                    }
+                    for name, stage in self._stages.items()
+                },
+            }
+
+
+context_pipeline_stats = ContextPipelineStats()
+
+
+class ContextPipeline:
+    """
+    Runs stages as soon as the stages they depend on have finished, so independent stages
+    (e.g. two LLM classifiers and a few database lookups) overlap instead of adding up.
+    """
+    def __init__(self, stages: List[Stage], stats: Optional[ContextPipelineStats] = context_pipeline_stats, results: Optional[Dict[str, Any]] = None):
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError("Stage names must be unique")
+
+        # results of an earlier pipeline can be passed in and depended on like finished stages
+        results = dict(results or {})
+
+        # stages may only depend on stages listed before them, which also rules out cycles
+        seen = set(results)
+        for stage in stages:
+            missing = [name for name in stage.after if name not in seen]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown or later stages: {missing}")
+            seen.add(stage.name)
+
+        self.stages = stages
+        self.stats = stats
+        self.results: Dict[str, Any] = results
+        self.timings: Dict[str, float] = {}
+        self.statuses: Dict[str, str] = {}
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, asyncio.Task]) -> None:
+        waiting_on = [tasks[name] for name in stage.after if name in tasks]
+        if waiting_on:
+            await asyncio.gather(*waiting_on)
+
+        start = time.perf_counter()
+        try:
+            if stage.blocking:
+                call = run_in_threadpool(stage.func, self.results)
+            else:
+                call = stage.func(self.results)
+            self.results[stage.name] = await asyncio.wait_for(call, stage.timeout)
+            self.statuses[stage.name] = "ok"
+        except asyncio.TimeoutError:
+            logging.warning(f"Context stage '{stage.name}' timed out after {stage.timeout}s, using default")
+            self.results[stage.name] = stage.default
+            self.statuses[stage.name] = "timeout"
+        except Exception as e:
+            logging.error(f"Error in context stage '{stage.name}': {e}")
+            self.results[stage.name] = stage.default
+            self.statuses[stage.name] = "error"
+        self.timings[stage.name] = (time.perf_counter() - start) * 1000
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Runs every stage and returns {stage name: result}.
+        """
+        start = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+        for stage in self.stages:
+            tasks[stage.name] = asyncio.create_task(self._run_stage(stage, tasks))
+        await asyncio.gather(*tasks.values())
+
+        total_ms = (time.perf_counter() - start) * 1000
+        if self.stats is not None:
+            self.stats.record(self.timings, self.statuses, total_ms)
+        logging.info(
+            f"Context pipeline finished in {total_ms:.0f}ms: "
+            + ", ".join(f"{name}={elapsed:.0f}ms({self.statuses[name]})" for name, elapsed in self.timings.items())
+        )
+        return self.results
@@ -0,0 +1,155 @@
+# app/websockets/delta_stream.py
+import asyncio
+import os
+import time
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+# Send response text to the client as it is generated (per message: "stream")
+STREAM_DELTAS = os.getenv("STREAM_DELTAS", "false").lower() == "true"
+# A delta frame is sent once this many characters are waiting ...
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "48"))
+# ... or this many milliseconds after the previous frame, whichever comes first
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "40"))
+
+
+class StreamStats:
+    """
+    Time from the orchestrate message to the first response text the client can show, with
+    and without delta streaming, and how deltas were coalesced into frames. Exposed on /metrics.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.first_visible = {"deltas": [0, 0.0, 0.0], "blocks": [0, 0.0, 0.0]}  # count, total ms, max ms
+        self.deltas = 0
+        self.frames = 0
+        self.chars = 0
+
+    def record_first_visible(self, mode: str, ms: float) -> None:
+        with self._lock:
+            entry = self.first_visible[mode]
+            entry[0] += 1
+            entry[1] += ms
+            entry[2] = max(entry[2], ms)
+
+    def record_frame(self, deltas: int, chars: int) -> None:
+        with self._lock:
+            self.frames += 1
+            self.deltas += deltas
+            self.chars += chars
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **{
+                    f"first_visible_{mode}": {
+                        "turns": count,
+                        "avg_ms": round(total / count, 1) if count else 0.0,
+                        "max_ms": round(longest, 1),
+                    }
+                    for mode, (count, total, longest) in self.first_visible.items()
+                },
+                "frames": self.frames,
+                "deltas_per_frame": round(self.deltas / self.frames, 2) if self.frames else 0.0,
+                "chars_per_frame": round(self.chars / self.frames, 1) if self.frames else 0.0,
+            }
+
+
+stream_stats = StreamStats()
+
+
+class DeltaStream:
+    """
+    Forwards a response's text deltas to the client as numbered "ai_delta" frames.
+
+    The first delta is sent at once (it is what the user waits for); later ones are
+    coalesced until `flush_chars` characters are waiting or `flush_ms` have passed since the
+    previous frame, so a reply of many one-token deltas costs a few dozen frames. complete()
+    sends what is left and then the whole message as "ai_response" with the next sequence
+    number, for clients that only want the full text. `started_at` (perf_counter) is when
+    the user's message arrived.
+    """
+    def __init__(
+        self,
+        send: Callable[[dict], Awaitable[Any]],
+        started_at: Optional[float] = None,
+        flush_chars: int = STREAM_FLUSH_CHARS,
+        flush_ms: float = STREAM_FLUSH_MS,
+        stats: StreamStats = stream_stats,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.send = send
+        self.clock = clock
+        self.started_at = started_at if started_at is not None else clock()
+        self.flush_chars = flush_chars
+        self.flush_ms = flush_ms
+        self.stats = stats
+        self.seq = 0
+        self._buffer = []
+        self._buffered_chars = 0
+        self._last_frame: Optional[float] = None
+        self._timer: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
+    async def add(self, delta: str) -> None:
+        if not delta:
+            return
+        self._buffer.append(delta)
+        self._buffered_chars += len(delta)
+        if self._last_frame is None or self._buffered_chars >= self.flush_chars:
+            await self.flush()
+            return
+        waited_ms = (self.clock() - self._last_frame) * 1000
+        if waited_ms >= self.flush_ms:
+            await self.flush()
+        elif self._timer is None:
+            # the model may pause here; send what is waiting when the interval is up
+            self._timer = asyncio.get_running_loop().create_task(self._flush_later((self.flush_ms - waited_ms) / 1000))
+
+    async def _flush_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Sends the waiting deltas as one frame.
+        """
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        text, deltas = "".join(self._buffer), len(self._buffer)
+        self._buffer, self._buffered_chars = [], 0
+        first = self._last_frame is None
+        self._last_frame = self.clock()
+        async with self._send_lock:
+            self.seq += 1
+            await self.send({"type": "ai_delta", "seq": self.seq, "text": text})
+        self.stats.record_frame(deltas, len(text))
+        if first:
+            self.stats.record_first_visible("deltas", (self._last_frame - self.started_at) * 1000)
+
+    async def complete(self, text: str) -> None:
+        """
+        Sends the waiting deltas, then the whole message.
+        """
+        await self.flush()
+        async with self._send_lock:
+            self.seq += 1
+            await self.send({"type": "ai_response", "seq": self.seq, "text": text})
+        if self._last_frame is None:
+            # no deltas came through (e.g. a non-text response); the full message is the first text
+            self._last_frame = self.clock()
+            self.stats.record_first_visible("deltas", (self._last_frame - self.started_at) * 1000)
+
+    def stop(self) -> None:
+        """
+        Drops waiting deltas without sending them (the response was cancelled).
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._buffer, self._buffered_chars = [], 0
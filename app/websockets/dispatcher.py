@@ -0,0 +1,207 @@
+# app/websockets/dispatcher.py
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+
+# Turns (orchestrate, improv, audio and image messages) that may wait behind the running one; more are refused
+SESSION_MAX_PENDING_TURNS = int(os.getenv("SESSION_MAX_PENDING_TURNS", "4"))
+# A new orchestrate message cancels the response in progress instead of waiting for it (per message: "interrupt")
+SESSION_INTERRUPT_TURNS = os.getenv("SESSION_INTERRUPT_TURNS", "false").lower() == "true"
+
+
+class DispatchStats:
+    """
+    Websocket message dispatch counters across sessions, exposed on /metrics.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.state_messages = 0
+        self.turns_queued = 0
+        self.turns_completed = 0
+        self.turns_failed = 0
+        self.turns_cancelled = 0
+        self.turns_rejected = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.started = 0
+
+    def record_state(self) -> None:
+        with self._lock:
+            self.state_messages += 1
+
+    def record_queued(self) -> None:
+        with self._lock:
+            self.turns_queued += 1
+
+    def record_rejected(self) -> None:
+        with self._lock:
+            self.turns_rejected += 1
+
+    def record_start(self, wait_ms: float) -> None:
+        with self._lock:
+            self.started += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def record_outcome(self, outcome: str, count: int = 1) -> None:
+        with self._lock:
+            if outcome == "completed":
+                self.turns_completed += count
+            elif outcome == "cancelled":
+                self.turns_cancelled += count
+            else:
+                self.turns_failed += count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state_messages": self.state_messages,
+                "turns_queued": self.turns_queued,
+                "turns_completed": self.turns_completed,
+                "turns_failed": self.turns_failed,
+                "turns_cancelled": self.turns_cancelled,
+                "turns_rejected": self.turns_rejected,
+                "avg_queue_wait_ms": round(self.total_wait_ms / self.started, 2) if self.started else 0.0,
+                "max_queue_wait_ms": round(self.max_wait_ms, 2),
+            }
+
+
+dispatch_stats = DispatchStats()
+
+
+@dataclass
+class Turn:
+    kind: str
+    handler: Callable[[], Awaitable[Any]]
+    interruptible: bool
+    queued_at: float = field(default_factory=time.perf_counter)
+
+
+class SessionDispatcher:
+    """
+    Runs one websocket connection's messages without head-of-line blocking.
+
+    State messages (gps, time, personality, feedback, ...) are applied by apply() straight
+    from the receive loop. Turns go through submit() onto a queue that one task works
+    through in order, so a response never overlaps the next and an image or transcript is
+    in the context before the turn that follows it. At most `max_pending` turns wait; more
+    are refused with a BUSY error. A turn submitted with `interrupt` cancels the running
+    and waiting interruptible turns (responses, not audio or image processing) first, and
+    cancel() does the same for a client's cancel message.
+    """
+    def __init__(self, websocket: WebSocket, user_id: str, max_pending: int = SESSION_MAX_PENDING_TURNS, stats: DispatchStats = dispatch_stats):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.max_pending = max_pending
+        self.stats = stats
+        self._pending: Deque[Turn] = deque()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._current: Optional[asyncio.Task] = None
+        self._current_turn: Optional[Turn] = None
+        self._closed = False
+
+    async def _send(self, payload: dict) -> None:
+        try:
+            await self.websocket.send_json(payload)
+        except Exception as e:
+            logging.info(f"Could not send {payload.get('type')} to user {self.user_id}: {e}")
+
+    async def apply(self, kind: str, handler: Callable[[], Awaitable[Any]]) -> None:
+        """
+        Runs a state message's handler now, between the receive loop's reads.
+        """
+        self.stats.record_state()
+        try:
+            await handler()
+        except WebSocketDisconnect:
+            raise
+        except Exception as e:
+            logging.error(f"Error handling {kind} message for user {self.user_id}: {e}")
+            await self._send({"type": "error", "message": f"Error handling {kind} message"})
+
+    async def submit(self, kind: str, handler: Callable[[], Awaitable[Any]], interruptible: bool = True, interrupt: bool = False) -> bool:
+        """
+        Queues a turn behind the running one. Returns False if it was refused.
+        """
+        if self._closed:
+            return False
+        if interrupt:
+            await self.cancel()
+        if len(self._pending) >= self.max_pending:
+            self.stats.record_rejected()
+            logging.warning(f"Refusing {kind} message for user {self.user_id}: {len(self._pending)} turns already waiting")
+            await self._send({"type": "error", "text": "BUSY"})
+            return False
+        self._pending.append(Turn(kind, handler, interruptible))
+        self.stats.record_queued()
+        self._wakeup.set()
+        if self._worker is None:
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        return True
+
+    async def cancel(self) -> int:
+        """
+        Cancels the running and waiting interruptible turns. Returns how many were cancelled.
+        """
+        dropped = [turn for turn in self._pending if turn.interruptible]
+        for turn in dropped:
+            self._pending.remove(turn)
+            await self._send({"type": "cancelled", "message": turn.kind})
+        self.stats.record_outcome("cancelled", len(dropped))
+        cancelled = len(dropped)
+        if self._current is not None and not self._current.done() and self._current_turn.interruptible:
+            self._current.cancel()
+            # wait for it to stop, so the next turn does not overlap its last sends
+            await asyncio.wait({self._current})
+            cancelled += 1
+        return cancelled
+
+    async def _run(self) -> None:
+        while not self._closed:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            turn = self._pending.popleft()
+            self.stats.record_start((time.perf_counter() - turn.queued_at) * 1000)
+            self._current_turn = turn
+            self._current = asyncio.ensure_future(turn.handler())
+            await asyncio.wait({self._current})
+            await self._finished(turn, self._current)
+
+    async def _finished(self, turn: Turn, task: asyncio.Task) -> None:
+        if task.cancelled():
+            self.stats.record_outcome("cancelled")
+            await self._send({"type": "cancelled", "message": turn.kind})
+            return
+        error = task.exception()
+        if error is None:
+            self.stats.record_outcome("completed")
+        elif isinstance(error, WebSocketDisconnect):
+            self.stats.record_outcome("failed")
+        else:
+            self.stats.record_outcome("failed")
+            logging.error(f"Error handling {turn.kind} message for user {self.user_id}: {error}")
+            await self._send({"type": "error", "message": f"Error handling {turn.kind} message"})
+
+    async def close(self) -> None:
+        """
+        Stops the session's turns: the running one is cancelled and waiting ones are dropped.
+        """
+        self._closed = True
+        self._pending.clear()
+        if self._current is not None and not self._current.done():
+            self._current.cancel()
+            await asyncio.wait({self._current})
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.wait({self._worker})
@@ -1,23 +1,27 @@
 # app/websocket_handlers/text_handler.py
 import asyncio
 import base64
+import logging
 import os
+import time
+from typing import Optional
 from agents import Agent, RunResultStreaming, Runner
 from app.function.improv_form_filler.form_orhestration import FormOrchestration
 from fastapi import WebSocket
 from openai import AsyncOpenAI
-from app.supabase.conversation_history import Message, append_message_to_history, replace_conversation_history_with_summary
-from app.supabase.profiles import ProfileRepository
+from app.supabase.conversation_history import Message, append_message_to_history_async, get_history_length_async
+from app.supabase.credit_ledger import credit_ledger
+from app.supabase.rolling_summary import summary_queue
+from app.utils.token_accounting import TurnUsage, token_usage_stats
 from app.utils.token_count import calculate_credits_to_deduct, calculate_provider_cost
-from app.websockets.context.store import get_context_key, update_context
+from app.websockets.context.store import get_context_key_async, update_context_async
+from app.websockets.delta_stream import STREAM_DELTAS, DeltaStream, stream_stats
 from app.websockets.orchestrate_contextual import orchestration_websocket
+from app.websockets.speculative import cancel_response
 from app.websockets.schemas.messages import ImprovMessage, LocalLingoMessage, OrchestrateMessage, PersonalityMessage, UIActionMessage, TextMessage, AudioMessage, ImageMessage, GPSMessage, TimeMessage, FeedbackMessage
 
 
 from app.function.memory_extraction import MemoryExtractionService
-from app.personal_agents.slang_extraction import SlangExtractionService
-from app.psychology.mbti_analysis import MBTIAnalysisService
-from app.psychology.ocean_analysis import OceanAnalysisService
 
 
 openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
@@ -25,32 +29,32 @@ openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 async def handle_text(websocket: WebSocket, message: TextMessage, user_id: str):
     await websocket.send_json({"type": "text_action", "status": "ok"})
-    update_context(user_id, "last_message", message.text)
-    update_context(user_id, "settings", message)    
+    await update_context_async(user_id, "last_message", message.text)
+    await update_context_async(user_id, "settings", message)    
 
 
 async def handle_audio(websocket: WebSocket, message: AudioMessage, user_id: str):
     await websocket.send_json({"type": "audio_action", "status": "ok"})
-    update_context(user_id, "settings", message)
+    await update_context_async(user_id, "settings", message)
     # Transcribe audio using Whisper
     audio_bytes = base64.b64decode(message.audio)
     user_transcript = await stt(audio_bytes)
 
     await websocket.send_json({"type": "user_transcript", "text": user_transcript})
-    update_context(user_id, "last_message", user_transcript)
+    await update_context_async(user_id, "last_message", user_transcript)
     
 
 async def handle_image(websocket: WebSocket, message: ImageMessage, user_id: str):
     await websocket.send_json({"type": "image_action", "status": "image ok"})
     await websocket.send_json({"type": "info", "text": "Analyzing image..."})
     image_analysis = await analyze_image(image_data=message.data, image_message=message.input, image_format=message.format)    
-    update_context(user_id, "last_image_analysis", image_analysis)
+    await update_context_async(user_id, "last_image_analysis", image_analysis)
     await websocket.send_json({"type": "image_analysis", "text": image_analysis})
 
 
 async def handle_gps(websocket: WebSocket, message: GPSMessage, user_id: str):
     await websocket.send_json({"type": "gps_action", "status": "ok"})
-    update_context(user_id, "gps", {
+    await update_context_async(user_id, "gps", {
         "latitude": message.coords.latitude,
         "longitude": message.coords.longitude,
         "altitude": message.coords.altitude,
@@ -61,7 +65,7 @@ async def handle_gps(websocket: WebSocket, message: GPSMessage, user_id: str):
 
 async def handle_time(websocket: WebSocket, message: TimeMessage, user_id: str):
     await websocket.send_json({"type": "time_action", "status": "ok"})
-    update_context(user_id, "time", {"timestamp": message.timestamp, "timezone": message.timezone})
+    await update_context_async(user_id, "time", {"timestamp": message.timestamp, "timezone": message.timezone})
 
 
 ui_action_agent = Agent(
@@ -105,15 +109,15 @@ async def handle_ui_action(websocket: WebSocket, message: str):
     
 async def handle_personality(websocket: WebSocket, message: PersonalityMessage, user_id: str):
     await websocket.send_json({"type": "personality_action", "status": "Personality ok"})
-    update_context(user_id, "personality", message)
+    await update_context_async(user_id, "personality", message)
 
 async def handle_feedback(websocket: WebSocket, message: FeedbackMessage, user_id: str):
     await websocket.send_json({"type": "feedback_action", "status": "Feedback ok"})
-    update_context(user_id, "feedback", message.feedback_type)
+    await update_context_async(user_id, "feedback", message.feedback_type)
 
 async def handle_local_lingo(websocket: WebSocket, message: LocalLingoMessage, user_id: str):
     await websocket.send_json({"type": "local_lingo_action", "status": "Local Lingo ok"})
-    update_context(user_id, "local_lingo", message.local_lingo)
+    await update_context_async(user_id, "local_lingo", message.local_lingo)
 
 
 from app.function.improv_form_filler.forms import connect_profile_form
@@ -137,55 +141,91 @@ async def handle_orchestration(websocket: WebSocket, message: OrchestrateMessage
         message = ImprovMessage(type="improv", improv_form_name=form_orchestration.improv_form.name, user_input=message.user_input)
         await handle_improv(websocket=websocket, user_id=user_id, message=message)
     else:
+        started_at = time.perf_counter()
         await websocket.send_json({"type": "orchestration", "status": "processing"})
 
-        settings = get_context_key(user_id, "settings")
+        settings = await get_context_key_async(user_id, "settings")
         
         result : RunResultStreaming = await orchestration_websocket(user_id=user_id, user_input=message.user_input, websocket=websocket, extract=message.extract, summarize=message.summarize)
 
         asyncio.create_task(handle_ui_action(websocket, message.user_input))
 
-        async for event in result.stream_events():
-            if event.type == "raw_response_event":
-                continue
-
-            elif event.type == "agent_updated_stream_event":
-                await websocket.send_json({
-                    "type": "agent_updated",
-                    "text": event.new_agent.name
-                })
-
-            elif event.type == "run_item_stream_event":
-                if event.item.type == "tool_call_item":
-                    await websocket.send_json({
-                        "type": "tool_call_item",
-                        "text": event.item.raw_item.name
-                    })
-
-                elif event.item.type == "tool_call_output_item":
+        usage = TurnUsage()
+        stream = message.stream if message.stream is not None else STREAM_DELTAS
+        deltas = DeltaStream(websocket.send_json, started_at=started_at) if stream else None
+        first_visible = True
+        try:
+            async for event in result.stream_events():
+                if event.type == "raw_response_event":
+                    usage.observe(event)
+                    if deltas is not None and getattr(event.data, "type", None) == "response.output_text.delta":
+                        await deltas.add(event.data.delta)
+                    continue
+
+                # keep the text sent so far ahead of the tool calls and agent changes that follow it
+                if deltas is not None:
+                    await deltas.flush()
+
+                if event.type == "agent_updated_stream_event":
                     await websocket.send_json({
-                        "type": "tool_call_output_item",
-                        "text": event.item.output
+                        "type": "agent_updated",
+                        "text": event.new_agent.name
                     })
 
-                elif event.item.type == "message_output_item":
-                    #print("AI Response: ", event.item.raw_item.content[0].text)
-                    await websocket.send_json({
-                        "type": "ai_response",
-                        "text":  event.item.raw_item.content[0].text
-                    })
+                elif event.type == "run_item_stream_event":
+                    if event.item.type == "tool_call_item":
+                        await websocket.send_json({
+                            "type": "tool_call_item",
+                            "text": event.item.raw_item.name
+                        })
+
+                    elif event.item.type == "tool_call_output_item":
+                        await websocket.send_json({
+                            "type": "tool_call_output_item",
+                            "text": event.item.output
+                        })
+
+                    elif event.item.type == "message_output_item":
+                        #print("AI Response: ", event.item.raw_item.content[0].text)
+                        text = event.item.raw_item.content[0].text
+                        if deltas is not None:
+                            # the rest of the deltas, then the whole message with the next sequence number
+                            await deltas.complete(text)
+                            continue
+                        await websocket.send_json({
+                            "type": "ai_response",
+                            "text":  text
+                        })
+                        if first_visible:
+                            first_visible = False
+                            stream_stats.record_first_visible("blocks", (time.perf_counter() - started_at) * 1000)
+
+            # stream_events ends quietly when cancelled while waiting for the model
+            if asyncio.current_task().cancelling():
+                raise asyncio.CancelledError()
+        except asyncio.CancelledError:
+            # the turn was interrupted (see SessionDispatcher): stop the model and charge for what it used
+            if deltas is not None:
+                deltas.stop()
+            cancel_response(result)
+            observe_response(usage, result)
+            if usage.output_tokens:
+                credit_ledger.deduct(user_id, usage.credits())
+            raise
                     
         final = result.final_output
+        # the prompt that was actually sent (instructions with history, memories and slang)
+        observe_response(usage, result)
         await websocket.send_json({"type": "ai_transcript", "text": final})
         await websocket.send_json({"type": "orchestration", "status": "done"})
             
         # TODO: change this to the actual agent name dynamically
-        history = append_message_to_history(user_id, "Noelle", final)
+        history = await append_message_to_history_async(user_id, "Noelle", final)
 
         # Process the history and costs in the background
-        asyncio.create_task(process_history(user_id, history, summarize=message.summarize, extract=message.extract))
+        asyncio.create_task(process_history(user_id, history, summarize=message.summarize, extract=message.extract, usage=usage))
         
-        settings = get_context_key(user_id, "settings")
+        settings = await get_context_key_async(user_id, "settings")
         if settings.type == "audio":
             # send audio response
             encoded_audio = await tts(final, settings.voice)
@@ -239,7 +279,16 @@ async def tts(text :str, voice :str) -> str:
     encoded_audio = base64.b64encode(audio_data).decode()
     return encoded_audio
     
-async def process_history(user_id: str, history: list[Message], summarize: int = 10, extract: bool = True):
+def observe_response(usage: TurnUsage, result) -> None:
+    """
+    Records the prompt of the run that answered, and any speculative run that was started
+    and discarded for this turn (see SpeculativeStream), so the turn is billed for both.
+    """
+    usage.observe_run(getattr(result, "run", result))
+    for run, events in getattr(result, "discarded", []):
+        usage.add_discarded(run, events)
+
+async def process_history(user_id: str, history: list[Message], summarize: int = 10, extract: bool = True, usage: Optional[TurnUsage] = None):
     
     # Get the user input from the history (second to the last message)
     user_message = history[-2]
@@ -249,44 +298,25 @@ async def process_history(user_id: str, history: list[Message], summarize: int =
     ai_message = history[-1]
     ai_output = ai_message.content
         
-    # calculate costs
-    provider_cost = calculate_provider_cost(user_input, ai_output)
-    credits_cost = calculate_credits_to_deduct(provider_cost)
+    # calculate costs (from the streamed turn's usage when there is one)
+    if usage is not None:
+        provider_cost = usage.cost()
+        credits_cost = usage.credits()
+        token_usage_stats.record(usage, credits_cost)
+        cached = f"{usage.cached_ratio:.0%} cached" if usage.cached_ratio is not None else "no usage reported"
+        logging.info(f"Turn usage for {user_id}: {usage.input_tokens} input tokens ({cached}), {usage.output_tokens} output tokens, {credits_cost} credits")
+    else:
+        provider_cost = calculate_provider_cost(user_input, ai_output)
+        credits_cost = calculate_credits_to_deduct(provider_cost)
     
-    # deduct credits
-    profile_repo = ProfileRepository()
-    profile_repo.deduct_credits(user_id, credits_cost)
+    # deduct credits (recorded locally, written to Supabase in the ledger's next batch)
+    credit_ledger.deduct(user_id, credits_cost)
     
-    # replace history with summary if the history is longer than the summarize value
-    if len(history) > summarize:
-        asyncio.create_task(replace_conversation_history_with_summary(user_id))
-        
-        if extract:        
-            # get all message from history that match the user_id
-            history_string = [msg for msg in history if msg.user_id == user_id]
-        
-            # Convert the history to a string
-            history_string = "\n".join([f"{msg.role}: {msg.content}" for msg in history_string])
-            
-            # Extract knowledge from the history.
-            extraction = MemoryExtractionService(user_id)
-            extract_task = asyncio.create_task(extraction.extract_memory(history_string))
-            await extract_task
-
-            # Run MBTI analysis
-            mbti_service = MBTIAnalysisService(user_id)
-            mbti_task = asyncio.create_task(mbti_service.analyze_message(history_string))
-            await mbti_task
-
-            # Run OCEAN analysis
-            ocean_service = OceanAnalysisService(user_id)
-            ocean_task = asyncio.create_task(ocean_service.analyze_message(history_string))
-            await ocean_task
-                    
-            # Run SLANG analysis
-            slang_service = SlangExtractionService(user_id)
-            slang_task = asyncio.create_task(slang_service.extract_slang(history_string))
-            await slang_task
+    # fold the oldest messages into the rolling summary once there are more than `summarize` raw
+    # messages; the folded messages are what gets analyzed (see fold_history)
+    # (the total from the tail includes the summary, so this only skips turns that cannot fold)
+    if await get_history_length_async(user_id) > summarize:
+        summary_queue.schedule(user_id, summarize, extract=extract)
     
     
     # costs = f"""
@@ -1,21 +1,32 @@
 # app/orchestration/orchestrate_contextual.py
+import asyncio
 import logging
 import os
+from dataclasses import dataclass
+from typing import Mapping, Optional, Union
 from app.function.personality_prompt import get_personality_prompt
 from fastapi import WebSocket
+from fastapi.concurrency import run_in_threadpool
 from app.function.memory_extraction import MemoryExtractionService
 from app.function.supabase_tools import clear_history, create_user_feedback, get_user_birthdate, get_user_gender, get_user_location, get_users_name, retrieve_personalized_info_about_user, update_user_birthdate, update_user_gender, update_user_location, update_user_name
 from app.personal_agents import memory_agents, multistep_agent
 from app.personal_agents.slang_extraction import SlangExtractionService
 from app.psychology.intent_classification import IntentClassificationService
 from app.psychology.mbti_analysis import MBTIAnalysisService
+from app.psychology.multistep_service import MultistepService
 from app.psychology.ocean_analysis import OceanAnalysisService
 from app.psychology.theory_planned_behavior import TheoryPlannedBehaviorService
-from app.supabase.conversation_history import append_message_to_history
-from app.supabase.knowledge_edges import get_connected_memories, pretty_print_memories
-from app.supabase.profiles import ProfileRepository
+from app.supabase.conversation_history import append_message_to_history_async
+from app.supabase.knowledge_edges import get_connected_memories_async, pretty_print_memories
+from app.supabase.memory_index import warm_user_memory_index
+from app.supabase.pgvector import generate_embedding_async
+from app.supabase.profiles import AsyncProfileRepository
+from app.supabase.rolling_summary import SUMMARY_ROLE
 from app.utils.geocode import reverse_geocode
-from app.websockets.context.store import delete_context_key, get_context, get_context_key, update_context
+from app.websockets.context_pipeline import CONTEXT_LLM_TIMEOUT_SECONDS, CONTEXT_LOOKUP_TIMEOUT_SECONDS, ContextPipeline, Stage
+from app.websockets.prompt_assembler import PROMPT_HISTORY_TOKEN_BUDGET, STATIC, USER, PromptAssembler, Section
+from app.websockets.speculative import SPECULATIVE_RESPONSE, SpeculativeStream
+from app.websockets.context.store import delete_context_key_async, get_context_async, get_context_snapshot_async, update_context_async
 from agents import Agent, AgentHooks, ModelSettings, RunResultStreaming, Runner, WebSearchTool
 from dateutil import parser
 from app.personal_agents.notification_agent import notification_agent
@@ -23,7 +34,10 @@ from app.personal_agents.notification_agent import notification_agent
 
 openai_model = os.getenv("OPENAI_MODEL") or "gpt-4o-mini"
 
-profile_repo = ProfileRepository()
+# With SPECULATIVE_RESPONSE, a recalled memory is only added to the prompt above this similarity (it is what restarts the response)
+SPECULATIVE_MEMORY_SIMILARITY = float(os.getenv("SPECULATIVE_MEMORY_SIMILARITY", "0.8"))
+
+profile_repo = AsyncProfileRepository()
 
 agent_name = "Noelle"
 
@@ -186,78 +200,123 @@ else:
     )
 
 
+# Tools that don't depend on the user, built once and shared by every session
+database_tool = database_agent.as_tool(
+    tool_name="database_agent",
+    tool_description="The database agent can be used to get the user's name, birthdate, location, gender, and other information."
+)
+
+search_tool = search_agent.as_tool(
+    tool_name="web_search",
+    tool_description="Search the internet for the user's answer."
+)
+
+notification_tool = notification_agent.as_tool(
+    tool_name="notification_agent",
+    tool_description="The notification agent can be used to schedule and unschedule push notifications."
+)
+
+
+# Template for the conversational agent; sessions clone it (see create_session_agents) and never modify it
 noelle_agent = Agent(
     name=agent_name,
     handoff_description="A conversational agent that leads the conversation with the user to get to know them better.",
     model=openai_model, # "o3-mini"
-    tools=[
-        database_agent.as_tool(
-            tool_name="database_agent",
-            tool_description="The database agent can be used to get the user's name, birthdate, location, gender, and other information."
-        ),
-        
-        search_agent.as_tool(
-            tool_name="web_search",
-            tool_description="Search the internet for the user's answer."
-        ),
-        
-        memory_agents.agent.as_tool(
-            tool_name="memory_search",
-            tool_description="Search your memories of the user for relevant information and context to make the conversation more meaningful."
-        ),
-        
-        notification_agent.as_tool(
-            tool_name="notification_agent",
-            tool_description="The notification agent can be used to schedule and unschedule push notifications."
-        ),
-        
-        multistep_agent.multistep_agent.as_tool(
-            tool_name="multistep_agent",
-            tool_description="The multistep agent can be used to start or abort a multistep process. It is smart to send the intention of the user to the multistep agent with the context of the conversation."
-        )
-    ],
+    tools=[database_tool, search_tool, notification_tool],
     model_settings=settings,
     #mcp_servers=[care_mcp, connect_mcp],
     #hooks=MyHooks(),
 )
 
 
+@dataclass
+class SessionAgents:
+    """
+    The agents for one websocket session: the template agent with the memory and multistep
+    tools bound to the session's user. Built once per connection, so a turn only has to
+    clone `agent` with its instructions and never touches state shared with other sessions.
+    """
+    user_id: str
+    agent: Agent
+    multistep_service: MultistepService
+
+
+def create_session_agents(user_id: str) -> SessionAgents:
+    multistep_service = MultistepService(user_id)
+
+    memory_tool = memory_agents.create_memory_agent(user_id).as_tool(
+        tool_name="memory_search",
+        tool_description="Search your memories of the user for relevant information and context to make the conversation more meaningful."
+    )
+    multistep_tool = multistep_agent.create_multistep_agent(multistep_service).as_tool(
+        tool_name="multistep_agent",
+        tool_description="The multistep agent can be used to start or abort a multistep process. It is smart to send the intention of the user to the multistep agent with the context of the conversation."
+    )
+
+    # Tools in a fixed order by name: their schemas come before the instructions in the request,
+    # so they are the first thing the provider's prompt cache has to match
+    tools = sorted([database_tool, search_tool, memory_tool, notification_tool, multistep_tool], key=lambda tool: tool.name)
+    agent = noelle_agent.clone(tools=tools)
+    return SessionAgents(user_id=user_id, agent=agent, multistep_service=multistep_service)
+
+
+def get_session_agents(user_id: str, websocket: WebSocket) -> SessionAgents:
+    """
+    The session's agents, created on first use and kept on the websocket for the rest of the connection.
+    """
+    session = getattr(websocket.state, "agents", None)
+    if session is None or session.user_id != user_id:
+        session = create_session_agents(user_id)
+        websocket.state.agents = session
+    return session
+
+
 async def build_user_profile(user_id: str, websocket: WebSocket):
     await websocket.send_json({"type": "orchestration", "status": "building user profile"})
     
-    profile_service = ProfileRepository()
-    
     # Initialize analysis services and retrieve context info
-    mbti_service = MBTIAnalysisService(user_id)
-    ocean_service = OceanAnalysisService(user_id)
+    mbti_service, ocean_service = await asyncio.gather(
+        MBTIAnalysisService.create(user_id),
+        OceanAnalysisService.create(user_id),
+    )
 
-    update_context(user_id, "user_id", user_id)
+    await update_context_async(user_id, "user_id", user_id)
+    
+    # Build this connection's agents once instead of on every message
+    get_session_agents(user_id, websocket)
+    
+    # Load the user's memories for in-process vector search without holding up the connection
+    asyncio.create_task(run_in_threadpool(warm_user_memory_index, user_id))
     
     # Get the user's name
-    user_name = profile_service.get_user_name(user_id)
+    user_name = await profile_repo.get_user_name(user_id)
     
     if user_name:
-        update_context(user_id, "user_name", user_name)
+        await update_context_async(user_id, "user_name", user_name)
         await websocket.send_json({"type": "orchestration", "status": "user name updated"})
         
     
     mbti_type = mbti_service.get_mbti_type()   
-    update_context(user_id, "mbti_type", mbti_type)
+    await update_context_async(user_id, "mbti_type", mbti_type)
     
     style_prompt = mbti_service.generate_style_prompt(mbti_type)
-    update_context(user_id, "style_prompt", style_prompt)
+    await update_context_async(user_id, "style_prompt", style_prompt)
 
     ocean_traits = ocean_service.get_pretty_print_ocean_format()    
-    update_context(user_id, "ocean_traits", ocean_traits)
+    await update_context_async(user_id, "ocean_traits", ocean_traits)
     
     await websocket.send_json({"type": "orchestration", "status": "user profile built"})
 
 
-async def build_contextual_prompt(user_id: str) -> str:
+async def build_contextual_prompt(user_id: str, context: Optional[Mapping] = None) -> str:
+    """
+    What is known about the user that stays the same from turn to turn (see build_turn_prompt
+    for the rest), so this part of the instructions stays cacheable across the session.
+    `context` is the turn's snapshot of the context store, if already taken.
+    """
     
-    profile_service = ProfileRepository()
     # Get the user's name
-    user_name = profile_service.get_user_name(user_id)
+    user_name = await profile_repo.get_user_name(user_id)
 
     prompt_parts = []
     prompt_parts.append(f"user_id: {user_id} (use this for database operations)")
@@ -267,7 +326,8 @@ async def build_contextual_prompt(user_id: str) -> str:
     else:
         prompt_parts.append("    You don't know the user's name yet. You will need to ask the user for their name. (automatically update the user name in the database when you get it) \n")
      
-    context = get_context(user_id)
+    if context is None:
+        context = await get_context_async(user_id)
         
     mbti_type = context.get("mbti_type")
     if mbti_type:
@@ -276,7 +336,18 @@ async def build_contextual_prompt(user_id: str) -> str:
     ocean_traits = context.get("ocean_traits")
     if ocean_traits:
         prompt_parts.append(f"      The user's ocean traits are {ocean_traits} \n")
-    
+
+    return "\n".join(prompt_parts)
+
+
+async def build_turn_prompt(user_id: str, context: Optional[Mapping] = None) -> str:
+    """
+    The user's situation right now: location, local time and a recent image.
+    """
+    prompt_parts = []
+    if context is None:
+        context = await get_context_async(user_id)
+
     location = context.get("gps")
     if location:
         location_name = await reverse_geocode(location['latitude'], location['longitude'])
@@ -295,176 +366,176 @@ async def build_contextual_prompt(user_id: str) -> str:
     return "\n".join(prompt_parts)
 
 
-async def orchestration_websocket( user_id: str, user_input: str, websocket: WebSocket, summarize: int = 10, extract: bool = True) -> RunResultStreaming:
+async def orchestration_websocket( user_id: str, user_input: str, websocket: WebSocket, summarize: int = 10, extract: bool = True) -> Union[RunResultStreaming, SpeculativeStream]:
     await websocket.send_json({"type": "orchestration", "status": "processing"})
         
     slang_service = SlangExtractionService(user_id)
     memory_service = MemoryExtractionService(user_id)
     intent_service = IntentClassificationService(user_id)
     tpb_service = TheoryPlannedBehaviorService(user_id)
-    multistep_agent.service.user_id = user_id
+    session = get_session_agents(user_id, websocket)
     
-    slang_result_pretty_print = slang_service.pretty_print_slang_result(slang_service.retrieve_similar_slang(user_input))
-    if slang_result_pretty_print:
-        slang_result_pretty_print = f"""
-Fun Slang you can use:
-    {slang_result_pretty_print}
-        """
-    else:
-        slang_result_pretty_print = ""
+    # One read of the context store for the whole turn: an immutable snapshot, so every
+    # stage sees the same version and none of them takes the store's locks
+    turn_context = await get_context_snapshot_async(user_id)
     
+    async def lookup_slang(results):
+        # the embedding stage has cached the input's embedding, so this is one RPC
+        return slang_service.pretty_print_slang_result(await slang_service.retrieve_similar_slang_async(user_input))
     
-    history = append_message_to_history(user_id, "user", user_input)
+    def history_text(results):
+        history = results["history"]
+        if not history:
+            return f"user: {user_input}"
+        return "\n".join([f"{msg.role}: {msg.content}" for msg in history])
     
-    history_string = "\n".join([f"{msg.role}: {msg.content}" for msg in history])
+    async def classify_intent(results):
+        return await intent_service.classify_intent(history_text(results))
     
-    # Intent classification
-    intent = await intent_service.classify_intent(history_string)
+    async def classify_behavior(results):
+        return await tpb_service.classify_behavior(history_text(results))
     
-    memory_string = ""
-    relational_context_string = ""
+    async def recall_memories(results):
+        intent = results["intent"]
+        if intent is None or intent.confidence_score < 0.85 or not intent.memory_trigger:
+            return "", "", None
+        
+        await websocket.send_json({"type": "orchestration", "status": "recalling memories"})
+        similar_memories = await run_in_threadpool(memory_service.vector_search, user_input, 1)
+        if not similar_memories:
+            return "", "", None
+        
+        memory_string = similar_memories[0]['knowledge_text']
+        relational_context = await get_connected_memories_async(user_id, similar_memories[0]['id'])
+        await websocket.send_json({"type": "orchestration", "status": "recalling context"})
+        return memory_string, pretty_print_memories(relational_context), similar_memories[0].get('similarity')
+    
+    # The active multistep comes from the turn's snapshot, so it stays in the prompt even if judging it fails
+    multistep = turn_context.get("multistep")
+    
+    async def judge_multistep(results):
+        # judge() updates the multistep in place (step, reason) once the judgement is in
+        session.multistep_service.multistep = multistep
+        await session.multistep_service.judge(user_input)
+    
+    # Independent lookups run concurrently; each degrades to its default on failure or timeout.
+    # The history append is a write, so it has no time limit: cancelling it midway could lose
+    # the user's message, or store it while the turn carries on without it.
+    context_stages = [
+        Stage("embedding", lambda results: generate_embedding_async(user_input), timeout=CONTEXT_LOOKUP_TIMEOUT_SECONDS),
+        Stage("slang", lookup_slang, after=["embedding"], timeout=CONTEXT_LOOKUP_TIMEOUT_SECONDS, default=""),
+        Stage("history", lambda results: append_message_to_history_async(user_id, "user", user_input)),
+        Stage("user_prompt", lambda results: build_contextual_prompt(user_id, turn_context), timeout=CONTEXT_LOOKUP_TIMEOUT_SECONDS, default=f"user_id: {user_id} (use this for database operations)"),
+        Stage("turn_prompt", lambda results: build_turn_prompt(user_id, turn_context), timeout=CONTEXT_LOOKUP_TIMEOUT_SECONDS, default=""),
+    ]
+    if multistep:
+        context_stages.append(Stage("multistep", judge_multistep, timeout=CONTEXT_LLM_TIMEOUT_SECONDS))
+    classifier_stages = [
+        Stage("intent", classify_intent, after=["history"], timeout=CONTEXT_LLM_TIMEOUT_SECONDS),
+        Stage("tpb", classify_behavior, after=["history"], timeout=CONTEXT_LLM_TIMEOUT_SECONDS),
+        Stage("memories", recall_memories, after=["intent", "embedding"], timeout=CONTEXT_LOOKUP_TIMEOUT_SECONDS, default=("", "", None)),
+    ]
     
-    if intent.confidence_score < 0.85:
-        intent = ("Unconfident in the intent of the user, a possible clarifying question: "+ intent.clarifying_question + " if used ask is it in the most natural way possible")
+    if SPECULATIVE_RESPONSE:
+        # The classifiers run alongside the response instead of ahead of it (see SpeculativeStream)
+        context = await ContextPipeline(context_stages).run()
     else:
-        if intent.memory_trigger:
-            await websocket.send_json({"type": "orchestration", "status": "recalling memories"})
-            
-            similar_memories = memory_service.vector_search(user_input, limit=1)
-            if similar_memories and len(similar_memories) > 0:
-                memory_string = similar_memories[0]['knowledge_text']
-            
-            if similar_memories and len(similar_memories) > 0:
-            
-                # print(f"\n--------- Similar Memories ---------\n")
-                
-                # print(f"Id: {similar_memories[0]['id']}")
-                # print(f"{memory_string}")
-                
-                # print(f"\n----------------------------------------\n")
-                
-                relational_context = get_connected_memories(user_id, similar_memories[0]['id'])
-                
-                await websocket.send_json({"type": "orchestration", "status": "recalling context"})
-                
-                # print(f"\n--------- Relational Context ---------\n")
-                          
-                relational_context_string = pretty_print_memories(relational_context)
-                # print(relational_context_string)
-
-                    
-                # print(f"\n----------------------------------------\n")
-                
-            else:
-                # print("No similar memories found")
-                pass
-           
-    # Behavior classification
-    tpb = await tpb_service.classify_behavior(history_string)
-    if tpb.confidence_score < 0.85:
-        tpb = "Unconfident in the behavior analysis of the user"
+        context = await ContextPipeline(context_stages + classifier_stages).run()
+    
+    # The rolling summary gets a section of its own: the history section is trimmed from the
+    # start, which is where the summary sits
+    history = context["history"] or []
+    summary_string = "\n".join(msg.content for msg in history if msg.role == SUMMARY_ROLE)
+    recent_history = [msg for msg in history if msg.role != SUMMARY_ROLE]
+    history_string = "\n".join(f"{msg.role}: {msg.content}" for msg in recent_history) if recent_history else f"user: {user_input}"
+    
+    def classifier_prompt(results):
+        """
+        The part of the instructions that depends on the classifiers: a recalled memory,
+        when the intent called for one (and, when speculating, the match is strong enough
+        to be worth restarting the response for).
+        """
+        memory_string, relational_context_string, similarity = results["memories"]
+        if not memory_string:
+            return ""
+        if SPECULATIVE_RESPONSE and similarity is not None and similarity < SPECULATIVE_MEMORY_SIMILARITY:
+            return ""
+        return f"""    {memory_string}
+    {relational_context_string}"""
 
 
-    
     # Get the last image analysis
-    last_image_analysis = get_context_key(user_id, "last_image_analysis")
-    if last_image_analysis:
-        last_image_analysis = f"""
-Last Image Analysis:
-    {last_image_analysis}
-        """
-    else:
-        last_image_analysis = ""
+    last_image_analysis = turn_context.get("last_image_analysis") or ""
      
-    # Setup the memory tools
-    memory_agents.agent.tools = memory_agents.create_memory_tools(user_id)
-    noelle_agent.tools.append(memory_agents.agent.as_tool(
-        tool_name="memory_search",
-        tool_description="Search your memories of the user for relevant information and context to make the conversation more meaningful."
-    ))
-    
     # Get the feedback type
-    feedback_type = get_context_key(user_id, "feedback")
+    feedback_type = turn_context.get("feedback")
     if feedback_type is not None:
-        if feedback_type:
-            feedback_prompt = """
-Feedback:
-    The user liked your last message
-            """
-        else:
-            feedback_prompt = """
-Feedback:
-    The user disliked your last message
-            """
+        feedback_prompt = "    The user liked your last message" if feedback_type else "    The user disliked your last message"
     else:
         feedback_prompt = ""
-    delete_context_key(user_id, "feedback")
+    if feedback_type is not None:
+        await delete_context_key_async(user_id, "feedback")
 
     # Local Lingo
-    local_lingo = get_context_key(user_id, "local_lingo")
+    local_lingo = turn_context.get("local_lingo")
     if local_lingo:
-        local_lingo_instructions = """
-Use the location to adapt you responses to the local area with a slight local accent of that location.
-        """
+        local_lingo_instructions = "Use the location to adapt you responses to the local area with a slight local accent of that location."
     else:
         local_lingo_instructions = ""
         
         
     # Multistep
-    multistep = get_context_key(user_id, "multistep")
     if multistep:
-        await multistep_agent.service.judge(user_input)
-        multistep_instructions = f"""
-You are in the middle of a multistep process.
-    The goal of this multistep process is: {multistep.goal}
+        multistep_instructions = f"""    The goal of this multistep process is: {multistep.goal}
     {multistep.content}
         
-    Get the user to fullfill this reasoning to move to the next step: {multistep.reason}
-        """
+    Get the user to fullfill this reasoning to move to the next step: {multistep.reason}"""
     else:
         multistep_instructions = ""
         
         
-    personality = get_context_key(user_id, "personality")
+    personality = turn_context.get("personality")
     if personality:
-        user_requested_personality = f"""
-The User has requested you to have response with the following personality traits:
-{get_personality_prompt(personality.empathy, personality.directness, personality.warmth, personality.challenge)}
-        """
+        user_requested_personality = get_personality_prompt(personality.empathy, personality.directness, personality.warmth, personality.challenge)
     else:
         user_requested_personality = ""
         
-    noelle_agent.instructions = f"""
-The user's id is, use this for database operations: {user_id}
-
-{personalized_instructions}
-
-The user's imformation:
-    {await build_contextual_prompt(user_id)}  
-    
-    {local_lingo_instructions}
-    
-{tool_instructions} 
-
-{slang_result_pretty_print}
- 
-Conversation History:
-    {history_string}
-    
-{feedback_prompt}
-    
-{last_image_analysis}
-
-{multistep_instructions}
-
-{user_requested_personality}
-    
-The user's input:
-    {user_input}
-    """ 
-
-    print(f"Noelle instructions: {noelle_agent.instructions}")
-
-    # Streaming: run the agent in streaming mode
-    response : RunResultStreaming = Runner.run_streamed(noelle_agent, input=user_input)
-    return response
\ No newline at end of file
+    def instructions_for(memory_prompt: str) -> str:
+        # Laid out for the provider's prompt cache: text shared by every user, then the user's
+        # profile and settings, then this turn. History leads the turn sections because it only
+        # grows at the end, so the previous turn's prompt is usually a prefix of this one.
+        # The user's input is the run's input (and the last history line), so it is not repeated here.
+        # Higher priority sections are the last to be trimmed when the prompt is over the ceiling.
+        prompt = PromptAssembler().assemble([
+            Section("personality", personalized_instructions, tier=STATIC),
+            Section("tools", tool_instructions, tier=STATIC),
+            Section("user", context["user_prompt"], title="The user's imformation:", tier=USER, budget=400),
+            Section("requested_personality", user_requested_personality, title="The User has requested you to have response with the following personality traits:", tier=USER, budget=300),
+            Section("local_lingo", local_lingo_instructions, tier=USER, budget=50),
+            Section("summary", summary_string, title="Summary of the earlier conversation:", priority=75, budget=500),
+            Section("history", history_string, title="Conversation History:", priority=70, budget=PROMPT_HISTORY_TOKEN_BUDGET, keep="tail"),
+            Section("situation", context["turn_prompt"], title="The user's situation:", priority=90, budget=200),
+            Section("multistep", multistep_instructions, title="You are in the middle of a multistep process.", priority=80, budget=400),
+            Section("memory", memory_prompt, title="Something you remember about the user that relates to this message:", priority=60, budget=600),
+            Section("feedback", feedback_prompt, title="Feedback:", priority=40, budget=50),
+            Section("image", last_image_analysis, title="Last Image Analysis:", priority=20, budget=500),
+            Section("slang", context["slang"], title="Fun Slang you can use:", priority=10, budget=300),
+        ])
+        return prompt.text
+
+    def start_response(memory_prompt: Optional[str]) -> RunResultStreaming:
+        # Each run gets its own copy of the session's agent, so a restarted run keeps its own instructions
+        agent = session.agent.clone(instructions=instructions_for(memory_prompt or ""))
+        print(f"Noelle instructions: {agent.instructions}")
+
+        # Streaming: run the agent in streaming mode
+        return Runner.run_streamed(agent, input=user_input)
+
+    if SPECULATIVE_RESPONSE:
+        async def classify():
+            results = await ContextPipeline(classifier_stages, results=context).run()
+            return classifier_prompt(results)
+
+        return SpeculativeStream(start_response, classify())
+
+    return start_response(classifier_prompt(context))
\ No newline at end of file
@@ -0,0 +1,200 @@
+# app/websockets/prompt_assembler.py
+import logging
+import os
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.utils.token_count import count_tokens
+
+
+# Upper bound on the tokens of the assembled Noelle instructions
+PROMPT_TOKEN_CEILING = int(os.getenv("PROMPT_TOKEN_CEILING", "6000"))
+# Tokens of conversation history kept in the instructions (oldest messages are dropped first)
+PROMPT_HISTORY_TOKEN_BUDGET = int(os.getenv("PROMPT_HISTORY_TOKEN_BUDGET", "2500"))
+
+# Characters per token when a section has to be cut inside a line
+CHARS_PER_TOKEN = 4
+
+# Section tiers, in prompt order: the same for every user, the same for every turn of one
+# user, and different on every turn
+STATIC = "static"
+USER = "user"
+TURN = "turn"
+TIERS = (STATIC, USER, TURN)
+
+
+@dataclass
+class Section:
+    """
+    One block of the instructions.
+
+    Sections are laid out by tier (STATIC, then USER, then TURN) and in the given order
+    within a tier, so the prompt starts with the longest prefix that repeats across
+    requests and the provider's prompt cache can serve it. STATIC sections are never
+    trimmed. USER and TURN sections are cut to `budget` tokens (keeping the end of the text
+    when `keep` is "tail", as for the conversation history), which gives the same result
+    for the same text. If the prompt is still over the ceiling, TURN sections are trimmed
+    or dropped starting from the lowest `priority`; USER sections are left alone so they
+    stay cacheable. `title` is kept above the text as long as any of the text is.
+    """
+    name: str
+    text: str
+    title: str = ""
+    priority: int = 0
+    budget: Optional[int] = None
+    tier: str = TURN
+    keep: str = "head"
+
+
+@dataclass
+class AssembledPrompt:
+    text: str
+    tokens: Dict[str, int]
+    trimmed: List[str]
+    tiers: Dict[str, str]
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+    @property
+    def tier_tokens(self) -> Dict[str, int]:
+        return {tier: sum(tokens for name, tokens in self.tokens.items() if self.tiers[name] == tier) for tier in TIERS}
+
+
+def trim_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """
+    Cuts `text` to at most `max_tokens`, on line boundaries where possible. keep="tail"
+    keeps the last lines instead of the first.
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    lines = text.split("\n")
+    if keep == "tail":
+        lines.reverse()
+    kept: List[str] = []
+    used = 0
+    for line in lines:
+        tokens = count_tokens(line) + 1
+        if used + tokens > max_tokens:
+            if not kept:
+                # a single line over the budget: cut it by characters
+                limit = max_tokens * CHARS_PER_TOKEN
+                kept.append(line[-limit:] if keep == "tail" else line[:limit])
+            break
+        kept.append(line)
+        used += tokens
+    if keep == "tail":
+        kept.reverse()
+    return "\n".join(kept)
+
+
+class PromptStats:
+    """
+    Per-section token counts across assembled prompts, exposed on /metrics.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._sections: Dict[str, Dict[str, int]] = {}
+        self._tiers: Dict[str, int] = dict.fromkeys(TIERS, 0)
+        self.prompts = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.over_ceiling = 0
+
+    def record(self, prompt: AssembledPrompt, over_ceiling: bool) -> None:
+        with self._lock:
+            self.prompts += 1
+            self.total_tokens += prompt.total_tokens
+            self.max_tokens = max(self.max_tokens, prompt.total_tokens)
+            self.over_ceiling += int(over_ceiling)
+            for tier, tokens in prompt.tier_tokens.items():
+                self._tiers[tier] += tokens
+            for name, tokens in prompt.tokens.items():
+                section = self._sections.setdefault(name, {"prompts": 0, "tokens": 0, "trimmed": 0})
+                section["prompts"] += 1
+                section["tokens"] += tokens
+            for name in prompt.trimmed:
+                self._sections[name]["trimmed"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "prompts": self.prompts,
+                "avg_tokens": round(self.total_tokens / self.prompts, 1) if self.prompts else 0.0,
+                "max_tokens": self.max_tokens,
+                "over_ceiling": self.over_ceiling,
+                "tiers": {tier: round(tokens / self.prompts, 1) if self.prompts else 0.0 for tier, tokens in self._tiers.items()},
+                "sections": {
+                    name: {
+                        "avg_tokens": round(section["tokens"] / section["prompts"], 1),
+                        "trimmed": section["trimmed"],
+                    }
+                    for name, section in self._sections.items()
+                },
+            }
+
+
+prompt_stats = PromptStats()
+
+
+class PromptAssembler:
+    """
+    Builds the instructions from sections within a token ceiling.
+    """
+    def __init__(self, ceiling: int = PROMPT_TOKEN_CEILING, stats: PromptStats = prompt_stats):
+        self.ceiling = ceiling
+        self.stats = stats
+
+    def assemble(self, sections: Sequence[Section]) -> AssembledPrompt:
+        ordered = sorted(sections, key=lambda section: TIERS.index(section.tier))
+        sections_by_name = {section.name: section for section in ordered}
+        texts = {section.name: section.text.strip("\n") for section in ordered}
+        trimmed: List[str] = []
+
+        def render(name: str) -> str:
+            text, title = texts[name], sections_by_name[name].title
+            return f"{title}\n{text}" if text and title else text
+
+        for section in ordered:
+            if section.tier == STATIC or section.budget is None:
+                continue
+            text = trim_to_tokens(texts[section.name], section.budget, section.keep)
+            if text != texts[section.name]:
+                texts[section.name] = text
+                trimmed.append(section.name)
+
+        tokens = {name: count_tokens(render(name)) for name in texts}
+        over = sum(tokens.values()) - self.ceiling
+        over_ceiling = over > 0
+        # lowest priority first; among equals the later section goes first
+        for section in sorted((s for s in ordered if s.tier == TURN), key=lambda s: (s.priority, -ordered.index(s))):
+            if over <= 0:
+                break
+            name = section.name
+            if not tokens[name]:
+                continue
+            texts[name] = trim_to_tokens(texts[name], tokens[name] - over - count_tokens(section.title), section.keep)
+            over -= tokens[name] - count_tokens(render(name))
+            tokens[name] = count_tokens(render(name))
+            if name not in trimmed:
+                trimmed.append(name)
+
+        prompt = AssembledPrompt(
+            text="\n\n".join(render(section.name) for section in ordered if texts[section.name]),
+            tokens=tokens,
+            trimmed=trimmed,
+            tiers={section.name: section.tier for section in ordered},
+        )
+        self.stats.record(prompt, over_ceiling)
+        logging.info(
+            f"Prompt assembled: {prompt.total_tokens} tokens "
+            + "(" + ", ".join(f"{tier}={count}" for tier, count in prompt.tier_tokens.items()) + "): "
+            + ", ".join(f"{name}={count}" for name, count in tokens.items())
+            + (f" (trimmed: {', '.join(trimmed)})" if trimmed else "")
+        )
+        return prompt
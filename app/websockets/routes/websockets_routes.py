@@ -1,13 +1,16 @@
 import os
+from functools import partial
 from app.auth import verify_token_websocket
 from openai import AsyncOpenAI
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
 
-from app.supabase.profiles import ProfileRepository
+from app.supabase.credit_ledger import credit_ledger
 from app.utils.moderation import ModerationService
+from app.websockets.context.store import expire_context_async
+from app.websockets.dispatcher import SESSION_INTERRUPT_TURNS, SessionDispatcher
 from app.websockets.handlers.text_handlers import handle_audio, handle_feedback, handle_gps, handle_image, handle_improv, handle_local_lingo, handle_orchestration, handle_personality, handle_text, handle_time
 from app.websockets.orchestrate_contextual import build_user_profile
-from app.websockets.schemas.messages import ImprovMessage, Message, AudioMessage, FeedbackMessage, GPSMessage, ImageMessage, LocalLingoMessage, PersonalityMessage, TextMessage, TimeMessage, OrchestrateMessage
+from app.websockets.schemas.messages import CancelMessage, ImprovMessage, Message, AudioMessage, FeedbackMessage, GPSMessage, ImageMessage, LocalLingoMessage, PersonalityMessage, TextMessage, TimeMessage, OrchestrateMessage
 from pydantic import TypeAdapter, ValidationError
 
 router = APIRouter()
@@ -25,10 +28,11 @@ async def websocket_main(websocket: WebSocket, user_id: str = Depends(verify_tok
     print("WebSocket connected")
 
     # Check credits send error back if 0
-    profile_service = ProfileRepository()
     moderation_service = ModerationService()
 
-    credits = profile_service.get_user_credit(user_id)
+    # Load the profile once for the session; the getters used by later turns are served from it,
+    # and the balance includes this process's charges that have not been flushed yet
+    credits = await credit_ledger.load(user_id)
     if credits is None or credits < 1:
         await websocket.send_json({"type": "error", "text": "NO_CREDITS"})
         return
@@ -39,6 +43,9 @@ async def websocket_main(websocket: WebSocket, user_id: str = Depends(verify_tok
     await build_user_profile(user_id, websocket)
 
 
+    # State messages are applied as they arrive; turns run in order behind the one in progress
+    dispatcher = SessionDispatcher(websocket, user_id)
+
     try:
         while True:
             raw = await websocket.receive_json()
@@ -56,37 +63,44 @@ async def websocket_main(websocket: WebSocket, user_id: str = Depends(verify_tok
             
             match message:          
                 case TextMessage():
-                    await handle_text(websocket, message, user_id)
+                    await dispatcher.apply("text", partial(handle_text, websocket, message, user_id))
                 
                 case AudioMessage():
-                    await handle_audio(websocket, message, user_id)
+                    # the transcript has to be in the context before the turn that follows it
+                    await dispatcher.submit("audio", partial(handle_audio, websocket, message, user_id), interruptible=False)
 
                 case ImageMessage():
-                    await handle_image(websocket, message, user_id)
+                    await dispatcher.submit("image", partial(handle_image, websocket, message, user_id), interruptible=False)
 
                 case GPSMessage():
-                    await handle_gps(websocket, message, user_id)
+                    await dispatcher.apply("gps", partial(handle_gps, websocket, message, user_id))
                     
                 case TimeMessage():
-                    await handle_time(websocket, message, user_id)
+                    await dispatcher.apply("time", partial(handle_time, websocket, message, user_id))
 
                 case PersonalityMessage():
-                    await handle_personality(websocket, message, user_id)
+                    await dispatcher.apply("personality", partial(handle_personality, websocket, message, user_id))
                 
                 case LocalLingoMessage():
-                    await handle_local_lingo(websocket, message, user_id)
+                    await dispatcher.apply("local_lingo", partial(handle_local_lingo, websocket, message, user_id))
                     
                 case FeedbackMessage():
-                    await handle_feedback(websocket, message, user_id)
+                    await dispatcher.apply("feedback", partial(handle_feedback, websocket, message, user_id))
                 
                 case OrchestrateMessage():
-                    await handle_orchestration(websocket, message, user_id)
+                    interrupt = message.interrupt if message.interrupt is not None else SESSION_INTERRUPT_TURNS
+                    await dispatcher.submit("orchestrate", partial(handle_orchestration, websocket, message, user_id), interrupt=interrupt)
 
                 case ImprovMessage():
-                    await handle_improv(websocket, user_id, message)
+                    await dispatcher.submit("improv", partial(handle_improv, websocket, user_id, message))
+
+                case CancelMessage():
+                    await dispatcher.cancel()
                     
                 
     except WebSocketDisconnect:
         print(f"WebSocket disconnected for user {user_id}")
-
-
+    finally:
+        await dispatcher.close()
+        # keep the context briefly for a reconnect, then let the store drop it
+        await expire_context_async(user_id)
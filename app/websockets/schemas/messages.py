@@ -74,6 +74,12 @@ class OrchestrateMessage(BaseModel):
     user_input: str
     extract: Optional[bool] = True
     summarize: Optional[int] = 10
+    interrupt: Optional[bool] = None  # cancel the response in progress (default: SESSION_INTERRUPT_TURNS)
+    stream: Optional[bool] = None  # send the response as "ai_delta" frames as it is generated (default: STREAM_DELTAS)
+
+# CANCEL (the response in progress and any waiting)
+class CancelMessage(BaseModel):
+    type: Literal["cancel"]
 
 # IMPROV
 class ImprovMessage(BaseModel):
@@ -82,4 +88,4 @@ class ImprovMessage(BaseModel):
     user_input: Optional[str] = None
 
 # UNIFIED MESSAGE TYPE
-Message = Union[TextMessage, AudioMessage, ImageMessage, GPSMessage, TimeMessage, UIActionMessage, PersonalityMessage, LocalLingoMessage, FeedbackMessage, OrchestrateMessage, ImprovMessage]
+Message = Union[TextMessage, AudioMessage, ImageMessage, GPSMessage, TimeMessage, UIActionMessage, PersonalityMessage, LocalLingoMessage, FeedbackMessage, OrchestrateMessage, ImprovMessage, CancelMessage]
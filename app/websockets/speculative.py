@@ -0,0 +1,210 @@
+# app/websockets/speculative.py
+import asyncio
+import logging
+import os
+import time
+from threading import Lock
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from agents import RunResultStreaming
+
+
+# Start the response before the intent/TPB classifiers finish (restarted if they change the prompt)
+SPECULATIVE_RESPONSE = os.getenv("SPECULATIVE_RESPONSE", "false").lower() == "true"
+
+
+class SpeculationStats:
+    """
+    How often speculative responses were kept or restarted, and the time they saved or wasted.
+    Exposed on /metrics to tune the speculation rules.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.started = 0
+        self.committed = 0
+        self.committed_on_tool_call = 0
+        self.restarted = 0
+        self.saved_ms = 0.0
+        self.wasted_ms = 0.0
+
+    def record_start(self) -> None:
+        with self._lock:
+            self.started += 1
+
+    def record_commit(self, saved_ms: float, tool_call: bool = False) -> None:
+        with self._lock:
+            self.committed += 1
+            self.committed_on_tool_call += int(tool_call)
+            self.saved_ms += saved_ms
+
+    def record_restart(self, wasted_ms: float) -> None:
+        with self._lock:
+            self.restarted += 1
+            self.wasted_ms += wasted_ms
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decided = self.committed + self.restarted
+            return {
+                "started": self.started,
+                "committed": self.committed,
+                "committed_on_tool_call": self.committed_on_tool_call,
+                "restarted": self.restarted,
+                "restart_rate": round(self.restarted / decided, 4) if decided else 0.0,
+                "avg_saved_ms": round(self.saved_ms / self.committed, 2) if self.committed else 0.0,
+                "avg_wasted_ms": round(self.wasted_ms / self.restarted, 2) if self.restarted else 0.0,
+            }
+
+
+speculation_stats = SpeculationStats()
+
+_DONE = object()
+
+
+async def _next_event(events: AsyncIterator[Any]) -> Any:
+    try:
+        return await events.__anext__()
+    except StopAsyncIteration:
+        return _DONE
+
+
+def _is_tool_call(event: Any) -> bool:
+    """
+    Whether a stream event is the model calling a tool. The call is streamed while the model
+    response is still coming in; the run only executes its tools once the response is complete.
+    """
+    event_type = getattr(event, "type", None)
+    if event_type == "raw_response_event":
+        data = event.data
+        item_type = getattr(getattr(data, "item", None), "type", None) or ""
+        return getattr(data, "type", None) == "response.output_item.added" and item_type.endswith("_call")
+    if event_type == "run_item_stream_event":
+        return getattr(event, "name", None) == "tool_called"
+    return False
+
+
+def _cancel_run(run: RunResultStreaming) -> None:
+    """
+    Stops a streamed run's model call, tools and guardrails.
+    """
+    cancel = getattr(run, "cancel", None)
+    if callable(cancel):
+        cancel()
+        return
+    # openai-agents 0.0.7 (pinned in requirements.txt) has no public cancel; _cleanup_tasks
+    # is what stream_events itself calls to stop the run's tasks. Re-check on upgrade.
+    cleanup = getattr(run, "_cleanup_tasks", None)
+    if callable(cleanup):
+        cleanup()
+    else:
+        logging.error(f"Cannot cancel a streamed run of type {type(run).__name__}; it will finish in the background")
+
+
+def cancel_response(result: Union[RunResultStreaming, "SpeculativeStream"]) -> None:
+    """
+    Stops a streamed response (and a speculative one's classifiers) that will not be read further.
+    """
+    if isinstance(result, SpeculativeStream):
+        result.pending.cancel()
+        result = result.run
+    _cancel_run(result)
+
+
+class SpeculativeStream:
+    """
+    Stands in for the RunResultStreaming returned by orchestration_websocket.
+
+    The response starts streaming from `start(None)` straight away while `pending` (the
+    classifiers) runs. Events are held back until `pending` resolves to the prompt
+    augmentation it implies: with none, the held events are released and the speculative
+    run continues; otherwise it is cancelled and `start(augmentation)` is streamed instead,
+    so the user never sees output from a discarded run.
+
+    A run that calls a tool is never discarded: its tools (profile writes, notifications,
+    clearing history) would run again in the restarted run. When a tool call shows up
+    before the classifiers finish, the speculative run is kept and `pending` is cancelled.
+    A discarded run and the events it streamed are kept in `discarded`, so its token usage
+    can be billed with the turn.
+    """
+    def __init__(
+        self,
+        start: Callable[[Optional[str]], RunResultStreaming],
+        pending: Awaitable[Optional[str]],
+        stats: SpeculationStats = speculation_stats,
+    ):
+        self.start = start
+        self.pending = asyncio.ensure_future(pending)
+        self.stats = stats
+        self.started_at = time.perf_counter()
+        self.run = start(None)
+        self.restarted = False
+        self.discarded: List[Tuple[RunResultStreaming, List[Any]]] = []
+        self.stats.record_start()
+
+    @property
+    def final_output(self) -> Any:
+        return self.run.final_output
+
+    async def _augmentation(self) -> Optional[str]:
+        try:
+            return await self.pending
+        except Exception as e:
+            logging.error(f"Error in speculative classifiers, keeping the speculative response: {e}")
+            return None
+
+    async def stream_events(self) -> AsyncIterator[Any]:
+        events = self.run.stream_events().__aiter__()
+        held: List[Any] = []
+        first_event_ms: Optional[float] = None
+        tool_call = False
+        next_event: Optional[asyncio.Future] = asyncio.ensure_future(_next_event(events))
+
+        # Buffer the speculative run's events until the classifiers have decided
+        while not self.pending.done():
+            done, _ = await asyncio.wait({next_event, self.pending}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event in done:
+                event = next_event.result()
+                if event is _DONE:
+                    next_event = None
+                    break
+                if first_event_ms is None:
+                    first_event_ms = (time.perf_counter() - self.started_at) * 1000
+                held.append(event)
+                next_event = asyncio.ensure_future(_next_event(events))
+                if _is_tool_call(event):
+                    # committed: a restart would run this run's tools a second time
+                    tool_call = True
+                    self.pending.cancel()
+                    break
+
+        augmentation = None if tool_call else await self._augmentation()
+        decided_ms = (time.perf_counter() - self.started_at) * 1000
+
+        if augmentation:
+            if next_event is not None:
+                next_event.cancel()
+            _cancel_run(self.run)
+            self.discarded.append((self.run, held))
+            self.stats.record_restart(decided_ms)
+            logging.info(f"Speculative response restarted after {decided_ms:.0f}ms ({len(held)} events discarded)")
+
+            self.restarted = True
+            self.run = self.start(augmentation)
+            async for event in self.run.stream_events():
+                yield event
+            return
+
+        if tool_call:
+            logging.info(f"Speculative response kept after {decided_ms:.0f}ms: it called a tool before the classifiers finished")
+        # Without speculation the model would only have started now
+        self.stats.record_commit(min(decided_ms, first_event_ms if first_event_ms is not None else decided_ms), tool_call)
+        for event in held:
+            yield event
+        if next_event is None:
+            return
+        event = await next_event
+        if event is _DONE:
+            return
+        yield event
+        async for event in events:
+            yield event
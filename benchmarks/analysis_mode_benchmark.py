@@ -0,0 +1,109 @@
+"""
+Post-turn analysis: four separate model calls vs. one combined call.
+
+Usage:
+    OPENAI_API_KEY=... python benchmarks/analysis_mode_benchmark.py [--runs 5] [--transcript path/to/transcript.txt]
+
+Runs the MBTI, OCEAN, memory and slang agents over the same transcript the way each
+ANALYSIS_MODE does and reports tokens and wall time per transcript:
+
+    sequential   the four agents one after another (process_history before the job queue)
+    separate     the four agents concurrently (ANALYSIS_MODE=separate on the job worker)
+    combined     the CombinedAnalysis agent, one call (ANALYSIS_MODE=combined)
+
+Only the model calls are measured; nothing is written to Supabase. Tokens are the usage
+reported by the API, summed over the calls of a run.
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from agents import Runner  # noqa: E402
+
+from app.function.memory_extraction import MemoryExtractionService  # noqa: E402
+from app.personal_agents.slang_extraction import SlangExtractionService  # noqa: E402
+from app.psychology.combined_analysis import combined_agent  # noqa: E402
+from app.psychology.mbti_analysis import mbti_agent  # noqa: E402
+from app.psychology.ocean_analysis import ocean_agent  # noqa: E402
+
+SAMPLE_TRANSCRIPT = """user: hey, long day again. the sprint review went sideways and my manager blamed the whole team
+Noelle: Oof, that sounds draining. What happened in the review?
+user: the demo crashed lol. no cap it was the one feature i told them wasnt ready
+Noelle: That's frustrating, especially when you flagged it early. How are you feeling about it now?
+user: kinda over it tbh. gonna go climb tonight, thats my reset. every tuesday and thursday
+Noelle: Climbing twice a week is a great ritual. Bouldering or ropes?
+user: bouldering. my sister got me into it after my breakup last year, it kinda saved me
+Noelle: I'm glad you found something that helped. Does your sister still climb with you?
+user: yeah when shes not slammed with med school. anyway im lowkey thinking about switching jobs
+Noelle: That's a big step. What's pulling you toward a change?"""
+
+
+def usage_of(result):
+    input_tokens = sum(response.usage.input_tokens for response in result.raw_responses)
+    output_tokens = sum(response.usage.output_tokens for response in result.raw_responses)
+    return input_tokens, output_tokens
+
+
+def separate_agents():
+    return [
+        mbti_agent,
+        ocean_agent,
+        MemoryExtractionService("benchmark").agent,
+        SlangExtractionService("benchmark").extraction_agent,
+    ]
+
+
+async def run_sequential(transcript):
+    return [await Runner.run(agent, transcript) for agent in separate_agents()]
+
+
+async def run_separate(transcript):
+    return await asyncio.gather(*(Runner.run(agent, transcript) for agent in separate_agents()))
+
+
+async def run_combined(transcript):
+    return [await Runner.run(combined_agent, transcript)]
+
+
+async def measure(mode, transcript, runs):
+    walls, inputs, outputs = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        results = await mode(transcript)
+        walls.append(time.perf_counter() - start)
+        usages = [usage_of(result) for result in results]
+        inputs.append(sum(usage[0] for usage in usages))
+        outputs.append(sum(usage[1] for usage in usages))
+    return {
+        "calls": len(results),
+        "input": statistics.mean(inputs),
+        "output": statistics.mean(outputs),
+        "wall_p50": statistics.median(walls),
+        "wall_max": max(walls),
+    }
+
+
+async def main(args):
+    transcript = Path(args.transcript).read_text() if args.transcript else SAMPLE_TRANSCRIPT
+    logging.disable(logging.INFO)
+
+    print(f"{args.runs} runs per mode, transcript of {len(transcript)} characters")
+    print(f"{'mode':>10} | {'calls':>5} | {'input tok':>9} | {'output tok':>10} | {'total tok':>9} | {'wall p50 (s)':>12} | {'wall max (s)':>12}")
+    print("-" * 86)
+    for name, mode in (("sequential", run_sequential), ("separate", run_separate), ("combined", run_combined)):
+        result = await measure(mode, transcript, args.runs)
+        print(f"{name:>10} | {result['calls']:>5} | {result['input']:>9.0f} | {result['output']:>10.0f} | "
+              f"{result['input'] + result['output']:>9.0f} | {result['wall_p50']:>12.2f} | {result['wall_max']:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--transcript", help="file with the transcript to analyze (role: content per line)")
+    asyncio.run(main(parser.parse_args()))
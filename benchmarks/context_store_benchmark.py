@@ -0,0 +1,151 @@
+"""
+Context store contention: one global lock vs. lock stripes with per-turn snapshots.
+
+Usage:
+    python benchmarks/context_store_benchmark.py [--threads 1 8 32 64] [--users 2000] [--turns 2000] [--shards 16]
+
+Each thread plays turns for random users the way a websocket turn uses the context store:
+the reads of orchestration_websocket and the handlers (mbti_type, ocean_traits, gps, time,
+image, multistep, last_image_analysis, feedback, local_lingo, personality, settings,
+last_message) and two writes (last_message, settings). Stores compared:
+
+    dict + lock    the original store: an unbounded dict and one threading.Lock taken on every call
+    one lock       the bounded store (TTL, byte cap) with one lock taken on every call
+    striped, keys  the bounded store with --shards lock stripes and lock-free reads, one
+                   get_context_key per key
+    striped, snap  the same, with one snapshot per turn (what orchestration_websocket does)
+
+Reports turns per second over all threads and the per-turn latency p50/p99 in microseconds.
+Under CPython's GIL only one thread runs Python at a time, so the tail latency is mostly
+threads waiting for the GIL; compare the rows at the same thread count.
+"""
+import argparse
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.websockets.context.backends import MemoryContextBackend  # noqa: E402
+from app.websockets.context.store import ContextStore  # noqa: E402
+
+TURN_KEYS = [
+    "mbti_type", "ocean_traits", "gps", "time", "image", "multistep",
+    "last_image_analysis", "feedback", "local_lingo", "personality", "settings", "last_message",
+]
+
+
+class DictStore:
+    """
+    The original context store: a module-level dict behind one lock.
+    """
+    def __init__(self):
+        self.store = {}
+        self.lock = threading.Lock()
+
+    def get_key(self, user_id, key):
+        with self.lock:
+            return self.store.get(user_id, {}).get(key)
+
+    def set(self, user_id, key, value):
+        with self.lock:
+            self.store.setdefault(user_id, {})[key] = value
+
+
+class OneLockStore:
+    """
+    The bounded context store with every call under one lock, as before lock striping.
+    """
+    def __init__(self):
+        self.store = ContextStore(MemoryContextBackend(idle_ttl=3600, max_bytes=1 << 30, shards=1))
+        self.lock = threading.Lock()
+
+    def get_key(self, user_id, key):
+        with self.lock:
+            return self.store.get_key(user_id, key)
+
+    def set(self, user_id, key, value):
+        with self.lock:
+            self.store.set(user_id, key, value)
+
+
+def turn_by_key(store, user_id, turn):
+    context = {key: store.get_key(user_id, key) for key in TURN_KEYS}
+    store.set(user_id, "last_message", f"message {turn}")
+    store.set(user_id, "settings", {"type": "text", "voice": "alloy"})
+    return context
+
+
+def turn_by_snapshot(store, user_id, turn):
+    context = store.snapshot(user_id)
+    store.set(user_id, "last_message", f"message {turn}")
+    store.set(user_id, "settings", {"type": "text", "voice": "alloy"})
+    return context
+
+
+def fill(store, users):
+    for i in range(users):
+        user_id = f"user-{i}"
+        store.set(user_id, "mbti_type", "INFJ")
+        store.set(user_id, "ocean_traits", "openness: 0.8, conscientiousness: 0.6")
+        store.set(user_id, "gps", {"latitude": 21.3, "longitude": -157.8})
+        store.set(user_id, "time", {"timestamp": "2025-01-01T12:00:00", "timezone": "Pacific/Honolulu"})
+        store.set(user_id, "personality", {"empathy": 50, "directness": 50, "warmth": 50, "challenge": 50})
+
+
+def run(store, turn, threads, users, turns):
+    def worker(seed):
+        rng = random.Random(seed)
+        latencies = []
+        for i in range(turns):
+            user_id = f"user-{rng.randrange(users)}"
+            start = time.perf_counter()
+            turn(store, user_id, i)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(worker, range(threads)))
+    wall = time.perf_counter() - start
+    latencies = sorted(latency for result in results for latency in result)
+    return {
+        "turns_per_s": len(latencies) / wall,
+        "p50_us": statistics.median(latencies) * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+    }
+
+
+def main(args):
+    def striped():
+        return ContextStore(MemoryContextBackend(idle_ttl=3600, max_bytes=1 << 30, shards=args.shards))
+
+    modes = (
+        ("dict + lock", DictStore, turn_by_key),
+        ("one lock", OneLockStore, turn_by_key),
+        ("striped, keys", striped, turn_by_key),
+        ("striped, snap", striped, turn_by_snapshot),
+    )
+
+    print(f"{args.users} users, {args.turns} turns per thread, {args.shards} stripes")
+    print(f"{'store':>14} | {'threads':>7} | {'turns/s':>10} | {'p50 (us)':>9} | {'p99 (us)':>9}")
+    print("-" * 62)
+    for threads in args.threads:
+        for name, make_store, turn in modes:
+            store = make_store()
+            fill(store, args.users)
+            result = run(store, turn, threads, args.users, args.turns)
+            print(f"{name:>14} | {threads:>7} | {result['turns_per_s']:>10.0f} | {result['p50_us']:>9.1f} | {result['p99_us']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--shards", type=int, default=16)
+    main(parser.parse_args())
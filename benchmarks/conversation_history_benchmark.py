@@ -0,0 +1,139 @@
+"""
+Conversation history writes: read-modify-write of the whole JSONB array vs. atomic append.
+
+Usage:
+    python benchmarks/conversation_history_benchmark.py [--lengths 10 100 1000] [--turns 200] [--writers 8]
+
+"rmw" reproduces the previous append_message_to_history: download the history array, parse
+every message, append one, serialize the whole array and upload it. "append" is the new
+path: serialize one message for the append_conversation_message RPC and read the recent
+window from the in-process tail. Both run against an in-memory stand-in for the
+conversation_history row, so the numbers are the client-side cost per turn (two appends)
+and the bytes that cross the network; round-trip latency is the same one call per append
+for both and is not simulated.
+
+The second table runs --writers threads appending to the same history at once and counts
+messages lost to overlapping read-modify-write cycles.
+"""
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+TAIL_SIZE = 50
+
+
+def message(i):
+    return {
+        "role": "user" if i % 2 == 0 else "Noelle",
+        "content": f"message {i} " + "lorem ipsum dolor sit amet " * 8,
+        "created_at": datetime.now().isoformat(),
+        "user_id": "00000000-0000-0000-0000-000000000000",
+    }
+
+
+class Row:
+    """The conversation_history row as PostgREST would hand it over: a JSON document."""
+    def __init__(self, length, server_side=True):
+        self.server_side = server_side
+        self.document = json.dumps([message(i) for i in range(length)])
+        self.lock = threading.Lock()
+        self.bytes = 0
+
+    def select(self):
+        with self.lock:
+            self.bytes += len(self.document)
+            return self.document
+
+    def update(self, document):
+        with self.lock:
+            self.bytes += len(document)
+            self.document = document
+
+    def append(self, payload):
+        # server-side `history || jsonb_build_array(message)`, atomic under the row lock
+        with self.lock:
+            self.bytes += len(payload)
+            if not self.server_side:
+                return None
+            history = json.loads(self.document)
+            history.append(json.loads(payload))
+            self.document = json.dumps(history)
+            return len(history)
+
+
+def rmw_append(row, i):
+    history = [dict(msg, created_at=datetime.fromisoformat(msg["created_at"])) for msg in json.loads(row.select())]
+    history.append(dict(message(i), created_at=datetime.now()))
+    row.update(json.dumps([dict(msg, created_at=msg["created_at"].isoformat()) for msg in history]))
+    return history
+
+
+def atomic_append(row, tail, i):
+    new_message = message(i)
+    row.append(json.dumps(new_message))
+    tail.append(new_message)
+    return list(tail)
+
+
+def client_seconds(fn, turns):
+    start = time.perf_counter()
+    for i in range(turns):
+        fn(i)
+        fn(i)
+    return time.perf_counter() - start
+
+
+def lost_messages(length, writers, per_writer, use_rmw):
+    row = Row(length)
+    tail = deque(maxlen=TAIL_SIZE)
+
+    def write(offset):
+        for i in range(per_writer):
+            if use_rmw:
+                rmw_append(row, offset + i)
+            else:
+                atomic_append(row, tail, offset + i)
+
+    threads = [threading.Thread(target=write, args=(w * per_writer,)) for w in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return length + writers * per_writer - len(json.loads(row.document))
+
+
+def main(args):
+    print(f"{args.turns} turns (2 appends each), client-side cost and bytes on the wire per turn")
+    print(f"{'history':>8} | {'rmw (ms)':>9} | {'append (ms)':>11} | {'speedup':>7} | {'rmw KB':>8} | {'append KB':>9}")
+    print("-" * 70)
+    for length in args.lengths:
+        row = Row(length)
+        rmw = client_seconds(lambda i: rmw_append(row, i), args.turns)
+        rmw_kb = row.bytes / args.turns / 1024
+
+        # the append itself runs in Postgres, so it is left out of the client-side time
+        row = Row(length, server_side=False)
+        tail = deque(json.loads(row.document)[-TAIL_SIZE:], maxlen=TAIL_SIZE)
+        append = client_seconds(lambda i: atomic_append(row, tail, i), args.turns)
+        append_kb = row.bytes / args.turns / 1024
+
+        print(f"{length:>8} | {rmw / args.turns * 1000:>9.3f} | {append / args.turns * 1000:>11.3f} | "
+              f"{rmw / append:>6.0f}x | {rmw_kb:>8.1f} | {append_kb:>9.2f}")
+
+    print()
+    print(f"{args.writers} concurrent writers x 50 appends")
+    print(f"{'history':>8} | {'rmw lost':>8} | {'append lost':>11}")
+    print("-" * 34)
+    for length in args.lengths:
+        print(f"{length:>8} | {lost_messages(length, args.writers, 50, True):>8} | {lost_messages(length, args.writers, 50, False):>11}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--writers", type=int, default=8)
+    main(parser.parse_args())
@@ -0,0 +1,95 @@
+"""
+Embedding throughput under concurrent load: one request per text vs. the micro-batcher.
+
+Usage:
+    python benchmarks/embedding_batcher_benchmark.py [--sessions 200] [--texts-per-session 3]
+
+Runs entirely offline against FakeEmbeddingBackend, which models an API with a fixed cost per
+request, a small cost per input and a capped number of concurrent connections. Each simulated
+websocket session embeds a few texts, some of which repeat across sessions (greetings).
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.openai.embeddings import EmbeddingBatcher, FakeEmbeddingBackend
+
+COMMON_TEXTS = ["hey", "hi", "good morning", "how are you?", "thanks"]
+
+
+def session_texts(session: int, count: int, rng: random.Random):
+    return [
+        rng.choice(COMMON_TEXTS) if rng.random() < 0.3 else f"session {session} message {i}"
+        for i in range(count)
+    ]
+
+
+async def run_sessions(embed, workload):
+    latencies = []
+
+    async def session(texts):
+        for text in texts:
+            start = time.perf_counter()
+            await embed(text)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(texts) for texts in workload))
+    return time.perf_counter() - start, latencies
+
+
+def report(name, backend, wall, latencies):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{name:>10} | {backend.requests:>8} | {wall:>8.2f} | {len(latencies) / wall:>10.0f} | "
+        f"{statistics.median(latencies):>8.1f} | {p99:>8.1f}"
+    )
+
+
+async def main(args):
+    rng = random.Random(7)
+    workload = [session_texts(s, args.texts_per_session, rng) for s in range(args.sessions)]
+
+    def make_backend():
+        return FakeEmbeddingBackend(
+            dim=args.dim,
+            latency=args.latency_ms / 1000,
+            per_item_latency=args.per_item_ms / 1000,
+            max_concurrency=args.connections,
+        )
+
+    print(f"{'mode':>10} | {'requests':>8} | {'wall (s)':>8} | {'texts/s':>10} | {'p50 (ms)':>8} | {'p99 (ms)':>8}")
+    print("-" * 70)
+
+    unbatched = make_backend()
+
+    async def embed_one(text):
+        return (await unbatched.embed([text]))[0]
+
+    wall, latencies = await run_sessions(embed_one, workload)
+    report("unbatched", unbatched, wall, latencies)
+
+    batched = make_backend()
+    batcher = EmbeddingBatcher(batched, max_batch_size=args.batch_size, max_wait_ms=args.wait_ms)
+    wall, latencies = await run_sessions(batcher.embed, workload)
+    report("batched", batched, wall, latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--texts-per-session", type=int, default=3)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--per-item-ms", type=float, default=0.2)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--wait-ms", type=float, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,177 @@
+"""
+Event-loop lag under concurrent websocket sessions: sync vs. async Supabase repositories.
+
+Usage:
+    python benchmarks/event_loop_lag_benchmark.py [--sessions 1 10 50] [--turns 5] [--latency-ms 20] [--think-ms 50]
+
+Each simulated session does what a websocket connection does against Supabase: load the
+profile and check credits on connect, then per turn append the user message, read the
+user's name, append the reply, deduct credits and check the history length, with a short
+pause standing in for the streamed model response. "sync" makes those calls with the
+blocking repositories straight from the coroutine (the websocket path before the async
+layer); "async" awaits the async repositories. Both talk to a local PostgREST stand-in
+that answers every request after --latency-ms, through the real Supabase clients.
+
+A monitor coroutine sleeps 5ms at a time and records how late it wakes up: that is how
+long any other connection (a token being streamed, a new message arriving) would have
+waited for the event loop.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.supabase import client as supabase_client  # noqa: E402
+from app.supabase import conversation_history, profiles  # noqa: E402
+from app.supabase.profiles import AsyncProfileRepository, ProfileRepository  # noqa: E402
+
+# Shaped like a JWT, which is all the Supabase client checks
+API_KEY = "header.payload.signature"
+TICK_SECONDS = 0.005
+
+
+class PostgrestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.02
+    lengths = {}
+    lock = threading.Lock()
+
+    def reply(self, payload):
+        time.sleep(self.latency)
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def do_GET(self):
+        user_id = parse_qs(urlparse(self.path).query).get("id", ["eq.unknown"])[0][3:]
+        self.reply([{"id": user_id, "email": "ada@example.com", "name": "Ada", "credits": 1000, "credits_used": 0}])
+
+    def do_PATCH(self):
+        self.reply([self.read_body()])
+
+    def do_POST(self):
+        body = self.read_body()
+        user_id = body["input_user_id"]
+        with self.lock:
+            if self.path.endswith("append_conversation_message"):
+                self.lengths[user_id] = self.lengths.get(user_id, 0) + 1
+                payload = self.lengths[user_id]
+            else:
+                payload = [{"messages": [], "total": self.lengths.get(user_id, 0)}]
+        self.reply(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def sync_session(user_id, turns, think):
+    repo = ProfileRepository()
+
+    async def run():
+        repo.get_profile_row(user_id, refresh=True)
+        repo.get_user_credit(user_id)
+        for turn in range(turns):
+            conversation_history.append_message_to_history(user_id, "user", f"message {turn}")
+            repo.get_user_name(user_id)
+            await asyncio.sleep(think)
+            conversation_history.append_message_to_history(user_id, "Noelle", f"reply {turn}")
+            repo.deduct_credits(user_id, 1)
+            conversation_history.get_history_length(user_id)
+
+    return run()
+
+
+def async_session(user_id, turns, think):
+    repo = AsyncProfileRepository()
+
+    async def run():
+        await repo.get_profile_row(user_id, refresh=True)
+        await repo.get_user_credit(user_id)
+        for turn in range(turns):
+            await conversation_history.append_message_to_history_async(user_id, "user", f"message {turn}")
+            await repo.get_user_name(user_id)
+            await asyncio.sleep(think)
+            await conversation_history.append_message_to_history_async(user_id, "Noelle", f"reply {turn}")
+            await repo.deduct_credits(user_id, 1)
+            await conversation_history.get_history_length_async(user_id)
+
+    return run()
+
+
+async def measure(session_factory, sessions, turns, think):
+    lags = []
+    done = asyncio.Event()
+
+    async def monitor():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK_SECONDS)
+            lags.append((time.perf_counter() - start - TICK_SECONDS) * 1000)
+
+    monitor_task = asyncio.create_task(monitor())
+    start = time.perf_counter()
+    await asyncio.gather(*(session_factory(str(uuid.uuid4()), turns, think) for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await monitor_task
+
+    lags.sort()
+    return {
+        "p50": statistics.median(lags),
+        "p99": lags[int(len(lags) * 0.99) - 1] if len(lags) > 1 else lags[0],
+        "max": lags[-1],
+        "turns_per_s": sessions * turns / elapsed,
+    }
+
+
+def main(args):
+    PostgrestHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PostgrestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.disable(logging.INFO)
+
+    # point the shared clients at the stand-in server
+    supabase_client.SUPABASE_URL = f"http://127.0.0.1:{server.server_port}"
+    profiles.SUPABASE_SERVICE_ROLE_KEY = API_KEY
+    conversation_history.SUPABASE_SERVICE_ROLE_KEY = API_KEY
+    conversation_history.supabase = supabase_client.LazySupabaseClient(API_KEY)
+
+    think = args.think_ms / 1000
+    print(f"{args.turns} turns per session, {args.latency_ms:.0f}ms per Supabase request, {args.think_ms:.0f}ms model time per turn")
+    print(f"{'sessions':>8} | {'mode':>5} | {'lag p50 (ms)':>12} | {'lag p99 (ms)':>12} | {'lag max (ms)':>12} | {'turns/s':>8}")
+    print("-" * 75)
+    for sessions in args.sessions:
+        for mode, factory in (("sync", sync_session), ("async", async_session)):
+            result = asyncio.run(measure(factory, sessions, args.turns, think))
+            print(f"{sessions:>8} | {mode:>5} | {result['p50']:>12.1f} | {result['p99']:>12.1f} | "
+                  f"{result['max']:>12.1f} | {result['turns_per_s']:>8.1f}")
+            # the async client belongs to the loop that created it
+            supabase_client._async_clients.clear()
+            supabase_client._async_clients_lock = None
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--think-ms", type=float, default=50)
+    main(parser.parse_args())
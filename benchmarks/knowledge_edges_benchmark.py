@@ -0,0 +1,95 @@
+"""
+Edge-creation latency: per-row cosine loop vs. the per-user embedding matrix.
+
+Usage:
+    python benchmarks/knowledge_edges_benchmark.py [--sizes 1000 10000 100000] [--dim 1536]
+
+The "loop" column reproduces the previous create_knowledge_edges scoring (json.loads +
+cosine_similarity per stored memory, then a full sort). The "matrix" column is the cost of
+scoring one new memory against a warm per-user memory index (one mat-vec + argpartition).
+"warm load" is the one-off cost of building the matrix from the rows Supabase returns.
+Round trips are not simulated; the previous code issued 2 per candidate edge, the batch
+engine issues 2 in total.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from app.utils.similarity import cosine_similarity
+from app.utils.vector_index import EmbeddingMatrix, parse_embedding
+
+THRESHOLD = 0.8
+TOP_K = 5
+# Distinct serialized embeddings; rows reuse them cyclically to keep memory bounded at 100k
+POOL_SIZE = 1000
+
+
+def build_rows(size: int, dim: int, rng: np.random.Generator):
+    pool = rng.standard_normal((POOL_SIZE, dim)).astype(np.float32)
+    serialized = [json.dumps(vec.tolist()) for vec in pool]
+    rows = [{"id": f"mem-{i}", "embedding": serialized[i % POOL_SIZE]} for i in range(size)]
+    return rows, pool
+
+
+def loop_edges(rows, source_embedding):
+    scored = []
+    for mem in rows:
+        score = cosine_similarity(source_embedding, json.loads(mem["embedding"]))
+        if score >= THRESHOLD:
+            scored.append((mem["id"], score))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return scored[:TOP_K]
+
+
+def warm_matrix(rows):
+    matrix = EmbeddingMatrix()
+    matrix.add_many([row["id"] for row in rows], [parse_embedding(row["embedding"]) for row in rows])
+    return matrix
+
+
+def time_call(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'memories':>10} | {'loop (ms)':>10} | {'matrix (ms)':>11} | {'speedup':>8} | {'warm load (ms)':>14}")
+    print("-" * 66)
+
+    for size in args.sizes:
+        rows, pool = build_rows(size, args.dim, rng)
+        # Near-duplicate of a stored memory so some candidates clear the threshold
+        source = pool[0] + 0.1 * rng.standard_normal(args.dim).astype(np.float32)
+
+        loop_repeat = 1 if size >= 100000 else args.repeat
+        loop_ms = time_call(lambda: loop_edges(rows, source.tolist()), loop_repeat)
+
+        start = time.perf_counter()
+        matrix = warm_matrix(rows)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        matrix_ms = time_call(lambda: matrix.top_k(source, TOP_K, threshold=THRESHOLD, exclude=["mem-0"]), args.repeat)
+
+        print(f"{size:>10} | {loop_ms:>10.1f} | {matrix_ms:>11.2f} | {loop_ms / matrix_ms:>7.0f}x | {load_ms:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
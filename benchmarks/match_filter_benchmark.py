@@ -0,0 +1,102 @@
+"""
+MemoryFilter evaluation: the original per-memory closures vs. the compiled filter.
+
+Usage:
+    python benchmarks/match_filter_benchmark.py [--memories 10000] [--repeat 5]
+
+Runs the filter chains used by the memory tools (plus a date threshold and a date sort)
+over synthetic memories shaped like user_knowledge rows, checks both paths return the
+same list, and reports the best-of-N wall time for each.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.utils.match_filter import MemoryFilter
+
+TOPICS = ["work", "stress", "family", "music", "friendship", "feedback", "health", "travel"]
+
+
+def synthetic_memories(count, rng):
+    memories = []
+    for i in range(count):
+        timestamp = (datetime(2025, 1, 1) + timedelta(minutes=rng.randint(0, 60 * 24 * 365))).isoformat()
+        memories.append({
+            "id": str(i),
+            "knowledge_text": f"memory {i}",
+            "timestamp": timestamp,
+            "similarity": rng.random(),
+            "metadata": {
+                "topics": rng.sample(TOPICS, rng.randint(1, 3)),
+                "emotional_intensity": rng.choice(["low", "medium", "high"]),
+                "language_style": rng.choice(["direct", "poetic", "reflective"]),
+                "importance": round(rng.random(), 2),
+                "disclosure": rng.random() < 0.3,
+                "ritual": rng.random() < 0.3,
+                "boundary_discussion": rng.random() < 0.2,
+                "self_awareness": rng.random() < 0.2,
+                "timestamp": timestamp,
+            },
+        })
+    return memories
+
+
+def reference_apply(memory_filter, memories):
+    filtered = [
+        memory for memory in memories
+        if (all(condition(memory) for condition in memory_filter.conditions) or
+            any(condition(memory) for condition in memory_filter.or_conditions))
+    ]
+    if memory_filter.sort_order:
+        reverse = memory_filter.sort_order == "desc"
+        if memory_filter.sort_key == "timestamp":
+            filtered = sorted(filtered, key=lambda m: datetime.fromisoformat(str(m.get("timestamp"))) if m.get("timestamp") else datetime.min, reverse=reverse)
+        else:
+            filtered = sorted(filtered, key=lambda m: m.get("similarity", 0.0), reverse=reverse)
+    return filtered
+
+
+FILTERS = {
+    "rituals": lambda: MemoryFilter().match("ritual", True).greater_than_or_equal("importance", 0.5),
+    "context_weighted": lambda: MemoryFilter().match("disclosure", True).match("boundary_discussion", True)
+        .greater_than_or_equal("importance", 0.7).match("emotional_intensity", "high"),
+    "topics": lambda: MemoryFilter().contains_any("topics", ["work", "music"]).greater_than_or_equal("importance", 0.5),
+    "recent_by_date": lambda: MemoryFilter().greater_than_or_equal("timestamp", "2025-06-01T00:00:00")
+        .less_than_or_equal("importance", 0.9).sort_by_date(),
+}
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(args):
+    memories = synthetic_memories(args.memories, random.Random(5))
+    print(f"{args.memories} memories, best of {args.repeat}")
+    print(f"{'filter':>16} | {'matches':>7} | {'closures (ms)':>13} | {'compiled (ms)':>13} | {'speedup':>7}")
+    print("-" * 70)
+    for name, make_filter in FILTERS.items():
+        memory_filter = make_filter()
+        expected = reference_apply(memory_filter, memories)
+        assert memory_filter.apply(memories) == expected, name
+
+        closures = best_of(args.repeat, lambda: reference_apply(memory_filter, memories))
+        compiled = best_of(args.repeat, lambda: memory_filter.apply(memories))
+        print(f"{name:>16} | {len(expected):>7} | {closures:>13.2f} | {compiled:>13.2f} | {closures / compiled:>6.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--memories", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
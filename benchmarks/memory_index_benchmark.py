@@ -0,0 +1,95 @@
+"""
+Per-user memory search: exact brute force vs. the in-process IVF-flat index.
+
+Usage:
+    python benchmarks/memory_index_benchmark.py [--sizes 1000 10000 100000] [--queries 200]
+
+Memories are synthetic clustered unit vectors (real embeddings cluster by topic, uniform noise
+does not), so recall is representative of a user's memory set rather than a worst case.
+Reports recall@k of the IVF results against brute force and p50/p99 query latency for both,
+plus the one-off cost of building the index. The find_similar_memories RPC this replaces
+also pays a network round trip per call, which is not modelled here.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from app.utils.vector_index import IVFFlatIndex
+
+
+def clustered_vectors(count, centers, rng):
+    dim = centers.shape[1]
+    labels = rng.integers(0, len(centers), count)
+    vectors = centers[labels]
+    vectors += 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[max(0, int(len(ordered) * fraction) - 1)]
+
+
+def timed_search(index, queries, k, exact):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, k, exact=exact))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, results
+
+
+def run(size, args, rng):
+    # queries are drawn around the same topics as the stored memories
+    centers = rng.standard_normal((max(10, size // 200), args.dim)).astype(np.float32)
+    vectors = clustered_vectors(size, centers, rng)
+    queries = clustered_vectors(args.queries, centers, rng)
+
+    index = IVFFlatIndex(nprobe=args.nprobe)
+    start = time.perf_counter()
+    index.add_many([f"m{i}" for i in range(size)], vectors)
+    build_s = time.perf_counter() - start
+    del vectors
+
+    exact_ms, exact = timed_search(index, queries, args.k, exact=True)
+    ivf_ms, approx = timed_search(index, queries, args.k, exact=False)
+
+    hits = sum(
+        len({item_id for item_id, _ in truth} & {item_id for item_id, _ in found})
+        for truth, found in zip(exact, approx)
+    )
+    recall = hits / (args.k * len(queries))
+
+    print(
+        f"{size:>8} | {build_s:>9.2f} | {recall:>9.3f} | "
+        f"{statistics.median(exact_ms):>9.2f} | {percentile(exact_ms, 0.99):>9.2f} | "
+        f"{statistics.median(ivf_ms):>9.2f} | {percentile(ivf_ms, 0.99):>9.2f}"
+    )
+
+
+def main(args):
+    rng = np.random.default_rng(42)
+    print(f"dim={args.dim} k={args.k} nprobe={args.nprobe} queries={args.queries}")
+    print(
+        f"{'memories':>8} | {'build (s)':>9} | {f'recall@{args.k}':>9} | "
+        f"{'flat p50':>9} | {'flat p99':>9} | {'ivf p50':>9} | {'ivf p99':>9}"
+    )
+    print("-" * 80)
+    for size in args.sizes:
+        run(size, args, rng)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=8)
+    main(parser.parse_args())
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import time
+from functools import partial
+from types import SimpleNamespace
+
+# the OpenAI clients are created when these modules are imported; no request is made
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app.function.analysis_jobs import analysis_handlers  # noqa: E402
+from app.psychology import mbti_analysis  # noqa: E402
+from app.psychology.mbti_analysis import MBTIAnalysisService, MBTIResponse  # noqa: E402
+from app.supabase.supabase_mbti import MBTI  # noqa: E402
+from app.utils.job_queue import JobQueue, JobWorker  # noqa: E402
+
+
+class DummyAsyncRepository:
+    def __init__(self):
+        self.saved = []
+
+    async def upsert_mbti(self, user_id, mbti):
+        self.saved.append(mbti)
+
+
+def test_failed_analysis_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(mbti_analysis, "MBTIRepository", DummyAsyncRepository)
+    monkeypatch.setattr(mbti_analysis, "AsyncMBTIRepository", DummyAsyncRepository)
+    service = MBTIAnalysisService("ada", mbti=MBTI())
+    calls = []
+
+    async def create(user_id):
+        return service
+
+    async def run(agent, message):
+        calls.append(message)
+        if len(calls) == 1:
+            raise RuntimeError("rate limited")
+        return SimpleNamespace(final_output=MBTIResponse(
+            extraversion_introversion=0.9, sensing_intuition=0.1, thinking_feeling=0.7, judging_perceiving=0.3,
+        ))
+
+    monkeypatch.setattr(MBTIAnalysisService, "create", create)
+    monkeypatch.setattr(mbti_analysis.Runner, "run", run)
+
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(queue, "fail", partial(queue.fail, retry_base=0.2))
+    queue.enqueue("ada", "mbti", "user: hi")
+    worker = JobWorker(queue, analysis_handlers)
+
+    async def run_twice():
+        assert await worker.run_once() == 1
+        await worker.drain()
+        # backing off
+        assert await worker.run_once() == 0
+        time.sleep(0.25)
+        assert await worker.run_once() == 1
+        await worker.drain()
+
+    asyncio.run(run_twice())
+
+    assert calls == ["user: hi", "user: hi"]
+    stats = queue.stats()["kinds"]["mbti"]
+    assert stats["retried"] == 1 and stats["completed"] == 1 and stats["failed"] == 0
+    assert service.mbti.message_count == 1 and len(service.async_repository.saved) == 1
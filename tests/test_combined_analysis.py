@@ -0,0 +1,81 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+# the OpenAI clients are created when these modules are imported; no request is made
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app.function.memory_extraction import MemoryMetadata  # noqa: E402
+from app.personal_agents.slang_extraction import SlangMetadata, SlangResult, SlangScore  # noqa: E402
+from app.psychology import combined_analysis  # noqa: E402
+from app.psychology.combined_analysis import CombinedAnalysisResponse, CombinedAnalysisService  # noqa: E402
+from app.psychology.mbti_analysis import MBTIAnalysisService, MBTIResponse  # noqa: E402
+from app.psychology.ocean_analysis import OceanAnalysisService, OceanResponse  # noqa: E402
+from app.supabase.supabase_mbti import MBTI  # noqa: E402
+from app.supabase.supabase_ocean import Ocean  # noqa: E402
+
+
+class DummyAsyncRepository:
+    def __init__(self):
+        self.saved = []
+
+    async def upsert_mbti(self, user_id, mbti):
+        self.saved.append(mbti)
+
+    async def upsert_ocean(self, user_id, ocean):
+        self.saved.append(ocean)
+
+
+def analysis():
+    return CombinedAnalysisResponse(
+        mbti=MBTIResponse(extraversion_introversion=0.9, sensing_intuition=0.1, thinking_feeling=0.7, judging_perceiving=0.3),
+        ocean=OceanResponse(openness=0.8, conscientiousness=0.4, extraversion=0.2, agreeableness=0.7, neuroticism=0.6),
+        memory=MemoryMetadata(
+            text="Goes bouldering every Tuesday and Thursday", topics=["climbing"], emotional_intensity="medium",
+            disclosure=False, ritual=True, boundary_discussion=False, language_style="casual", self_awareness=False,
+            recurring_theme=False, importance=0.6, sentiment_score=0.5, timestamp="",
+        ),
+        slang=SlangResult(slang_text="no cap", metadata=SlangMetadata(score=SlangScore(value_score=0.1, reason="Common slang"), topics=[], timestamp="")),
+    )
+
+
+def test_one_call_fans_out_to_every_analysis(monkeypatch):
+    calls, kept = [], []
+    for repository in ("mbti_analysis.MBTIRepository", "mbti_analysis.AsyncMBTIRepository", "ocean_analysis.OceanRepository", "ocean_analysis.AsyncOceanRepository"):
+        monkeypatch.setattr(f"app.psychology.{repository}", DummyAsyncRepository)
+    mbti_service = MBTIAnalysisService("ada", mbti=MBTI())
+    ocean_service = OceanAnalysisService("ada", ocean=Ocean())
+
+    async def run(agent, message):
+        calls.append((agent.name, message))
+        return SimpleNamespace(final_output=analysis())
+
+    async def create_mbti(user_id):
+        return mbti_service
+
+    async def create_ocean(user_id):
+        return ocean_service
+
+    def store_memory(self, memory):
+        kept.append(memory.text)
+        return True
+
+    async def store_slang(self, slang):
+        kept.append(slang.slang_text)
+
+    monkeypatch.setattr(combined_analysis.Runner, "run", run)
+    monkeypatch.setattr(combined_analysis.MBTIAnalysisService, "create", create_mbti)
+    monkeypatch.setattr(combined_analysis.OceanAnalysisService, "create", create_ocean)
+    monkeypatch.setattr(combined_analysis.MemoryExtractionService, "store_memory", store_memory)
+    monkeypatch.setattr(combined_analysis.SlangExtractionService, "store_slang", store_slang)
+
+    result = asyncio.run(CombinedAnalysisService("ada").analyze_message("user: hi"))
+
+    assert calls == [("CombinedAnalysis", "user: hi")]
+    assert result.mbti.extraversion_introversion == 0.9
+    # the same rolling averages as the separate analyses
+    assert mbti_service.mbti.message_count == 1 and mbti_service.get_mbti_type() == "ISFJ"
+    assert ocean_service.ocean.response_count == 1 and ocean_service.ocean.openness == 0.8
+    assert len(mbti_service.async_repository.saved) == 1 and len(ocean_service.async_repository.saved) == 1
+    # the memory is kept; the slang is below the value threshold
+    assert kept == ["Goes bouldering every Tuesday and Thursday"]
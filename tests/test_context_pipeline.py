@@ -0,0 +1,95 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.websockets.context_pipeline import ContextPipeline, ContextPipelineStats, Stage
+
+
+def sleeper(seconds, value):
+    async def run(results):
+        await asyncio.sleep(seconds)
+        return value
+    return run
+
+
+def test_independent_stages_overlap_and_dependencies_wait():
+    order = []
+    overlapped = {}
+    slang_started = threading.Event()
+    classifiers_started = []
+    both_classifiers_started = asyncio.Event()
+
+    async def history(results):
+        order.append("history start")
+        # only finishes if the blocking lookup runs alongside it
+        overlapped["slang"] = await asyncio.to_thread(slang_started.wait, 1)
+        order.append("history end")
+        return ["hi"]
+
+    def blocking_lookup(results):
+        slang_started.set()
+        return "slang"
+
+    def classifier(name):
+        async def run(results):
+            order.append(f"{name} start ({results['history']})")
+            classifiers_started.append(name)
+            if len(classifiers_started) == 2:
+                both_classifiers_started.set()
+            # neither finishes until both have started
+            await asyncio.wait_for(both_classifiers_started.wait(), 1)
+            overlapped[name] = True
+            return name
+        return run
+
+    pipeline = ContextPipeline([
+        Stage("history", history),
+        Stage("slang", blocking_lookup, blocking=True),
+        Stage("intent", classifier("intent"), after=["history"]),
+        Stage("tpb", classifier("tpb"), after=["history"]),
+    ], stats=None)
+
+    results = asyncio.run(pipeline.run())
+
+    assert results == {"history": ["hi"], "slang": "slang", "intent": "intent", "tpb": "tpb"}
+    assert pipeline.statuses == {"history": "ok", "slang": "ok", "intent": "ok", "tpb": "ok"}
+    assert overlapped == {"slang": True, "intent": True, "tpb": True}
+    # the classifiers wait for the history they depend on
+    assert order[:2] == ["history start", "history end"]
+    assert sorted(order[2:]) == ["intent start (['hi'])", "tpb start (['hi'])"]
+
+
+def test_timeouts_and_errors_fall_back_to_defaults():
+    def broken(results):
+        raise RuntimeError("db down")
+
+    stats = ContextPipelineStats()
+    pipeline = ContextPipeline([
+        Stage("slow", sleeper(1, "late"), timeout=0.01, default="fallback"),
+        Stage("broken", broken, blocking=True, default=""),
+        Stage("after", lambda results: sleeper(0, results["slow"] + "!")(results), after=["slow", "broken"]),
+    ], stats=stats)
+
+    results = asyncio.run(pipeline.run())
+
+    assert results == {"slow": "fallback", "broken": "", "after": "fallback!"}
+    assert pipeline.statuses == {"slow": "timeout", "broken": "error", "after": "ok"}
+    stages = stats.stats()["stages"]
+    assert stages["slow"]["timeouts"] == 1
+    assert stages["broken"]["errors"] == 1
+
+
+def test_dependencies_must_come_first():
+    with pytest.raises(ValueError):
+        ContextPipeline([Stage("intent", sleeper(0, None), after=["history"]), Stage("history", sleeper(0, None))])
+
+
+def test_results_from_an_earlier_pipeline_can_be_depended_on():
+    pipeline = ContextPipeline(
+        [Stage("intent", lambda results: sleeper(0, results["history"] + ["classified"])(results), after=["history"])],
+        stats=None,
+        results={"history": ["hi"]},
+    )
+
+    assert asyncio.run(pipeline.run()) == {"history": ["hi"], "intent": ["hi", "classified"]}
@@ -0,0 +1,275 @@
+import asyncio
+import sqlite3
+import threading
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.websockets.context.backends import MemoryContextBackend, SqliteContextBackend
+from app.websockets.context.store import ContextStore
+from app.websockets.schemas.messages import AudioMessage
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_store(max_bytes=10_000, shards=4):
+    clock = FakeClock()
+    backend = MemoryContextBackend(idle_ttl=100, max_bytes=max_bytes, sweep_interval=0, shards=shards, clock=clock)
+    return ContextStore(backend, disconnected_ttl=10, max_field_bytes=1_000), clock
+
+
+def make_shared_store(tmp_path, near_cache_seconds=0.0, max_bytes=10_000):
+    clock = FakeClock()
+    backend = SqliteContextBackend(str(tmp_path / "context.sqlite3"), idle_ttl=100, max_bytes=max_bytes, sweep_interval=0, clock=clock)
+    store = ContextStore(backend, disconnected_ttl=10, max_field_bytes=1_000, near_cache_seconds=near_cache_seconds, clock=clock)
+    return store, clock
+
+
+def test_get_returns_a_copy_and_unknown_users_are_empty():
+    store, _ = make_store()
+    store.set("u1", "gps", {"lat": 1})
+
+    context = store.get("u1")
+    context["gps"] = None
+
+    assert store.get_key("u1", "gps") == {"lat": 1}
+    assert store.get("nobody") == {}
+    assert store.get_key("nobody", "gps") is None
+
+
+def test_idle_users_are_dropped():
+    store, clock = make_store()
+    store.set("u1", "gps", "here")
+    store.set("u2", "gps", "there")
+
+    clock.now += 60
+    assert store.get_key("u1", "gps") == "here"
+    clock.now += 60
+
+    assert store.get("u2") == {}
+    assert store.get_key("u1", "gps") == "here"
+    assert store.stats()["idle_evictions"] == 1
+
+
+def test_expire_drops_a_disconnected_user_unless_they_return():
+    store, clock = make_store()
+    store.set("u1", "gps", "here")
+    store.set("u2", "gps", "there")
+    store.expire("u1")
+    store.expire("u2")
+
+    clock.now += 5
+    assert store.get_key("u2", "gps") == "there"
+    clock.now += 6
+
+    assert store.stats()["users"] == 1
+    assert store.get("u1") == {}
+    assert store.get_key("u2", "gps") == "there"
+
+
+def test_key_ttl():
+    store, clock = make_store()
+    store.set("u1", "last_image_analysis", "a cat", ttl=5)
+    store.set("u1", "gps", "here")
+
+    clock.now += 6
+
+    assert store.get("u1") == {"gps": "here"}
+    assert store.stats()["bytes"] == len("gps") + len("here")
+
+
+def test_large_message_fields_are_not_kept():
+    store, _ = make_store()
+    message = AudioMessage(type="audio", audio="x" * 5_000, voice="nova")
+
+    store.set("u1", "settings", message)
+
+    settings = store.get_key("u1", "settings")
+    assert settings.type == "audio" and settings.voice == "nova"
+    assert settings.audio == ""
+    assert message.audio == "x" * 5_000
+    assert store.stats()["slimmed_fields"] == 1
+
+
+def test_least_recently_used_users_are_dropped_over_the_byte_cap():
+    store, clock = make_store(max_bytes=300, shards=1)
+    store.set("u1", "note", "a" * 100)
+    clock.now += 1
+    store.set("u2", "note", "b" * 100)
+    clock.now += 1
+    store.get("u1")
+    clock.now += 1
+
+    store.set("u3", "note", "c" * 100)
+
+    assert store.get("u2") == {}
+    assert store.get_key("u1", "note") == "a" * 100
+    assert store.get_key("u3", "note") == "c" * 100
+    stats = store.stats()
+    assert stats["size_evictions"] == 1
+    assert stats["bytes"] <= 300
+
+
+def test_bytes_track_overwrites_and_deletes():
+    store, _ = make_store()
+    store.set("u1", "note", "a" * 100)
+    store.set("u1", "note", "a" * 10)
+    store.set("u2", "note", "b" * 50)
+    assert store.stats()["bytes"] == 2 * len("note") + 60
+
+    store.delete_key("u1", "note")
+    store.delete("u2")
+
+    assert store.stats()["bytes"] == 0
+    store.replace("u2", "note", "ignored")
+    assert store.get("u2") == {}
+
+
+def test_snapshot_is_not_changed_by_later_writes():
+    store, clock = make_store()
+    store.set("u1", "gps", "here")
+    store.set("u1", "feedback", True)
+
+    snapshot = store.snapshot("u1")
+    store.set("u1", "gps", "there")
+    store.delete_key("u1", "feedback")
+
+    assert dict(snapshot) == {"gps": "here", "feedback": True}
+    assert dict(store.snapshot("u1")) == {"gps": "there"}
+    try:
+        snapshot["gps"] = "elsewhere"
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("snapshots are read-only")
+
+
+def test_snapshot_applies_expiry_and_reconnects():
+    store, clock = make_store()
+    store.set("u1", "last_image_analysis", "a cat", ttl=5)
+    store.set("u1", "gps", "here")
+    store.expire("u1")
+
+    clock.now += 6
+    assert dict(store.snapshot("u1")) == {"gps": "here"}
+
+    # reading again after the reconnect cleared the disconnect deadline
+    clock.now += 6
+    assert dict(store.snapshot("u1")) == {"gps": "here"}
+    assert dict(store.snapshot("nobody")) == {}
+
+
+def test_users_are_spread_over_shards():
+    store, _ = make_store(shards=8)
+    for i in range(200):
+        store.set(f"user-{i}", "gps", i)
+
+    shard_sizes = [len(shard.users) for shard in store.backend._shards]
+    assert sum(shard_sizes) == 200
+    assert max(shard_sizes) < 200
+    assert store.stats()["shards"] == 8
+    assert all(store.get_key(f"user-{i}", "gps") == i for i in range(200))
+
+
+def test_shared_backend_is_seen_by_every_worker(tmp_path):
+    worker_a, _ = make_shared_store(tmp_path)
+    worker_b, _ = make_shared_store(tmp_path)
+
+    worker_a.set("u1", "gps", {"latitude": 1.0, "longitude": 2.0})
+    worker_a.set("u1", "settings", AudioMessage(type="audio", audio="x" * 5_000, voice="nova"))
+
+    assert worker_b.get_key("u1", "gps") == {"latitude": 1.0, "longitude": 2.0}
+    assert worker_b.get_key("u1", "settings").voice == "nova"
+    assert worker_b.get_many("u1", ["gps", "feedback"]) == {"gps": {"latitude": 1.0, "longitude": 2.0}}
+
+    worker_b.delete_key("u1", "gps")
+    assert worker_a.get_key("u1", "gps") is None
+
+
+def test_shared_backend_expiry_and_byte_cap(tmp_path):
+    store, clock = make_shared_store(tmp_path, max_bytes=300)
+    store.set("u1", "last_image_analysis", "a cat", ttl=5)
+    store.set("u1", "note", "a" * 100)
+    store.set("u2", "note", "b" * 100)
+    store.expire("u2")
+
+    clock.now += 6
+    assert store.get("u1") == {"note": "a" * 100}
+
+    clock.now += 5
+    assert store.get("u2") == {}
+
+    store.set("u3", "note", "c" * 150)
+    store.set("u4", "note", "d" * 150)
+    stats = store.stats()
+    assert stats["backend"] == "sqlite"
+    assert stats["bytes"] <= 300
+    assert stats["size_evictions"] >= 1
+    assert store.get_key("u4", "note") == "d" * 150
+
+
+def test_near_cache_serves_reads_until_it_expires(tmp_path):
+    worker_a, clock = make_shared_store(tmp_path, near_cache_seconds=1)
+    worker_b, _ = make_shared_store(tmp_path)
+    worker_a.set("u1", "gps", "here")
+
+    assert worker_a.get_key("u1", "gps") == "here"
+    worker_b.set("u1", "gps", "there")
+    worker_a.set("u1", "time", "noon")
+
+    # served locally, with this worker's own write applied
+    assert worker_a.get_many("u1", ["gps", "time"]) == {"gps": "here", "time": "noon"}
+    clock.now += 2
+    assert worker_a.get_key("u1", "gps") == "there"
+
+    near_cache = worker_a.stats()["near_cache"]
+    assert near_cache["hits"] == 1
+    assert near_cache["misses"] == 2
+
+
+def test_shared_backend_reads_do_not_take_the_write_lock(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "context.sqlite3")
+    backend = SqliteContextBackend(path, idle_ttl=100, max_bytes=10_000, sweep_interval=0, touch_interval=30, busy_timeout=0.05, clock=clock)
+    backend.set("u1", "gps", "here")
+
+    # another worker holds the write lock
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("begin immediate")
+    try:
+        clock.now += 10
+        assert backend.get_all("u1") == {"gps": "here"}
+        clock.now += 30
+        # the deadline is due for renewal but the lock is taken: the read still succeeds
+        assert backend.get_all("u1") == {"gps": "here"}
+    finally:
+        other.execute("rollback")
+        other.close()
+
+    # once the lock is free the touch goes through
+    assert backend.get_all("u1") == {"gps": "here"}
+    last_access = backend.connection.execute("select last_access from context_users where user_id = 'u1'").fetchone()[0]
+    assert last_access == clock.now
+
+
+def test_a_blocking_backend_is_called_off_the_event_loop(tmp_path):
+    store, _ = make_shared_store(tmp_path)
+    threads = []
+    get = store.get
+
+    def record_thread(user_id):
+        threads.append(threading.get_ident())
+        return get(user_id)
+
+    async def scenario():
+        await store.run(store.set, "u1", "gps", "here")
+        return await store.run(record_thread, "u1")
+
+    assert asyncio.run(scenario()) == {"gps": "here"}
+    assert threads and threads[0] != threading.get_ident()
@@ -0,0 +1,129 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.supabase import credit_ledger as ledger_module
+from app.supabase import profiles
+from app.supabase.credit_ledger import CreditLedger
+from app.supabase.profiles import profile_cache
+
+
+class FakeCall:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    async def execute(self):
+        if self.client.fail:
+            raise ConnectionError("supabase down")
+        if self.name == "deduct_credits":
+            self.client.rpcs += 1
+            results = []
+            for deduction in self.params["deductions"]:
+                row = self.client.rows[deduction["user_id"]]
+                charged = min(deduction["amount"], max(row["credits"], 0))
+                row["credits"] -= charged
+                row["credits_used"] += charged
+                results.append({"id": row["id"], "credits": row["credits"], "credits_used": row["credits_used"], "charged": charged})
+            return SimpleNamespace(data=results)
+        # profiles select
+        self.client.selects += 1
+        return SimpleNamespace(data=[dict(self.client.rows[self.params])])
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.params = value
+        return self
+
+
+class FakeAsyncClient:
+    def __init__(self):
+        self.rows = {user_id: {"id": user_id, "credits": 10, "credits_used": 0} for user_id in ("ada", "bob")}
+        self.rpcs = 0
+        self.selects = 0
+        self.fail = False
+
+    def rpc(self, name, params):
+        return FakeCall(self, name, params)
+
+    def table(self, name):
+        return FakeCall(self, name, None)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeAsyncClient()
+
+    async def get_client(key=None):
+        return fake
+
+    monkeypatch.setattr(ledger_module, "get_async_supabase_client", get_client)
+    monkeypatch.setattr(profiles, "get_async_supabase_client", get_client)
+    profile_cache.clear()
+    yield fake
+    profile_cache.clear()
+
+
+def test_charges_are_batched_into_one_rpc(client):
+    ledger = CreditLedger()
+
+    async def run():
+        assert await ledger.load("ada") == 10
+        assert await ledger.load("bob") == 10
+        for _ in range(3):
+            assert ledger.deduct("ada", 2)
+            assert ledger.deduct("bob", 1)
+        # the gate sees the charges before they are written
+        assert ledger.balance("ada") == 4
+        assert client.rpcs == 0
+        assert await ledger.flush() == 2
+
+    asyncio.run(run())
+
+    assert client.rpcs == 1
+    assert client.rows["ada"]["credits"] == 4
+    assert client.rows["ada"]["credits_used"] == 6
+    assert client.rows["bob"]["credits"] == 7
+    assert ledger.balance("bob") == 7
+    assert profile_cache.get("ada")["credits"] == 4
+    assert ledger.stats()["pending_credits"] == 0
+
+
+def test_balance_never_goes_below_zero(client):
+    ledger = CreditLedger()
+
+    async def run():
+        await ledger.load("ada")
+        ledger.deduct("ada", 8)
+        ledger.deduct("ada", 8)
+        assert not ledger.has_credits("ada")
+        await ledger.flush()
+
+    asyncio.run(run())
+
+    assert client.rows["ada"]["credits"] == 0
+    assert client.rows["ada"]["credits_used"] == 10
+    assert ledger.stats()["shortfall_credits"] == 6
+
+
+def test_failed_flush_keeps_charges_pending(client):
+    ledger = CreditLedger()
+
+    async def run():
+        await ledger.load("ada")
+        ledger.deduct("ada", 3)
+        client.fail = True
+        await ledger.flush()
+        assert ledger.balance("ada") == 7
+        client.fail = False
+        await ledger.flush()
+
+    asyncio.run(run())
+
+    assert client.rows["ada"]["credits"] == 7
+    assert ledger.stats()["errors"] == 1
+    assert ledger.stats()["pending_credits"] == 0
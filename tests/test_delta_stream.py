@@ -0,0 +1,109 @@
+import asyncio
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.websockets.delta_stream import DeltaStream, StreamStats
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_stream(flush_chars=10, flush_ms=1000.0, clock=None):
+    sent = []
+
+    async def send(payload):
+        sent.append(payload)
+
+    stats = StreamStats()
+    if clock is None:
+        stream = DeltaStream(send, flush_chars=flush_chars, flush_ms=flush_ms, stats=stats)
+    else:
+        stream = DeltaStream(send, started_at=99.0, flush_chars=flush_chars, flush_ms=flush_ms, stats=stats, clock=clock)
+    return stream, sent, stats
+
+
+def test_first_delta_is_sent_at_once_and_later_ones_are_coalesced_by_size():
+    async def scenario():
+        stream, sent, stats = make_stream(clock=FakeClock())
+        for delta in ["Hi", " there", ",", " how", " are", " you", " doing", "?"]:
+            await stream.add(delta)
+        await stream.complete("Hi there, how are you doing?")
+        return sent, stats.stats()
+
+    sent, stats = asyncio.run(scenario())
+    assert sent == [
+        {"type": "ai_delta", "seq": 1, "text": "Hi"},
+        {"type": "ai_delta", "seq": 2, "text": " there, how"},
+        {"type": "ai_delta", "seq": 3, "text": " are you doing"},
+        {"type": "ai_delta", "seq": 4, "text": "?"},
+        {"type": "ai_response", "seq": 5, "text": "Hi there, how are you doing?"},
+    ]
+    assert "".join(frame["text"] for frame in sent[:-1]) == sent[-1]["text"]
+    assert stats["frames"] == 4
+    assert stats["deltas_per_frame"] == 2.0
+    assert stats["first_visible_deltas"] == {"turns": 1, "avg_ms": 1000.0, "max_ms": 1000.0}
+
+
+def test_deltas_are_flushed_by_time():
+    async def scenario():
+        clock = FakeClock()
+        stream, sent, _ = make_stream(flush_chars=1000, flush_ms=50, clock=clock)
+        await stream.add("a")
+        await stream.add("b")
+        clock.now += 0.06
+        await stream.add("c")
+        return sent
+
+    assert asyncio.run(scenario()) == [
+        {"type": "ai_delta", "seq": 1, "text": "a"},
+        {"type": "ai_delta", "seq": 2, "text": "bc"},
+    ]
+
+
+def test_waiting_deltas_are_sent_when_the_model_pauses():
+    async def scenario():
+        stream, sent, _ = make_stream(flush_chars=1000, flush_ms=10)
+        await stream.add("a")
+        await stream.add("b")
+        await stream.add("c")
+        waiting = list(sent)
+        await asyncio.sleep(0.05)
+        return waiting, sent
+
+    waiting, sent = asyncio.run(scenario())
+    assert waiting == [{"type": "ai_delta", "seq": 1, "text": "a"}]
+    assert sent == [
+        {"type": "ai_delta", "seq": 1, "text": "a"},
+        {"type": "ai_delta", "seq": 2, "text": "bc"},
+    ]
+
+
+def test_stop_drops_waiting_deltas():
+    async def scenario():
+        stream, sent, _ = make_stream(flush_chars=1000, flush_ms=10)
+        await stream.add("a")
+        await stream.add("b")
+        stream.stop()
+        await asyncio.sleep(0.03)
+        return sent
+
+    assert asyncio.run(scenario()) == [{"type": "ai_delta", "seq": 1, "text": "a"}]
+
+
+def test_a_message_without_deltas_is_still_sent_whole():
+    async def scenario():
+        stream, sent, stats = make_stream(clock=FakeClock())
+        await stream.flush()
+        await stream.complete("Done.")
+        return sent, stats.stats()
+
+    sent, stats = asyncio.run(scenario())
+    assert sent == [{"type": "ai_response", "seq": 1, "text": "Done."}]
+    assert stats["frames"] == 0
+    assert stats["first_visible_deltas"]["turns"] == 1
@@ -0,0 +1,171 @@
+import asyncio
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.websockets.dispatcher import DispatchStats, SessionDispatcher
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, payload):
+        self.sent.append(payload)
+
+
+def make_dispatcher(max_pending=4):
+    websocket = FakeWebSocket()
+    return SessionDispatcher(websocket, "u1", max_pending=max_pending, stats=DispatchStats()), websocket
+
+
+def test_state_messages_are_applied_while_a_turn_runs():
+    async def scenario():
+        dispatcher, _ = make_dispatcher()
+        release = asyncio.Event()
+        events = []
+
+        async def turn():
+            events.append("turn started")
+            await release.wait()
+            events.append("turn done")
+
+        async def gps():
+            events.append("gps")
+
+        await dispatcher.submit("orchestrate", turn)
+        await asyncio.sleep(0.001)
+        await dispatcher.apply("gps", gps)
+        release.set()
+        await asyncio.sleep(0.01)
+        await dispatcher.close()
+        return events, dispatcher.stats.stats()
+
+    events, stats = asyncio.run(scenario())
+    assert events == ["turn started", "gps", "turn done"]
+    assert stats["state_messages"] == 1
+    assert stats["turns_completed"] == 1
+
+
+def test_turns_run_one_at_a_time_in_order():
+    async def scenario():
+        dispatcher, _ = make_dispatcher()
+        events = []
+
+        def turn(name):
+            async def run():
+                events.append(f"{name} start")
+                await asyncio.sleep(0.005)
+                events.append(f"{name} end")
+            return run
+
+        for name in ("audio", "first", "second"):
+            await dispatcher.submit(name, turn(name))
+        await asyncio.sleep(0.05)
+        await dispatcher.close()
+        return events
+
+    assert asyncio.run(scenario()) == [
+        "audio start", "audio end", "first start", "first end", "second start", "second end",
+    ]
+
+
+def test_turns_over_the_limit_are_refused():
+    async def scenario():
+        dispatcher, websocket = make_dispatcher(max_pending=2)
+        release = asyncio.Event()
+
+        async def turn():
+            await release.wait()
+
+        accepted = [await dispatcher.submit("orchestrate", turn) for _ in range(4)]
+        await asyncio.sleep(0)
+        accepted.append(await dispatcher.submit("orchestrate", turn))
+        release.set()
+        await asyncio.sleep(0.01)
+        await dispatcher.close()
+        return accepted, websocket.sent, dispatcher.stats.stats()
+
+    accepted, sent, stats = asyncio.run(scenario())
+    # the first starts running once the worker gets going; two may wait behind it
+    assert accepted == [True, True, False, False, True]
+    assert sent.count({"type": "error", "text": "BUSY"}) == 2
+    assert stats["turns_rejected"] == 2
+    assert stats["turns_completed"] == 3
+
+
+def test_interrupt_cancels_responses_but_not_audio():
+    async def scenario():
+        dispatcher, websocket = make_dispatcher()
+        events = []
+
+        async def response(name):
+            try:
+                events.append(f"{name} start")
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                events.append(f"{name} cancelled")
+                raise
+
+        async def transcribe():
+            await asyncio.sleep(0.01)
+            events.append("audio done")
+
+        async def answer():
+            events.append("answer")
+
+        await dispatcher.submit("orchestrate", lambda: response("old"))
+        await asyncio.sleep(0.001)
+        await dispatcher.submit("audio", transcribe, interruptible=False)
+        await dispatcher.submit("orchestrate", lambda: response("queued"))
+        await dispatcher.submit("orchestrate", answer, interrupt=True)
+        await asyncio.sleep(0.05)
+        await dispatcher.close()
+        return events, websocket.sent, dispatcher.stats.stats()
+
+    events, sent, stats = asyncio.run(scenario())
+    assert events == ["old start", "old cancelled", "audio done", "answer"]
+    assert sent.count({"type": "cancelled", "message": "orchestrate"}) == 2
+    assert stats["turns_cancelled"] == 2
+
+
+def test_a_failing_turn_is_reported_and_the_next_one_runs():
+    async def scenario():
+        dispatcher, websocket = make_dispatcher()
+        events = []
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        async def fine():
+            events.append("fine")
+
+        await dispatcher.submit("image", broken)
+        await dispatcher.submit("orchestrate", fine)
+        await asyncio.sleep(0.01)
+        await dispatcher.close()
+        return events, websocket.sent
+
+    events, sent = asyncio.run(scenario())
+    assert events == ["fine"]
+    assert {"type": "error", "message": "Error handling image message"} in sent
+
+
+def test_close_cancels_the_running_turn():
+    async def scenario():
+        dispatcher, _ = make_dispatcher()
+        cancelled = asyncio.Event()
+
+        async def turn():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        await dispatcher.submit("orchestrate", turn)
+        await asyncio.sleep(0.001)
+        await dispatcher.close()
+        return cancelled.is_set(), await dispatcher.submit("orchestrate", turn)
+
+    assert asyncio.run(scenario()) == (True, False)
@@ -0,0 +1,53 @@
+import asyncio
+
+from app.openai.embeddings import EmbeddingBatcher, FakeEmbeddingBackend
+
+
+def test_concurrent_callers_share_one_request():
+    backend = FakeEmbeddingBackend(dim=8)
+    batcher = EmbeddingBatcher(backend, max_batch_size=16, max_wait_ms=5)
+
+    async def run():
+        return await asyncio.gather(*(batcher.embed(f"text {i}") for i in range(10)))
+
+    vectors = asyncio.run(run())
+
+    assert backend.requests == 1
+    assert vectors[3] == backend.vector("text 3")
+
+
+def test_identical_texts_are_deduplicated():
+    backend = FakeEmbeddingBackend(dim=8)
+    batcher = EmbeddingBatcher(backend, max_batch_size=16, max_wait_ms=5)
+
+    async def run():
+        return await batcher.embed_many(["hi", "hi ", "hello", "hi"])
+
+    vectors = asyncio.run(run())
+
+    assert backend.texts == 2
+    assert vectors[0] == vectors[1] == vectors[3]
+    assert batcher.stats()["coalesced"] == 2
+
+
+def test_full_batches_flush_without_waiting():
+    backend = FakeEmbeddingBackend(dim=8)
+    batcher = EmbeddingBatcher(backend, max_batch_size=4, max_wait_ms=10_000)
+
+    async def run():
+        return await asyncio.wait_for(batcher.embed_many([f"t{i}" for i in range(8)]), timeout=1)
+
+    asyncio.run(run())
+
+    assert backend.requests == 2
+
+
+def test_backend_errors_resolve_to_none():
+    class FailingBackend(FakeEmbeddingBackend):
+        async def embed(self, texts):
+            raise RuntimeError("boom")
+
+    batcher = EmbeddingBatcher(FailingBackend(), max_wait_ms=1)
+
+    assert asyncio.run(batcher.embed("hello")) is None
+    assert batcher.stats()["failures"] == 1
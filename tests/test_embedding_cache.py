@@ -0,0 +1,67 @@
+import pytest
+
+from app.utils.embedding_cache import EmbeddingCache, SqliteEmbeddingStore, make_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_ignores_whitespace_but_not_model_or_case():
+    assert make_key("ada", "hey  there ") == make_key("ada", "hey there")
+    assert make_key("ada", "hey there") != make_key("other", "hey there")
+    assert make_key("ada", "Hey there") != make_key("ada", "hey there")
+
+
+def test_get_or_create_only_calls_backend_on_miss():
+    cache = EmbeddingCache(max_entries=10)
+    calls = []
+
+    def create(text):
+        calls.append(text)
+        return [1.0, 2.0]
+
+    assert cache.get_or_create("ada", "hello", create) == [1.0, 2.0]
+    assert cache.get_or_create("ada", " hello", create) == [1.0, 2.0]
+
+    assert calls == ["hello"]
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_failed_embeddings_are_not_cached():
+    cache = EmbeddingCache(max_entries=10)
+    assert cache.get_or_create("ada", "hello", lambda text: None) is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction_and_ttl():
+    clock = FakeClock()
+    cache = EmbeddingCache(max_entries=2, ttl_seconds=10, clock=clock)
+
+    cache.set("ada", "a", [1.0])
+    cache.set("ada", "b", [2.0])
+    assert cache.get("ada", "a") == [1.0]  # "b" is now least recently used
+    cache.set("ada", "c", [3.0])
+
+    assert cache.get("ada", "b") is None
+    assert cache.stats()["evictions"] == 1
+
+    clock.now = 11
+    assert cache.get("ada", "a") is None
+    assert cache.stats()["evictions"] == 2
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    EmbeddingCache(store=SqliteEmbeddingStore(path)).set("ada", "hello", [0.5, 0.25])
+
+    restarted = EmbeddingCache(store=SqliteEmbeddingStore(path))
+
+    assert restarted.get("ada", "hello") == pytest.approx([0.5, 0.25])
+    assert restarted.stats()["store_hits"] == 1
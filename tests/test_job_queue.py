@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from app.utils.job_queue import JobQueue, JobWorker
+
+
+def test_pending_jobs_for_a_user_coalesce(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    queue.enqueue("ada", "memory", "user: hi\nNoelle: hello")
+    queue.enqueue("ada", "memory", "Noelle: hello\nuser: how are you?")
+    queue.enqueue("bob", "memory", "user: yo")
+
+    jobs = queue.claim(10)
+    assert sorted(job.user_id for job in jobs) == ["ada", "bob"]
+    ada = next(job for job in jobs if job.user_id == "ada")
+    assert ada.payload == "user: hi\nNoelle: hello\nuser: how are you?"
+
+    # a running job does not absorb new work; it waits in a new job
+    queue.enqueue("ada", "memory", "user: still there?")
+    assert queue.stats()["depth"] == 1
+    assert queue.stats()["kinds"]["memory"]["coalesced"] == 1
+
+
+def test_failed_jobs_back_off_and_give_up(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    queue.enqueue("ada", "mbti", "user: hi")
+
+    job = queue.claim(1)[0]
+    queue.fail(job, "rate limited", max_attempts=2, retry_base=0.05)
+    assert queue.claim(1) == []
+    time.sleep(0.06)
+
+    job = queue.claim(1)[0]
+    assert job.attempts == 2
+    queue.fail(job, "rate limited", max_attempts=2, retry_base=0.05)
+
+    stats = queue.stats()
+    assert stats["depth"] == 0
+    assert stats["kinds"]["mbti"]["retried"] == 1
+    assert stats["kinds"]["mbti"]["failed"] == 1
+
+
+def test_worker_runs_independent_analyses_concurrently(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    for kind in ("memory", "mbti", "ocean", "slang"):
+        queue.enqueue("ada", kind, "user: hi")
+
+    async def analysis(user_id, payload):
+        await asyncio.sleep(0.1)
+
+    worker = JobWorker(queue, dict.fromkeys(("memory", "mbti", "ocean", "slang"), analysis), concurrency=4)
+
+    async def run():
+        start = time.perf_counter()
+        assert await worker.run_once() == 4
+        await worker.drain()
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) < 0.3
+    stats = queue.stats()
+    assert stats["depth"] == 0 and stats["running"] == 0
+    assert all(stats["kinds"][kind]["completed"] == 1 for kind in ("memory", "mbti", "ocean", "slang"))
@@ -0,0 +1,147 @@
+import json
+import random
+from datetime import datetime, timedelta
+
+from app.utils.match_filter import MemoryFilter, matches_spec
+
+TOPICS = ["work", "stress", "family", "music", "friendship", "feedback", "health"]
+INTENSITIES = ["low", "medium", "high"]
+STYLES = ["direct", "poetic", "reflective"]
+FLAGS = ["disclosure", "ritual", "boundary_discussion", "self_awareness", "recurring_theme"]
+
+
+def random_memory(rng, index):
+    timestamp = datetime(2025, 1, 1) + timedelta(hours=rng.randint(0, 24 * 120))
+    metadata = {
+        "text": f"memory {index}",
+        "topics": rng.sample(TOPICS, rng.randint(1, 3)),
+        "emotional_intensity": rng.choice(INTENSITIES),
+        "language_style": rng.choice(STYLES),
+        "importance": round(rng.random(), 2),
+        "sentiment_score": round(rng.uniform(-1, 1), 2),
+        "timestamp": timestamp.isoformat(),
+        **{flag: rng.random() < 0.4 for flag in FLAGS},
+    }
+    if rng.random() < 0.1:
+        del metadata["importance"]
+    return {
+        "id": str(index),
+        "knowledge_text": metadata["text"],
+        "metadata": metadata,
+        "mention_count": rng.randint(1, 5),
+        "similarity": round(rng.random(), 3),
+    }
+
+
+def random_filter(rng):
+    memory_filter = MemoryFilter()
+    for _ in range(rng.randint(0, 3)):
+        kind = rng.choice(["match", "gte", "lte", "contains", "contains_any", "contains_all", "date", "or_match", "or_contains"])
+        if kind == "match":
+            if rng.random() < 0.5:
+                memory_filter.match(rng.choice(FLAGS), rng.random() < 0.5)
+            else:
+                memory_filter.match("emotional_intensity", rng.choice(INTENSITIES))
+        elif kind == "gte":
+            memory_filter.greater_than_or_equal(rng.choice(["importance", "sentiment_score", "mention_count"]), round(rng.uniform(-0.5, 1), 1))
+        elif kind == "lte":
+            memory_filter.less_than_or_equal(rng.choice(["importance", "sentiment_score"]), round(rng.uniform(-0.5, 1), 1))
+        elif kind == "contains":
+            memory_filter.contains("topics", rng.choice(TOPICS))
+        elif kind == "contains_any":
+            memory_filter.contains_any("topics", rng.sample(TOPICS, 2))
+        elif kind == "contains_all":
+            memory_filter.contains_all("topics", rng.sample(TOPICS, 2))
+        elif kind == "date":
+            threshold = datetime(2025, 1, 1) + timedelta(days=rng.randint(0, 120))
+            memory_filter.greater_than_or_equal("timestamp", threshold.isoformat())
+        elif kind == "or_match":
+            memory_filter.or_match("language_style", rng.choice(STYLES))
+        else:
+            memory_filter.or_contains("topics", rng.choice(TOPICS))
+    return memory_filter
+
+
+def test_compiled_spec_matches_python_apply():
+    rng = random.Random(3)
+    memories = [random_memory(rng, i) for i in range(300)]
+
+    for _ in range(300):
+        memory_filter = random_filter(rng)
+        # the spec travels to Postgres as JSON
+        spec = json.loads(json.dumps(memory_filter.to_spec()))
+
+        expected = [memory["id"] for memory in memory_filter.apply(memories)]
+        compiled = [memory["id"] for memory in memories if matches_spec(memory, spec)]
+
+        assert compiled == expected, spec
+
+
+def test_spec_records_clauses_and_sort():
+    spec = MemoryFilter() \
+        .match("ritual", True) \
+        .greater_than_or_equal("timestamp", datetime(2025, 3, 1)) \
+        .or_contains("topics", "music") \
+        .sort_by_similarity() \
+        .to_spec()
+
+    assert spec == {
+        "all": [
+            {"op": "eq", "key": "ritual", "value": True},
+            {"op": "gte", "key": "timestamp", "value": "2025-03-01T00:00:00"},
+        ],
+        "any": [{"op": "contains", "key": "topics", "value": "music"}],
+        "sort": {"key": "similarity", "order": "desc"},
+    }
+
+
+def test_booleans_are_not_numbers_in_spec():
+    memory = {"metadata": {"importance": 1}}
+    spec = MemoryFilter().match("importance", True).to_spec()
+
+    assert not matches_spec(memory, spec)
+
+
+def reference_apply(memory_filter, memories):
+    # the original closure-based evaluation
+    filtered = [
+        memory for memory in memories
+        if (all(condition(memory) for condition in memory_filter.conditions) or
+            any(condition(memory) for condition in memory_filter.or_conditions))
+    ]
+    if memory_filter.sort_order:
+        reverse = memory_filter.sort_order == "desc"
+        if memory_filter.sort_key == "timestamp":
+            filtered = sorted(filtered, key=lambda m: datetime.fromisoformat(str(m.get("timestamp"))) if m.get("timestamp") else datetime.min, reverse=reverse)
+        else:
+            filtered = sorted(filtered, key=lambda m: m.get("similarity", 0.0), reverse=reverse)
+    return filtered
+
+
+def test_compiled_filter_matches_closures_row_wise_and_column_wise():
+    rng = random.Random(11)
+    memories = [random_memory(rng, i) for i in range(600)]
+    for memory in memories:
+        if rng.random() < 0.5:
+            memory["timestamp"] = memory["metadata"]["timestamp"]
+
+    for _ in range(200):
+        memory_filter = random_filter(rng)
+        if rng.random() < 0.3:
+            memory_filter.sort_by_date(rng.choice(["asc", "desc"]))
+        elif rng.random() < 0.3:
+            memory_filter.sort_by_similarity(rng.choice(["asc", "desc"]))
+
+        small = memories[:50]
+        assert memory_filter.apply(small) == reference_apply(memory_filter, small)
+        assert memory_filter.apply(memories) == reference_apply(memory_filter, memories)
+
+
+def test_compiled_filter_is_rebuilt_when_the_chain_grows():
+    memory_filter = MemoryFilter().match("ritual", True)
+    first = memory_filter.compile()
+    assert memory_filter.compile() is first
+
+    memory_filter.greater_than_or_equal("importance", 0.5)
+    assert memory_filter.compile() is not first
+    assert len(memory_filter.compile().clauses) == 2
@@ -0,0 +1,201 @@
+import asyncio
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from types import SimpleNamespace
+
+import pytest
+
+from app.supabase import profiles
+from app.supabase.profiles import AsyncProfileRepository, ProfileRepository, invalidate_profile, profile_cache
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.update_values = None
+        self.filters = []
+
+    def select(self, columns):
+        return self
+
+    def update(self, values):
+        self.update_values = values
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row[column] in values)
+        return self
+
+    def execute(self):
+        rows = [row for row in self.client.rows.values() if all(f(row) for f in self.filters)]
+        if self.update_values is not None:
+            self.client.updates += 1
+            for row in rows:
+                row.update(self.update_values)
+        else:
+            self.client.selects += 1
+        return SimpleNamespace(data=[dict(row) for row in rows])
+
+
+class FakeRpc:
+    """The deduct_credits and add_credits functions from app/supabase/sql/credits.sql."""
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        self.client.rpcs += 1
+        if self.name == "add_credits":
+            row = self.client.rows[self.params["input_user_id"]]
+            row["credits"] += self.params["amount"]
+            return SimpleNamespace(data=row["credits"])
+
+        results = []
+        for deduction in self.params["deductions"]:
+            row = self.client.rows.get(deduction["user_id"])
+            if row is None:
+                continue
+            charged = min(deduction["amount"], max(row["credits"], 0))
+            if self.params.get("strict") and charged < deduction["amount"]:
+                charged = 0
+            row["credits"] -= charged
+            row["credits_used"] += charged
+            results.append({"id": row["id"], "credits": row["credits"], "credits_used": row["credits_used"], "charged": charged})
+        return SimpleNamespace(data=results)
+
+
+class AsyncFakeQuery(FakeQuery):
+    async def execute(self):
+        return super().execute()
+
+
+class AsyncFakeRpc(FakeRpc):
+    async def execute(self):
+        return super().execute()
+
+
+class FakeClient:
+    query_class = FakeQuery
+    rpc_class = FakeRpc
+
+    def __init__(self):
+        self.rows = {
+            user_id: {"id": user_id, "email": f"{user_id}@example.com", "name": user_id.title(), "credits": 10, "credits_used": 0}
+            for user_id in ("ada", "bob", "cy")
+        }
+        self.selects = 0
+        self.updates = 0
+        self.rpcs = 0
+
+    def table(self, name):
+        return self.query_class(self, name)
+
+    def rpc(self, name, params):
+        return self.rpc_class(self, name, params)
+
+
+class AsyncFakeClient(FakeClient):
+    query_class = AsyncFakeQuery
+    rpc_class = AsyncFakeRpc
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeClient()
+    async_fake = AsyncFakeClient()
+    async_fake.rows = fake.rows
+
+    async def get_async_client(key):
+        return async_fake
+
+    monkeypatch.setattr(profiles, "get_supabase_client", lambda key: fake)
+    monkeypatch.setattr(profiles, "get_async_supabase_client", get_async_client)
+    fake.async_client = async_fake
+    profile_cache.clear()
+    yield fake
+    profile_cache.clear()
+
+
+def test_getters_share_one_profile_query(client):
+    repo = ProfileRepository()
+
+    assert repo.get_user_name("ada") == "Ada"
+    assert repo.get_user_credit("ada") == 10
+    assert repo.get_user_credits_used("ada") == 0
+    assert ProfileRepository().get_user_email("ada") == "ada@example.com"
+    assert repo.get_profile("ada").name == "Ada"
+    assert repo.get_user_name("nobody") is None
+    assert client.selects == 2
+
+
+def test_updates_are_applied_to_the_snapshot(client):
+    repo = ProfileRepository()
+    repo.get_user_name("ada")
+
+    repo.update_user_name("ada", "Ada L.")
+    assert repo.deduct_credits("ada", 3)
+
+    assert repo.get_user_name("ada") == "Ada L."
+    assert repo.get_user_credit("ada") == 7
+    assert repo.get_user_credits_used("ada") == 3
+    # deduct_credits is one atomic RPC, no read first
+    assert client.selects == 1
+    assert client.updates == 1
+    assert client.rpcs == 1
+    # all or nothing: a balance that does not cover the amount is left as it is
+    assert not repo.deduct_credits("ada", 50)
+    assert repo.get_user_credit("ada") == 7
+    assert repo.get_user_credits_used("ada") == 3
+
+
+def test_invalidate_reloads_changes_made_elsewhere(client):
+    repo = ProfileRepository()
+    repo.get_user_credit("bob")
+
+    client.rows["bob"]["credits"] = 50
+    assert repo.get_user_credit("bob") == 10
+
+    invalidate_profile("bob")
+    assert repo.get_user_credit("bob") == 50
+
+
+def test_get_profiles_batches_uncached_users(client):
+    repo = ProfileRepository()
+    repo.get_user_name("ada")
+
+    found = repo.get_profiles(["ada", "bob", "cy", "nobody", "bob"])
+
+    assert sorted(found) == ["ada", "bob", "cy"]
+    assert found["cy"].email == "cy@example.com"
+    assert client.selects == 2
+    repo.get_user_name("cy")
+    assert client.selects == 2
+
+
+def test_async_repository_shares_the_snapshot(client):
+    async def run():
+        repo = AsyncProfileRepository()
+        assert await repo.get_user_name("ada") == "Ada"
+        assert await repo.get_user_credit("ada") == 10
+        assert await repo.deduct_credits("ada", 4)
+        assert not await repo.deduct_credits("ada", 7)
+        assert await repo.get_user_name("nobody") is None
+        return await repo.get_profiles(["ada", "bob"])
+
+    found = asyncio.run(run())
+
+    assert sorted(found) == ["ada", "bob"]
+    # the sync repository reads the same snapshot, including the async write
+    assert ProfileRepository().get_user_credit("ada") == 6
+    assert ProfileRepository().get_user_credits_used("ada") == 4
+    assert client.selects == 0
+    assert client.async_client.selects == 3
+    assert client.async_client.rpcs == 2
@@ -0,0 +1,46 @@
+from app.utils.token_count import count_tokens
+from app.websockets.prompt_assembler import STATIC, USER, PromptAssembler, PromptStats, Section, trim_to_tokens
+
+
+STATIC_TEXT = "You are Noelle, a friendly companion.\n" * 20
+
+
+def sections(history, slang="slang " * 200):
+    return [
+        Section("user", "The user's name is Ada", title="The user's information:", tier=USER),
+        Section("history", history, title="Conversation History:", priority=70, budget=200, keep="tail"),
+        Section("slang", slang, title="Fun Slang you can use:", priority=10, budget=100),
+        Section("personality", STATIC_TEXT, tier=STATIC),
+    ]
+
+
+def test_static_and_user_sections_lead_and_stay_identical_across_turns():
+    assembler = PromptAssembler(ceiling=10_000, stats=PromptStats())
+    first = assembler.assemble(sections("user: hi"))
+    second = assembler.assemble(sections("user: hi\nNoelle: hello\nuser: how are you?", slang=""))
+
+    prefix = STATIC_TEXT.strip("\n") + "\n\nThe user's information:\nThe user's name is Ada"
+    assert first.text.startswith(prefix)
+    assert second.text.startswith(prefix)
+    assert second.tokens["slang"] == 0
+    assert first.tier_tokens[STATIC] == second.tier_tokens[STATIC] > 0
+
+
+def test_budgets_keep_the_latest_history_and_ceiling_drops_low_priority_first():
+    history = "\n".join(f"user: message number {i}" for i in range(200))
+    stats = PromptStats()
+    assembler = PromptAssembler(ceiling=count_tokens(STATIC_TEXT) + 150, stats=stats)
+    prompt = assembler.assemble(sections(history))
+
+    assert "message number 199" in prompt.text
+    assert "message number 0\n" not in prompt.text
+    assert prompt.tokens["slang"] == 0
+    assert prompt.total_tokens <= assembler.ceiling + 5
+    assert "The user's name is Ada" in prompt.text
+    assert set(prompt.trimmed) >= {"history", "slang"}
+    assert stats.stats()["sections"]["history"]["trimmed"] == 1
+
+
+def test_trim_to_tokens_cuts_a_single_long_line():
+    text = "word " * 500
+    assert count_tokens(trim_to_tokens(text, 20)) <= 20
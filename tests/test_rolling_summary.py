@@ -0,0 +1,108 @@
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+
+# the analysis services create their OpenAI clients when imported; no request is made
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app.supabase import rolling_summary  # noqa: E402
+from app.supabase.conversation_history import Message  # noqa: E402
+from app.supabase.rolling_summary import SUMMARY_ROLE, SummaryQueue, fold_history  # noqa: E402
+
+
+def message(role, content):
+    return Message(role=role, content=content, created_at=datetime(2025, 1, 1), user_id="ada")
+
+
+async def fake_threadpool(func, *args):
+    return func(*args)
+
+
+@pytest.fixture
+def history(monkeypatch):
+    store = {"ada": [message("user", f"message {i}") for i in range(12)]}
+    calls = []
+
+    async def get_head(user_id, count):
+        return store[user_id][:count], len(store[user_id])
+
+    async def fold(user_id, summary, replaced_count, expected_head):
+        if store[user_id][0] != expected_head:
+            return None
+        store[user_id] = [summary] + store[user_id][replaced_count:]
+        return len(store[user_id])
+
+    async def summarize(previous_summary, messages):
+        calls.append((previous_summary, [msg.content for msg in messages]))
+        return f"{previous_summary}+{len(messages)}"
+
+    monkeypatch.setattr(rolling_summary, "get_history_head_async", get_head)
+    monkeypatch.setattr(rolling_summary, "fold_history_async", fold)
+    monkeypatch.setattr(rolling_summary, "summarize_messages", summarize)
+    return store, calls
+
+
+def test_only_messages_leaving_the_window_are_folded(history):
+    store, calls = history
+
+    summary = asyncio.run(fold_history("ada", threshold=10, keep=4))
+    assert summary.content == "+8"
+    assert [msg.content for msg in store["ada"][1:]] == [f"message {i}" for i in range(8, 12)]
+    assert calls == [("", [f"message {i}" for i in range(8)])]
+
+    # under the threshold again: nothing to do
+    assert asyncio.run(fold_history("ada", threshold=10, keep=4)) is None
+
+    store["ada"] += [message("user", f"message {i}") for i in range(12, 19)]
+    summary = asyncio.run(fold_history("ada", threshold=10, keep=4))
+    # the previous summary is extended with the next messages only
+    assert calls[-1] == ("+8", [f"message {i}" for i in range(8, 15)])
+    assert store["ada"][0].role == SUMMARY_ROLE
+    assert summary.content == "+8+7"
+    assert len(store["ada"]) == 5
+
+
+def test_only_folded_messages_are_queued_for_analysis(history, monkeypatch):
+    store, _ = history
+    queued = []
+    monkeypatch.setattr(rolling_summary, "run_in_threadpool", fake_threadpool)
+    monkeypatch.setattr("app.function.analysis_jobs.enqueue_analysis", lambda user_id, transcript: queued.append(transcript))
+
+    # 12 raw messages over a threshold of 10: the first 8 are folded and analyzed
+    asyncio.run(fold_history("ada", threshold=10, keep=4, extract=True))
+    assert queued == ["\n".join(f"user: message {i}" for i in range(8))]
+
+    # the kept messages and the summary are not analyzed again while nothing folds
+    store["ada"] += [message("user", f"message {i}") for i in range(12, 18)]
+    assert asyncio.run(fold_history("ada", threshold=10, keep=4, extract=True)) is None
+    assert len(queued) == 1
+
+    store["ada"].append(message("user", "message 18"))
+    asyncio.run(fold_history("ada", threshold=10, keep=4, extract=True))
+    assert queued[-1] == "\n".join(f"user: message {i}" for i in range(8, 15))
+
+
+def test_bursts_for_one_user_coalesce_into_one_fold():
+    folds = []
+
+    async def fold(user_id, threshold, extract=False):
+        folds.append((user_id, threshold, extract))
+        await asyncio.sleep(0.01)
+        return True
+
+    queue = SummaryQueue(fold=fold, delay=0.02, workers=2)
+
+    async def run():
+        for i in range(5):
+            queue.schedule("ada", 10, extract=(i == 2))
+        queue.schedule("bob", 8)
+        await asyncio.sleep(0.05)
+        await queue.stop()
+
+    asyncio.run(run())
+
+    assert sorted(folds) == [("ada", 10, True), ("bob", 8, False)]
+    assert queue.stats()["coalesced"] == 4
+    assert queue.stats()["folds"] == 2
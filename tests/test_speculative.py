@@ -0,0 +1,136 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.utils.token_accounting import TurnUsage
+from app.utils.token_count import count_tokens
+from app.websockets.speculative import SpeculationStats, SpeculativeStream
+
+
+def delta_event(text):
+    return SimpleNamespace(type="raw_response_event", data=SimpleNamespace(type="response.output_text.delta", delta=text))
+
+
+class FakeRun:
+    def __init__(self, name, events=3, delay=0.01):
+        self.name = name
+        self.events = events
+        self.delay = delay
+        self.cancelled = False
+        self.final_output = None
+
+    async def stream_events(self):
+        for i in range(self.events):
+            await asyncio.sleep(self.delay)
+            if self.cancelled:
+                return
+            yield f"{self.name}-{i}"
+        self.final_output = f"{self.name} done"
+
+    def _cleanup_tasks(self):
+        self.cancelled = True
+
+
+def run_stream(augmentation, classifier_delay):
+    runs = []
+    stats = SpeculationStats()
+
+    def start(prompt):
+        runs.append(FakeRun("augmented" if prompt else "speculative"))
+        return runs[-1]
+
+    async def classify():
+        await asyncio.sleep(classifier_delay)
+        return augmentation
+
+    async def consume():
+        stream = SpeculativeStream(start, classify(), stats=stats)
+        events = [event async for event in stream.stream_events()]
+        return stream, events
+
+    stream, events = asyncio.run(consume())
+    return stream, events, runs, stats
+
+
+def test_speculative_response_is_kept_when_the_prompt_does_not_change():
+    stream, events, runs, stats = run_stream(augmentation="", classifier_delay=0.015)
+
+    assert events == ["speculative-0", "speculative-1", "speculative-2"]
+    assert stream.final_output == "speculative done"
+    assert len(runs) == 1
+    assert stats.stats()["committed"] == 1
+    assert stats.stats()["avg_saved_ms"] > 0
+
+
+def test_speculative_response_restarts_when_the_classifiers_change_the_prompt():
+    stream, events, runs, stats = run_stream(augmentation="memory", classifier_delay=0.015)
+
+    # nothing from the discarded run reaches the client
+    assert events == ["augmented-0", "augmented-1", "augmented-2"]
+    assert stream.final_output == "augmented done"
+    assert runs[0].cancelled
+    assert stats.stats()["restart_rate"] == 1.0
+
+
+def test_classifier_errors_keep_the_speculative_response():
+    stats = SpeculationStats()
+
+    async def failing():
+        raise RuntimeError("classifier down")
+
+    async def consume():
+        stream = SpeculativeStream(lambda prompt: FakeRun("speculative"), failing(), stats=stats)
+        return [event async for event in stream.stream_events()]
+
+    assert asyncio.run(consume()) == ["speculative-0", "speculative-1", "speculative-2"]
+    assert stats.stats()["committed"] == 1
+
+
+def tool_call_event():
+    return SimpleNamespace(type="raw_response_event", data=SimpleNamespace(type="response.output_item.added", item=SimpleNamespace(type="function_call")))
+
+
+class ToolCallingRun(FakeRun):
+    async def stream_events(self):
+        await asyncio.sleep(self.delay)
+        yield tool_call_event()
+        async for event in super().stream_events():
+            yield event
+
+
+def test_a_run_that_calls_a_tool_is_kept_even_if_the_prompt_would_change():
+    stats = SpeculationStats()
+    runs = []
+    classifier_cancelled = []
+
+    def start(prompt):
+        runs.append(ToolCallingRun("augmented" if prompt else "speculative"))
+        return runs[-1]
+
+    async def classify():
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            classifier_cancelled.append(True)
+            raise
+        return "memory"
+
+    async def consume():
+        stream = SpeculativeStream(start, classify(), stats=stats)
+        return [event async for event in stream.stream_events()]
+
+    events = asyncio.run(consume())
+    # its tools must not run a second time in a restarted run
+    assert len(runs) == 1 and not runs[0].cancelled
+    assert events[1:] == ["speculative-0", "speculative-1", "speculative-2"]
+    assert classifier_cancelled == [True]
+    assert stats.stats()["committed_on_tool_call"] == 1
+
+
+def test_a_discarded_run_is_billed_with_the_turn():
+    stream, _, runs, _ = run_stream(augmentation="memory", classifier_delay=0.015)
+    assert [run for run, _ in stream.discarded] == [runs[0]]
+
+    usage = TurnUsage()
+    usage.add_discarded(SimpleNamespace(input="how are you?"), [delta_event("Hello there")])
+    assert usage.input_tokens == count_tokens("how are you?")
+    assert usage.output_tokens == count_tokens("Hello there")
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.supabase import client as supabase_client
+from app.supabase.client import LazySupabaseClient, SupabasePoolStats, get_async_supabase_client, get_supabase_client
+
+# Shaped like a JWT, which is all the Supabase client checks
+API_KEY = "header.payload.signature"
+
+
+class RestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = json.dumps([{"id": 1}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def rest_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stats = SupabasePoolStats()
+    monkeypatch.setattr(supabase_client, "SUPABASE_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(supabase_client, "pool_stats", stats)
+    monkeypatch.setattr(supabase_client, "_clients", {})
+    monkeypatch.setattr(supabase_client, "_async_clients", {})
+    yield stats
+    server.shutdown()
+
+
+def test_one_shared_client_reuses_its_connections(rest_server):
+    lazy = LazySupabaseClient(API_KEY)
+    assert supabase_client._clients == {}
+
+    for _ in range(3):
+        assert lazy.table("profiles").select("*").execute().data == [{"id": 1}]
+
+    client = get_supabase_client(API_KEY)
+    assert lazy.postgrest is client.postgrest
+    stats = rest_server.stats()
+    assert stats["requests"] == 3
+    assert stats["connections"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_async_client_is_shared_and_instrumented(rest_server):
+    async def query():
+        client = await get_async_supabase_client(API_KEY)
+        assert await get_async_supabase_client(API_KEY) is client
+        return (await client.table("profiles").select("*").execute()).data
+
+    assert asyncio.run(query()) == [{"id": 1}]
+    assert rest_server.stats()["requests"] == 1
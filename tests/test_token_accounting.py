@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from app.utils.token_accounting import TokenUsageStats, TurnUsage
+from app.utils.token_count import count_tokens
+
+
+def delta_event(text):
+    return SimpleNamespace(type="raw_response_event", data=SimpleNamespace(type="response.output_text.delta", delta=text))
+
+
+def completed_event(input_tokens, output_tokens, cached_tokens=0):
+    usage = SimpleNamespace(
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        input_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+    )
+    return SimpleNamespace(type="raw_response_event", data=SimpleNamespace(type="response.completed", response=SimpleNamespace(usage=usage)))
+
+
+def test_streamed_deltas_and_prompt_are_counted_without_api_usage():
+    usage = TurnUsage()
+    deltas = ["Hello", " there,", " how are", " you?"]
+    for delta in deltas:
+        usage.observe(delta_event(delta))
+
+    instructions = "You are Noelle.\nRecent conversation:\nuser: hi"
+    agent = SimpleNamespace(model="gpt-4o-mini", instructions=instructions)
+    usage.observe_run(SimpleNamespace(last_agent=agent, input="how are you?"))
+
+    assert not usage.reported
+    assert usage.output_tokens == sum(count_tokens(delta) for delta in deltas)
+    assert usage.input_tokens == count_tokens(instructions) + count_tokens("how are you?")
+    assert usage.cost() > 0
+    assert usage.cached_ratio is None
+
+
+def test_api_usage_is_preferred_and_summed_across_requests():
+    usage = TurnUsage()
+    usage.observe(delta_event("estimated"))
+    # a tool call makes two model requests in one turn
+    usage.observe(completed_event(1200, 40, cached_tokens=1024))
+    usage.observe(completed_event(1300, 60))
+    usage.add_prompt("only used when the API reports nothing")
+
+    assert usage.input_tokens == 2500
+    assert usage.output_tokens == 100
+    assert round(usage.cached_ratio, 3) == round(1024 / 2500, 3)
+
+    stats = TokenUsageStats()
+    stats.record(usage, usage.credits())
+    assert stats.stats()["reported_turns"] == 1
+    assert stats.stats()["cached_tokens"] == 1024
+    assert stats.stats()["cached_ratio"] == round(1024 / 2500, 4)
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from app.utils.similarity import cosine_similarity
+from app.utils.vector_index import EmbeddingMatrix, IVFFlatIndex, parse_embedding
+
+
+def random_vectors(count, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((count, dim)).astype(np.float32)
+
+
+def test_parse_embedding_from_pgvector_string():
+    vec = parse_embedding("[0.5, -1.0, 2]")
+    assert vec.dtype == np.float32
+    assert vec.tolist() == [0.5, -1.0, 2.0]
+
+
+def test_top_k_matches_brute_force_cosine():
+    vectors = random_vectors(200)
+    matrix = EmbeddingMatrix()
+    matrix.add_many([f"m{i}" for i in range(len(vectors))], vectors)
+
+    query = random_vectors(1, seed=1)[0]
+    expected = sorted(
+        ((f"m{i}", cosine_similarity(query, vec)) for i, vec in enumerate(vectors)),
+        key=lambda pair: pair[1],
+        reverse=True,
+    )[:5]
+
+    result = matrix.top_k(query, 5)
+
+    assert [item_id for item_id, _ in result] == [item_id for item_id, _ in expected]
+    for (_, score), (_, expected_score) in zip(result, expected):
+        assert score == pytest.approx(expected_score, abs=1e-5)
+
+
+def test_top_k_threshold_and_exclude():
+    matrix = EmbeddingMatrix()
+    matrix.add("same", [1.0, 0.0])
+    matrix.add("close", [0.9, 0.1])
+    matrix.add("far", [0.0, 1.0])
+
+    result = matrix.top_k([1.0, 0.0], 5, threshold=0.8, exclude=["same"])
+
+    assert [item_id for item_id, _ in result] == ["close"]
+
+
+def test_remove_and_replace_keep_rows_consistent():
+    matrix = EmbeddingMatrix(capacity=1)
+    matrix.add("a", [1.0, 0.0])
+    matrix.add("b", [0.0, 1.0])
+    matrix.add("c", [1.0, 1.0])
+
+    assert matrix.remove("a")
+    assert not matrix.remove("a")
+    matrix.add("b", [1.0, 0.0])
+
+    assert len(matrix) == 2
+    assert matrix.top_k([1.0, 0.0], 1)[0][0] == "b"
+    assert "a" not in matrix
+
+
+def clustered_vectors(count, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    labels = rng.integers(0, clusters, count)
+    return (centers[labels] + 0.3 * rng.standard_normal((count, dim))).astype(np.float32)
+
+
+def test_ivf_index_is_exact_until_trained():
+    vectors = random_vectors(50)
+    index = IVFFlatIndex(min_train_rows=100)
+    index.add_many([f"m{i}" for i in range(len(vectors))], vectors)
+
+    assert not index.is_trained
+    assert index.search(vectors[3], 3) == index.matrix.top_k(vectors[3], 3)
+
+
+def test_ivf_index_recall_against_brute_force():
+    vectors = clustered_vectors(3000)
+    index = IVFFlatIndex(nprobe=8, min_train_rows=1000)
+    index.add_many([f"m{i}" for i in range(len(vectors))], vectors)
+    assert index.is_trained
+
+    queries = clustered_vectors(50, seed=1)
+    hits = 0
+    for query in queries:
+        expected = {item_id for item_id, _ in index.search(query, 10, exact=True)}
+        hits += len(expected & {item_id for item_id, _ in index.search(query, 10)})
+
+    assert hits / (10 * len(queries)) >= 0.9
+
+
+def test_ivf_index_add_and_remove_after_training():
+    vectors = clustered_vectors(500)
+    index = IVFFlatIndex(min_train_rows=200)
+    index.add_many([f"m{i}" for i in range(len(vectors))], vectors)
+
+    index.add("new", vectors[7])
+    assert {item_id for item_id, _ in index.search(vectors[7], 2)} == {"m7", "new"}
+
+    assert index.remove("m7")
+    assert index.remove("m0")
+    assert [item_id for item_id, _ in index.search(vectors[7], 1)] == ["new"]
+    assert "m0" not in {item_id for item_id, _ in index.search(vectors[0], 5)}